@@ -21,6 +21,7 @@ class Settings(BaseSettings):
     default_model: str = "qwen3-0.6b"
     sd_model_path: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models", "stable-diffusion-lcm")
     hf_home: str = os.environ.get("HF_HOME", os.path.expanduser("~/.cache/huggingface/hub"))
+    vector_data_dir: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "vectors")
     
     # RKLLM Runtime settings
     rkllm_lib_path: str = "/usr/lib/librkllmrt.so"  # System library path
@@ -163,6 +163,22 @@ class BenchmarkRunner:
             print(f"❌ Error loading model: {e}")
             return False
     
+    def count_tokens(self, text: str) -> int:
+        """Token count from the server's /v1/tokenize, ~4 chars/token if unavailable"""
+        if not text:
+            return 0
+        try:
+            response = requests.post(
+                f"{self.base_url}/v1/tokenize",
+                json={"prompt": text},
+                timeout=10
+            )
+            if response.status_code == 200:
+                return response.json()["count"]
+        except requests.RequestException:
+            pass
+        return len(text) // 4
+    
     def run_single_inference(self, prompt: str, prompt_id: str, prompt_name: str, 
                             temperature: float = 0.7, max_tokens: int = 2048) -> PerformanceMetrics:
         """Run a single inference and collect metrics"""
@@ -270,13 +286,11 @@ class BenchmarkRunner:
             # Store response
             metrics.response_text = ''.join(response_chunks)
             
-            # Estimate tokens if not provided (rough approximation: 4 chars per token)
+            # Count tokens with the server's tokenizer if usage stats were missing
             if metrics.input_tokens == 0:
-                metrics.input_tokens = len(prompt) // 4
+                metrics.input_tokens = self.count_tokens(prompt)
             if metrics.output_tokens == 0:
-                # If we have response text, use a better approximation or count chunks if they were single tokens
-                # For now, fallback to char length / 4 if no usage stats
-                metrics.output_tokens = len(metrics.response_text) // 4
+                metrics.output_tokens = self.count_tokens(metrics.response_text)
             
             # Recalculate derived metrics
             metrics.__post_init__()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Mock-runtime benchmark: CPU cost of waiting for async inference to finish.
+
+Compares the old strategy (poll rkllm_is_running every 1 ms) against the
+event-driven wait on GenerationSession.done that RKLLMModel.generate() now
+uses. Runs entirely against MockRKLLMRuntime, so no NPU is required.
+
+Usage:
+    python scripts/benchmark_completion_wait.py --requests 20 --tokens 64
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.generation_session import GenerationSession, SessionRegistry
+from models.rkllm_model_mock import MockRKLLMRuntime
+
+
+@dataclass
+class WaitResult:
+    """Aggregate measurements for one wait strategy"""
+    strategy: str
+    requests: int
+    wall_ms_per_request: float
+    cpu_ms_per_request: float
+    waiter_cpu_ms_per_request: float
+
+
+def wait_polling(runtime: MockRKLLMRuntime, session: GenerationSession):
+    """Previous behaviour: 10 ms initial delay, then poll every 1 ms"""
+    time.sleep(0.01)
+    while runtime.is_running():
+        time.sleep(0.001)
+
+
+def wait_event(runtime: MockRKLLMRuntime, session: GenerationSession):
+    """Current behaviour: block on the completion event set by the callback"""
+    session.wait()
+
+
+def run_strategy(name, wait_fn, requests: int, tokens: int, step_time: float) -> WaitResult:
+    runtime = MockRKLLMRuntime(n_batch=1, step_time=step_time)
+    registry = SessionRegistry()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    waiter_cpu = 0.0
+
+    for _ in range(requests):
+        session = GenerationSession(prompt="benchmark", max_tokens=tokens)
+        registry.register(session)
+        runtime.run_async(session)
+
+        thread_start = time.thread_time()
+        wait_fn(runtime, session)
+        waiter_cpu += time.thread_time() - thread_start
+
+        registry.unregister(session)
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    return WaitResult(
+        strategy=name,
+        requests=requests,
+        wall_ms_per_request=wall * 1000 / requests,
+        cpu_ms_per_request=cpu * 1000 / requests,
+        waiter_cpu_ms_per_request=waiter_cpu * 1000 / requests,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare polling vs event-driven completion waits")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per strategy")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens generated per request")
+    parser.add_argument("--step-ms", type=float, default=20.0, help="Mock decode step in ms (~50 tok/s)")
+    args = parser.parse_args()
+
+    results = [
+        run_strategy("poll-1ms", wait_polling, args.requests, args.tokens, args.step_ms / 1000),
+        run_strategy("event", wait_event, args.requests, args.tokens, args.step_ms / 1000),
+    ]
+
+    print(f"\n{'Strategy':<10} {'Wall ms/req':>12} {'CPU ms/req':>12} {'Waiter CPU ms/req':>18}")
+    print("-" * 56)
+    for r in results:
+        print(f"{r.strategy:<10} {r.wall_ms_per_request:>12.1f} {r.cpu_ms_per_request:>12.2f} "
+              f"{r.waiter_cpu_ms_per_request:>18.2f}")
+
+    poll, event = results
+    if event.cpu_ms_per_request > 0:
+        print(f"\nCPU time per request reduced {poll.cpu_ms_per_request / event.cpu_ms_per_request:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
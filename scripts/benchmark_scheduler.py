@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Mock-runtime benchmark: queue policies under simulated load.
+
+Replays the same Poisson arrival trace against BatchScheduler once per queue
+policy (fifo, fair, sjf) and reports end-to-end latency percentiles. The
+workload mixes many short chat replies with a few long generations from two
+clients that both send the default max_tokens, so shortest-job-first has to
+rely on the learned per-client output length. Runs entirely against
+MockRKLLMRuntime, so no NPU is required.
+
+Usage:
+    python scripts/benchmark_scheduler.py --requests 200 --load 0.9
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.batch_scheduler import BatchScheduler
+from models.fair_queue import FairQueue, QUEUE_POLICIES
+from models.generation_session import GenerationSession, SessionRegistry
+from models.rkllm_model_mock import MockRKLLMRuntime
+
+
+@dataclass
+class PolicyResult:
+    """Latency distribution for one queue policy"""
+    policy: str
+    requests: int
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    short_p50_ms: float
+    long_p99_ms: float
+
+
+def make_trace(n: int, load: float, step_time: float, long_fraction: float,
+               short_tokens: int, long_tokens: int, seed: int) -> List[Tuple[float, str, int]]:
+    """(arrival offset s, client, output tokens) with Poisson arrivals at the given utilisation"""
+    rng = random.Random(seed)
+    mean_tokens = long_fraction * long_tokens + (1 - long_fraction) * short_tokens
+    rate = load / (mean_tokens * step_time)  # Requests per second for one slot
+    trace, t = [], 0.0
+    for _ in range(n):
+        t += rng.expovariate(rate)
+        if rng.random() < long_fraction:
+            trace.append((t, "summarizer", long_tokens))
+        else:
+            trace.append((t, "chat", rng.randint(short_tokens // 2, short_tokens * 3 // 2)))
+    return trace
+
+
+async def run_policy(policy: str, trace, step_time: float, n_slots: int, max_tokens: int) -> PolicyResult:
+    runtime = MockRKLLMRuntime(n_batch=n_slots, step_time=step_time)
+    scheduler = BatchScheduler(n_slots=n_slots, max_context_len=max_tokens * 4,
+                               queue=FairQueue(policy=policy))
+    registry = SessionRegistry()
+    latencies: List[Tuple[str, float]] = []
+    start = time.perf_counter()
+
+    async def one(offset: float, client: str, tokens: int):
+        await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+        session = GenerationSession(prompt="x" * 64, max_tokens=max_tokens, tenant=client)
+        registry.register(session)
+        submitted = time.perf_counter()
+        await scheduler.submit(session, lambda: runtime.run(session, output_tokens=tokens))
+        latencies.append((client, (time.perf_counter() - submitted) * 1000))
+
+    await asyncio.gather(*(one(*req) for req in trace))
+    scheduler.shutdown()
+
+    def pct(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    all_ms = [ms for _, ms in latencies]
+    short_ms = [ms for client, ms in latencies if client == "chat"] or [0.0]
+    long_ms = [ms for client, ms in latencies if client == "summarizer"] or [0.0]
+    return PolicyResult(
+        policy=policy,
+        requests=len(latencies),
+        p50_ms=pct(all_ms, 0.5),
+        p99_ms=pct(all_ms, 0.99),
+        mean_ms=statistics.mean(all_ms),
+        short_p50_ms=pct(short_ms, 0.5),
+        long_p99_ms=pct(long_ms, 0.99),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare queue policies on MockRKLLMRuntime")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per policy")
+    parser.add_argument("--load", type=float, default=0.9, help="Offered load as a fraction of capacity")
+    parser.add_argument("--slots", type=int, default=1, help="Batch slots (hardware.n_batch)")
+    parser.add_argument("--step-ms", type=float, default=1.0, help="Mock decode step time in ms")
+    parser.add_argument("--long-fraction", type=float, default=0.15, help="Share of long generations")
+    parser.add_argument("--short-tokens", type=int, default=24, help="Typical short reply length")
+    parser.add_argument("--long-tokens", type=int, default=400, help="Long generation length")
+    parser.add_argument("--max-tokens", type=int, default=512, help="max_tokens sent by every client")
+    parser.add_argument("--policies", nargs="+", default=["fifo", "sjf"], choices=QUEUE_POLICIES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    step_time = args.step_ms / 1000
+    trace = make_trace(args.requests, args.load, step_time / args.slots, args.long_fraction,
+                       args.short_tokens, args.long_tokens, args.seed)
+
+    print(f"{args.requests} requests, load {args.load:.0%}, {args.slots} slot(s), "
+          f"{args.long_fraction:.0%} long ({args.long_tokens} tok) / short (~{args.short_tokens} tok)\n")
+    print(f"{'policy':<8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'short p50':>12}{'long p99':>12}")
+    for policy in args.policies:
+        r = asyncio.run(run_policy(policy, trace, step_time, args.slots, args.max_tokens))
+        print(f"{r.policy:<8}{r.p50_ms:>10.1f}{r.p99_ms:>10.1f}{r.mean_ms:>10.1f}"
+              f"{r.short_p50_ms:>12.1f}{r.long_p99_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
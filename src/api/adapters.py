@@ -104,28 +104,38 @@ def ollama_generate_to_internal(request: OllamaGenerateRequest) -> InferenceRequ
     )
 
 
-def ollama_chat_to_internal(request: OllamaChatRequest) -> InferenceRequest:
+def format_ollama_chat_prompt(messages: List[ChatMessage], add_generation_prompt: bool = True) -> str:
     """
-    Convert Ollama chat request to internal format
+    Format Ollama chat messages into a plain "Role: content" prompt
     
-    Similar to OpenAI chat but with Ollama's parameter names.
+    Args:
+        messages: Chat messages
+        add_generation_prompt: Append the assistant trigger (False when
+            counting single messages)
     """
-    options = request.options or {}
-    
-    # Build prompt from messages
     prompt_parts = []
-    for msg in request.messages:
+    for msg in messages:
         if msg.role == "system":
-            prompt_parts.append(f"System: {msg.content}")
+            prompt_parts.append(f"System: {msg.content}\n")
         elif msg.role == "user":
-            prompt_parts.append(f"User: {msg.content}")
+            prompt_parts.append(f"User: {msg.content}\n")
         elif msg.role == "assistant":
-            prompt_parts.append(f"Assistant: {msg.content}")
+            prompt_parts.append(f"Assistant: {msg.content}\n")
+    if add_generation_prompt:
+        prompt_parts.append("Assistant:")
+    return "".join(prompt_parts)
+
+
+def ollama_chat_to_internal(request: OllamaChatRequest) -> InferenceRequest:
+    """
+    Convert Ollama chat request to internal format
     
-    prompt = "\n".join(prompt_parts) + "\nAssistant:"
+    Similar to OpenAI chat but with Ollama's parameter names.
+    """
+    options = request.options or {}
     
     return InferenceRequest(
-        prompt=prompt,
+        prompt=format_ollama_chat_prompt(request.messages),
         mode=InferenceMode.GENERATE,
         max_tokens=options.get("num_predict", 512),
         temperature=options.get("temperature", 0.8),
@@ -166,7 +176,8 @@ def internal_to_openai_chat(
         usage=Usage(
             prompt_tokens=response.prefill_tokens,
             completion_tokens=response.generate_tokens,
-            total_tokens=response.prefill_tokens + response.generate_tokens
+            total_tokens=response.prefill_tokens + response.generate_tokens,
+            timing=response.timing.to_dict() if response.timing else None
         )
     )
 
@@ -191,7 +202,8 @@ def internal_to_openai_completion(
         usage=Usage(
             prompt_tokens=response.prefill_tokens,
             completion_tokens=response.generate_tokens,
-            total_tokens=response.prefill_tokens + response.generate_tokens
+            total_tokens=response.prefill_tokens + response.generate_tokens,
+            timing=response.timing.to_dict() if response.timing else None
         )
     )
 
@@ -220,7 +232,8 @@ def internal_to_ollama_generate(
         prompt_eval_count=response.prefill_tokens,
         prompt_eval_duration=prompt_eval_duration_ns,
         eval_count=response.generate_tokens,
-        eval_duration=eval_duration_ns
+        eval_duration=eval_duration_ns,
+        timing=response.timing.to_dict() if response.timing else None
     )
 
 
@@ -247,7 +260,8 @@ def internal_to_ollama_chat(
         prompt_eval_count=response.prefill_tokens,
         prompt_eval_duration=prompt_eval_duration_ns,
         eval_count=response.generate_tokens,
-        eval_duration=eval_duration_ns
+        eval_duration=eval_duration_ns,
+        timing=response.timing.to_dict() if response.timing else None
     )
 
 
@@ -255,6 +269,15 @@ def internal_to_ollama_chat(
 # Embedding Adapters
 # ============================================================================
 
+def _embedding_to_list(embedding) -> List[float]:
+    """Serialize a float32 array (or list) for the JSON response"""
+    if embedding is None:
+        return []
+    if hasattr(embedding, "tolist"):
+        return embedding.tolist()
+    return list(embedding)
+
+
 def openai_embedding_to_internal(request) -> List[InferenceRequest]:
     """
     Convert OpenAI embedding request to internal format(s)
@@ -308,7 +331,7 @@ def internal_to_openai_embedding(
     embedding_data = [
         EmbeddingData(
             object="embedding",
-            embedding=resp.embedding or [],
+            embedding=_embedding_to_list(resp.embedding),
             index=i
         )
         for i, resp in enumerate(responses)
@@ -335,7 +358,7 @@ def internal_to_ollama_embedding(
     from src.api.schemas import OllamaEmbeddingResponse
     
     return OllamaEmbeddingResponse(
-        embedding=response.embedding or [],
+        embedding=_embedding_to_list(response.embedding),
         model=model_name,
         created_at=datetime.now().isoformat(),
         total_duration=int(response.time_ms * 1_000_000),  # ms to ns
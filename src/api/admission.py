@@ -0,0 +1,88 @@
+"""
+Admission helpers shared by the OpenAI, Ollama and vector routes.
+
+They map a request onto the BatchScheduler's fair-queuing inputs (tenant,
+priority class, deadline) and turn scheduler refusals into HTTP errors:
+429 when a request is refused up front, 504 when its deadline passed while
+it waited. Both carry Retry-After.
+"""
+import hashlib
+import time
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from models.batch_scheduler import AdmissionError, DeadlineExceededError
+from models.fair_queue import PRIORITY_CLASSES
+from config.settings import inference_config
+
+
+def request_tenant(http_request: Optional[Request], user: Optional[str] = None) -> str:
+    """
+    Fair-queuing key for a request: the API key (hashed, so keys never show
+    up in /v1/queue), else the OpenAI ``user`` field, else the client address.
+    """
+    if http_request is not None:
+        auth = http_request.headers.get("authorization", "")
+        if auth.lower().startswith("bearer ") and auth[7:].strip():
+            return "key-" + hashlib.sha256(auth[7:].strip().encode("utf-8")).hexdigest()[:12]
+    if user:
+        return user
+    if http_request is not None and http_request.client is not None:
+        return http_request.client.host
+    return "anonymous"
+
+
+def request_priority(http_request: Optional[Request], priority: Optional[str] = None) -> Optional[str]:
+    """Scheduling class from the request body, else the X-Priority header"""
+    if priority is None and http_request is not None:
+        priority = http_request.headers.get("x-priority")
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown priority '{priority}', expected one of {', '.join(PRIORITY_CLASSES)}"
+        )
+    return priority
+
+
+def request_deadline(http_request: Optional[Request], timeout: Optional[float] = None) -> Optional[float]:
+    """
+    ``time.monotonic()`` deadline for getting an NPU slot, from the timeout
+    field, else the X-Request-Timeout header, else scheduler.default_timeout_s
+    """
+    if timeout is None and http_request is not None:
+        header = http_request.headers.get("x-request-timeout")
+        if header:
+            try:
+                timeout = float(header)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid X-Request-Timeout header: {header!r}")
+    if timeout is None:
+        timeout = inference_config.get('scheduler', {}).get('default_timeout_s', 0) or None
+    if timeout is None:
+        return None
+    return time.monotonic() + timeout
+
+
+def admission_http_error(e: AdmissionError) -> HTTPException:
+    """
+    429 for a request refused up front, 504 for one whose deadline passed
+    while it waited; both carry Retry-After
+    """
+    status_code = 504 if isinstance(e, DeadlineExceededError) else 429
+    return HTTPException(status_code=status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def check_admission(current_model, deadline: Optional[float], priority: Optional[str] = None):
+    """
+    Refuse a request before a stream is opened, so the client gets a real
+    429 instead of an error event inside a 200 response; only work of the
+    same or a higher priority class counts against it
+    """
+    scheduler = getattr(current_model, 'scheduler', None)
+    if scheduler is None:
+        return
+    try:
+        scheduler.check_admission(deadline, priority)
+    except AdmissionError as e:
+        raise admission_http_error(e)
@@ -0,0 +1,67 @@
+"""
+Client-disconnect handling for generation endpoints.
+
+Generation runs as an asyncio task on the model's BatchScheduler. When the
+HTTP client goes away, the task is cancelled; RKLLMModel.generate_async()
+turns that cancellation into ``GenerationSession.request_stop("cancelled")``,
+which aborts the runtime and frees the batch slot instead of decoding tokens
+nobody will read.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+# nginx convention for "client closed request"; never reaches the client
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def cancel_task(task: Optional[asyncio.Task]):
+    """Cancel a generation task and wait until it has unwound"""
+    if task is None or task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.debug(f"Cancelled task finished with error: {e}")
+
+
+async def run_until_disconnect(
+    http_request: Optional[Request],
+    awaitable: Awaitable[Any],
+    poll_interval: float = 0.1
+) -> Any:
+    """
+    Await a generation while watching the HTTP connection.
+
+    Args:
+        http_request: Incoming request to watch (None disables the watch)
+        awaitable: Generation coroutine, e.g. ``model.generate_async(...)``
+        poll_interval: Seconds between disconnect checks
+
+    Returns:
+        Result of the awaitable
+
+    Raises:
+        HTTPException: 499 if the client disconnected before completion
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if http_request is not None and await http_request.is_disconnected():
+                logger.warning("🔌 Client disconnected, cancelling generation")
+                await cancel_task(task)
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    except asyncio.CancelledError:
+        # Handler itself was cancelled (server shutdown / ASGI disconnect)
+        await cancel_task(task)
+        raise
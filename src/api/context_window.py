@@ -0,0 +1,107 @@
+"""
+Context-window fitting shared by the OpenAI and Ollama chat routes.
+
+Chats that would overflow the model's context window lose their oldest
+turns (or have them compacted into a digest) before the prompt is
+formatted; see ContextPlanner. Each route passes its own prompt formatter,
+so token counts match the prompt it actually sends.
+"""
+import logging
+from enum import Enum
+from typing import Callable
+
+from models.tokenizer_service import TokenizerService
+from models.context_planner import ContextPlanner, build_digest
+from config.settings import inference_config
+
+logger = logging.getLogger(__name__)
+
+
+def get_tokenizer_service(current_model) -> TokenizerService:
+    """The model's tokenizer service, or an estimate-only one (e.g. mock models)"""
+    service = getattr(current_model, 'tokenizer_service', None)
+    return service if service is not None else _ESTIMATOR
+
+
+_ESTIMATOR = TokenizerService()
+
+
+def message_role(msg) -> str:
+    role = msg.role if hasattr(msg, 'role') else msg.get('role', 'user')
+    # MessageRole members format as "MessageRole.user" in f-strings
+    return role.value if isinstance(role, Enum) else role
+
+
+def message_text(msg) -> str:
+    """Text of a chat message, ignoring image parts"""
+    content = msg.content if hasattr(msg, 'content') else msg.get('content', '')
+    if not isinstance(content, list):
+        return content or ""
+    parts = []
+    for part in content:
+        if hasattr(part, 'type') and part.type == 'text':
+            parts.append(part.text)
+        elif isinstance(part, dict) and part.get('type') == 'text':
+            parts.append(part.get('text', ''))
+    return "".join(parts)
+
+
+async def fit_chat_to_context(
+    current_model,
+    messages: list,
+    max_tokens: int,
+    format_prompt: Callable[..., str]
+) -> list:
+    """
+    Drop or compact the oldest turns of a chat that would overflow the
+    model's context window (see ContextPlanner). System messages at the
+    start and the latest message are always kept.
+
+    Args:
+        current_model: Loaded model (max_context_len, tokenizer_service)
+        messages: Chat messages
+        max_tokens: Tokens to leave room for after the prompt
+        format_prompt: format_prompt(messages, add_generation_prompt=...) of
+            the route, used to count each message's tokens
+
+    Returns:
+        The messages to format, unchanged if the chat fits. A digest of the
+        dropped turns is a ``{"role": "system", "content": ...}`` dict.
+    """
+    ctx_cfg = inference_config.get('context_window', {})
+    context_size = getattr(current_model, 'max_context_len', 0)
+    if not ctx_cfg.get('enabled', True) or not context_size or len(messages) < 2:
+        return messages
+
+    service = get_tokenizer_service(current_model)
+    formatted = [format_prompt([msg], add_generation_prompt=False) for msg in messages]
+    counts = await service.count_many_async(formatted + [format_prompt([])])
+
+    planner = ContextPlanner(
+        context_size,
+        strategy=ctx_cfg.get('strategy', 'compact'),
+        block_fraction=ctx_cfg.get('block_fraction', 0.25),
+        digest_tokens=ctx_cfg.get('digest_tokens', 256),
+        reserve_tokens=ctx_cfg.get('reserve_tokens', 16)
+    )
+    roles = [message_role(msg) for msg in messages]
+    plan = planner.plan(roles, counts[:-1], max_tokens, generation_prompt_tokens=counts[-1])
+    if not plan.truncated:
+        return messages
+
+    n_system = plan.dropped[0]  # Pinned leading system messages
+    fitted = [messages[i] for i in plan.keep[:n_system]]
+    if plan.digest_tokens:
+        # The digest's own wrapper is covered by reserve_tokens
+        digest = build_digest(
+            [(roles[i], message_text(messages[i])) for i in plan.dropped],
+            plan.digest_tokens,
+            service.count
+        )
+        if digest:
+            fitted.append({"role": "system", "content": digest})
+    fitted.extend(messages[i] for i in plan.keep[n_system:])
+
+    logger.info(f"✂️  Context window: dropped {len(plan.dropped)} of {len(messages)} messages "
+                f"({plan.prompt_tokens}/{plan.budget} tokens kept, strategy={planner.strategy})")
+    return fitted
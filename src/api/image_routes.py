@@ -1,12 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from typing import Optional, List, Literal, Dict
 import time
 import base64
 import io
 import os
 import logging
 from models.model_manager import ModelManager
+from models.inference_types import RequestTiming
 from config.settings import Settings
 
 router = APIRouter()
@@ -34,6 +35,7 @@ class ImageObject(BaseModel):
 class ImageGenerationResponse(BaseModel):
     created: int
     data: List[ImageObject]
+    timing: Optional[Dict[str, float]] = None  # Per-stage latency breakdown in ms
 
 # Dependency to get ModelManager (singleton)
 def get_model_manager():
@@ -43,12 +45,14 @@ def get_model_manager():
 @router.post("/images/generations", response_model=ImageGenerationResponse)
 async def generate_image(
     request: ImageGenerationRequest,
+    http_response: Response,
     manager: ModelManager = Depends(get_model_manager)
 ):
     """
     Generate images using Stable Diffusion on NPU.
     Compatible with OpenAI API.
     """
+    timing = RequestTiming()
     logger.info(f"Image generation request: {request.prompt}")
     
     if request.n > 1:
@@ -64,12 +68,13 @@ async def generate_image(
              raise HTTPException(status_code=503, detail="Stable Diffusion model not available")
 
         # Generate
-        image = await sd_model.generate(
-            prompt=request.prompt,
-            num_inference_steps=request.num_inference_steps,
-            guidance_scale=request.guidance_scale,
-            seed=request.seed
-        )
+        with timing.measure('image_generate_ms'):
+            image = await sd_model.generate(
+                prompt=request.prompt,
+                num_inference_steps=request.num_inference_steps,
+                guidance_scale=request.guidance_scale,
+                seed=request.seed
+            )
         
         # Save image to SDimages folder
         sd_images_dir = "SDimages"
@@ -96,9 +101,12 @@ async def generate_image(
             url = f"/SDimages/{filename}"
             response_data.append(ImageObject(url=url, revised_prompt=request.prompt))
 
+        timing.finish()
+        http_response.headers["Server-Timing"] = timing.server_timing()
         return ImageGenerationResponse(
             created=int(time.time()),
-            data=response_data
+            data=response_data,
+            timing=timing.to_dict()
         )
 
     except Exception as e:
@@ -0,0 +1,66 @@
+"""
+Prometheus Metrics Route
+GET /metrics in the Prometheus text exposition format
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+import logging
+
+from models.model_manager import model_manager
+from utils.metrics import HTTP_REQUESTS, REGISTRY, collect_model_stats, current_endpoint, endpoint_for_path
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Metrics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus scrape endpoint
+
+    Endpoint: GET /metrics
+    """
+    current_model = model_manager.get_current_model()
+    if current_model is not None:
+        try:
+            collect_model_stats(current_model)
+        except Exception as e:
+            # A broken stats provider must not take the whole scrape down
+            logger.warning(f"Failed to collect model metrics: {e}")
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """
+    Counts HTTP requests by API surface and status, and tags the request
+    context with its endpoint label for the latency histograms.
+
+    Pure ASGI (not BaseHTTPMiddleware) so streaming responses pass through
+    untouched and the context variable is visible to the route handlers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = endpoint_for_path(scope["path"])
+        token = current_endpoint.set(endpoint)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS.inc(endpoint=endpoint, status=str(status["code"]))
+            current_endpoint.reset(token)
@@ -7,20 +7,33 @@ same underlying RKLLM model and queue as OpenAI routes.
 All requests are translated to internal format, queued with OpenAI
 requests, and responses are translated back to Ollama format.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from typing import Optional
 from src.api.schemas import (
     OllamaGenerateRequest, OllamaGenerateResponse,
     OllamaChatRequest, OllamaChatResponse,
-    OllamaEmbeddingRequest, OllamaEmbeddingResponse
+    OllamaEmbeddingRequest, OllamaEmbeddingResponse,
+    ChatMessage
 )
 from src.api.adapters import (
     ollama_generate_to_internal,
     ollama_chat_to_internal,
+    format_ollama_chat_prompt,
     internal_to_ollama_generate,
     internal_to_ollama_chat
 )
-from src.models.inference_types import InferenceResponse
+from src.models.inference_types import InferenceResponse, RequestTiming
+from src.api.cancellation import run_until_disconnect
+from src.api.context_window import fit_chat_to_context
+# Same module paths as RKLLMModel, so the scheduler's exceptions match
+from api.admission import (
+    request_tenant,
+    request_priority,
+    request_deadline,
+    admission_http_error,
+    check_admission
+)
+from models.batch_scheduler import ContextLengthError, AdmissionError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -98,7 +111,7 @@ async def ensure_model_loaded(preferred_model: Optional[str] = None):
 
 
 @router.post("/generate", response_model=OllamaGenerateResponse)
-async def ollama_generate(request: OllamaGenerateRequest):
+async def ollama_generate(request: OllamaGenerateRequest, http_request: Request, http_response: Response):
     """
     Ollama-compatible text generation endpoint
     
@@ -115,29 +128,40 @@ async def ollama_generate(request: OllamaGenerateRequest):
     """
     from src.main import model_manager
     
+    timing = RequestTiming()
     logger.info(f"Ollama generate request: {request.prompt[:50]}...")
     
     # Ensure model is loaded (auto-load if needed)
     await ensure_model_loaded(preferred_model=request.model)
+    tenant = request_tenant(http_request)
+    priority = request_priority(http_request)
+    deadline = request_deadline(http_request)
     
     # Convert to internal format
-    internal_req = ollama_generate_to_internal(request)
+    with timing.measure('template_ms'):
+        internal_req = ollama_generate_to_internal(request)
     
     logger.info(f"Ollama params: max_tokens={internal_req.max_tokens}, temp={internal_req.temperature}, prompt_len={len(internal_req.prompt)}")
     
     # Get model and generate (uses shared queue with OpenAI!)
     model = model_manager.get_current_model()
+    check_admission(model, deadline, priority)
     
     try:
         # Call model's async generate (same queue as OpenAI routes)
-        text, stats = await model.generate_async(
+        text, stats = await run_until_disconnect(http_request, model.generate_async(
             prompt=internal_req.prompt,
             max_new_tokens=internal_req.max_tokens,
             temperature=internal_req.temperature,
             top_p=internal_req.top_p,
             top_k=internal_req.top_k,
-            repeat_penalty=internal_req.repeat_penalty
-        )
+            repeat_penalty=internal_req.repeat_penalty,
+            stop=internal_req.stop,
+            tenant=tenant,
+            priority=priority,
+            deadline=deadline,
+            timing=timing
+        ))
         
         # Build internal response
         internal_resp = InferenceResponse(
@@ -147,19 +171,27 @@ async def ollama_generate(request: OllamaGenerateRequest):
             prefill_time_ms=stats.get('prefill_time_ms', 0.0) if stats else 0.0,
             generate_tokens=stats.get('generate_tokens', 0) if stats else 0,
             generate_time_ms=stats.get('generate_time_ms', 0.0) if stats else 0.0,
-            request_id=internal_req.request_id
+            request_id=internal_req.request_id,
+            timing=timing.finish()
         )
+        http_response.headers["Server-Timing"] = timing.server_timing()
         
         # Convert to Ollama format
         return internal_to_ollama_generate(internal_resp, request.model)
         
+    except HTTPException:
+        raise
+    except ContextLengthError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionError as e:
+        raise admission_http_error(e)
     except Exception as e:
         logger.error(f"Error in Ollama generate: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/chat", response_model=OllamaChatResponse)
-async def ollama_chat(request: OllamaChatRequest):
+async def ollama_chat(request: OllamaChatRequest, http_request: Request, http_response: Response):
     """
     Ollama-compatible chat endpoint
     
@@ -177,27 +209,44 @@ async def ollama_chat(request: OllamaChatRequest):
     """
     from src.main import model_manager
     
+    timing = RequestTiming()
     logger.info(f"Ollama chat request: {len(request.messages)} messages")
     
     # Ensure model is loaded (auto-load if needed)
     await ensure_model_loaded(preferred_model=request.model)
-    
-    # Convert to internal format
-    internal_req = ollama_chat_to_internal(request)
+    tenant = request_tenant(http_request)
+    priority = request_priority(http_request)
+    deadline = request_deadline(http_request)
     
     # Get model and generate
     model = model_manager.get_current_model()
+    check_admission(model, deadline, priority)
+    
+    # Convert to internal format, trimming history that would overflow the context
+    # num_predict <= 0 means "model default", which generation treats as 512
+    num_predict = (request.options or {}).get("num_predict")
+    reserve = num_predict if num_predict and num_predict > 0 else 512
+    with timing.measure('template_ms'):
+        messages = await fit_chat_to_context(model, request.messages, reserve, format_ollama_chat_prompt)
+        if messages is not request.messages:
+            request = request.model_copy(update={"messages": [ChatMessage.model_validate(m) for m in messages]})
+        internal_req = ollama_chat_to_internal(request)
     
     try:
         # Call model's async generate (same queue!)
-        text, stats = await model.generate_async(
+        text, stats = await run_until_disconnect(http_request, model.generate_async(
             prompt=internal_req.prompt,
             max_new_tokens=internal_req.max_tokens,
             temperature=internal_req.temperature,
             top_p=internal_req.top_p,
             top_k=internal_req.top_k,
-            repeat_penalty=internal_req.repeat_penalty
-        )
+            repeat_penalty=internal_req.repeat_penalty,
+            stop=internal_req.stop,
+            tenant=tenant,
+            priority=priority,
+            deadline=deadline,
+            timing=timing
+        ))
         
         # Build internal response
         internal_resp = InferenceResponse(
@@ -207,12 +256,20 @@ async def ollama_chat(request: OllamaChatRequest):
             prefill_time_ms=stats.get('prefill_time_ms', 0.0) if stats else 0.0,
             generate_tokens=stats.get('generate_tokens', 0) if stats else 0,
             generate_time_ms=stats.get('generate_time_ms', 0.0) if stats else 0.0,
-            request_id=internal_req.request_id
+            request_id=internal_req.request_id,
+            timing=timing.finish()
         )
+        http_response.headers["Server-Timing"] = timing.server_timing()
         
         # Convert to Ollama format
         return internal_to_ollama_chat(internal_resp, request.model)
         
+    except HTTPException:
+        raise
+    except ContextLengthError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionError as e:
+        raise admission_http_error(e)
     except Exception as e:
         logger.error(f"Error in Ollama chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -254,7 +311,7 @@ async def ollama_list_models():
 
 @router.post("/embed", response_model=OllamaEmbeddingResponse)
 @router.post("/embeddings", response_model=OllamaEmbeddingResponse)
-async def ollama_embeddings(request: OllamaEmbeddingRequest):
+async def ollama_embeddings(request: OllamaEmbeddingRequest, http_request: Request):
     """
     Ollama-compatible embeddings endpoint
     
@@ -308,7 +365,10 @@ async def ollama_embeddings(request: OllamaEmbeddingRequest):
             text=internal_req.prompt,
             inference_config=inference_config,
             pooling_strategy=pooling_strategy,
-            normalize=normalize
+            normalize=normalize,
+            tenant=request_tenant(http_request),
+            priority=request_priority(http_request),
+            deadline=request_deadline(http_request)
         )
         
         # Create internal response
@@ -328,6 +388,8 @@ async def ollama_embeddings(request: OllamaEmbeddingRequest):
         
     except HTTPException:
         raise
+    except AdmissionError as e:
+        raise admission_http_error(e)
     except Exception as e:
         logger.error(f"Error in Ollama embeddings: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -2,7 +2,7 @@
 OpenAI-compatible API endpoints
 Implements /v1/chat/completions and /v1/models
 """
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse, JSONResponse
 import time
 import uuid
@@ -12,7 +12,6 @@ import asyncio
 from typing import AsyncGenerator, Optional, List
 import json
 import base64
-import requests
 
 from api.schemas import (
     ChatCompletionRequest,
@@ -30,9 +29,30 @@ from api.schemas import (
     CompletionChoice,
     TextCompletionChunk,
     EmbeddingRequest,
-    EmbeddingResponse
+    EmbeddingResponse,
+    RerankRequest,
+    RerankResponse,
+    RerankResult,
+    RerankUsage,
+    TokenizeRequest,
+    TokenizeResponse,
+    DetokenizeRequest,
+    DetokenizeResponse,
+    QueuePolicyRequest
+)
+from api.cancellation import cancel_task, run_until_disconnect
+from api.context_window import fit_chat_to_context, get_tokenizer_service, message_role
+from api.admission import (
+    request_tenant,
+    request_priority,
+    request_deadline,
+    admission_http_error,
+    check_admission
 )
 from models.model_manager import model_manager
+from models.batch_scheduler import ContextLengthError, AdmissionError
+from models.inference_types import RequestTiming
+from utils.image_fetcher import ImageFetcher, ImageFetchError, last_user_image_urls
 from config.settings import settings, inference_config
 
 logger = logging.getLogger(__name__)
@@ -108,9 +128,14 @@ async def ensure_model_loaded(preferred_model: Optional[str] = None):
     return current_model
 
 
-def format_chat_prompt(messages: list, image_data: bytes = None) -> str:
+def format_chat_prompt(messages: list, image_tag: str = "<image>", add_generation_prompt: bool = True) -> str:
     """
     Format chat messages into a single prompt string using config template
+    
+    Args:
+        messages: Chat messages
+        image_tag: Placeholder for one image (see VisionProfile.image_tag)
+        add_generation_prompt: Append the assistant trigger (False for prefixes)
     """
     chat_tmpl = inference_config.get('chat_template', {})
     user_prefix = chat_tmpl.get('user_prefix', 'User: ')
@@ -120,30 +145,33 @@ def format_chat_prompt(messages: list, image_data: bytes = None) -> str:
     
     prompt_parts = []
     
-    for msg in messages:
+    # Only the last user message's images are encoded (see ImageFetcher.load)
+    last_user = max((i for i, msg in enumerate(messages) if message_role(msg) == 'user'), default=-1)
+    
+    for index, msg in enumerate(messages):
         role = msg.role if hasattr(msg, 'role') else msg.get('role', 'user')
         content = msg.content if hasattr(msg, 'content') else msg.get('content', '')
         
         # Handle multimodal content (list of dicts)
         if isinstance(content, list):
             text_content = ""
-            has_image = False
+            n_images = 0
             for part in content:
                 if hasattr(part, 'type') and part.type == 'text':
                     text_content += part.text
                 elif isinstance(part, dict) and part.get('type') == 'text':
                     text_content += part.get('text', '')
                 elif hasattr(part, 'type') and part.type == 'image_url':
-                    has_image = True
+                    n_images += 1
                 elif isinstance(part, dict) and part.get('type') == 'image_url':
-                    has_image = True
+                    n_images += 1
             content = text_content
             
-            # Inject vision tokens if this message had an image
-            if has_image and is_chatml:
+            # Inject one vision tag per image sent with this request
+            if n_images and is_chatml and index == last_user:
                 # RKLLM runtime requires <image> tag for multimodal input
                 # Based on C++ demo: "<image>What is in the image?"
-                content = f"<image>{content}"
+                content = f"{image_tag * n_images}{content}"
         
         if is_chatml:
             # Robust ChatML formatting
@@ -163,68 +191,172 @@ def format_chat_prompt(messages: list, image_data: bytes = None) -> str:
                 prompt_parts.append(f"Assistant: {content}\n")
     
     # Add trigger for assistant response
-    if is_chatml:
-        prompt_parts.append("<|im_start|>assistant\n")
-    else:
-        prompt_parts.append("Assistant:")
+    if add_generation_prompt:
+        prompt_parts.append("<|im_start|>assistant\n" if is_chatml else "Assistant:")
     
     return "".join(prompt_parts)
 
 
-def extract_image_data(messages: list) -> Optional[bytes]:
+def format_chat_prefix(messages: list) -> str:
     """
-    Extract image data from the last user message.
-    Supports base64 or URL.
+    Format the leading system messages - the part of the prompt shared by
+    every request that uses the same system prompt.
+    
+    Returns:
+        Formatted prefix of format_chat_prompt(messages), or "" if none
     """
-    for msg in reversed(messages):
+    leading = []
+    for msg in messages:
         role = msg.role if hasattr(msg, 'role') else msg.get('role', 'user')
-        if role == 'user':
-            content = msg.content if hasattr(msg, 'content') else msg.get('content', '')
-            if isinstance(content, list):
-                for part in content:
-                    # Handle dict (from JSON)
-                    if isinstance(part, dict) and part.get('type') == 'image_url':
-                        image_url = part.get('image_url', {}).get('url', '')
-                        if image_url.startswith('data:image'):
-                            # Base64
-                            try:
-                                header, encoded = image_url.split(",", 1)
-                                return base64.b64decode(encoded)
-                            except Exception as e:
-                                logger.error(f"Failed to decode base64 image: {e}")
-                                return None
-                        elif image_url.startswith('http'):
-                            # URL
-                            try:
-                                resp = requests.get(image_url, timeout=10)
-                                resp.raise_for_status()
-                                return resp.content
-                            except Exception as e:
-                                logger.error(f"Failed to download image: {e}")
-                                return None
-                    # Handle Pydantic model
-                    elif hasattr(part, 'type') and part.type == 'image_url':
-                         image_url = part.image_url.url
-                         if image_url.startswith('data:image'):
-                            try:
-                                header, encoded = image_url.split(",", 1)
-                                return base64.b64decode(encoded)
-                            except Exception as e:
-                                logger.error(f"Failed to decode base64 image: {e}")
-                                return None
-                         elif image_url.startswith('http'):
-                            try:
-                                resp = requests.get(image_url, timeout=10)
-                                resp.raise_for_status()
-                                return resp.content
-                            except Exception as e:
-                                logger.error(f"Failed to download image: {e}")
-                                return None
-    return None
+        if role != "system":
+            break
+        leading.append(msg)
+    if not leading or len(leading) == len(messages):
+        return ""
+    return format_chat_prompt(leading, add_generation_prompt=False)
+
+
+async def count_prompt_tokens(current_model, prompt: str) -> int:
+    """
+    Count prompt tokens off the event loop.
+    
+    With a real tokenizer, prompts that leave no room to generate are
+    rejected with 400 before they reach the NPU.
+    """
+    service = get_tokenizer_service(current_model)
+    tokens = await service.count_async(prompt)
+    max_context_len = getattr(current_model, 'max_context_len', 0)
+    if service.available and max_context_len and tokens >= max_context_len:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Prompt is {tokens} tokens, which exceeds the model's max_context_len of {max_context_len}"
+        )
+    return tokens
+
+
+async def count_completion_tokens(current_model, text: str, perf_stats: Optional[dict]) -> int:
+    """Generated tokens as reported by the runtime, else counted from the text"""
+    if perf_stats and perf_stats.get('generate_tokens'):
+        return perf_stats['generate_tokens']
+    return await get_tokenizer_service(current_model).count_async(text)
+
+
+def format_sse(chunk) -> str:
+    """
+    SSE frame for a streamed chunk. Plain strings are queue status updates
+    and go out as SSE comments, which OpenAI clients ignore.
+    """
+    if isinstance(chunk, str):
+        return chunk
+    return f"data: {chunk.model_dump_json()}\n\n"
+
+
+def overloaded_event(e: AdmissionError) -> str:
+    """SSE error event for a streamed request dropped by admission control"""
+    error_data = {"error": {"message": str(e), "type": "overloaded", "retry_after": e.retry_after}}
+    return f"data: {json.dumps(error_data)}\n\n"
+
+
+def queue_status_comment(info: dict) -> str:
+    """SSE comment reporting the request's queue position while it waits"""
+    return f": queue position={info['position']} estimated_wait_s={info['estimated_wait_s']}\n\n"
+
+
+def schedule_auto_cache(current_model, prefix: Optional[str]):
+    """
+    Build the automatic binary cache for a prompt prefix in the background
+    once it has been seen often enough (see PromptCacheManager.claim_auto_cache).
+    """
+    if not prefix:
+        return
+    cache_mgr = current_model.cache_manager
+    claim = cache_mgr.claim_auto_cache(current_model.model_name, prefix)
+    if claim is None:
+        return
+    cache_name, cache_path = claim
+    
+    async def create():
+        success, ttft_ms = False, 0.0
+        try:
+            logger.info(f"🔥 Creating automatic prompt cache {cache_name} ({len(prefix)} chars)")
+            _, perf_stats = await current_model.generate_async(
+                prompt=prefix,
+                max_new_tokens=1,  # Minimal generation, we just need the prefill cache
+                binary_cache_path=cache_path,
+                save_binary_cache=True,
+                tenant="system",
+                priority="background"
+            )
+            success = True
+            ttft_ms = perf_stats.get('prefill_time_ms', 0) if perf_stats else 0.0
+        except Exception as e:
+            logger.error(f"Automatic prompt cache {cache_name} failed: {e}")
+        finally:
+            cache_mgr.complete_auto_cache(current_model.model_name, cache_name, prefix, success, ttft_ms)
+    
+    asyncio.create_task(create())
+
+
+def get_image_fetcher() -> ImageFetcher:
+    """Shared image fetcher (one pooled HTTP client for all requests)"""
+    global _image_fetcher
+    if _image_fetcher is None:
+        fetch_cfg = inference_config.get('image_fetch', {})
+        _image_fetcher = ImageFetcher(
+            max_bytes=int(fetch_cfg.get('max_mb', 20) * 1024 * 1024),
+            timeout=fetch_cfg.get('timeout_s', 10.0),
+            max_connections=fetch_cfg.get('max_connections', 8),
+            max_workers=fetch_cfg.get('decode_workers', 2)
+        )
+    return _image_fetcher
+
+
+_image_fetcher: Optional[ImageFetcher] = None
+
+
+async def close_image_fetcher():
+    """Close the shared HTTP client (server shutdown)"""
+    global _image_fetcher
+    if _image_fetcher is not None:
+        await _image_fetcher.aclose()
+        _image_fetcher = None
+
+
+def check_image_count(current_model, messages: list) -> int:
+    """
+    Number of images the request sends to the vision encoder.
+    
+    Raises:
+        ImageFetchError: The model has no vision encoder or too many images were sent
+    """
+    n_images = len(last_user_image_urls(messages))
+    if not n_images:
+        return 0
+    profile = getattr(current_model, 'vision_profile', None)
+    if profile is None:
+        raise ImageFetchError(f"Model '{model_manager.get_loaded_model_name()}' does not accept image input")
+    if n_images > profile.max_images:
+        raise ImageFetchError(f"{n_images} images sent, at most {profile.max_images} per request")
+    return n_images
+
+
+async def extract_image_data(current_model, messages: list) -> list:
+    """
+    Load the images of the last user message (base64 data URLs or http(s) URLs).
+    
+    Downloads and decoding run off the event loop; see ImageFetcher.
+    
+    Raises:
+        ImageFetchError: An image could not be downloaded or decoded
+    """
+    profile = getattr(current_model, 'vision_profile', None)
+    if profile is None:
+        return []
+    return await get_image_fetcher().load(messages, image_size=profile.image_size)
 
 
 @router.post("/chat/completions", response_model=ChatCompletionResponse)
-async def create_chat_completion(request: ChatCompletionRequest):
+async def create_chat_completion(request: ChatCompletionRequest, http_request: Request, http_response: Response):
     """
     Create a chat completion (OpenAI compatible)
     
@@ -232,19 +364,43 @@ async def create_chat_completion(request: ChatCompletionRequest):
     
     Supports binary prompt caching for 50-70% TTFT reduction.
     Use 'use_cache' parameter to specify which binary cache to load.
+    
+    If the client disconnects mid-generation the request is cancelled and
+    its NPU batch slot is released.
+    
+    The per-stage timing breakdown is returned in usage.timing and the
+    Server-Timing header (streams: pre-generation stages only in the header).
     """
+    timing = RequestTiming()
     try:
         logger.info(f"Chat completion request for model: {request.model}")
         logger.debug(f"Messages: {len(request.messages)}, Stream: {request.stream}")
         
         # Ensure model is loaded
         current_model = await ensure_model_loaded(preferred_model=request.model)
+        tenant = request_tenant(http_request, request.user)
+        priority = request_priority(http_request, request.priority)
+        deadline = request_deadline(http_request, request.timeout)
+        check_admission(current_model, deadline, priority)
+        
+        # Image embeddings take context space next to the text
+        n_images = check_image_count(current_model, request.messages)
+        profile = getattr(current_model, 'vision_profile', None)
+        image_tokens = n_images * profile.image_tokens if n_images else 0
+        
+        # Format messages into prompt, trimming history that would overflow the context
+        # max_tokens <= 0 means "model default", which generation treats as 512
+        reserve = request.max_tokens if request.max_tokens and request.max_tokens > 0 else 512
+        with timing.measure('template_ms'):
+            messages = await fit_chat_to_context(
+                current_model, request.messages, reserve + image_tokens, format_chat_prompt
+            )
+            prompt = format_chat_prompt(messages, image_tag=profile.image_tag if profile else "<image>")
+            prompt_tokens = await count_prompt_tokens(current_model, prompt) + image_tokens
         
-        # Format messages into prompt
-        prompt = format_chat_prompt(request.messages)
-        
-        # Extract image data if present
-        image_data = extract_image_data(request.messages)
+        # Fetch and prepare the images concurrently, off the event loop
+        with timing.measure('image_fetch_ms'):
+            images = await extract_image_data(current_model, request.messages)
         
         # Setup binary cache if requested
         binary_cache_path = None
@@ -253,11 +409,15 @@ async def create_chat_completion(request: ChatCompletionRequest):
             cache_mgr = current_model.cache_manager
             if cache_mgr.cache_exists(request.model, request.use_cache):
                 binary_cache_path = cache_mgr.get_cache_path(request.model, request.use_cache)
+                cache_mgr.record_hit(request.model, request.use_cache)
                 cache_used = True
                 logger.info(f"🔥 Loading binary cache: {request.use_cache}")
             else:
                 logger.warning(f"Cache '{request.use_cache}' not found, proceeding without cache")
         
+        # Without an explicit cache, repeated system prompts get one automatically
+        auto_prefix = None if request.use_cache else format_chat_prefix(request.messages)
+        
         # Generate completion ID and timestamp
         completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
         created_time = int(time.time())
@@ -271,13 +431,21 @@ async def create_chat_completion(request: ChatCompletionRequest):
                     completion_id=completion_id,
                     created_time=created_time,
                     binary_cache_path=binary_cache_path,
-                    image_data=image_data
+                    images=images,
+                    http_request=http_request,
+                    auto_prefix=auto_prefix,
+                    prompt_tokens=prompt_tokens,
+                    tenant=tenant,
+                    priority=priority,
+                    deadline=deadline,
+                    timing=timing
                 ),
-                media_type="text/event-stream"
+                media_type="text/event-stream",
+                headers={"Server-Timing": timing.server_timing()}
             )
         
         # Non-streaming response - use loaded model with async batching
-        generated_text, perf_stats = await current_model.generate_async(
+        generated_text, perf_stats = await run_until_disconnect(http_request, current_model.generate_async(
             prompt=prompt,
             max_new_tokens=request.max_tokens or 512,
             temperature=request.temperature or 0.8,
@@ -288,8 +456,15 @@ async def create_chat_completion(request: ChatCompletionRequest):
             binary_cache_path=binary_cache_path,
             save_binary_cache=False,  # Load, don't save
             stop=request.stop if isinstance(request.stop, list) else [request.stop] if request.stop else None,
-            image_data=image_data
-        )
+            images=images,
+            conversation_id=request.conversation_id or request.user,
+            auto_prefix=auto_prefix,
+            tenant=tenant,
+            priority=priority,
+            deadline=deadline,
+            timing=timing
+        ))
+        schedule_auto_cache(current_model, auto_prefix)
         
         # Log performance stats if available
         if perf_stats:
@@ -298,6 +473,10 @@ async def create_chat_completion(request: ChatCompletionRequest):
                        f"Tokens={perf_stats.get('generate_tokens', 0)}, "
                        f"Speed={perf_stats.get('generate_tokens', 0) / (perf_stats.get('generate_time_ms', 1) / 1000):.1f} tok/s")
         
+        completion_tokens = await count_completion_tokens(current_model, generated_text, perf_stats)
+        timing.finish()
+        http_response.headers["Server-Timing"] = timing.server_timing()
+        
         # Create response
         response = ChatCompletionResponse(
             id=completion_id,
@@ -314,16 +493,23 @@ async def create_chat_completion(request: ChatCompletionRequest):
                 )
             ],
             usage=Usage(
-                prompt_tokens=len(prompt.split()),  # Rough estimate
-                completion_tokens=len(generated_text.split()),  # Rough estimate
-                total_tokens=len(prompt.split()) + len(generated_text.split()),
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
                 cache_hit=cache_used,
-                cached_prompts=[request.use_cache] if cache_used else None
+                cached_prompts=[request.use_cache] if cache_used else None,
+                timing=timing.to_dict()
             )
         )
         
         return response
         
+    except HTTPException:
+        raise
+    except (ContextLengthError, ImageFetchError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionError as e:
+        raise admission_http_error(e)
     except Exception as e:
         logger.error(f"Error in chat completion: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -335,17 +521,33 @@ async def stream_chat_completion(
     completion_id: str,
     created_time: int,
     binary_cache_path: Optional[str] = None,
-    image_data: Optional[bytes] = None
+    images: Optional[list] = None,
+    http_request: Optional[Request] = None,
+    auto_prefix: Optional[str] = None,
+    prompt_tokens: int = 0,
+    tenant: Optional[str] = None,
+    priority: Optional[str] = None,
+    deadline: Optional[float] = None,
+    timing: Optional[RequestTiming] = None
 ) -> AsyncGenerator[str, None]:
     """
     Stream chat completion tokens
     
-    Yields SSE-formatted chunks
+    Yields SSE-formatted chunks. While the request waits for a batch slot,
+    its queue position and estimated wait are sent as SSE comments.
     
     Args:
         binary_cache_path: Path to binary cache file to load
-        image_data: Optional image data for multimodal inference
+        images: Images for multimodal inference (see extract_image_data)
+        http_request: Incoming request, watched for client disconnects
+        auto_prefix: Formatted system prefix eligible for automatic caching
+        tenant: Fair-queuing key
+        priority: Scheduling class
+        deadline: time.monotonic() by which the request must get a slot
+        timing: Stage timings so far, completed and sent in the final chunk's usage
     """
+    generation_task = None
+    timing = timing or RequestTiming()
     try:
         # Buffer for collecting generated text
         generated_text = ""
@@ -392,33 +594,48 @@ async def stream_chat_completion(
             binary_cache_path=binary_cache_path,
             save_binary_cache=False,  # Load, don't save
             stop=request.stop if isinstance(request.stop, list) else [request.stop] if request.stop else None,
-            image_data=image_data
+            images=images,
+            conversation_id=request.conversation_id or request.user,
+            auto_prefix=auto_prefix,
+            tenant=tenant,
+            priority=priority,
+            on_wait=lambda info: chunk_queue.put_nowait(queue_status_comment(info)),
+            deadline=deadline,
+            timing=timing
         ))
         
         # Consume queue while generation is running
         while not generation_task.done():
+            if http_request is not None and await http_request.is_disconnected():
+                logger.warning("🔌 Client disconnected from chat stream, cancelling generation")
+                await cancel_task(generation_task)
+                return
             try:
                 # Wait for next chunk with timeout to check task status
                 chunk = await asyncio.wait_for(chunk_queue.get(), timeout=0.05)
-                yield f"data: {chunk.model_dump_json()}\n\n"
+                yield format_sse(chunk)
             except asyncio.TimeoutError:
                 continue
         
         # Flush remaining items in queue
-        while not chunk_queue.empty():
-            chunk = await chunk_queue.get()
-            yield f"data: {chunk.model_dump_json()}\n\n"
+        with timing.measure('stream_flush_ms'):
+            while not chunk_queue.empty():
+                chunk = await chunk_queue.get()
+                yield format_sse(chunk)
             
         # Get result from task (to raise exceptions if any and get perf stats)
         _, perf_stats = await generation_task
+        schedule_auto_cache(current_model, auto_prefix)
         
         # Send final chunk with finish_reason and perf stats
+        completion_tokens = await count_completion_tokens(current_model, generated_text, perf_stats)
         usage_data = {
-            "prompt_tokens": len(prompt.split()),
-            "completion_tokens": len(generated_text.split()),
-            "total_tokens": len(prompt.split()) + len(generated_text.split()),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
             "cache_hit": binary_cache_path is not None,
-            "cached_prompts": [request.use_cache] if binary_cache_path else None
+            "cached_prompts": [request.use_cache] if binary_cache_path else None,
+            "timing": timing.finish().to_dict()
         }
         
         # Add RKLLM perf stats if available
@@ -446,6 +663,12 @@ async def stream_chat_completion(
         yield f"data: {final_chunk.model_dump_json()}\n\n"
         yield "data: [DONE]\n\n"
         
+    except asyncio.CancelledError:
+        logger.warning("Streaming chat completion cancelled; cancelling generation task")
+        await cancel_task(generation_task)
+        raise
+    except AdmissionError as e:
+        yield overloaded_event(e)
     except Exception as e:
         logger.error(f"Error in streaming: {e}", exc_info=True)
         error_data = {"error": {"message": str(e), "type": "internal_error"}}
@@ -453,7 +676,7 @@ async def stream_chat_completion(
 
 
 @router.post("/completions", response_model=CompletionResponse)
-async def create_completion(request: CompletionRequest):
+async def create_completion(request: CompletionRequest, http_request: Request, http_response: Response):
     """
     Create a text completion (OpenAI compatible)
     
@@ -462,12 +685,19 @@ async def create_completion(request: CompletionRequest):
     Simple one-shot completion without chat formatting.
     For multi-turn conversations, use /v1/chat/completions instead.
     """
+    timing = RequestTiming()
     try:
         logger.info(f"Text completion request for model: {request.model}")
         logger.debug(f"Prompt length: {len(request.prompt)}, Stream: {request.stream}")
         
         # Ensure model is loaded
         current_model = await ensure_model_loaded(preferred_model=request.model)
+        with timing.measure('template_ms'):
+            prompt_tokens = await count_prompt_tokens(current_model, request.prompt)
+        tenant = request_tenant(http_request, request.user)
+        priority = request_priority(http_request, request.priority)
+        deadline = request_deadline(http_request, request.timeout)
+        check_admission(current_model, deadline, priority)
         
         # Setup binary cache if requested
         binary_cache_path = None
@@ -476,6 +706,7 @@ async def create_completion(request: CompletionRequest):
             cache_mgr = current_model.cache_manager
             if cache_mgr.cache_exists(request.model, request.use_cache):
                 binary_cache_path = cache_mgr.get_cache_path(request.model, request.use_cache)
+                cache_mgr.record_hit(request.model, request.use_cache)
                 cache_used = True
                 logger.info(f"🔥 Loading binary cache: {request.use_cache}")
             else:
@@ -494,12 +725,19 @@ async def create_completion(request: CompletionRequest):
                     created_time=created_time,
                     binary_cache_path=binary_cache_path,
                     current_model=current_model,
+                    http_request=http_request,
+                    prompt_tokens=prompt_tokens,
+                    tenant=tenant,
+                    priority=priority,
+                    deadline=deadline,
+                    timing=timing,
                 ),
-                media_type="text/event-stream"
+                media_type="text/event-stream",
+                headers={"Server-Timing": timing.server_timing()}
             )
         
         # Non-streaming response
-        generated_text, perf_stats = await current_model.generate_async(
+        generated_text, perf_stats = await run_until_disconnect(http_request, current_model.generate_async(
             prompt=request.prompt,
             max_new_tokens=request.max_tokens or 512,
             temperature=request.temperature or 0.8,
@@ -507,8 +745,13 @@ async def create_completion(request: CompletionRequest):
             top_k=request.top_k or 20,
             repeat_penalty=request.repeat_penalty or 1.1,
             binary_cache_path=binary_cache_path,
-            save_binary_cache=False  # Load, don't save
-        )
+            save_binary_cache=False,  # Load, don't save
+            stop=request.stop if isinstance(request.stop, list) else [request.stop] if request.stop else None,
+            tenant=tenant,
+            priority=priority,
+            deadline=deadline,
+            timing=timing
+        ))
         
         # Log performance stats if available
         if perf_stats:
@@ -517,6 +760,10 @@ async def create_completion(request: CompletionRequest):
                        f"Tokens={perf_stats.get('generate_tokens', 0)}, "
                        f"Speed={perf_stats.get('generate_tokens', 0) / (perf_stats.get('generate_time_ms', 1) / 1000):.1f} tok/s")
         
+        completion_tokens = await count_completion_tokens(current_model, generated_text, perf_stats)
+        timing.finish()
+        http_response.headers["Server-Timing"] = timing.server_timing()
+        
         # Create response
         response = CompletionResponse(
             id=completion_id,
@@ -530,11 +777,12 @@ async def create_completion(request: CompletionRequest):
                 )
             ],
             usage=Usage(
-                prompt_tokens=len(request.prompt.split()),  # Rough estimate
-                completion_tokens=len(generated_text.split()),  # Rough estimate
-                total_tokens=len(request.prompt.split()) + len(generated_text.split()),
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
                 cache_hit=cache_used,
-                cached_prompts=[request.use_cache] if cache_used else None
+                cached_prompts=[request.use_cache] if cache_used else None,
+                timing=timing.to_dict()
             )
         )
         
@@ -542,6 +790,10 @@ async def create_completion(request: CompletionRequest):
         
     except HTTPException:
         raise
+    except ContextLengthError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionError as e:
+        raise admission_http_error(e)
     except Exception as e:
         logger.error(f"Error in text completion: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -553,14 +805,25 @@ async def stream_text_completion(
     created_time: int,
     binary_cache_path: Optional[str] = None,
     current_model=None,
+    http_request: Optional[Request] = None,
+    prompt_tokens: int = 0,
+    tenant: Optional[str] = None,
+    priority: Optional[str] = None,
+    deadline: Optional[float] = None,
+    timing: Optional[RequestTiming] = None,
 ) -> AsyncGenerator[str, None]:
     """
     Stream text completion tokens via SSE.
 
     Yields SSE-formatted chunks with ``object: "text_completion"`` and
     ``choices[].text`` fields, matching the OpenAI text completion streaming
-    specification.
+    specification. Generation is cancelled as soon as ``http_request``
+    reports that the client disconnected. Queue position updates are sent
+    as SSE comments while the request waits for a batch slot. The final
+    chunk's usage carries the request's stage timings.
     """
+    generation_task = None
+    timing = timing or RequestTiming()
     try:
         generated_text = ""
         chunk_queue: asyncio.Queue = asyncio.Queue()
@@ -605,30 +868,36 @@ async def stream_text_completion(
                 binary_cache_path=binary_cache_path,
                 save_binary_cache=False,
                 stop=request.stop if isinstance(request.stop, list) else [request.stop] if request.stop else None,
+                tenant=tenant,
+                priority=priority,
+                on_wait=lambda info: chunk_queue.put_nowait(queue_status_comment(info)),
+                deadline=deadline,
+                timing=timing,
             ))
 
             # Consume queue while generation is running
             while not generation_task.done():
+                if http_request is not None and await http_request.is_disconnected():
+                    logger.warning("🔌 Client disconnected from completion stream, cancelling generation")
+                    await cancel_task(generation_task)
+                    return
                 try:
                     chunk = await asyncio.wait_for(chunk_queue.get(), timeout=0.05)
-                    yield f"data: {chunk.model_dump_json()}\n\n"
+                    yield format_sse(chunk)
                 except asyncio.TimeoutError:
                     continue
 
             # Flush remaining items in queue
-            while not chunk_queue.empty():
-                chunk = await chunk_queue.get()
-                yield f"data: {chunk.model_dump_json()}\n\n"
+            with timing.measure('stream_flush_ms'):
+                while not chunk_queue.empty():
+                    chunk = await chunk_queue.get()
+                    yield format_sse(chunk)
 
             # Get result (raise exceptions if any and retrieve perf stats)
             _, perf_stats = await generation_task
         except asyncio.CancelledError:
             logger.warning("Streaming text completion cancelled; cancelling generation task")
-            generation_task.cancel()
-            try:
-                await generation_task
-            except asyncio.CancelledError:
-                pass
+            await cancel_task(generation_task)
             raise
 
         # Determine finish_reason: "length" if max_tokens was reached, else "stop"
@@ -638,12 +907,14 @@ async def stream_text_completion(
             finish_reason = "length"
 
         # Build usage data
+        completion_tokens = await count_completion_tokens(current_model, generated_text, perf_stats)
         usage_data = {
-            "prompt_tokens": len(request.prompt.split()),
-            "completion_tokens": len(generated_text.split()),
-            "total_tokens": len(request.prompt.split()) + len(generated_text.split()),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
             "cache_hit": binary_cache_path is not None,
             "cached_prompts": [request.use_cache] if binary_cache_path else None,
+            "timing": timing.finish().to_dict(),
         }
 
         # Final chunk with finish_reason and usage
@@ -663,6 +934,8 @@ async def stream_text_completion(
         yield f"data: {final_chunk.model_dump_json()}\n\n"
         yield "data: [DONE]\n\n"
 
+    except AdmissionError as e:
+        yield overloaded_event(e)
     except Exception as e:
         logger.error(f"Error in text completion streaming: {e}", exc_info=True)
         error_data = {"error": {"message": str(e), "type": "internal_error"}}
@@ -703,12 +976,57 @@ async def list_models():
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
+    health = {
         "status": "healthy",
         "model_loaded": model_manager.is_model_loaded(),
         "loaded_model": model_manager.get_loaded_model_name(),
         "timestamp": int(time.time())
     }
+    image_encoder = getattr(model_manager.get_current_model(), 'image_encoder', None)
+    if image_encoder is not None:
+        health["image_encoder"] = image_encoder.health()
+    if _image_fetcher is not None:
+        health["image_fetch"] = _image_fetcher.stats()
+    return health
+
+
+@router.get("/queue")
+async def queue_status():
+    """
+    Requests waiting for an NPU batch slot, in projected dispatch order
+    
+    Endpoint: GET /v1/queue
+    
+    Tenants are reported as the user field or a hash of the API key.
+    """
+    current_model = model_manager.get_current_model()
+    scheduler = getattr(current_model, 'scheduler', None)
+    if scheduler is None:
+        return {"loaded_model": None, "slots": None, "queue": []}
+    return {
+        "loaded_model": model_manager.get_loaded_model_name(),
+        "slots": scheduler.stats(),
+        "queue": scheduler.queue_snapshot()
+    }
+
+
+@router.post("/queue/policy")
+async def set_queue_policy(request: QueuePolicyRequest):
+    """
+    Switch the queue ordering of the loaded model at runtime
+    
+    Endpoint: POST /v1/queue/policy
+    
+    Waiting requests are re-ordered immediately. The setting lasts until the
+    model is reloaded; set scheduler.policy in inference_config to keep it.
+    """
+    current_model = model_manager.get_current_model()
+    scheduler = getattr(current_model, 'scheduler', None)
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="No model currently loaded")
+    previous = scheduler.policy
+    scheduler.set_policy(request.policy)
+    return {"policy": scheduler.policy, "previous": previous}
 
 
 # ============================================================================
@@ -716,7 +1034,7 @@ async def health_check():
 # ============================================================================
 
 @router.post("/embeddings", response_model=EmbeddingResponse)
-async def create_embeddings(request: EmbeddingRequest):
+async def create_embeddings(request: EmbeddingRequest, http_request: Request):
     """
     Create embeddings for text input(s)
     
@@ -768,27 +1086,28 @@ async def create_embeddings(request: EmbeddingRequest):
         
         logger.info(f"Processing {len(internal_requests)} embedding request(s)")
         
-        # Process each request
-        responses = []
-        for internal_req in internal_requests:
-            # Call model's get_embeddings method
-            embedding_vec, stats = await current_model.get_embeddings(
-                text=internal_req.prompt,
-                inference_config=inference_config,
-                pooling_strategy=pooling_strategy,
-                normalize=normalize
-            )
-            
-            # Create internal response
-            internal_resp = InferenceResponse(
+        # One slot acquisition for the whole list; duplicates and previously
+        # seen inputs are served from the model's embedding cache
+        embeddings, stats_list = await current_model.get_embeddings_batch(
+            texts=[internal_req.prompt for internal_req in internal_requests],
+            inference_config=inference_config,
+            pooling_strategy=pooling_strategy,
+            normalize=normalize,
+            tenant=request_tenant(http_request, request.user),
+            priority=request_priority(http_request, request.priority),
+            deadline=request_deadline(http_request, request.timeout)
+        )
+        
+        responses = [
+            InferenceResponse(
                 embedding=embedding_vec,
                 embedding_dim=stats.get("embedding_dim"),
                 tokens_processed=stats.get("tokens_processed", 0),
                 time_ms=stats.get("time_ms", 0.0),
                 request_id=internal_req.request_id
             )
-            
-            responses.append(internal_resp)
+            for internal_req, embedding_vec, stats in zip(internal_requests, embeddings, stats_list)
+        ]
         
         # Convert to OpenAI format
         response = internal_to_openai_embedding(responses, current_model.model_name)
@@ -799,11 +1118,122 @@ async def create_embeddings(request: EmbeddingRequest):
         
     except HTTPException:
         raise
+    except ContextLengthError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionError as e:
+        raise admission_http_error(e)
     except Exception as e:
         logger.error(f"Error creating embeddings: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/rerank", response_model=RerankResponse)
+async def create_rerank(request: RerankRequest, http_request: Request):
+    """
+    Score documents against a query
+    
+    Endpoint: POST /v1/rerank
+    
+    All pairs run as one job on the batch scheduler. In logits mode the
+    query part of the judge prompt stays in the KV cache between pairs, so
+    each pair only prefills its document.
+    """
+    try:
+        from models.reranker import rank
+        
+        current_model = await ensure_model_loaded(preferred_model=request.model)
+        if not hasattr(current_model, 'rerank'):
+            raise HTTPException(status_code=501, detail="Loaded model does not support reranking")
+        deadline = request_deadline(http_request, request.timeout)
+        
+        rerank_config = inference_config.get("rerank", {})
+        mode = request.mode
+        if mode == "auto":
+            mode = rerank_config.get("mode", "auto")
+        
+        scores, stats = await run_until_disconnect(
+            http_request,
+            current_model.rerank(
+                query=request.query,
+                documents=request.documents,
+                inference_config=inference_config,
+                mode=mode,
+                instruction=request.instruction or rerank_config.get("instruction"),
+                tenant=request_tenant(http_request),
+                priority=request_priority(http_request, request.priority),
+                deadline=deadline
+            )
+        )
+        
+        results = [
+            RerankResult(
+                index=index,
+                relevance_score=score,
+                document=request.documents[index] if request.return_documents else None
+            )
+            for index, score in rank(scores, request.top_n)
+        ]
+        return RerankResponse(
+            results=results,
+            model=current_model.model_name,
+            mode=stats["mode"],
+            usage=RerankUsage(total_tokens=stats.get("tokens_processed", 0))
+        )
+        
+    except HTTPException:
+        raise
+    except AdmissionError as e:
+        raise admission_http_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in rerank: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/tokenize", response_model=TokenizeResponse)
+async def tokenize(request: TokenizeRequest):
+    """
+    Tokenize text or chat messages with the loaded model's tokenizer
+    
+    Endpoint: POST /v1/tokenize
+    
+    Chat messages are formatted with the server's chat template first, so
+    the count matches what a chat completion would prefill.
+    """
+    if (request.prompt is None) == (request.messages is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'prompt' or 'messages'")
+    
+    current_model = await ensure_model_loaded(preferred_model=request.model)
+    service = get_tokenizer_service(current_model)
+    if not service.available:
+        raise HTTPException(status_code=501, detail="No tokenizer files found next to the loaded model")
+    
+    text = request.prompt if request.prompt is not None else format_chat_prompt(request.messages)
+    tokens = await service.encode_async(text)
+    max_context_len = getattr(current_model, 'max_context_len', 0)
+    return TokenizeResponse(
+        tokens=tokens,
+        count=len(tokens),
+        max_context_len=max_context_len,
+        model=current_model.model_name
+    )
+
+
+@router.post("/detokenize", response_model=DetokenizeResponse)
+async def detokenize(request: DetokenizeRequest):
+    """
+    Convert token IDs back to text
+    
+    Endpoint: POST /v1/detokenize
+    """
+    current_model = await ensure_model_loaded(preferred_model=request.model)
+    service = get_tokenizer_service(current_model)
+    if not service.available:
+        raise HTTPException(status_code=501, detail="No tokenizer files found next to the loaded model")
+    return DetokenizeResponse(prompt=await service.decode_async(request.tokens), model=current_model.model_name)
+
+
 # ============================================================================
 # CACHE MANAGEMENT ENDPOINTS
 # ============================================================================
@@ -828,6 +1258,10 @@ async def list_all_caches():
         return {
             "object": "list",
             "data": caches,
+            "auto_cache": current_model.cache_manager.auto_cache_stats(),
+            "usage": current_model.cache_manager.usage(),
+            "embedding_cache": current_model.embedding_cache.stats(),
+            "image_cache": current_model.image_cache.stats(),
             "timestamp": int(time.time())
         }
         
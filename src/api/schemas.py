@@ -35,7 +35,22 @@ class ChatMessage(BaseModel):
     name: Optional[str] = None
 
 
-class ChatCompletionRequest(BaseModel):
+class SchedulingFields(BaseModel):
+    """Scheduler inputs shared by requests that queue for the NPU"""
+    priority: Optional[Literal["interactive", "batch", "background"]] = Field(
+        default=None,
+        description="Scheduling class (default interactive; also settable via the X-Priority header). "
+                    "Batch and background work only runs when no interactive request waits."
+    )
+    timeout: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Seconds the request may wait for an NPU slot (also X-Request-Timeout header). "
+                    "Requests that cannot start in time are refused with 429 or 504."
+    )
+
+
+class ChatCompletionRequest(SchedulingFields):
     """OpenAI-compatible chat completion request"""
     model: str = Field(default="default", description="Model to use for completion")
     messages: List[ChatMessage] = Field(..., description="List of messages in the conversation")
@@ -59,6 +74,11 @@ class ChatCompletionRequest(BaseModel):
                     "The cached prompt (e.g., system prompt) is loaded from NPU state, "
                     "then new messages are processed on top of it."
     )
+    conversation_id: Optional[str] = Field(
+        default=None,
+        description="Conversation key (falls back to 'user'). The conversation's NPU state is "
+                    "snapshotted and restored when it returns after other conversations ran."
+    )
     
     model_config = {
         "protected_namespaces": (),
@@ -99,6 +119,10 @@ class Usage(BaseModel):
         default=None,
         description="Whether any caches were used in this request"
     )
+    timing: Optional[Dict[str, float]] = Field(
+        default=None,
+        description="Per-stage latency breakdown in ms (queue_wait_ms, prefill_ms, decode_ms, ...)"
+    )
 
 
 class ChatCompletionResponse(BaseModel):
@@ -144,7 +168,7 @@ class ErrorResponse(BaseModel):
 # TEXT COMPLETION SCHEMAS (OpenAI /v1/completions)
 # ============================================================================
 
-class CompletionRequest(BaseModel):
+class CompletionRequest(SchedulingFields):
     """OpenAI-compatible text completion request"""
     model: str = Field(default="default", description="Model to use for completion")
     prompt: str = Field(..., description="The prompt to generate completions for")
@@ -243,6 +267,7 @@ class OllamaGenerateResponse(BaseModel):
     prompt_eval_duration: Optional[int] = Field(default=None, description="Prompt evaluation time")
     eval_count: Optional[int] = Field(default=None, description="Number of tokens generated")
     eval_duration: Optional[int] = Field(default=None, description="Generation time in nanoseconds")
+    timing: Optional[Dict[str, float]] = Field(default=None, description="Per-stage latency breakdown in ms")
 
 
 class OllamaChatRequest(BaseModel):
@@ -276,13 +301,14 @@ class OllamaChatResponse(BaseModel):
     prompt_eval_duration: Optional[int] = None
     eval_count: Optional[int] = None
     eval_duration: Optional[int] = None
+    timing: Optional[Dict[str, float]] = None
 
 
 # ============================================================================
 # EMBEDDING SCHEMAS (OpenAI /v1/embeddings)
 # ============================================================================
 
-class EmbeddingRequest(BaseModel):
+class EmbeddingRequest(SchedulingFields):
     """OpenAI-compatible embedding request"""
     model: str = Field(default="default", description="Model to use for embeddings")
     input: Union[str, List[str]] = Field(..., description="Text(s) to embed - string or array of strings")
@@ -354,3 +380,100 @@ class OllamaEmbeddingResponse(BaseModel):
     total_duration: Optional[int] = Field(default=None, description="Total time in nanoseconds")
     load_duration: Optional[int] = Field(default=None, description="Model load time in nanoseconds")
     prompt_eval_count: Optional[int] = Field(default=None, description="Number of tokens in prompt")
+
+
+# ============================================================================
+# RERANK SCHEMAS (/v1/rerank, Cohere / Jina style)
+# ============================================================================
+
+class RerankRequest(SchedulingFields):
+    """Rerank request: score documents against a query"""
+    model: str = Field(default="default", description="Model to use for scoring")
+    query: str = Field(..., description="Search query")
+    documents: List[str] = Field(..., min_length=1, description="Candidate documents")
+    top_n: Optional[int] = Field(default=None, ge=1, description="Return only the best N results")
+    return_documents: bool = Field(default=False, description="Include document text in results")
+    mode: Literal["auto", "logits", "embedding"] = Field(
+        default="auto",
+        description="'logits' = yes/no relevance probe, 'embedding' = cosine over embeddings, "
+                    "'auto' = logits when the model's tokenizer is available"
+    )
+    instruction: Optional[str] = Field(default=None, description="Task description for the logits probe")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "model": "qwen3-0.6b",
+                "query": "How many NPU cores does the RK3588 have?",
+                "documents": ["The RK3588 NPU has three cores.", "Bananas are yellow."],
+                "top_n": 1
+            }
+        }
+
+
+class RerankResult(BaseModel):
+    """Score of one document"""
+    index: int = Field(description="Index in the input documents")
+    relevance_score: float
+    document: Optional[str] = None
+
+
+class RerankUsage(BaseModel):
+    """Token usage for reranking"""
+    total_tokens: int
+
+
+class RerankResponse(BaseModel):
+    """Rerank response, results sorted by relevance"""
+    object: Literal["list"] = "list"
+    results: List[RerankResult]
+    model: str
+    mode: str
+    usage: RerankUsage
+
+
+# ============================================================================
+# TOKENIZER SCHEMAS (/v1/tokenize, /v1/detokenize)
+# ============================================================================
+
+class TokenizeRequest(BaseModel):
+    """Tokenize a raw prompt or chat messages"""
+    model: str = Field(default="default", description="Model whose tokenizer to use")
+    prompt: Optional[str] = Field(default=None, description="Raw text")
+    messages: Optional[List[ChatMessage]] = Field(default=None, description="Chat messages (chat template applied)")
+
+
+class TokenizeResponse(BaseModel):
+    """Token IDs and count"""
+    tokens: List[int]
+    count: int
+    max_context_len: int
+    model: str
+    
+    model_config = {
+        "protected_namespaces": ()
+    }
+
+
+class DetokenizeRequest(BaseModel):
+    """Convert token IDs back to text"""
+    model: str = Field(default="default", description="Model whose tokenizer to use")
+    tokens: List[int]
+
+
+class DetokenizeResponse(BaseModel):
+    """Decoded text"""
+    prompt: str
+    model: str
+
+
+# ============================================================================
+# SCHEDULER SCHEMAS (/v1/queue)
+# ============================================================================
+
+class QueuePolicyRequest(BaseModel):
+    """Switch the scheduler's queue ordering"""
+    policy: Literal["fair", "fifo", "sjf"] = Field(
+        ...,
+        description="'fair' (weighted per tenant), 'fifo' (arrival order) or 'sjf' (shortest predicted job first)"
+    )
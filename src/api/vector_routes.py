@@ -0,0 +1,251 @@
+"""
+Vector Search API Routes
+Endpoints for a local vector index fed by the loaded embedding model
+
+Collection calls (file I/O, IVF training, search) run on worker threads via
+asyncio.to_thread so bulk ingest never blocks the event loop and the
+streams it serves.
+"""
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
+import asyncio
+import logging
+import uuid
+
+import numpy as np
+
+from api.openai_routes import ensure_model_loaded
+from api.admission import admission_http_error, request_deadline, request_priority, request_tenant
+from config.settings import settings, inference_config
+from models.batch_scheduler import AdmissionError
+from utils.vector_index import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Create API router
+router = APIRouter(prefix="/v1/vector", tags=["Vector Search"])
+
+_vector_cfg = inference_config.get("vector_index", {})
+vector_store = VectorStore(
+    settings.vector_data_dir,
+    ivf_threshold=_vector_cfg.get("ivf_threshold", 20000),
+    nprobe=_vector_cfg.get("nprobe", 8)
+)
+
+
+class VectorDocument(BaseModel):
+    """A document to embed and index"""
+    id: Optional[str] = Field(None, description="Document ID (generated if omitted, replaces an existing ID)")
+    text: str = Field(..., description="Text to embed")
+    metadata: Optional[Dict[str, Any]] = Field(None, description="Arbitrary JSON returned with search hits")
+
+
+class VectorAddRequest(BaseModel):
+    """Request to add documents to a collection"""
+    documents: List[VectorDocument] = Field(..., min_length=1)
+    model: Optional[str] = Field(None, description="Embedding model (defaults to the loaded model)")
+    metric: Literal["cosine", "ip"] = Field("cosine", description="Similarity metric for a new collection")
+    index_type: Optional[Literal["auto", "flat", "ivf"]] = Field(
+        None, description="Index for a new collection (default from inference_config)"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "documents": [
+                    {"id": "doc-1", "text": "The NPU has three cores", "metadata": {"source": "manual.pdf"}}
+                ]
+            }
+        }
+
+
+class VectorSearchRequest(BaseModel):
+    """Request to search a collection"""
+    query: Optional[str] = Field(None, description="Query text (embedded with the collection's model)")
+    vector: Optional[List[float]] = Field(None, description="Query vector, instead of text")
+    top_k: int = Field(10, ge=1, le=1000)
+    nprobe: Optional[int] = Field(None, ge=1, description="IVF lists to search (higher = better recall)")
+    model: Optional[str] = None
+
+
+class VectorDeleteRequest(BaseModel):
+    """Request to delete documents by ID"""
+    ids: List[str] = Field(..., min_length=1)
+
+
+async def _embed(
+    texts: List[str],
+    preferred_model: Optional[str],
+    http_request: Request,
+    priority: Optional[str] = None
+) -> tuple[np.ndarray, str]:
+    """
+    Embed texts with the loaded model; returns (matrix, model_name).
+
+    Tenant and deadline come from the request like on the OpenAI routes; an
+    X-Priority header overrides ``priority``.
+    """
+    tenant = request_tenant(http_request)
+    priority = request_priority(http_request) or priority
+    deadline = request_deadline(http_request)
+    current_model = await ensure_model_loaded(preferred_model=preferred_model)
+    emb_config = inference_config.get("embedding_model", {})
+    embeddings, _ = await current_model.get_embeddings_batch(
+        texts=texts,
+        inference_config=inference_config,
+        pooling_strategy=emb_config.get("pooling_strategy", "last"),
+        normalize=emb_config.get("normalize", True),
+        tenant=tenant,
+        priority=priority,
+        deadline=deadline
+    )
+    return np.stack(embeddings), current_model.model_name
+
+
+def _check_model(collection, model_name: str):
+    """Vectors from different models live in different spaces"""
+    if collection.model_name and model_name and collection.model_name != model_name:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Collection '{collection.name}' was built with model '{collection.model_name}', "
+                   f"but '{model_name}' is loaded"
+        )
+
+
+def _get_collection(name: str):
+    try:
+        collection = vector_store.get(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"Collection '{name}' not found")
+    return collection
+
+
+@router.get("/collections")
+async def list_collections():
+    """
+    List vector collections
+
+    Endpoint: GET /v1/vector/collections
+    """
+    return {"object": "list", "data": vector_store.list()}
+
+
+@router.get("/collections/{name}")
+async def get_collection(name: str):
+    """
+    Describe one collection
+
+    Endpoint: GET /v1/vector/collections/{name}
+    """
+    return _get_collection(name).info()
+
+
+@router.post("/collections/{name}/add")
+async def add_documents(name: str, request: VectorAddRequest, http_request: Request):
+    """
+    Embed documents and add them to a collection (created on first add)
+
+    Endpoint: POST /v1/vector/collections/{name}/add
+
+    Documents are embedded in the "batch" scheduling class unless the
+    X-Priority header says otherwise, so bulk indexing never holds up
+    interactive requests.
+    """
+    try:
+        vectors, model_name = await _embed(
+            [doc.text for doc in request.documents], request.model, http_request, priority="batch"
+        )
+        collection = await asyncio.to_thread(
+            vector_store.get_or_create,
+            name,
+            dim=vectors.shape[1],
+            metric=request.metric,
+            index_type=request.index_type or _vector_cfg.get("index_type", "auto"),
+            model_name=model_name
+        )
+        _check_model(collection, model_name)
+
+        ids = [doc.id or uuid.uuid4().hex for doc in request.documents]
+        added = await asyncio.to_thread(
+            collection.add,
+            ids,
+            vectors,
+            texts=[doc.text for doc in request.documents],
+            metadata=[doc.metadata for doc in request.documents]
+        )
+        logger.info(f"Added {added} document(s) to vector collection '{name}'")
+        return {"collection": name, "added": added, "ids": ids, "count": collection.size}
+
+    except HTTPException:
+        raise
+    except AdmissionError as e:
+        raise admission_http_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error adding vectors: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/collections/{name}/search")
+async def search_collection(name: str, request: VectorSearchRequest, http_request: Request):
+    """
+    Top-k similarity search by query text or vector
+
+    Endpoint: POST /v1/vector/collections/{name}/search
+    """
+    if (request.query is None) == (request.vector is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'query' or 'vector'")
+
+    collection = await asyncio.to_thread(_get_collection, name)
+    try:
+        if request.query is not None:
+            vectors, model_name = await _embed([request.query], request.model or collection.model_name, http_request)
+            _check_model(collection, model_name)
+            query = vectors[0]
+        else:
+            query = np.asarray(request.vector, dtype=np.float32)
+
+        hits = await asyncio.to_thread(collection.search, query, top_k=request.top_k, nprobe=request.nprobe)
+        return {"object": "list", "collection": name, "data": hits}
+
+    except HTTPException:
+        raise
+    except AdmissionError as e:
+        raise admission_http_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching vectors: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/collections/{name}/delete")
+async def delete_documents(name: str, request: VectorDeleteRequest):
+    """
+    Delete documents by ID
+
+    Endpoint: POST /v1/vector/collections/{name}/delete
+    """
+    collection = await asyncio.to_thread(_get_collection, name)
+    deleted = await asyncio.to_thread(collection.delete, request.ids)
+    return {"collection": name, "deleted": deleted, "count": collection.size}
+
+
+@router.delete("/collections/{name}")
+async def drop_collection(name: str):
+    """
+    Delete a collection and its files
+
+    Endpoint: DELETE /v1/vector/collections/{name}
+    """
+    try:
+        dropped = await asyncio.to_thread(vector_store.drop, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not dropped:
+        raise HTTPException(status_code=404, detail=f"Collection '{name}' not found")
+    return {"success": True, "message": f"Collection '{name}' deleted"}
@@ -13,10 +13,12 @@ from pathlib import Path
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
-from api.openai_routes import router as openai_router
+from api.openai_routes import router as openai_router, close_image_fetcher
 from api.model_routes import router as model_router
 from api.ollama_routes import router as ollama_router
 from api.image_routes import router as image_router
+from api.vector_routes import router as vector_router
+from api.metrics_routes import router as metrics_router, MetricsMiddleware
 from config.settings import settings
 from models.rkllm_model import RKLLMModel
 from models.model_manager import model_manager
@@ -64,7 +66,9 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🛑 Server shutting down...")
-    # TODO: Cleanup loaded models
+    await close_image_fetcher()
+    # Release the NPU and persist cache statistics
+    model_manager.unload_model()
 
 # Create FastAPI app
 app = FastAPI(
@@ -84,6 +88,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 from fastapi.staticfiles import StaticFiles
 
@@ -92,6 +97,8 @@ app.include_router(openai_router)
 app.include_router(model_router)
 app.include_router(ollama_router)
 app.include_router(image_router, prefix="/v1") # Mount at /v1/images/generations
+app.include_router(vector_router)
+app.include_router(metrics_router)
 
 # Mount SDimages directory for static access
 sd_images_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "SDimages")
@@ -125,6 +132,7 @@ async def root():
                 "available": "/v1/models/available"
             },
             "health": "/v1/health",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
@@ -0,0 +1,464 @@
+"""
+Request scheduler for the execution slots of a model.
+
+A slot is a worker thread that runs one request's blocking runtime call at a
+time. Requests wait in a pending queue and are admitted into a slot as soon
+as one frees up (i.e. when the previous request in that slot has finished),
+and each slot's KV usage is tracked against ``max_context_len`` so an
+admitted request can never overflow its slot.
+
+RKLLMModel uses a single slot: every rkllm_run on an RKLLM handle is a
+single-input call on the same handle, and the runtime does not map
+concurrent calls onto its n_batch batch positions, so runs on one handle
+are serialized. Several slots only give real concurrency with a runtime
+that runs sessions side by side, such as MockRKLLMRuntime in tests and
+benchmarks.
+
+Waiting requests are ordered by a FairQueue: priority classes first, then
+weighted fair sharing between tenants (or FIFO, or shortest predicted job
+first - switchable at runtime), with optional per-tenant slot caps.
+Waiters can register a callback that is told their queue position and
+estimated wait whenever it changes.
+
+Admission control keeps bursts from piling up work nobody will wait for:
+the queue has a maximum depth, sessions may carry a deadline, and requests
+that cannot start in time are refused up front with a retry hint derived
+from the measured decode rate and the max_tokens already queued. Only work
+of the request's own or a higher priority class counts, since lower classes
+never run before it. A session whose deadline passes while it waits is
+dropped before it reaches the NPU.
+
+The blocking runtime call for a request is supplied by the caller as a
+``job`` callable and runs on a dedicated thread pool with one worker per slot.
+"""
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from .fair_queue import DEFAULT_PRIORITY, PRIORITY_CLASSES, FairQueue
+from .generation_session import GenerationSession
+
+logger = logging.getLogger(__name__)
+
+
+class ContextLengthError(ValueError):
+    """The prompt alone does not fit into a slot's KV cache"""
+
+
+class AdmissionError(RuntimeError):
+    """The scheduler refused a request; ``retry_after`` is a wait hint in seconds"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class QueueFullError(AdmissionError):
+    """The queue is at max depth, or too long to start before the deadline"""
+
+
+class DeadlineExceededError(AdmissionError):
+    """The session's deadline passed before it got a batch slot"""
+
+
+@dataclass
+class BatchSlot:
+    """One execution slot of the scheduler"""
+    index: int
+    session: Optional[GenerationSession] = None
+
+    @property
+    def busy(self) -> bool:
+        return self.session is not None
+
+    @property
+    def kv_used(self) -> int:
+        """Tokens currently held in this slot's KV cache"""
+        if self.session is None:
+            return 0
+        return self.session.prompt_tokens + self.session.generated_tokens
+
+
+@dataclass
+class _PendingJob:
+    session: GenerationSession
+    job: Callable[[], Any]
+    future: asyncio.Future
+    on_wait: Optional[Callable[[dict], None]] = None
+    position: int = 0
+    started_at: float = 0.0
+    expiry: Optional[asyncio.TimerHandle] = None
+
+
+class BatchScheduler:
+    """Admits queued sessions into free execution slots"""
+
+    # Weight of the newest job duration in the running average
+    _DURATION_ALPHA = 0.2
+
+    def __init__(
+        self,
+        n_slots: int,
+        max_context_len: int,
+        queue: Optional[FairQueue] = None,
+        max_queue_depth: int = 0
+    ):
+        """
+        Args:
+            n_slots: Number of execution slots (1 for an RKLLM handle)
+            max_context_len: KV capacity of each slot in tokens
+            queue: Ordering of waiting requests (default: equal-weight tenants, no caps)
+            max_queue_depth: Waiting requests beyond which new ones are refused (0 = unlimited)
+        """
+        if n_slots < 1:
+            raise ValueError(f"n_slots must be >= 1, got {n_slots}")
+        self.n_slots = n_slots
+        self.max_context_len = max_context_len
+        self.max_queue_depth = max_queue_depth
+        self.slots = [BatchSlot(index=i) for i in range(n_slots)]
+        self._queue = queue if queue is not None else FairQueue()
+        self._executor = ThreadPoolExecutor(max_workers=n_slots, thread_name_prefix="rkllm-slot")
+
+        # Counters for /v1/health-style reporting
+        self.completed = 0
+        self.generated_tokens = 0
+        self.avg_job_seconds = 0.0
+        self.tokens_per_second = 0.0  # Per-slot generation rate, prefill included
+        self.rejected = 0
+        self.expired = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    async def submit(
+        self,
+        session: GenerationSession,
+        job: Callable[[], Any],
+        on_wait: Optional[Callable[[dict], None]] = None
+    ) -> Any:
+        """
+        Queue a session and wait for its job to finish in a batch slot.
+
+        Args:
+            session: Session to run; ``session.slot`` is set on admission.
+                ``session.tenant`` and ``session.priority`` pick its queue.
+            job: Blocking callable that drives the runtime for this session
+            on_wait: Called on the event loop with ``{"position", "estimated_wait_s"}``
+                while the session waits, each time its position changes
+
+        Returns:
+            Whatever ``job`` returns
+
+        Raises:
+            ContextLengthError: If the prompt alone does not fit into a slot
+            QueueFullError: If the queue is full or too long for the deadline
+            DeadlineExceededError: If ``session.deadline`` passes while queued
+            ValueError: If the session's priority class is unknown
+        """
+        self._check_context(session)
+        self.check_admission(session.deadline, session.priority)
+
+        loop = asyncio.get_running_loop()
+        session.queued_at = time.monotonic()
+        pending = _PendingJob(session=session, job=job, future=loop.create_future(), on_wait=on_wait)
+        if session.deadline is not None:
+            pending.expiry = loop.call_later(
+                max(0.0, session.deadline - time.monotonic()), self._expire, pending
+            )
+        self._queue.push(
+            pending,
+            tenant=session.tenant,
+            priority=session.priority,
+            prompt_tokens=session.prompt_tokens,
+            max_tokens=session.max_tokens
+        )
+        if self.active_count == self.n_slots:
+            logger.info(f"📊 All {self.n_slots} batch slots busy, {len(self._queue)} request(s) queued")
+        self._admit()
+
+        try:
+            return await pending.future
+        except asyncio.CancelledError:
+            # Still waiting for a slot: drop it from the queue
+            if self._queue.remove(pending):
+                self._notify_waiters()
+            raise
+        finally:
+            if pending.expiry is not None:
+                pending.expiry.cancel()
+
+    def check_admission(self, deadline: Optional[float] = None, priority: Optional[str] = None):
+        """
+        Refuse a new request early if it would only add to a backlog.
+
+        Queue depth and backlog only count sessions of the request's own or a
+        higher priority class: queued batch jobs do not hold up interactive
+        requests.
+
+        Args:
+            deadline: ``time.monotonic()`` by which the request must start
+            priority: Priority class of the request (None = default class)
+
+        Raises:
+            QueueFullError: Queue at max depth, or the expected wait exceeds the deadline
+            DeadlineExceededError: The deadline has already passed
+        """
+        ahead = len(self._queued_ahead(priority))
+        if self.max_queue_depth and ahead >= self.max_queue_depth:
+            self.rejected += 1
+            raise QueueFullError(
+                f"Request queue is full ({ahead} waiting)",
+                retry_after=self.retry_after(priority)
+            )
+        if deadline is None:
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.expired += 1
+            raise DeadlineExceededError("Request deadline passed before it was queued",
+                                        retry_after=self.retry_after(priority))
+        if self.active_count == self.n_slots:
+            wait = self.retry_after(priority)
+            if self.tokens_per_second > 0 and wait > remaining:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Expected queue wait of {wait}s exceeds the request deadline ({remaining:.1f}s)",
+                    retry_after=wait
+                )
+
+    def retry_after(self, priority: Optional[str] = None) -> float:
+        """
+        Seconds until the backlog ahead of a ``priority`` request has drained.
+
+        The backlog is the max_tokens still owed to running sessions plus
+        those of every queued session of the same or a higher priority
+        class, divided by the measured generation rate of all slots together.
+        """
+        ahead = self._queued_ahead(priority)
+        if self.tokens_per_second <= 0:
+            return self.estimate_wait(len(ahead))
+        backlog = sum(
+            max(0, slot.session.max_tokens - slot.session.generated_tokens)
+            for slot in self.slots if slot.busy
+        )
+        backlog += sum(entry.item.session.max_tokens for entry in ahead)
+        return backlog / (self.tokens_per_second * self.n_slots)
+
+    @property
+    def policy(self) -> str:
+        return self._queue.policy
+
+    def set_policy(self, policy: str):
+        """
+        Switch the queue ordering ("fair", "fifo" or "sjf") at runtime.
+
+        Raises:
+            ValueError: Unknown policy
+        """
+        self._queue.set_policy(policy)
+        logger.info(f"📊 Queue policy set to {policy}")
+        self._notify_waiters()
+
+    @property
+    def active_count(self) -> int:
+        return sum(1 for slot in self.slots if slot.busy)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._queue)
+
+    def queue_snapshot(self) -> List[dict]:
+        """Waiting requests in projected dispatch order (no prompt content)"""
+        order = self._queue.ordered(self._active_by_tenant())
+        return [
+            {
+                "position": i + 1,
+                "session_id": entry.item.session.session_id,
+                "tenant": entry.tenant,
+                "priority": entry.priority,
+                "estimated_wait_s": self.estimate_wait(i),
+            }
+            for i, entry in enumerate(order)
+        ]
+
+    def estimate_wait(self, ahead: int) -> float:
+        """
+        Seconds until a request with ``ahead`` requests before it gets a slot.
+
+        Based on the running average job duration; the jobs in the slots
+        are assumed to be half done.
+        """
+        if self.active_count < self.n_slots and ahead == 0:
+            return 0.0
+        return round(self.avg_job_seconds * (ahead + 0.5) / self.n_slots, 2)
+
+    def stats(self) -> dict:
+        """Snapshot of slot occupancy and KV usage"""
+        return {
+            "n_slots": self.n_slots,
+            "active": self.active_count,
+            "pending": self.pending_count,
+            "policy": self.policy,
+            "active_by_tenant": self._active_by_tenant(),
+            "avg_job_seconds": round(self.avg_job_seconds, 3),
+            "tokens_per_second": round(self.tokens_per_second * self.n_slots, 1),
+            "max_queue_depth": self.max_queue_depth,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "max_context_len": self.max_context_len,
+            "kv_used": [slot.kv_used for slot in self.slots],
+            "completed": self.completed,
+            "generated_tokens": self.generated_tokens,
+        }
+
+    def shutdown(self):
+        """
+        Stop the slot worker threads (model unload).
+
+        Queued sessions are cancelled, running ones are asked to stop, and
+        the call blocks until every slot thread has left its runtime call,
+        so the caller can release the runtime handle afterwards.
+        """
+        while len(self._queue):
+            entry = self._queue.pop()
+            if not entry.item.future.done():
+                entry.item.future.cancel()
+        for slot in self.slots:
+            if slot.busy:
+                slot.session.request_stop("cancelled")
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _check_context(self, session: GenerationSession):
+        """Clamp max_tokens so prompt + generation fits the slot's KV cache"""
+        available = self.max_context_len - session.prompt_tokens
+        if available <= 0:
+            raise ContextLengthError(
+                f"Prompt ({session.prompt_tokens} tokens) exceeds max_context_len "
+                f"({self.max_context_len})"
+            )
+        if session.max_tokens > available:
+            logger.info(
+                f"✂️  Clamping max_tokens {session.max_tokens} -> {available} "
+                f"to fit max_context_len={self.max_context_len}"
+            )
+            session.max_tokens = available
+
+    def _queued_ahead(self, priority: Optional[str] = None) -> list:
+        """Queued entries that are dispatched before a new ``priority`` request"""
+        priority = priority or DEFAULT_PRIORITY
+        # An unknown class counts everything; the queue rejects it on push
+        rank = PRIORITY_CLASSES.index(priority) if priority in PRIORITY_CLASSES else len(PRIORITY_CLASSES)
+        return [entry for entry in self._queue if PRIORITY_CLASSES.index(entry.priority) <= rank]
+
+    def _free_slot(self) -> Optional[BatchSlot]:
+        for slot in self.slots:
+            if not slot.busy:
+                return slot
+        return None
+
+    def _active_by_tenant(self) -> Dict[str, int]:
+        active: Dict[str, int] = {}
+        for slot in self.slots:
+            if slot.busy:
+                tenant = slot.session.tenant or "anonymous"
+                active[tenant] = active.get(tenant, 0) + 1
+        return active
+
+    def _admit(self):
+        """Move pending sessions into free slots (runs on the event loop)"""
+        while len(self._queue):
+            slot = self._free_slot()
+            if slot is None:
+                break
+            entry = self._queue.pop(self._active_by_tenant())
+            if entry is None:
+                # Every waiting tenant is at its concurrency cap
+                break
+            pending = entry.item
+            if pending.future.done():
+                continue
+            if pending.session.deadline is not None and time.monotonic() >= pending.session.deadline:
+                self._fail_expired(pending)
+                continue
+
+            slot.session = pending.session
+            pending.session.slot = slot.index
+            pending.started_at = pending.session.started_at = time.monotonic()
+            logger.debug(f"➡️  Session {pending.session.session_id} ({entry.tenant}/{entry.priority}) "
+                         f"admitted to slot {slot.index}")
+
+            loop = asyncio.get_running_loop()
+            task = loop.run_in_executor(self._executor, pending.job)
+            task.add_done_callback(
+                lambda fut, slot=slot, pending=pending: self._on_job_done(slot, pending, fut)
+            )
+        self._notify_waiters()
+
+    def _expire(self, pending: _PendingJob):
+        """Deadline timer: fail the session if it is still waiting"""
+        if self._queue.remove(pending):
+            self._fail_expired(pending)
+            self._notify_waiters()
+
+    def _fail_expired(self, pending: _PendingJob):
+        self.expired += 1
+        logger.info(f"⏰ Session {pending.session.session_id} deadline passed while queued, "
+                    f"dropped before reaching the NPU")
+        if not pending.future.done():
+            pending.future.set_exception(DeadlineExceededError(
+                "Request deadline passed while waiting for a batch slot",
+                retry_after=self.retry_after(pending.session.priority)
+            ))
+
+    def _notify_waiters(self):
+        """Tell waiting sessions their new position, if it changed"""
+        order = self._queue.ordered(self._active_by_tenant())
+        for i, entry in enumerate(order):
+            pending = entry.item
+            if pending.on_wait is None or pending.position == i + 1:
+                continue
+            pending.position = i + 1
+            try:
+                pending.on_wait({"position": i + 1, "estimated_wait_s": self.estimate_wait(i)})
+            except Exception as e:
+                logger.debug(f"Queue position callback failed: {e}")
+
+    def _on_job_done(self, slot: BatchSlot, pending: _PendingJob, fut: asyncio.Future):
+        """Release the slot, resolve the caller and admit the next request"""
+        self.completed += 1
+        self.generated_tokens += pending.session.generated_tokens
+        duration = time.monotonic() - pending.started_at
+        if self.avg_job_seconds == 0.0:
+            self.avg_job_seconds = duration
+        else:
+            self.avg_job_seconds += self._DURATION_ALPHA * (duration - self.avg_job_seconds)
+        tokens = pending.session.generated_tokens
+        if tokens > 0:
+            # Output length history feeds the sjf predictions
+            self._queue.record_output(pending.session.tenant, tokens)
+        if tokens > 0 and duration > 0:
+            rate = tokens / duration
+            if self.tokens_per_second == 0.0:
+                self.tokens_per_second = rate
+            else:
+                self.tokens_per_second += self._DURATION_ALPHA * (rate - self.tokens_per_second)
+        slot.session = None
+
+        if not pending.future.done():
+            if fut.cancelled():
+                pending.future.cancel()
+            elif fut.exception() is not None:
+                pending.future.set_exception(fut.exception())
+            else:
+                pending.future.set_result(fut.result())
+
+        self._admit()
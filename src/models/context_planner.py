@@ -0,0 +1,182 @@
+"""
+Context-window planning for chat prompts.
+
+A chat that outgrows the model's context window must lose its oldest turns
+before it reaches the NPU; otherwise the runtime shifts the KV cache itself
+and every later turn pays a full re-prefill. How the history is cut matters
+as much as where: if the cut moves by one message every turn, the retained
+prompt never shares a prefix with the previous one and neither the prefix
+index nor the conversation snapshots can hit.
+
+The planner therefore only cuts at fixed block boundaries. The non-system
+history is divided into blocks of ``block_fraction`` of the budget, counted
+from the start of the conversation, and the first user message of each block
+is a cut candidate. Earlier messages never change, so neither do the
+candidates; the cut stays put until the tail no longer fits and then jumps a
+whole block ahead, which leaves room for several more turns before it moves
+again.
+
+Leading system messages and the latest message are always kept. With the
+"compact" strategy the dropped turns are replaced by a short extractive
+digest in a system message. The digest depends only on the dropped turns,
+so it is identical for every request that shares the same cut.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Tuple
+
+CONTEXT_STRATEGIES = ("drop", "compact")
+
+_DIGEST_HEADER = "Summary of {count} earlier messages (truncated to fit the context window):\n"
+
+
+@dataclass
+class ContextPlan:
+    """Which chat messages make it into the prompt"""
+    keep: List[int]                  # Indices of kept messages, in order
+    dropped: List[int] = field(default_factory=list)
+    budget: int = 0                  # Prompt tokens available
+    prompt_tokens: int = 0           # Tokens of the kept messages (digest excluded)
+    digest_tokens: int = 0           # Tokens reserved for the digest (compact only)
+    fits: bool = True                # False if even the minimal prompt is too long
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.dropped)
+
+
+class ContextPlanner:
+    """Drops or compacts the oldest chat turns to fit a context window"""
+
+    def __init__(
+        self,
+        context_size: int,
+        strategy: str = "drop",
+        block_fraction: float = 0.25,
+        digest_tokens: int = 256,
+        reserve_tokens: int = 16
+    ):
+        """
+        Args:
+            context_size: Model context window in tokens
+            strategy: "drop" removes old turns, "compact" replaces them with a digest
+            block_fraction: Cut granularity as a fraction of the budget (hysteresis)
+            digest_tokens: Token budget for the digest of dropped turns
+            reserve_tokens: Safety margin for template tokens not counted per message
+        """
+        if strategy not in CONTEXT_STRATEGIES:
+            raise ValueError(f"Unknown context strategy '{strategy}', expected one of {CONTEXT_STRATEGIES}")
+        if not 0 < block_fraction <= 1:
+            raise ValueError("block_fraction must be in (0, 1]")
+        self.context_size = context_size
+        self.strategy = strategy
+        self.block_fraction = block_fraction
+        self.digest_tokens = digest_tokens if strategy == "compact" else 0
+        self.reserve_tokens = reserve_tokens
+
+    def plan(
+        self,
+        roles: Sequence[str],
+        message_tokens: Sequence[int],
+        max_tokens: int,
+        generation_prompt_tokens: int = 0
+    ) -> ContextPlan:
+        """
+        Plan the messages to keep.
+
+        Args:
+            roles: Role of each message
+            message_tokens: Formatted token count of each message
+            max_tokens: Tokens reserved for the completion
+            generation_prompt_tokens: Tokens of the assistant trigger
+        """
+        n = len(message_tokens)
+        budget = max(0, self.context_size - max_tokens - generation_prompt_tokens - self.reserve_tokens)
+        total = sum(message_tokens)
+        if total <= budget or n == 0:
+            return ContextPlan(keep=list(range(n)), budget=budget, prompt_tokens=total)
+
+        # Leading system messages are pinned, the latest message always stays
+        start = 0
+        while start < n - 1 and roles[start] == "system":
+            start += 1
+        system_tokens = sum(message_tokens[:start])
+        tail_budget = budget - system_tokens - self.digest_tokens
+
+        cut = self._choose_cut(roles, message_tokens, start, tail_budget, budget)
+        keep = list(range(start)) + list(range(cut, n))
+        kept_tokens = sum(message_tokens[i] for i in keep)
+        return ContextPlan(
+            keep=keep,
+            dropped=list(range(start, cut)),
+            budget=budget,
+            prompt_tokens=kept_tokens,
+            digest_tokens=self.digest_tokens if cut > start else 0,
+            fits=kept_tokens + (self.digest_tokens if cut > start else 0) <= budget
+        )
+
+    def _choose_cut(
+        self,
+        roles: Sequence[str],
+        message_tokens: Sequence[int],
+        start: int,
+        tail_budget: int,
+        budget: int
+    ) -> int:
+        """First block-boundary cut whose tail fits, else only the latest message"""
+        n = len(message_tokens)
+        block = max(1, int(budget * self.block_fraction))
+
+        # Suffix sums: tail[i] = tokens of messages i..n-1
+        tail = [0] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            tail[i] = tail[i + 1] + message_tokens[i]
+
+        offset = 0        # History tokens before message i
+        last_block = 0
+        for i in range(start, n):
+            if i > start and roles[i] == "user" and offset // block > last_block:
+                last_block = offset // block
+                if tail[i] <= tail_budget:
+                    return i
+            offset += message_tokens[i]
+        return n - 1
+
+
+def build_digest(
+    turns: Sequence[Tuple[str, str]],
+    max_tokens: int,
+    count_tokens: Callable[[str], int],
+    max_line_chars: int = 200
+) -> Optional[str]:
+    """
+    Extractive digest of dropped turns: one truncated line per message,
+    newest first until the token budget is used.
+
+    Args:
+        turns: (role, text) of the dropped messages, oldest first
+        max_tokens: Token budget for the digest
+        count_tokens: Token counter for the model
+        max_line_chars: Longest excerpt kept per message
+
+    Returns:
+        Digest text, or None if not even the header fits
+    """
+    header = _DIGEST_HEADER.format(count=len(turns))
+    used = count_tokens(header)
+    if not turns or used > max_tokens:
+        return None
+
+    lines: List[str] = []
+    for role, text in reversed(turns):
+        excerpt = " ".join(text.split())
+        if not excerpt:
+            continue
+        if len(excerpt) > max_line_chars:
+            excerpt = excerpt[:max_line_chars].rstrip() + "..."
+        line = f"- {role}: {excerpt}\n"
+        cost = count_tokens(line)
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    return header + "".join(reversed(lines))
@@ -0,0 +1,52 @@
+"""
+Pooling and normalization of RKLLM hidden states into embedding vectors.
+
+The runtime hands the last hidden layer to the callback as a float pointer
+that is only valid for the duration of the callback. The buffer is wrapped
+as a (num_tokens, embd_size) NumPy view without copying, and only the data
+the pooling strategy needs leaves the callback: one row for "cls" / "last",
+one reduced row for "mean".
+"""
+import ctypes
+
+import numpy as np
+
+POOLING_STRATEGIES = ("mean", "cls", "last")
+
+
+def hidden_state_view(ptr, num_tokens: int, embd_size: int) -> np.ndarray:
+    """
+    Zero-copy (num_tokens, embd_size) float32 view over the runtime's buffer.
+
+    The view aliases C memory: pool it before the callback returns.
+    """
+    ptr = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_float))
+    return np.ctypeslib.as_array(ptr, shape=(num_tokens, embd_size))
+
+
+def pool_hidden_states(states: np.ndarray, strategy: str = "last") -> np.ndarray:
+    """
+    Pool per-token hidden states into a single float32 vector.
+
+    Args:
+        states: (num_tokens, embd_size) array, may be a view over C memory
+        strategy: "mean", "cls" (first token) or "last" (default, also used
+            for unknown strategies)
+
+    Returns:
+        Owned 1-D float32 array of length embd_size
+    """
+    if strategy == "mean":
+        # Accumulate in float64, the sum over hundreds of tokens loses precision in float32
+        return states.mean(axis=0, dtype=np.float64).astype(np.float32)
+    if strategy == "cls":
+        return np.array(states[0], dtype=np.float32)
+    return np.array(states[-1], dtype=np.float32)
+
+
+def l2_normalize(embedding: np.ndarray) -> np.ndarray:
+    """Scale to unit length; a zero vector is returned unchanged"""
+    norm = np.linalg.norm(embedding)
+    if norm > 0:
+        embedding = embedding / norm
+    return embedding.astype(np.float32, copy=False)
@@ -0,0 +1,234 @@
+"""
+Priority classes and per-tenant weighted fair queuing for the batch scheduler.
+
+Requests carry a priority class and a tenant key (API key or ``user``
+field). Classes are served strictly in order: a queued interactive request
+always goes before batch work, and background jobs (automatic cache builds)
+only run when nothing else waits.
+
+Within a class, tenants share the NPU by start-time fair queuing. Each
+request is stamped with a virtual start tag ``S = max(V, F_tenant)`` and
+finish tag ``F_tenant = S + cost / weight``, where cost is the request's
+token work (prompt + max_tokens) and V is the start tag of the request most
+recently dispatched from that class. The smallest start tag goes next, so a
+tenant that floods the queue only delays itself: its later requests carry
+ever larger tags while a newcomer starts at the current virtual time.
+
+Per-tenant concurrency caps bound how many slots one tenant can hold at
+once; a capped tenant's requests are skipped until one of its jobs ends.
+
+The order within a class is a switchable policy:
+  - "fair": start-time fair queuing between tenants (above)
+  - "fifo": arrival order
+  - "sjf": shortest predicted job first. The predicted cost is the prompt
+    (weighted by how much cheaper prefill is than decode) plus the expected
+    output: the tenant's learned average output length, capped by the
+    request's max_tokens. Waiting earns ``aging_tokens_per_s`` of credit per
+    second, so a long job overtakes newly arriving short ones eventually
+    and cannot starve.
+"""
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+PRIORITY_CLASSES = ("interactive", "batch", "background")
+QUEUE_POLICIES = ("fair", "fifo", "sjf")
+DEFAULT_PRIORITY = "interactive"
+DEFAULT_TENANT = "anonymous"
+
+
+@dataclass
+class QueueEntry:
+    """One waiting request"""
+    item: Any
+    tenant: str
+    priority: str
+    cost: float
+    start_tag: float = 0.0
+    seq: int = 0
+    prompt_tokens: int = 0
+    max_tokens: int = 0
+    enqueued_at: float = 0.0
+
+    @property
+    def sort_key(self):
+        return (PRIORITY_CLASSES.index(self.priority), self.start_tag, self.seq)
+
+
+@dataclass
+class _ClassState:
+    virtual_time: float = 0.0
+    finish_tags: Dict[str, float] = field(default_factory=dict)
+
+
+class FairQueue:
+    """Strict priority between classes; fair, FIFO or SJF order within a class"""
+
+    # Weight of the newest observation in the per-tenant output length average
+    _OUTPUT_ALPHA = 0.2
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        tenant_max_active: int = 0,
+        tenant_caps: Optional[Dict[str, int]] = None,
+        policy: str = "fair",
+        prefill_cost_ratio: float = 0.1,
+        aging_tokens_per_s: float = 20.0
+    ):
+        """
+        Args:
+            weights: Share of each tenant (default 1.0); a weight of 2 gets twice the tokens
+            tenant_max_active: Slots one tenant may hold at once (0 = unlimited)
+            tenant_caps: Per-tenant overrides of tenant_max_active
+            policy: Order within a priority class - "fair", "fifo" or "sjf"
+            prefill_cost_ratio: Cost of one prompt token relative to one generated token (sjf)
+            aging_tokens_per_s: Predicted cost forgiven per second of waiting (sjf)
+        """
+        self.weights = dict(weights or {})
+        self.tenant_max_active = tenant_max_active
+        self.tenant_caps = dict(tenant_caps or {})
+        self.set_policy(policy)
+        self.prefill_cost_ratio = prefill_cost_ratio
+        self.aging_tokens_per_s = aging_tokens_per_s
+        self._entries: List[QueueEntry] = []
+        self._classes = {name: _ClassState() for name in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+        self._avg_output: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def set_policy(self, policy: str):
+        """Switch the ordering policy; applies to entries already queued"""
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {QUEUE_POLICIES}")
+        self.policy = policy
+
+    def push(
+        self,
+        item: Any,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        cost: Optional[float] = None,
+        prompt_tokens: int = 0,
+        max_tokens: int = 0
+    ) -> QueueEntry:
+        """
+        Queue an item.
+
+        Args:
+            cost: Fair-share cost (default prompt_tokens + max_tokens)
+            prompt_tokens, max_tokens: Request size, used for sjf predictions
+
+        Raises:
+            ValueError: Unknown priority class
+        """
+        tenant = tenant or DEFAULT_TENANT
+        priority = priority or DEFAULT_PRIORITY
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {PRIORITY_CLASSES}")
+
+        if cost is None:
+            cost = prompt_tokens + max_tokens
+        state = self._classes[priority]
+        start = max(state.virtual_time, state.finish_tags.get(tenant, 0.0))
+        state.finish_tags[tenant] = start + max(cost, 1.0) / self.weight(tenant)
+
+        entry = QueueEntry(item=item, tenant=tenant, priority=priority, cost=cost,
+                           start_tag=start, seq=next(self._seq), prompt_tokens=prompt_tokens,
+                           max_tokens=max_tokens, enqueued_at=time.monotonic())
+        self._entries.append(entry)
+        return entry
+
+    def pop(self, active_by_tenant: Optional[Dict[str, int]] = None) -> Optional[QueueEntry]:
+        """
+        Remove and return the next entry whose tenant is under its cap.
+
+        Args:
+            active_by_tenant: Slots currently held per tenant
+        """
+        active_by_tenant = active_by_tenant or {}
+        now = time.monotonic()
+        eligible = [e for e in self._entries if self._under_cap(e.tenant, active_by_tenant)]
+        if not eligible:
+            return None
+        best = min(eligible, key=lambda e: self._order_key(e, now))
+        self._entries.remove(best)
+        state = self._classes[best.priority]
+        state.virtual_time = max(state.virtual_time, best.start_tag)
+        return best
+
+    def remove(self, item: Any) -> bool:
+        """Drop a waiting item (e.g. cancelled); False if it is not queued"""
+        for entry in self._entries:
+            if entry.item is item:
+                self._entries.remove(entry)
+                return True
+        return False
+
+    def ordered(self, active_by_tenant: Optional[Dict[str, int]] = None) -> List[QueueEntry]:
+        """
+        Entries in projected dispatch order.
+
+        Caps are applied as if each dispatched entry kept its slot, so the
+        order is what the queue would do with no job finishing meanwhile;
+        capped entries that could never go in that case come last.
+        """
+        active = dict(active_by_tenant or {})
+        now = time.monotonic()
+        remaining = sorted(self._entries, key=lambda e: self._order_key(e, now))
+        order = []
+        while remaining:
+            nxt = next((e for e in remaining if self._under_cap(e.tenant, active)), None)
+            if nxt is None:
+                order.extend(remaining)
+                break
+            remaining.remove(nxt)
+            order.append(nxt)
+            active[nxt.tenant] = active.get(nxt.tenant, 0) + 1
+        return order
+
+    def record_output(self, tenant: Optional[str], generated_tokens: int):
+        """Learn a tenant's typical output length from a finished job"""
+        tenant = tenant or DEFAULT_TENANT
+        avg = self._avg_output.get(tenant)
+        if avg is None:
+            self._avg_output[tenant] = float(generated_tokens)
+        else:
+            self._avg_output[tenant] = avg + self._OUTPUT_ALPHA * (generated_tokens - avg)
+
+    def predicted_output(self, tenant: str, max_tokens: int) -> float:
+        """Expected generated tokens: the tenant's average, capped by max_tokens"""
+        avg = self._avg_output.get(tenant)
+        if avg is None:
+            return float(max_tokens)
+        return min(avg, float(max_tokens)) if max_tokens > 0 else avg
+
+    def predicted_cost(self, entry: QueueEntry, now: Optional[float] = None) -> float:
+        """sjf cost of an entry in generated-token units, after aging"""
+        now = time.monotonic() if now is None else now
+        cost = entry.prompt_tokens * self.prefill_cost_ratio + self.predicted_output(entry.tenant, entry.max_tokens)
+        return cost - self.aging_tokens_per_s * (now - entry.enqueued_at)
+
+    def _order_key(self, entry: QueueEntry, now: float):
+        rank = PRIORITY_CLASSES.index(entry.priority)
+        if self.policy == "fifo":
+            return (rank, entry.seq)
+        if self.policy == "sjf":
+            return (rank, self.predicted_cost(entry, now), entry.seq)
+        return entry.sort_key
+
+    def weight(self, tenant: str) -> float:
+        return max(float(self.weights.get(tenant, 1.0)), 1e-6)
+
+    def cap(self, tenant: str) -> int:
+        return int(self.tenant_caps.get(tenant, self.tenant_max_active))
+
+    def _under_cap(self, tenant: str, active_by_tenant: Dict[str, int]) -> bool:
+        cap = self.cap(tenant)
+        return cap <= 0 or active_by_tenant.get(tenant, 0) < cap
@@ -0,0 +1,245 @@
+"""
+Per-request generation state for RKLLM inference.
+
+Every call into the runtime owns a GenerationSession. The session is
+registered in a SessionRegistry and its integer key is handed to rkllm_run
+as the ``userdata`` pointer, so the single C callback registered at
+rkllm_init() can route tokens, stop state and perf stats back to the request
+that produced them instead of writing into model-wide fields.
+
+Completion is signalled through ``GenerationSession.done``: the callback sets
+it on RKLLM_RUN_FINISH / RKLLM_RUN_ERROR (or when the session pauses the
+runtime), so callers block on an event instead of polling rkllm_is_running.
+
+Stop sequences are matched incrementally by StopSequenceMatcher. Text that
+could still become a stop string is held back from the streaming callback,
+and on a match the session trims it and asks the owner to abort decode.
+"""
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .stop_matcher import StopSequenceMatcher
+
+logger = logging.getLogger(__name__)
+
+# Used when the client does not send its own stop sequences
+DEFAULT_STOP_SEQUENCES = ["<|im_end|>", "<|endoftext|>"]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token) used when no tokenizer is available"""
+    return max(1, len(text) // 4) if text else 0
+
+
+class GenerationSession:
+    """State owned by a single generate / embedding request"""
+
+    def __init__(
+        self,
+        prompt: str = "",
+        max_tokens: int = 512,
+        callback: Optional[Callable[[str], None]] = None,
+        stop: Optional[List[str]] = None,
+        prompt_tokens: Optional[int] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ):
+        """
+        Args:
+            prompt: Prompt text sent to the runtime (kept for KV bookkeeping)
+            max_tokens: Maximum tokens to generate (<= 0 falls back to 512)
+            callback: Optional streaming callback receiving each text piece
+            stop: Optional stop sequences (defaults to ChatML end markers)
+            prompt_tokens: Prompt length in tokens (estimated if not given)
+            tenant: Fair-queuing key (API key or user), None = anonymous
+            priority: Scheduling class (interactive, batch, background)
+            deadline: time.monotonic() by which the session must get a slot
+        """
+        self.session_id = 0  # Assigned by SessionRegistry.register()
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt)
+        self.max_tokens = max_tokens if max_tokens > 0 else 512
+        self.callback = callback
+        self.stop_sequences = stop if stop else list(DEFAULT_STOP_SEQUENCES)
+        self.stop_matcher = StopSequenceMatcher(self.stop_sequences)
+        self.matched_stop: Optional[str] = None
+        self.tenant = tenant
+        self.priority = priority
+        self.deadline = deadline
+
+        # Hook that aborts decode outside the callback frame (set by the
+        # model). Without one, the session pauses the runtime via return 1.
+        self.abort_fn: Optional[Callable[["GenerationSession"], None]] = None
+        self.stopped = False
+        self.aborted = threading.Event()  # Set once abort_fn has completed
+
+        # Output buffers: raw runtime tokens and the text released to the client
+        self.tokens: List[str] = []
+        self.token_ids: List[int] = []
+        self.output: List[str] = []
+
+        # time.monotonic() stage timestamps for latency metrics
+        self.queued_at: Optional[float] = None       # Submitted to the scheduler
+        self.started_at: Optional[float] = None      # Admitted to a batch slot
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+
+        # Runtime state
+        self.state: Optional[int] = None
+        self.perf_stats: Optional[dict] = None
+        self.finish_reason: Optional[str] = None
+        self.error: Optional[str] = None
+        self.slot = 0  # Batch slot index inside the runtime
+        self.done = threading.Event()  # Set on FINISH / ERROR / pause
+
+        # Filled by the dispatcher for RKLLM_INFER_GET_LAST_HIDDEN_LAYER runs
+        self.hidden_states = None  # Pooled float32 vector
+        self.pooling_strategy = "last"
+        self.embd_size = 0
+        self.num_tokens = 0
+        self.logits = None  # Last-position logits of RKLLM_INFER_GET_LOGITS runs
+
+        # ctypes buffers that must stay alive until the run completes
+        self.keepalive: list = []
+
+    @property
+    def text(self) -> str:
+        """Text released so far (stop sequences trimmed)"""
+        return "".join(self.output)
+
+    @property
+    def generated_tokens(self) -> int:
+        return len(self.tokens)
+
+    def on_token(self, text: str, token_id: int = -1) -> int:
+        """
+        Handle one RKLLM_RUN_NORMAL callback.
+
+        Returns:
+            Callback return code for the runtime (0 = continue, 1 = pause)
+        """
+        if self.stopped:
+            # Tokens still in flight after a stop/abort request are dropped
+            return 0 if self.abort_fn else 1
+
+        if self.generated_tokens >= self.max_tokens:
+            if self.finish_reason is None:
+                logger.info(f"🛑 Max tokens reached ({self.max_tokens}), stopping generation")
+                self.finish_reason = "length"
+            self._release(self.stop_matcher.flush())
+            # A paused run emits no FINISH, so release the waiter here
+            self.done.set()
+            return 1
+
+        if not text:
+            return 0
+
+        self.tokens.append(text)
+        self.last_token_at = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = self.last_token_at
+        if token_id >= 0:
+            self.token_ids.append(token_id)
+
+        emit, matched = self.stop_matcher.feed(text)
+        self._release(emit)
+        if matched:
+            self.matched_stop = self.stop_matcher.matched
+            logger.info(f"🛑 Stop sequence {self.matched_stop!r} matched, stopping generation")
+            return self.request_stop("stop")
+        return 0
+
+    def request_stop(self, reason: str) -> int:
+        """
+        Stop this session early (stop sequence, cancellation).
+
+        Releases the waiter and triggers the abort hook. Returns the
+        callback code to hand back to the runtime.
+        """
+        if self.stopped:
+            return 0 if self.abort_fn else 1
+        self.stopped = True
+        if self.finish_reason is None:
+            self.finish_reason = reason
+        self.done.set()
+        if self.abort_fn:
+            self.abort_fn(self)
+            return 0
+        return 1
+
+    def _release(self, text: str):
+        """Append text to the client-visible output and stream it"""
+        if not text:
+            return
+        self.output.append(text)
+        if self.callback:
+            self.callback(text)
+
+    def on_finish(self, perf_stats: Optional[dict] = None):
+        """Handle RKLLM_RUN_FINISH"""
+        if perf_stats is not None:
+            self.perf_stats = perf_stats
+        if not self.stopped:
+            self._release(self.stop_matcher.flush())
+        if self.finish_reason is None:
+            self.finish_reason = "stop"
+        self.done.set()
+
+    def on_error(self, message: str = "RKLLM runtime reported an error"):
+        """Handle RKLLM_RUN_ERROR"""
+        if self.stopped:
+            # Aborted runs may report an error state; the result is still valid
+            logger.debug(f"Ignoring error after stop in session {self.session_id}")
+            self.done.set()
+            return
+        self.error = message
+        logger.error(f"❌ Generation error in session {self.session_id}: {message}")
+        self.done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the runtime signals completion; False on timeout"""
+        return self.done.wait(timeout)
+
+
+class SessionRegistry:
+    """
+    Maps ``userdata`` keys to live sessions.
+
+    Keys start at 1 so that a NULL userdata pointer (which ctypes hands to
+    the callback as ``None``) never resolves to a session.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[int, GenerationSession] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def register(self, session: GenerationSession) -> int:
+        """Register a session and return its userdata key"""
+        with self._lock:
+            session.session_id = next(self._ids)
+            self._sessions[session.session_id] = session
+        return session.session_id
+
+    def unregister(self, session: GenerationSession):
+        with self._lock:
+            self._sessions.pop(session.session_id, None)
+
+    def get(self, key: Optional[int]) -> Optional[GenerationSession]:
+        """Look up a session by the userdata value passed to the callback"""
+        if not key:
+            return None
+        with self._lock:
+            return self._sessions.get(key)
+
+    def active(self) -> List[GenerationSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,446 @@
+"""
+Vision encoders for multimodal RKLLM models.
+
+Multimodal models ship a ``*vision*.rknn`` encoder next to the ``.rkllm``
+file. Running the ``imgenc`` demo binary per request reloads that model
+every time, which dominates time-to-first-token for image prompts.
+
+ImageEncoderWorker keeps the encoder loaded in a long-lived child process
+(RKNN-Lite runs NPU work outside the server process, like imgenc did) and
+exchanges image bytes and embedding arrays over a pipe. The parent:
+  - waits for the worker to report that the model is loaded,
+  - restarts it when a request times out or the process dies, retrying the
+    request once, with a cooldown after repeated failed starts,
+  - pings it periodically while idle so a dead worker is replaced before
+    the next image arrives.
+
+ImgencImageEncoder is the fallback when rknn-toolkit-lite2 is not
+installed: it still runs one imgenc process per image, but locates the
+binary and vision model only once.
+"""
+import importlib.util
+import itertools
+import logging
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from utils.image_fetcher import ImageInput, PreparedImage, letterbox
+
+logger = logging.getLogger(__name__)
+
+
+def find_vision_model(model_dir: str) -> Optional[str]:
+    """Path of the ``*vision*.rknn`` encoder in a model directory"""
+    for name in sorted(os.listdir(model_dir)):
+        if name.endswith(".rknn") and "vision" in name:
+            return os.path.join(model_dir, name)
+    return None
+
+
+def find_imgenc(model_dir: str) -> Optional[str]:
+    """Path of the imgenc demo binary below a model directory"""
+    for root, _, files in os.walk(model_dir):
+        if "imgenc" in files:
+            return os.path.join(root, "imgenc")
+    fallback = os.path.join(model_dir, "demo_Linux_aarch64", "imgenc")
+    return fallback if os.path.exists(fallback) else None
+
+
+def vision_model_id(model_path: str, image_size: Optional[int] = None) -> str:
+    """Identifies an encoder's output space: model file name and size, input resolution"""
+    model_id = Path(model_path).stem
+    if os.path.exists(model_path):
+        model_id += f"-{os.path.getsize(model_path)}"
+    if image_size:
+        model_id += f"-{image_size}px"
+    return model_id
+
+
+def rknnlite_available() -> bool:
+    return importlib.util.find_spec("rknnlite") is not None
+
+
+class RKNNLiteImageEncoder:
+    """
+    Vision encoder on RKNN-Lite, run inside the worker process.
+
+    Preprocessing follows the imgenc demo: pad to a square with a grey
+    background, resize to the model input and feed uint8 NHWC; mean/std
+    normalisation is compiled into the .rknn model.
+    """
+
+    def __init__(self, model_path: str, image_size: int = 392, core_mask: Optional[int] = None):
+        from rknnlite.api import RKNNLite
+
+        self.image_size = image_size
+        self.rknn = RKNNLite(verbose=False)
+        if self.rknn.load_rknn(model_path) != 0:
+            raise RuntimeError(f"Failed to load vision model {model_path}")
+        mask = RKNNLite.NPU_CORE_AUTO if core_mask is None else core_mask
+        if self.rknn.init_runtime(core_mask=mask) != 0:
+            raise RuntimeError("Failed to initialise RKNN-Lite runtime for the vision model")
+
+    def preprocess(self, image: ImageInput) -> np.ndarray:
+        if isinstance(image, PreparedImage):
+            pixels = image.pixels
+            if pixels.shape[:2] != (self.image_size, self.image_size):
+                raise ValueError(f"Prepared image is {pixels.shape[1]}x{pixels.shape[0]}, "
+                                 f"encoder expects {self.image_size}x{self.image_size}")
+        else:
+            pixels = letterbox(image, self.image_size)
+        return pixels[np.newaxis]
+
+    def encode(self, image: ImageInput) -> np.ndarray:
+        outputs = self.rknn.inference(inputs=[self.preprocess(image)], data_format="nhwc")
+        if not outputs:
+            raise RuntimeError("Vision model returned no outputs")
+        return np.concatenate([np.asarray(o, dtype=np.float32).ravel() for o in outputs])
+
+    def release(self):
+        self.rknn.release()
+
+
+def _worker_main(conn, factory: Callable[..., Any], model_path: str, options: Dict[str, Any]):
+    """Child process loop: load the encoder once, then serve requests"""
+    try:
+        encoder = factory(model_path, **options)
+    except Exception as e:
+        conn.send(("error", 0, f"Failed to load vision encoder: {e}"))
+        return
+    conn.send(("ready", 0, os.getpid()))
+
+    try:
+        while True:
+            try:
+                op, req_id, payload = conn.recv()
+            except EOFError:
+                break
+            if op == "stop":
+                break
+            if op == "ping":
+                conn.send(("pong", req_id, None))
+            elif op == "encode":
+                try:
+                    conn.send(("ok", req_id, encoder.encode(payload)))
+                except Exception as e:
+                    conn.send(("error", req_id, str(e)))
+    finally:
+        release = getattr(encoder, "release", None)
+        if release is not None:
+            release()
+
+
+class ImageEncoderError(RuntimeError):
+    """The worker is unavailable (crashed, timed out or failed to start)"""
+
+
+class ImageEncoderWorker:
+    """Long-lived vision encoder process with health checks and restart"""
+
+    def __init__(
+        self,
+        model_path: str,
+        factory: Callable[..., Any] = RKNNLiteImageEncoder,
+        options: Optional[Dict[str, Any]] = None,
+        timeout: float = 30.0,
+        load_timeout: float = 60.0,
+        max_restarts: int = 3,
+        restart_cooldown: float = 30.0,
+        health_interval: float = 30.0,
+        mp_context: str = "spawn"
+    ):
+        """
+        Args:
+            model_path: Path to the vision .rknn model
+            factory: Encoder class/function built in the child as factory(model_path, **options)
+            options: Keyword arguments for the factory (e.g. image_size, core_mask)
+            timeout: Seconds to wait for one image before the worker is restarted
+            load_timeout: Seconds to wait for the model to load on (re)start
+            max_restarts: Consecutive failed starts before pausing restarts
+            restart_cooldown: Seconds to wait after max_restarts failed starts
+            health_interval: Seconds between idle pings (0 disables the monitor)
+            mp_context: multiprocessing start method ("spawn" is safe with threads)
+        """
+        self.model_path = model_path
+        self.factory = factory
+        self.options = dict(options or {})
+        self.model_id = vision_model_id(model_path, self.options.get("image_size"))
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self.max_restarts = max_restarts
+        self.restart_cooldown = restart_cooldown
+        self.health_interval = health_interval
+        self._ctx = multiprocessing.get_context(mp_context)
+
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self._ids = itertools.count(1)
+        self._failed_starts = 0
+        self._retry_after = 0.0
+        self._stopped = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+        # Counters for health reporting
+        self.starts = 0
+        self.restarts = 0
+        self.encoded = 0
+        self.total_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the worker and wait until the model is loaded"""
+        with self._lock:
+            self._ensure_running()
+        if self.health_interval > 0 and self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, name="image-encoder-health", daemon=True)
+            self._monitor.start()
+
+    def encode(self, image: ImageInput) -> np.ndarray:
+        """
+        Encode one image (encoded bytes or pixels prepared by ImageFetcher).
+
+        Raises:
+            ValueError: The worker rejected the image (e.g. undecodable)
+            ImageEncoderError: The worker could not produce a result after a restart
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    self._ensure_running()
+                    start = time.perf_counter()
+                    embeddings = self._request("encode", image, self.timeout)
+                    self.encoded += 1
+                    self.total_ms += (time.perf_counter() - start) * 1000
+                    return embeddings
+                except ImageEncoderError as e:
+                    self.last_error = str(e)
+                    self._kill()
+                    if attempt == 1:
+                        raise
+                    logger.warning(f"⚠️  Image encoder failed ({e}), restarting worker")
+
+    def ping(self, timeout: float = 2.0) -> bool:
+        """True if the worker answers within ``timeout``"""
+        with self._lock:
+            return self._ping_locked(timeout)
+
+    def health(self) -> Dict[str, Any]:
+        alive = self._process is not None and self._process.is_alive()
+        return {
+            "backend": getattr(self.factory, "__name__", str(self.factory)),
+            "alive": alive,
+            "pid": self._process.pid if alive else None,
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "encoded": self.encoded,
+            "avg_encode_ms": round(self.total_ms / self.encoded, 1) if self.encoded else 0.0,
+            "last_error": self.last_error,
+        }
+
+    def stop(self):
+        """Stop the worker process and the health monitor"""
+        self._stopped.set()
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.send(("stop", 0, None))
+                except (OSError, ValueError):
+                    pass
+            if self._process is not None:
+                self._process.join(timeout=5)
+            self._kill()
+
+    # ------------------------------------------------------------------
+    # Internals (caller holds self._lock)
+    # ------------------------------------------------------------------
+
+    def _ensure_running(self):
+        if self._process is not None and self._process.is_alive():
+            return
+        if self._process is not None:
+            self.last_error = f"Worker exited with code {self._process.exitcode}"
+            logger.warning(f"⚠️  Image encoder worker died ({self.last_error}), restarting")
+            self._kill()
+        if time.monotonic() < self._retry_after:
+            raise ImageEncoderError(f"Image encoder unavailable after {self.max_restarts} failed starts")
+
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.factory, self.model_path, self.options),
+            name="image-encoder",
+            daemon=True
+        )
+        start = time.perf_counter()
+        process.start()
+        child_conn.close()
+        self._process, self._conn = process, parent_conn
+        if self.starts:
+            self.restarts += 1
+        self.starts += 1
+
+        try:
+            self._receive(0, self.load_timeout, expect="ready")
+        except (ImageEncoderError, ValueError) as e:
+            self._kill()
+            self._failed_starts += 1
+            self.last_error = str(e)
+            if self._failed_starts >= self.max_restarts:
+                self._retry_after = time.monotonic() + self.restart_cooldown
+                self._failed_starts = 0
+            raise ImageEncoderError(str(e))
+        self._failed_starts = 0
+        logger.info(f"🖼️  Image encoder worker ready (pid {process.pid}, "
+                    f"{(time.perf_counter() - start) * 1000:.0f} ms to load)")
+
+    def _request(self, op: str, payload: Any, timeout: float) -> Any:
+        req_id = next(self._ids)
+        try:
+            self._conn.send((op, req_id, payload))
+        except (OSError, ValueError) as e:
+            raise ImageEncoderError(f"Worker pipe closed: {e}")
+        return self._receive(req_id, timeout)
+
+    def _receive(self, req_id: int, timeout: float, expect: str = "ok") -> Any:
+        try:
+            if not self._conn.poll(timeout):
+                raise ImageEncoderError(f"No reply from image encoder within {timeout:.0f}s")
+            status, reply_id, payload = self._conn.recv()
+        except EOFError:
+            raise ImageEncoderError("Image encoder worker exited")
+        except OSError as e:
+            raise ImageEncoderError(f"Image encoder pipe error: {e}")
+        if status == "error":
+            if expect == "ready":
+                raise ImageEncoderError(payload)
+            raise ValueError(payload)
+        if reply_id != req_id:
+            raise ImageEncoderError(f"Out-of-order reply from image encoder ({reply_id} != {req_id})")
+        return payload
+
+    def _ping_locked(self, timeout: float) -> bool:
+        if self._process is None or not self._process.is_alive():
+            return False
+        try:
+            self._request("ping", None, timeout)
+            return True
+        except (ImageEncoderError, ValueError):
+            return False
+
+    def _kill(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join(timeout=5)
+            self._process = None
+
+    def _monitor_loop(self):
+        """Replace a dead or hung worker while no request is using it"""
+        while not self._stopped.wait(self.health_interval):
+            if not self._lock.acquire(blocking=False):
+                continue  # Busy encoding, which is its own health check
+            try:
+                if self._process is not None and not self._ping_locked(timeout=5.0):
+                    logger.warning("⚠️  Image encoder failed its health check, restarting")
+                    self.last_error = "Health check failed"
+                    self._kill()
+                    self._ensure_running()
+            except ImageEncoderError as e:
+                logger.error(f"❌ Image encoder restart failed: {e}")
+            finally:
+                self._lock.release()
+
+
+class ImgencImageEncoder:
+    """One imgenc process per image (fallback without RKNN-Lite)"""
+
+    def __init__(self, imgenc_path: str, vision_model_path: str, core_num: int = 1, timeout: float = 60.0):
+        self.imgenc_path = imgenc_path
+        self.vision_model_path = vision_model_path
+        self.model_id = vision_model_id(vision_model_path)
+        self.core_num = core_num
+        self.timeout = timeout
+        if not os.access(imgenc_path, os.X_OK):
+            os.chmod(imgenc_path, 0o755)
+
+    def start(self):
+        pass
+
+    def encode(self, image: ImageInput) -> np.ndarray:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if isinstance(image, PreparedImage):
+                from PIL import Image
+                image_path = os.path.join(temp_dir, "input.png")
+                Image.fromarray(image.pixels).save(image_path)
+            else:
+                image_path = os.path.join(temp_dir, "input.jpg")
+                with open(image_path, "wb") as f:
+                    f.write(image)
+            # Usage: ./imgenc <model_path> <image_path> <core_num>; writes img_vec.bin to cwd
+            cmd = [self.imgenc_path, self.vision_model_path, image_path, str(self.core_num)]
+            logger.info(f"🖼️  Running image encoder: {' '.join(cmd)}")
+            result = subprocess.run(cmd, cwd=temp_dir, capture_output=True, text=True, timeout=self.timeout)
+            if result.returncode != 0:
+                raise ValueError(f"imgenc failed: {result.stderr}")
+            output_path = os.path.join(temp_dir, "img_vec.bin")
+            if not os.path.exists(output_path):
+                raise ValueError("imgenc did not write img_vec.bin")
+            return np.fromfile(output_path, dtype=np.float32)
+
+    def health(self) -> Dict[str, Any]:
+        return {"backend": "imgenc", "alive": True}
+
+    def stop(self):
+        pass
+
+
+def create_image_encoder(model_path: str, config: Optional[Dict[str, Any]] = None):
+    """
+    Build the image encoder for an LLM, or None if it has no vision model.
+
+    Args:
+        model_path: Path to the .rkllm file (the vision model sits next to it)
+        config: ``vision_encoder`` section of inference_config
+    """
+    config = config or {}
+    model_dir = os.path.dirname(model_path)
+    vision_model = find_vision_model(model_dir)
+    if vision_model is None:
+        return None
+
+    backend = config.get("backend", "auto")
+    if backend in ("auto", "rknnlite") and rknnlite_available():
+        options = {"image_size": config.get("image_size", 392)}
+        if config.get("core_mask") is not None:
+            options["core_mask"] = config["core_mask"]
+        return ImageEncoderWorker(
+            vision_model,
+            options=options,
+            timeout=config.get("timeout_s", 30.0),
+            max_restarts=config.get("max_restarts", 3),
+            health_interval=config.get("health_interval_s", 30.0)
+        )
+    if backend == "rknnlite":
+        logger.warning("⚠️  rknn-toolkit-lite2 not installed, falling back to imgenc")
+
+    imgenc = find_imgenc(model_dir)
+    if imgenc is None:
+        logger.error("❌ imgenc binary not found and RKNN-Lite unavailable; image input disabled")
+        return None
+    return ImgencImageEncoder(imgenc, vision_model, timeout=config.get("timeout_s", 60.0))
@@ -4,9 +4,11 @@ Internal request/response types for unified API handling.
 These types are API-agnostic and used internally to process requests
 from different API formats (OpenAI, Ollama, etc.) through a shared queue.
 """
-from dataclasses import dataclass
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
 from enum import Enum
-from typing import Optional
+from typing import Dict, Optional, Sequence
 
 
 class InferenceMode(Enum):
@@ -40,6 +42,71 @@ class InferenceRequest:
     source_api: str = "openai"  # "openai" or "ollama"
 
 
+@dataclass
+class RequestTiming:
+    """
+    Where the time of one request went, in milliseconds
+    
+    Filled in stage by stage as the request moves through the route
+    (templating, image fetch) and the model (queue, image encode, prefill,
+    decode), then reported in ``usage.timing`` and a Server-Timing header.
+    Stages a request does not go through stay at 0.
+    """
+    queue_wait_ms: float = 0.0        # Waiting for an NPU batch slot
+    template_ms: float = 0.0          # Chat template, history trimming, token counting
+    image_fetch_ms: float = 0.0       # Downloading and letterboxing images
+    image_encode_ms: float = 0.0      # Vision encoder (or image embedding cache)
+    prefill_ms: float = 0.0           # Prompt prefill reported by the runtime
+    decode_ms: float = 0.0            # Token generation reported by the runtime
+    first_token_ms: float = 0.0       # Request start to first generated token
+    stream_flush_ms: float = 0.0      # Draining buffered SSE chunks after generation
+    image_generate_ms: float = 0.0    # Stable Diffusion inference (/v1/images/generations)
+    total_ms: float = 0.0             # Request start to response (set by finish())
+    
+    # time.monotonic() when the request arrived
+    started_at: float = field(default_factory=time.monotonic, repr=False, compare=False)
+    
+    @contextmanager
+    def measure(self, stage: str):
+        """Add the elapsed time of a block to a stage"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            setattr(self, stage, getattr(self, stage) + (time.monotonic() - start) * 1000)
+    
+    def record_session(self, session, perf_stats: Optional[dict] = None):
+        """
+        Take the scheduler and runtime stages from a finished generation
+        
+        Args:
+            session: GenerationSession with queued_at / started_at / first_token_at
+            perf_stats: Runtime perf stats (prefill/generate time)
+        """
+        if session.queued_at is not None and session.started_at is not None:
+            self.queue_wait_ms = (session.started_at - session.queued_at) * 1000
+        if session.first_token_at is not None:
+            self.first_token_ms = (session.first_token_at - self.started_at) * 1000
+        if perf_stats:
+            self.prefill_ms = perf_stats.get('prefill_time_ms', 0.0)
+            self.decode_ms = perf_stats.get('generate_time_ms', 0.0)
+    
+    def finish(self) -> "RequestTiming":
+        self.total_ms = (time.monotonic() - self.started_at) * 1000
+        return self
+    
+    def to_dict(self) -> Dict[str, float]:
+        return {f.name: round(getattr(self, f.name), 2) for f in fields(self) if f.compare}
+    
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value, e.g. ``queue_wait;dur=12.5, prefill;dur=80.1``
+        
+        Stages that took no time (or have not happened yet) are left out.
+        """
+        return ", ".join(f"{name[:-3]};dur={value}" for name, value in self.to_dict().items() if value)
+
+
 @dataclass
 class InferenceResponse:
     """
@@ -52,8 +119,8 @@ class InferenceResponse:
     text: Optional[str] = None
     finish_reason: Optional[str] = None
     
-    # For embeddings (future)
-    embedding: Optional[list[float]] = None
+    # For embeddings: float32 numpy array (or list), converted by the adapters
+    embedding: Optional[Sequence[float]] = None
     embedding_dim: Optional[int] = None
     
     # Common metadata
@@ -66,3 +133,6 @@ class InferenceResponse:
     prefill_tokens: int = 0
     generate_time_ms: float = 0.0
     generate_tokens: int = 0
+    
+    # Per-stage breakdown (generation requests)
+    timing: Optional[RequestTiming] = None
@@ -0,0 +1,228 @@
+"""
+KV cache planning for one generation run.
+
+Before each rkllm_run the slot's KV cache is brought in line with the
+prompt from one of three sources:
+  - the resident KV cache, trimmed to the prefix it shares with the prompt
+    (TokenPrefixIndex); only the rest is prefilled, as token input
+  - a binary prompt cache: a conversation snapshot (ConversationCacheManager)
+    or the automatic cache of a repeated prefix (PromptCacheManager)
+  - nothing: the KV cache is cleared and the whole prompt is prefilled
+
+After the run the planner records what the KV cache now holds. A turn
+restored from (or saved to) a conversation snapshot keeps its KV history
+too, so the next turn of the same conversation is served from the resident
+KV cache instead of reloading a multi-MB snapshot.
+"""
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from utils.conversation_cache import RESIDENT, ConversationPlan
+from .prefix_cache import PrefixPlan, TokenPrefixIndex
+from .tokenizer_service import TokenizerService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class KVPlan:
+    """How one run prepares and leaves the KV cache"""
+    prompt_ids: Optional[List[int]] = None      # Tokens of the prompt, if tracked
+    prefix: Optional[PrefixPlan] = None         # Resident prefix reused (token input)
+    conversation: Optional[ConversationPlan] = None
+    binary_cache_path: Optional[str] = None
+    save_binary_cache: bool = False
+    track: bool = False                         # Record the KV contents after the run
+
+    @property
+    def input_ids(self) -> Optional[List[int]]:
+        """Tokens to prefill as RKLLM_INPUT_TOKEN, or None for text input"""
+        if self.prefix is None:
+            return None
+        return self.prompt_ids[self.prefix.reuse:]
+
+    @property
+    def keep_history(self) -> int:
+        return 1 if self.track else 0
+
+
+class KVPlanner:
+    """Chooses between resident KV reuse, binary prompt caches and a full prefill"""
+
+    def __init__(
+        self,
+        prefix_index: TokenPrefixIndex,
+        tokenizer_service: TokenizerService,
+        clear_kv: Optional[Callable[..., bool]] = None,
+        max_context_len: int = 0,
+        batch_size: int = 1,
+        token_input: bool = True,
+        conversation_cache=None,
+        prompt_cache=None,
+        model_name: str = ""
+    ):
+        """
+        Args:
+            prefix_index: Token sequences resident in each slot's KV cache
+            tokenizer_service: Encoder for prompts (prefix reuse needs a tokenizer)
+            clear_kv: clear_kv(start, end) trims the KV cache, clear_kv() empties
+                it; returns False on failure (None = rkllm_clear_kv_cache missing)
+            max_context_len: KV positions per slot
+            batch_size: n_batch of the handle; with several slots the KV cache
+                is shared and nothing is reused or tracked
+            token_input: Whether prompts may be sent as tokens (see token_input_allowed)
+            conversation_cache: ConversationCacheManager (None = disabled)
+            prompt_cache: PromptCacheManager for automatic prefix caches
+            model_name: Friendly model name (cache keys)
+        """
+        self.prefix_index = prefix_index
+        self.tokenizer_service = tokenizer_service
+        self.clear_kv = clear_kv
+        self.max_context_len = max_context_len
+        self.batch_size = batch_size
+        self.token_input = token_input
+        self.conversation_cache = conversation_cache
+        self.prompt_cache = prompt_cache
+        self.model_name = model_name
+
+    @property
+    def tracks_kv(self) -> bool:
+        """Whether the resident KV cache can be tracked and trimmed"""
+        return (self.batch_size == 1 and self.clear_kv is not None and self.token_input
+                and self.tokenizer_service.available)
+
+    def plan(
+        self,
+        prompt: str,
+        session,
+        conversation_id: Optional[str] = None,
+        auto_prefix: Optional[str] = None,
+        binary_cache_path: Optional[str] = None,
+        save_binary_cache: bool = False,
+        has_images: bool = False
+    ) -> KVPlan:
+        """
+        Prepare the slot's KV cache for ``prompt``.
+
+        Args:
+            prompt: Full formatted prompt
+            session: GenerationSession (slot, prompt_tokens)
+            conversation_id: Conversation key for snapshots
+            auto_prefix: Formatted prefix eligible for an automatic binary cache
+            binary_cache_path: Explicit binary cache requested by the client
+            save_binary_cache: Save rather than load the explicit cache
+            has_images: Multimodal input replaces the KV state wholesale
+        """
+        kv = KVPlan(binary_cache_path=binary_cache_path, save_binary_cache=save_binary_cache)
+
+        # Conversation cache: restore a displaced conversation's NPU state
+        # from its snapshot, or take a snapshot while prefilling
+        if self.conversation_cache is not None and self.batch_size == 1:
+            if conversation_id and not binary_cache_path and not has_images:
+                kv.conversation = self.conversation_cache.plan(
+                    self.model_name, conversation_id, prompt,
+                    kv_resident=self.prefix_index.resident_length(session.slot) > 0
+                )
+                if kv.conversation.action != RESIDENT:
+                    kv.binary_cache_path = kv.conversation.cache_path
+                    kv.save_binary_cache = kv.conversation.save
+                logger.info(f"💬 Conversation {conversation_id}: {kv.conversation.action}")
+            else:
+                self.conversation_cache.invalidate_resident()
+
+        # Automatic prefix cache: load the content-addressed binary cache of
+        # a repeated prefix, unless the live KV cache already holds it
+        if (auto_prefix and self.prompt_cache is not None and kv.conversation is None
+                and not kv.binary_cache_path and not has_images and self.batch_size == 1
+                and prompt.startswith(auto_prefix) and not self.covers(auto_prefix, session.slot)):
+            auto_cache_path = self.prompt_cache.lookup_prefix(self.model_name, auto_prefix)
+            if auto_cache_path:
+                logger.info(f"🔥 Auto prompt cache hit: {Path(auto_cache_path).stem}")
+                kv.binary_cache_path = auto_cache_path
+                kv.save_binary_cache = False
+
+        if not kv.binary_cache_path and not has_images:
+            kv.prompt_ids, kv.prefix = self.plan_reuse(prompt, session)
+            kv.track = kv.prefix is not None
+        else:
+            # Binary caches and images replace the KV state wholesale
+            self.reset(session)
+            if kv.conversation is not None and self.tracks_kv:
+                # The snapshot run keeps its KV history, so the next turn of
+                # this conversation is RESIDENT rather than another restore
+                kv.prompt_ids = self.tokenizer_service.encode(prompt)
+                session.prompt_tokens = len(kv.prompt_ids)
+                kv.track = True
+        return kv
+
+    def plan_reuse(self, prompt: str, session):
+        """
+        Keep the KV entries shared with the previous run and trim the rest.
+
+        Returns:
+            (prompt_ids, plan). With a plan, only prompt_ids[plan.reuse:] must
+            be prefilled and the run must keep history; without one the KV
+            cache has been cleared and the prompt is prefilled as text.
+        """
+        prompt_ids = None
+        plan = None
+        if self.tracks_kv:
+            prompt_ids = self.tokenizer_service.encode(prompt)
+            session.prompt_tokens = len(prompt_ids)
+            plan = self.prefix_index.plan(prompt_ids, session.slot)
+            # Clear up to the end of the context: anything past what we
+            # recorded (e.g. the last sampled token) must go too
+            if plan.reuse:
+                cleared = self.clear_kv(plan.trim_from, self.max_context_len)
+            else:
+                cleared = self.clear_kv()
+            if not cleared:
+                plan = None
+            if plan is not None:
+                self.prefix_index.truncate(plan.reuse, session.slot)
+                if plan.reuse:
+                    logger.info(f"♻️ Prefix cache hit: reusing {plan.reuse}/{len(prompt_ids)} tokens, "
+                                f"prefilling {len(prompt_ids) - plan.reuse}")
+
+        if plan is None:
+            self.reset(session)
+        return prompt_ids, plan
+
+    def reset(self, session):
+        """Start from an empty KV cache that the prefix index does not track"""
+        if self.batch_size != 1:
+            return
+        if self.clear_kv is not None and self.clear_kv():
+            logger.debug("🧹 KV cache cleared")
+        self.prefix_index.invalidate(session.slot)
+
+    def covers(self, prefix: str, slot: int = 0) -> bool:
+        """Whether the resident KV cache (prefix index) already holds ``prefix``"""
+        if not self.tokenizer_service.available or not self.prefix_index.resident_length(slot):
+            return False
+        prefix_ids = self.tokenizer_service.encode(prefix)
+        return self.prefix_index.match(prefix_ids, slot) >= len(prefix_ids)
+
+    def finish(self, kv: KVPlan, session, prompt: str):
+        """Record the KV contents and conversation state after a run"""
+        # The last sampled token has not been fed through the model yet
+        if kv.track:
+            if session.stopped and not session.token_ids:
+                # Aborted during prefill: KV contents are unknown
+                self.prefix_index.invalidate(session.slot)
+            else:
+                self.prefix_index.insert(kv.prompt_ids + session.token_ids[:-1], session.slot)
+        if kv.conversation is not None:
+            if session.stopped and not session.tokens:
+                # Aborted during prefill: the snapshot may be incomplete
+                self.conversation_cache.discard(kv.conversation)
+            else:
+                self.conversation_cache.commit(kv.conversation, prompt)
+
+    def fail(self, kv: Optional[KVPlan], session):
+        """Forget the KV state of a failed run"""
+        self.prefix_index.invalidate(session.slot)
+        if kv is not None and kv.conversation is not None:
+            self.conversation_cache.discard(kv.conversation)
@@ -0,0 +1,171 @@
+"""
+Token-level prefix index for KV cache reuse.
+
+A radix tree over token IDs records which token sequence is resident in the
+KV cache of each batch slot. For an incoming prompt the index returns the
+longest common prefix with what the slot already holds, so the runtime can
+trim its KV cache back to that point (rkllm_clear_kv_cache with start/end
+positions) and prefill only the diverging suffix. Edits, regenerations and
+branch-style chat UIs therefore keep the shared part of the conversation.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class _RadixNode:
+    __slots__ = ("edge", "children", "slots")
+
+    def __init__(self, edge: Tuple[int, ...] = ()):
+        self.edge = edge
+        self.children: Dict[int, "_RadixNode"] = {}
+        # Slots whose resident sequence passes through this node
+        self.slots = set()
+
+
+def _common_length(edge: Sequence[int], tokens: Sequence[int], offset: int) -> int:
+    n = min(len(edge), len(tokens) - offset)
+    i = 0
+    while i < n and edge[i] == tokens[offset + i]:
+        i += 1
+    return i
+
+
+@dataclass
+class PrefixPlan:
+    """How to bring a slot's KV cache in line with a new prompt"""
+    reuse: int            # Leading prompt tokens already resident
+    trim_from: int        # First KV position to clear (== reuse)
+    resident: int         # Tokens resident before trimming
+
+
+class TokenPrefixIndex:
+    """Radix tree of the token sequences resident in each slot's KV cache"""
+
+    def __init__(self):
+        self._root = _RadixNode()
+        self._resident: Dict[int, Tuple[int, ...]] = {}
+
+        # Counters for reporting
+        self.lookups = 0
+        self.hits = 0
+        self.reused_tokens = 0
+
+    def match(self, tokens: Sequence[int], slot: int = 0) -> int:
+        """Length of the longest common prefix of ``tokens`` and the slot's KV"""
+        node = self._root
+        i = 0
+        while i < len(tokens):
+            child = node.children.get(tokens[i])
+            if child is None or slot not in child.slots:
+                break
+            k = _common_length(child.edge, tokens, i)
+            i += k
+            if k < len(child.edge):
+                break
+            node = child
+        return i
+
+    def plan(self, tokens: Sequence[int], slot: int = 0) -> PrefixPlan:
+        """
+        Decide how much of the slot's KV cache to keep for ``tokens``.
+
+        At least one prompt token is always left to prefill, since the
+        runtime needs fresh logits to start decoding.
+        """
+        reuse = min(self.match(tokens, slot), max(len(tokens) - 1, 0))
+        self.lookups += 1
+        if reuse:
+            self.hits += 1
+            self.reused_tokens += reuse
+        return PrefixPlan(reuse=reuse, trim_from=reuse, resident=self.resident_length(slot))
+
+    def insert(self, tokens: Sequence[int], slot: int = 0):
+        """Record ``tokens`` as the complete resident sequence of ``slot``"""
+        self.invalidate(slot)
+        tokens = tuple(tokens)
+        self._resident[slot] = tokens
+
+        node = self._root
+        i = 0
+        while i < len(tokens):
+            child = node.children.get(tokens[i])
+            if child is None:
+                child = _RadixNode(tokens[i:])
+                child.slots.add(slot)
+                node.children[tokens[i]] = child
+                return
+            k = _common_length(child.edge, tokens, i)
+            if k < len(child.edge):
+                # Split the edge at the divergence point
+                mid = _RadixNode(child.edge[:k])
+                mid.slots = set(child.slots)
+                child.edge = child.edge[k:]
+                mid.children[child.edge[0]] = child
+                node.children[tokens[i]] = mid
+                child = mid
+            child.slots.add(slot)
+            node = child
+            i += k
+
+    def truncate(self, length: int, slot: int = 0):
+        """Keep only the first ``length`` resident tokens of ``slot``"""
+        resident = self._resident.get(slot, ())
+        if length < len(resident):
+            self.insert(resident[:length], slot)
+
+    def invalidate(self, slot: Optional[int] = None):
+        """Forget what is resident in ``slot`` (all slots if None)"""
+        if slot is None:
+            self._root = _RadixNode()
+            self._resident.clear()
+            return
+        if self._resident.pop(slot, None) is None:
+            return
+        node = self._root
+        while True:
+            nxt = None
+            for key, child in list(node.children.items()):
+                if slot in child.slots:
+                    child.slots.discard(slot)
+                    if not child.slots:
+                        del node.children[key]
+                    else:
+                        nxt = child
+                    break
+            if nxt is None:
+                return
+            node = nxt
+
+    def resident_length(self, slot: int = 0) -> int:
+        return len(self._resident.get(slot, ()))
+
+    def resident_tokens(self, slot: int = 0) -> List[int]:
+        return list(self._resident.get(slot, ()))
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "reused_tokens": self.reused_tokens,
+            "resident_tokens": {slot: len(seq) for slot, seq in self._resident.items()},
+        }
+
+
+# rkllm_set_chat_template arguments that make the runtime pass prompts through verbatim
+NO_CHAT_TEMPLATE = ("", "", "")
+
+
+def token_input_allowed(runtime_template: Optional[Tuple[str, str, str]], enable_thinking: bool) -> bool:
+    """
+    Whether a prompt may be sent as token IDs instead of text.
+
+    The runtime applies its chat template, and with it the thinking switch,
+    to RKLLM_INPUT_PROMPT only. Token input is therefore the same request
+    only when the runtime template has been cleared and thinking is off.
+
+    Args:
+        runtime_template: (system, prefix, postfix) last passed to
+            rkllm_set_chat_template, or None for the model's built-in template
+        enable_thinking: Effective thinking mode of the request
+    """
+    return runtime_template == NO_CHAT_TEMPLATE and not enable_thinking
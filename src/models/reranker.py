@@ -0,0 +1,82 @@
+"""
+Prompt construction and scoring for (query, document) reranking.
+
+Two scoring methods are supported:
+  - "logits": a yes/no relevance probe. The model reads a judge prompt and
+    the score is P("yes") from the logits of the next token, restricted to
+    the "yes" and "no" tokens (the Qwen3-Reranker recipe).
+  - "embedding": cosine similarity between the query embedding and each
+    document embedding. Document vectors come from the embedding cache
+    when they were seen before.
+
+Judge prompts put the query before the document, so every pair of one
+request shares a token prefix. With the token prefix cache each pair only
+prefills its document part.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RERANK_MODES = ("auto", "logits", "embedding")
+
+DEFAULT_INSTRUCTION = "Given a web search query, retrieve relevant passages that answer the query"
+
+_JUDGE_PREFIX = (
+    "<|im_start|>system\n"
+    "Judge whether the Document meets the requirements based on the Query and the Instruct "
+    "provided. Note that the answer can only be \"yes\" or \"no\".<|im_end|>\n"
+    "<|im_start|>user\n"
+    "<Instruct>: {instruction}\n"
+    "<Query>: {query}\n"
+)
+_JUDGE_SUFFIX = (
+    "<Document>: {document}<|im_end|>\n"
+    "<|im_start|>assistant\n"
+    "<think>\n\n</think>\n\n"
+)
+
+
+def build_judge_prompts(
+    query: str,
+    documents: Sequence[str],
+    instruction: Optional[str] = None
+) -> Tuple[str, List[str]]:
+    """
+    Build the yes/no judge prompt for every document.
+
+    Returns:
+        (shared_prefix, prompts) where each prompt starts with shared_prefix
+    """
+    prefix = _JUDGE_PREFIX.format(instruction=instruction or DEFAULT_INSTRUCTION, query=query)
+    return prefix, [prefix + _JUDGE_SUFFIX.format(document=doc) for doc in documents]
+
+
+def judge_token_ids(tokenizer) -> Tuple[int, int]:
+    """Token IDs of "yes" and "no" for the judge prompt"""
+    yes_ids = tokenizer.encode("yes", add_special_tokens=False)
+    no_ids = tokenizer.encode("no", add_special_tokens=False)
+    if len(yes_ids) != 1 or len(no_ids) != 1:
+        raise ValueError("Tokenizer does not encode 'yes'/'no' as single tokens; use mode='embedding'")
+    return yes_ids[0], no_ids[0]
+
+
+def yes_probability(logits: np.ndarray, yes_id: int, no_id: int) -> float:
+    """P(yes) from a softmax over just the yes/no logits"""
+    return float(1.0 / (1.0 + np.exp(float(logits[no_id]) - float(logits[yes_id]))))
+
+
+def cosine_scores(query: np.ndarray, documents: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one query vector against a (n, dim) matrix"""
+    query = np.asarray(query, dtype=np.float32)
+    documents = np.asarray(documents, dtype=np.float32)
+    norms = np.linalg.norm(documents, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = 1.0
+    return (documents @ query) / norms
+
+
+def rank(scores: Sequence[float], top_n: Optional[int] = None) -> List[Tuple[int, float]]:
+    """(index, score) pairs sorted best first, ties keep input order"""
+    order = sorted(range(len(scores)), key=lambda i: -scores[i])
+    if top_n is not None:
+        order = order[:top_n]
+    return [(i, float(scores[i])) for i in order]
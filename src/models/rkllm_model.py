@@ -6,14 +6,30 @@ import ctypes
 import os
 import logging
 import asyncio
-import subprocess
-import tempfile
+import time
 import numpy as np
 from typing import Optional, Callable, List
 from pathlib import Path
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from utils.cache_manager import PromptCacheManager
+from utils.conversation_cache import ConversationCacheManager
+from utils.embedding_cache import EmbeddingCache
+from utils.image_cache import ImageEmbeddingCache
+from utils.image_fetcher import ImageInput
+from utils.metrics import EMBEDDING, IMAGE_ENCODE, observe_duration, record_generation
 from utils.system_prompt_generator import SystemPromptGenerator
+from .generation_session import GenerationSession, SessionRegistry
+from .batch_scheduler import BatchScheduler
+from .fair_queue import FairQueue
+from .prefix_cache import NO_CHAT_TEMPLATE, TokenPrefixIndex, token_input_allowed
+from .kv_planner import KVPlanner
+from .embedding_pooling import hidden_state_view, pool_hidden_states, l2_normalize
+from .tokenizer_service import TokenizerService
+from .image_encoder import create_image_encoder
+from .inference_types import RequestTiming
+from .vision_profile import VisionProfile, resolve_vision_profile
+from .reranker import build_judge_prompts, judge_token_ids, yes_probability, cosine_scores
 
 logger = logging.getLogger(__name__)
 
@@ -182,12 +198,6 @@ class RKLLMModel:
     _callback_lock = threading.Lock()
     _unloading = False
     
-    # Phase 4.2: Multi-batch inference semaphore
-    # Limits concurrent inference requests to match n_batch parameter
-    # NOTE: This will be updated in load() based on config n_batch value
-    _batch_semaphore = None  # Initialized in load()
-    _batch_size = 1  # Current n_batch value
-    
     def __init__(self, model_path: str, lib_path: str = "/usr/lib/librkllmrt.so"):
         """
         Initialize RKLLM model
@@ -201,21 +211,33 @@ class RKLLMModel:
         self.handle = None
         self.lib = rkllm_lib
         
-        # Streaming state
-        self.current_callback = None
-        self.generated_text = []
-        self.generation_state = None
-        self.perf_stats = None  # Will be populated by callback
-        self.current_max_tokens = -1  # No limit by default
-        self.current_stop_sequences = [] # Stop sequences
+        # Per-request state lives in GenerationSession objects; the C callback
+        # resolves them from the userdata pointer passed to rkllm_run
+        self.sessions = SessionRegistry()
+        
+        # Request queue in front of the handle (created in load())
+        self.scheduler: Optional[BatchScheduler] = None
+        self._batch_size = 1
         
         # Cache management
         self.cache_manager = PromptCacheManager()
         self.system_prompt_generator = SystemPromptGenerator()
         self.model_name = None  # Set in load() method
+        self.conversation_cache: Optional[ConversationCacheManager] = None  # Set in load()
+        self.embedding_cache = EmbeddingCache()  # Budget set in load()
         
-        # Initialize state tracking for smart caching
-        self.npu_context = ""
+        # Token-level prefix cache: which token sequence is resident in the
+        # KV cache, so a new prompt only prefills its diverging suffix
+        self.prefix_index = TokenPrefixIndex()
+        self.tokenizer = None  # HF tokenizer from the model folder (optional)
+        # Last rkllm_set_chat_template arguments (None = model's built-in template)
+        self.runtime_template: Optional[tuple] = None
+        self.tokenizer_service = TokenizerService()  # Cached encodings, exact counts
+        self.max_context_len = 0
+        self.image_encoder = None  # Persistent vision encoder (multimodal models)
+        self.vision_profile: Optional[VisionProfile] = None  # Set in load() for VL models
+        self.image_cache = ImageEmbeddingCache()  # Budgets set in _start_image_encoder()
+        self._image_executor: Optional[ThreadPoolExecutor] = None
         
         # Validate paths
         if not os.path.exists(model_path):
@@ -227,66 +249,64 @@ class RKLLMModel:
         logger.info(f"Initializing REAL RKLLM model: {Path(model_path).name}")
         
     def _callback_impl(self, result, userdata, state):
-        """Internal callback for RKLLM - called from C library"""
+        """Internal callback for RKLLM - called from C library
+        
+        Routes each result to the GenerationSession identified by ``userdata``.
+        """
         try:
-            # Debug logging
-            logger.debug(f"Callback: state={state}, result='{result}'")
-
-            # Check token limit
-            if self.current_max_tokens > 0 and len(self.generated_text) >= self.current_max_tokens:
-                logger.info(f"🛑 Max tokens reached ({self.current_max_tokens}), stopping generation")
-                return 1  # Stop generation
-
-            # Check stop sequences
-            if self.current_stop_sequences:
-                # We only need to check the last few tokens + new token to be efficient
-                # But for simplicity, let's check the tail of the generated text
-                # Construct the tail text (enough to cover the longest stop sequence)
-                # Assuming max stop sequence is not huge (e.g. < 100 chars)
-                tail_len = 200 
-                current_tail = "".join(self.generated_text[-tail_len:])
-                
-                for stop_seq in self.current_stop_sequences:
-                    if stop_seq in current_tail:
-                        logger.info(f"🛑 Stop sequence '{stop_seq}' found, stopping generation")
-                        # return 1 # DISABLED to debug crash
-                        pass
-
-
-            # logger.info(f"🔔 Callback called: state={state}")
+            session = self.sessions.get(userdata)
+            if session is None:
+                # Late callbacks from aborted runs arrive after the session is gone
+                logger.debug(f"Callback for unknown session (userdata={userdata}, state={state})")
+                return 0
+            
+            logger.debug(f"Callback: session={session.session_id}, state={state}")
+            
+            # Every rkllm_run is a single-input call, so each callback carries
+            # a one-element result array
+            res = result[0] if result else None
+            
             if state == LLMCallState.RKLLM_RUN_FINISH:
-                self.generation_state = state
-                # Extract final performance stats
-                if result and result.contents:
-                    perf = result.contents.perf
-                    self.perf_stats = {
+                session.state = state
+                perf_stats = None
+                if res is not None:
+                    perf = res.perf
+                    perf_stats = {
                         'prefill_time_ms': perf.prefill_time_ms,
                         'prefill_tokens': perf.prefill_tokens,
                         'generate_time_ms': perf.generate_time_ms,
                         'generate_tokens': perf.generate_tokens,
                         'memory_usage_mb': perf.memory_usage_mb
                     }
-                    logger.debug(f"Performance stats: {self.perf_stats}")
+                    logger.debug(f"Performance stats: {perf_stats}")
+                    
+                    # Hidden-layer runs (embeddings) deliver their states on FINISH
+                    hidden = res.last_hidden_layer
+                    if hidden.hidden_states and hidden.num_tokens > 0:
+                        # The buffer dies with the callback: pool now, copying only what is needed
+                        states = hidden_state_view(hidden.hidden_states, hidden.num_tokens, hidden.embd_size)
+                        session.hidden_states = pool_hidden_states(states, session.pooling_strategy)
+                        session.embd_size = hidden.embd_size
+                        session.num_tokens = hidden.num_tokens
+                    
+                    # Logits runs (rerank probe): keep only the last position's row
+                    logits = res.logits
+                    if logits.logits and logits.num_tokens > 0:
+                        rows = hidden_state_view(logits.logits, logits.num_tokens, logits.vocab_size)
+                        session.logits = np.array(rows[-1], dtype=np.float32)
+                session.on_finish(perf_stats)
                 logger.debug("Generation finished")
             elif state == LLMCallState.RKLLM_RUN_ERROR:
-                self.generation_state = state
-                logger.error("❌ Generation error in callback")
+                session.state = state
+                session.on_error()
             elif state == LLMCallState.RKLLM_RUN_NORMAL:
-                self.generation_state = state
-                # logger.info(f"📝 RKLLM_RUN_NORMAL: result={result}, contents={result.contents if result else 'None'}")
-                if result and result.contents:
-                    text_ptr = result.contents.text
-                    # logger.info(f"📝 text_ptr={text_ptr}, type={type(text_ptr)}")
+                session.state = state
+                if res is not None:
+                    text_ptr = res.text
                     if text_ptr is not None:
                         text = text_ptr.decode('utf-8') if isinstance(text_ptr, bytes) else str(text_ptr)
-                        # logger.info(f"📝 Got text token: {repr(text)} (len={len(text)})")
-                        if text:  # Only append if non-empty
-                            self.generated_text.append(text)
-                            # Call user callback if set
-                            if self.current_callback:
-                                self.current_callback(text)
-                    else:
-                        logger.warning("⚠️  RKLLM_RUN_NORMAL but text_ptr is None")
+                        return session.on_token(text, res.token_id)
+                    logger.warning("⚠️  RKLLM_RUN_NORMAL but text_ptr is None")
                 else:
                     logger.warning("⚠️  RKLLM_RUN_NORMAL but no result or contents")
         except Exception as e:
@@ -358,18 +378,21 @@ class RKLLMModel:
             rkllm_param.is_async = model_defaults.get('is_async', False)
             logger.info(f"  🔄 is_async mode: {rkllm_param.is_async}")
             
-            # Image parameters
-            # Keep references to bytes to prevent GC
-            self._img_start_token = b"<|vision_start|>"
-            self._img_end_token = b"<|vision_end|>"
-            self._img_content_token = b"<|image_pad|>"
-            
-            model_path_lower = self.model_path.lower()
-            if 'qwen2-vl' in model_path_lower or 'vision' in model_path_lower:
+            # Image parameters from the model's vision profile
+            self.vision_profile = resolve_vision_profile(
+                self.model_path, inference_config.get('vision_encoder', {}).get('profile')
+            )
+            if self.vision_profile is not None:
+                # Keep references to bytes to prevent GC
+                self._img_start_token = self.vision_profile.img_start.encode('utf-8')
+                self._img_end_token = self.vision_profile.img_end.encode('utf-8')
+                self._img_content_token = self.vision_profile.img_content.encode('utf-8')
                 rkllm_param.img_start = self._img_start_token
                 rkllm_param.img_end = self._img_end_token
                 rkllm_param.img_content = self._img_content_token
-                logger.info(f"  🖼️  Configured Qwen2-VL image tokens for {self.model_path}")
+                logger.info(f"  🖼️  Vision profile {self.vision_profile.name}: "
+                            f"{self.vision_profile.image_tokens} tokens x {self.vision_profile.embed_dim} per "
+                            f"{self.vision_profile.image_width}x{self.vision_profile.image_height} image")
             else:
                 rkllm_param.img_start = None
                 rkllm_param.img_end = None
@@ -378,7 +401,7 @@ class RKLLMModel:
             # Extended parameters - ALL from config now!
             # Auto-detect base_domain_id for VL models if not explicitly set in config
             base_domain_id = hw_params.get('base_domain_id', 0)
-            if 'vl' in self.model_path.lower() or 'vision' in self.model_path.lower():
+            if self.vision_profile is not None:
                 logger.info(f"👁️  Detected Vision Language Model: {self.model_path}")
                 if base_domain_id == 0:
                     base_domain_id = 1
@@ -386,17 +409,32 @@ class RKLLMModel:
             
             rkllm_param.extend_param.base_domain_id = base_domain_id
             rkllm_param.extend_param.embed_flash = hw_params.get('embed_flash', 1)
-            n_batch = hw_params.get('n_batch', 3)
+            n_batch = hw_params.get('n_batch', 1)
             rkllm_param.extend_param.n_batch = n_batch
             rkllm_param.extend_param.use_cross_attn = hw_params.get('use_cross_attn', 0)
             rkllm_param.extend_param.enabled_cpus_num = hw_params.get('enabled_cpus_num', 4)
             rkllm_param.extend_param.enabled_cpus_mask = hw_params.get('enabled_cpus_mask', 0xF0)
             
-            # Initialize batch semaphore based on n_batch from config
-            if RKLLMModel._batch_semaphore is None or RKLLMModel._batch_size != n_batch:
-                RKLLMModel._batch_size = n_batch
-                RKLLMModel._batch_semaphore = asyncio.Semaphore(n_batch)
-                logger.info(f"📊 Batch semaphore initialized: {n_batch} concurrent slots")
+            # rkllm_run calls on one handle are serialized: the scheduler runs
+            # one request at a time whatever n_batch the runtime was given
+            self._batch_size = n_batch
+            self.max_context_len = max_context_len
+            sched_cfg = inference_config.get('scheduler', {})
+            queue = FairQueue(
+                weights=sched_cfg.get('tenant_weights', {}),
+                tenant_max_active=sched_cfg.get('tenant_max_active', 0),
+                tenant_caps=sched_cfg.get('tenant_caps', {}),
+                policy=sched_cfg.get('policy', 'fair'),
+                prefill_cost_ratio=sched_cfg.get('prefill_cost_ratio', 0.1),
+                aging_tokens_per_s=sched_cfg.get('aging_tokens_per_s', 20.0)
+            )
+            self.scheduler = BatchScheduler(
+                n_slots=1,
+                max_context_len=max_context_len,
+                queue=queue,
+                max_queue_depth=sched_cfg.get('max_queue_depth', 0)
+            )
+            logger.info(f"📊 Scheduler initialized: 1 slot × {max_context_len} tokens (n_batch={n_batch})")
 
             
             # Create callback
@@ -458,6 +496,15 @@ class RKLLMModel:
                 logger.warning("⚠️  rkllm_clear_kv_cache not found in library")
                 self.rkllm_clear_kv_cache = None
 
+            # Initialize abort function (used to stop decode on stop sequences)
+            try:
+                self.rkllm_abort = self.lib.rkllm_abort
+                self.rkllm_abort.argtypes = [RKLLM_Handle_t]
+                self.rkllm_abort.restype = ctypes.c_int
+            except AttributeError:
+                logger.warning("⚠️  rkllm_abort not found in library, stopped sessions will pause instead")
+                self.rkllm_abort = None
+
             # DISABLED: We handle chat templating manually in openai_routes.py
                 # Calling this disables internal parsing but might also interfere with our manual formatting
                 # if not careful. Since we send the full formatted string as a single "prompt",
@@ -475,10 +522,55 @@ class RKLLMModel:
             except Exception as e:
                 logger.error(f"Error setting up chat template: {e}")
             
+            # "none": prompts arrive fully formatted from the routes and reach
+            # the model verbatim, which also lets the prefix cache send tokens
+            if inference_config.get('chat_template', {}).get('runtime', 'builtin') == 'none':
+                try:
+                    self.set_chat_template(*NO_CHAT_TEMPLATE)
+                except Exception as e:
+                    logger.warning(f"⚠️  Could not clear the runtime chat template: {e}")
+            
             # Set model name from path (extract folder name)
             self.model_name = Path(self.model_path).parent.name
             logger.info(f"Model name set to: {self.model_name}")
             
+            # Tokenizer for the token-level prefix cache
+            self._load_tokenizer()
+            
+            # Disk budget for binary prompt caches
+            cache_cfg = inference_config.get('prompt_cache', {})
+            self.cache_manager.max_bytes_per_model = int(cache_cfg.get('max_mb_per_model', 0) * 1024 * 1024)
+            self.cache_manager.max_bytes_total = int(cache_cfg.get('max_mb_total', 0) * 1024 * 1024)
+            self.cache_manager.eviction_policy = cache_cfg.get('eviction_policy', 'lru')
+            self.cache_manager.stats_flush_interval_s = cache_cfg.get('stats_flush_interval_s', 30)
+            self.cache_manager.enforce_budget()
+            
+            # Content-addressed caches for repeated prompt prefixes
+            auto_cfg = inference_config.get('auto_prompt_cache', {})
+            self.cache_manager.auto_cache_enabled = auto_cfg.get('enabled', True)
+            self.cache_manager.auto_cache_min_sightings = auto_cfg.get('min_sightings', 3)
+            self.cache_manager.auto_cache_min_chars = auto_cfg.get('min_prefix_chars', 256)
+            
+            # Bounded LRU of embedding results (repeated RAG chunks skip the NPU)
+            emb_cfg = inference_config.get('embedding_model', {})
+            self.embedding_cache.max_bytes = int(emb_cfg.get('cache_mb', 256) * 1024 * 1024)
+            
+            # Per-conversation NPU state snapshots (RAM tier + disk tier)
+            session_cfg = inference_config.get('session_cache', {})
+            if session_cfg.get('enabled', True):
+                self.conversation_cache = ConversationCacheManager(
+                    self.cache_manager,
+                    ram_dir=session_cfg.get('ram_dir', '/dev/shm/rkllm-sessions'),
+                    ram_budget_bytes=int(session_cfg.get('ram_budget_mb', 512) * 1024 * 1024),
+                    disk_budget_bytes=int(session_cfg.get('disk_budget_mb', 2048) * 1024 * 1024),
+                    refresh_ratio=session_cfg.get('refresh_ratio', 0.5)
+                )
+                logger.info(f"💬 Conversation cache enabled: RAM {session_cfg.get('ram_budget_mb', 512)} MB, "
+                            f"disk {session_cfg.get('disk_budget_mb', 2048)} MB")
+            
+            # Vision encoder stays loaded between image requests
+            self._start_image_encoder(inference_config.get('vision_encoder', {}))
+            
             # Auto-generate system prompt cache if it doesn't exist
             self._ensure_system_cache()
             
@@ -486,6 +578,60 @@ class RKLLMModel:
             logger.error(f"Failed to load model: {e}", exc_info=True)
             raise
     
+    def _load_tokenizer(self):
+        """
+        Load the HF tokenizer shipped next to the .rkllm file, if any.
+        
+        Token IDs are needed for the prefix cache; without a tokenizer every
+        request is prefilled from scratch.
+        """
+        model_dir = Path(self.model_path).parent
+        if not any((model_dir / name).exists() for name in ("tokenizer.json", "tokenizer_config.json")):
+            logger.info(f"ℹ️  No tokenizer files in {model_dir}, token prefix cache disabled")
+            return
+        try:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+            self.tokenizer_service = TokenizerService(self.tokenizer)
+            logger.info(f"✅ Tokenizer loaded from {model_dir}, token prefix cache enabled")
+        except ImportError:
+            logger.warning("⚠️  transformers not installed, token prefix cache disabled")
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to load tokenizer from {model_dir}: {e}")
+    
+    def _clear_kv_cache(self, start_pos: Optional[int] = None, end_pos: Optional[int] = None) -> bool:
+        """
+        Clear the KV cache, fully or only positions [start_pos, end_pos).
+        
+        rkllm_clear_kv_cache takes one start/end entry per batch slot.
+        """
+        if not getattr(self, 'rkllm_clear_kv_cache', None):
+            return False
+        if start_pos is None:
+            ret = self.rkllm_clear_kv_cache(self.handle, 0, None, None)
+        else:
+            starts = (ctypes.c_int * self._batch_size)(*([start_pos] * self._batch_size))
+            ends = (ctypes.c_int * self._batch_size)(*([end_pos] * self._batch_size))
+            ret = self.rkllm_clear_kv_cache(self.handle, 0, starts, ends)
+        if ret != 0:
+            logger.warning(f"⚠️  Failed to clear KV cache: {ret}")
+            return False
+        return True
+    
+    def _kv_planner(self, token_input: bool = True) -> KVPlanner:
+        """KV cache planner over this model's prefix index and binary caches"""
+        return KVPlanner(
+            self.prefix_index,
+            self.tokenizer_service,
+            clear_kv=self._clear_kv_cache if getattr(self, 'rkllm_clear_kv_cache', None) else None,
+            max_context_len=self.max_context_len,
+            batch_size=self._batch_size,
+            token_input=token_input,
+            conversation_cache=self.conversation_cache,
+            prompt_cache=self.cache_manager,
+            model_name=self.model_name
+        )
+    
     def _ensure_system_cache(self):
         """
         Ensure system prompt cache exists for this model.
@@ -529,6 +675,7 @@ class RKLLMModel:
             if ret != 0:
                 logger.error(f"rkllm_set_chat_template failed with code: {ret}")
                 raise RuntimeError(f"Failed to set chat template: {ret}")
+            self.runtime_template = (system_prompt, prefix, postfix)
                 
             logger.info("✅ Chat template set successfully")
             
@@ -536,81 +683,104 @@ class RKLLMModel:
             logger.error(f"Error setting chat template: {e}")
             raise
 
-    def _encode_image(self, image_data: bytes) -> Optional[np.ndarray]:
+    def _abort_session(self, session: GenerationSession):
+        """
+        Abort decode for a session that hit a stop condition.
+        
+        Called from the RKLLM callback; rkllm_abort must not run inside the
+        callback frame, so it is issued from a short-lived helper thread.
+        """
+        def abort():
+            try:
+                ret = self.rkllm_abort(self.handle)
+                if ret != 0:
+                    logger.warning(f"⚠️  rkllm_abort returned {ret}")
+                else:
+                    logger.debug(f"🛑 Decode aborted for session {session.session_id}")
+            except Exception as e:
+                logger.error(f"Error aborting inference: {e}")
+            finally:
+                session.aborted.set()
+        
+        threading.Thread(target=abort, name=f"rkllm-abort-{session.session_id}", daemon=True).start()
+    
+    def _start_image_encoder(self, config: dict):
+        """Start the vision encoder for multimodal models (keeps the .rknn loaded)"""
+        try:
+            if self.vision_profile is None:
+                return
+            config = dict(config)
+            config.setdefault('image_size', self.vision_profile.image_size)
+            self.image_encoder = create_image_encoder(self.model_path, config)
+            if self.image_encoder is None:
+                return
+            
+            # Repeated images skip the encoder: RAM LRU plus memory-mapped .npy files
+            self.image_cache.max_bytes = int(config.get('cache_mb', 64) * 1024 * 1024)
+            disk_mb = config.get('disk_cache_mb', 512)
+            if disk_mb > 0:
+                self.image_cache.disk_max_bytes = int(disk_mb * 1024 * 1024)
+                self.image_cache.set_disk_dir(str(self.cache_manager.ensure_model_cache_dir(self.model_name) / "images"))
+            
+            self.image_encoder.start()
+            logger.info(f"🖼️  Image encoder ready: {self.image_encoder.health()['backend']}")
+        except Exception as e:
+            # Text generation still works; image requests fall back to text-only
+            logger.error(f"❌ Failed to start image encoder: {e}")
+    
+    def _encode_image(self, image_data: ImageInput) -> Optional[np.ndarray]:
         """
-        Encodes an image using the external imgenc binary.
+        Encodes an image with the vision encoder.
         Returns the embeddings as a numpy array of float32.
         """
+        if self.image_encoder is None:
+            logger.error("❌ No vision encoder available for this model")
+            return None
         try:
-            # Find the vision model (.rknn) in the same directory as the LLM
-            model_dir = os.path.dirname(self.model_path)
-            vision_model_path = None
-            for f in os.listdir(model_dir):
-                if f.endswith(".rknn") and "vision" in f:
-                    vision_model_path = os.path.join(model_dir, f)
-                    break
-            
-            if not vision_model_path:
-                logger.error("❌ Vision model (.rknn) not found in model directory")
-                return None
-
-            # Find the imgenc binary
-            # Assuming it's in models/qwen2-vl-2b/demo_Linux_aarch64/imgenc
-            # We search recursively in the model directory for 'imgenc'
-            imgenc_path = None
-            for root, dirs, files in os.walk(model_dir):
-                if "imgenc" in files:
-                    imgenc_path = os.path.join(root, "imgenc")
-                    break
-            
-            if not imgenc_path:
-                # Fallback to known location if not found
-                imgenc_path = os.path.join(model_dir, "demo_Linux_aarch64", "imgenc")
-                if not os.path.exists(imgenc_path):
-                    logger.error("❌ imgenc binary not found")
-                    return None
-
-            # Ensure imgenc is executable
-            os.chmod(imgenc_path, 0o755)
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Save image to temp file
-                temp_image_path = os.path.join(temp_dir, "input.jpg")
-                with open(temp_image_path, "wb") as f:
-                    f.write(image_data)
-                
-                # Run imgenc
-                # Usage: ./imgenc <model_path> <image_path> <core_num>
-                # We use core_num=1 by default
-                cmd = [imgenc_path, vision_model_path, temp_image_path, "1"]
-                
-                logger.info(f"🖼️  Running image encoder: {' '.join(cmd)}")
-                result = subprocess.run(
-                    cmd, 
-                    cwd=temp_dir, # Run in temp dir so img_vec.bin is created there
-                    capture_output=True, 
-                    text=True
-                )
-                
-                if result.returncode != 0:
-                    logger.error(f"❌ imgenc failed: {result.stderr}")
-                    return None
-                
-                # Read output
-                output_path = os.path.join(temp_dir, "img_vec.bin")
-                if not os.path.exists(output_path):
-                    logger.error("❌ img_vec.bin not generated")
-                    return None
-                
-                # Read binary data as float32
-                embeddings = np.fromfile(output_path, dtype=np.float32)
-                logger.info(f"✅ Image encoded. Shape: {embeddings.shape}")
+            key = self.image_cache.make_key(self.image_encoder.model_id, image_data)
+            embeddings = self.image_cache.get(key)
+            if embeddings is not None:
+                logger.info(f"⚡ Image embedding cache hit. Shape: {embeddings.shape}")
                 return embeddings
-
+            embeddings = self.image_encoder.encode(image_data)
+            self.image_cache.put(key, embeddings)
+            logger.info(f"✅ Image encoded. Shape: {embeddings.shape}")
+            return embeddings
         except Exception as e:
             logger.error(f"❌ Error encoding image: {e}")
             return None
 
+    def _encode_images(self, images: List[ImageInput]) -> Optional[np.ndarray]:
+        """
+        Encode several images into one contiguous buffer for RKLLMMultiModalInput.
+        
+        Returns None if any image fails, so the request falls back to text-only
+        instead of pairing embeddings with the wrong <image> tags.
+        """
+        embeddings = []
+        for image in images:
+            embedding = self._encode_image(image)
+            if embedding is None:
+                return None
+            embeddings.append(embedding)
+        try:
+            return self.vision_profile.pack(embeddings)
+        except ValueError as e:
+            logger.error(f"❌ {e}")
+            return None
+
+    async def encode_images_async(self, images: List[ImageInput]) -> Optional[np.ndarray]:
+        """
+        _encode_images off the event loop, outside any LLM batch slot.
+        
+        One thread suffices: the encoder worker serves one image at a time.
+        """
+        if self._image_executor is None:
+            self._image_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-encode")
+        loop = asyncio.get_running_loop()
+        with observe_duration(IMAGE_ENCODE, self.model_name):
+            return await loop.run_in_executor(self._image_executor, self._encode_images, images)
+    
     def generate(
         self,
         prompt: str,
@@ -624,7 +794,11 @@ class RKLLMModel:
         binary_cache_path: Optional[str] = None,
         save_binary_cache: bool = False,
         stop: Optional[List[str]] = None,
-        image_data: Optional[bytes] = None  # New parameter for image data
+        images: Optional[List[ImageInput]] = None,  # Encoded bytes or prepared pixels
+        conversation_id: Optional[str] = None,
+        auto_prefix: Optional[str] = None,
+        session: Optional[GenerationSession] = None,
+        image_embeds: Optional[np.ndarray] = None
     ) -> tuple[str, Optional[dict]]:
         """
         Generate text completion using REAL NPU
@@ -641,7 +815,15 @@ class RKLLMModel:
             binary_cache_path: Path to binary cache file (.rkllm_cache)
             save_binary_cache: If True, save NPU state to binary_cache_path after prefill
             stop: Optional list of stop sequences
-            image_data: Optional raw bytes of the image for multimodal inference
+            images: Images for multimodal inference (raw bytes or PreparedImage), one
+                per <image> tag in the prompt, prefilled together
+            conversation_id: Optional conversation key; its NPU state is snapshotted
+                and restored across turns by the conversation cache
+            auto_prefix: Formatted prompt prefix (e.g. system message) eligible for
+                an automatic content-addressed binary cache
+            session: Pre-built session (set by generate_async after slot admission)
+            image_embeds: Packed embeddings of images, encoded before the request
+                took its slot (set by generate_async); encoded here if None
             
         Returns:
             (Generated text, performance stats dict)
@@ -649,131 +831,127 @@ class RKLLMModel:
         if not self.handle:
             raise RuntimeError("Model not loaded. Call load() first.")
         
+        if session is None:
+            session = GenerationSession(
+                prompt=prompt,
+                max_tokens=max_new_tokens,
+                callback=callback,
+                stop=stop
+            )
+        if max_new_tokens <= 0:
+            logger.info(f"⚠️  max_new_tokens was {max_new_tokens}, defaulting to {session.max_tokens}")
+        
+        # rkllm_abort stops the whole handle; runs are serialized, so the only
+        # run it can hit is this session's
+        if getattr(self, 'rkllm_abort', None):
+            session.abort_fn = self._abort_session
+        
+        self.sessions.register(session)
+        kv_plan = None
         try:
-            logger.info(f"Running REAL NPU inference...")
+            if session.stopped:
+                # Cancelled between slot admission and the runtime call
+                logger.info(f"Session {session.session_id} cancelled before start, skipping NPU run")
+                return session.text, session.perf_stats
+            
+            logger.info(f"Running REAL NPU inference (session {session.session_id})...")
             logger.debug(f"Prompt length: {len(prompt)} chars")
             
-            # Smart Caching Logic
-            # Check if the new prompt is a continuation of the current NPU context
-            should_clear = True
-            input_prompt = prompt
-            
-            if self.npu_context and prompt.startswith(self.npu_context):
-                # Optimization: Only send the new part (delta)
-                delta = prompt[len(self.npu_context):]
-                if delta:
-                    logger.info(f"♻️ Smart Cache Hit: Sending delta ({len(delta)} chars)")
-                    input_prompt = delta
-                    should_clear = False
-                else:
-                    # Exact match? Weird but possible. Send empty or just clear to be safe.
-                    logger.warning("⚠️ Smart Cache: Exact match with context, clearing to be safe")
-            
-            if should_clear:
-                # Context switch or first run
-                if hasattr(self, 'rkllm_clear_kv_cache') and self.rkllm_clear_kv_cache:
-                    ret = self.rkllm_clear_kv_cache(self.handle, 0, None, None)
-                    if ret == 0:
-                        logger.debug("🧹 Smart Cache: Context switch, KV cache cleared")
-                        self.npu_context = ""
-                    else:
-                        logger.warning(f"⚠️  Failed to clear KV cache: {ret}")
+            # Thinking mode: request override, else the global config
+            from config.settings import inference_config
+            default_thinking = inference_config['model_defaults'].get('enable_thinking', False)
+            thinking = enable_thinking if enable_thinking is not None else default_thinking
+            
+            # KV cache: resident prefix reuse, conversation snapshot or
+            # automatic prefix cache. Token input skips the runtime chat
+            # template and thinking switch, so the token prefix cache is only
+            # used when neither would change the prompt.
+            kv_plan = self._kv_planner(token_input_allowed(self.runtime_template, thinking)).plan(
+                prompt, session,
+                conversation_id=conversation_id,
+                auto_prefix=auto_prefix,
+                binary_cache_path=binary_cache_path,
+                save_binary_cache=save_binary_cache,
+                has_images=bool(images)
+            )
+            binary_cache_path = kv_plan.binary_cache_path
+            save_binary_cache = kv_plan.save_binary_cache
             
             if binary_cache_path:
                 action = "Saving to" if save_binary_cache else "Loading from"
                 logger.info(f"🔥 Binary cache: {action} {binary_cache_path}")
             
-            # Reset state
-            self.generated_text = []
-            self.generation_state = None
-            self.current_callback = callback
-            
-            # Ensure max_new_tokens is positive
-            if max_new_tokens <= 0:
-                self.current_max_tokens = 512
-                logger.info(f"⚠️  max_new_tokens was {max_new_tokens}, defaulting to 512")
-            else:
-                self.current_max_tokens = max_new_tokens
-            
-            # Set stop sequences (default to common ones if not provided)
-            self.current_stop_sequences = stop if stop else ["<|im_end|>", "<|endoftext|>"]
-            
             # Create input
             rkllm_input = RKLLMInput()
             rkllm_input.role = b"user"
             
+            # ctypes keeps raw pointers only; the session holds the owning objects
+            prompt_bytes = prompt.encode('utf-8')
+            session.keepalive.append(prompt_bytes)
+            
             # Handle Multimodal Input
-            if image_data:
-                logger.info("🖼️  Processing Multimodal Input (Image + Text)")
+            if images:
+                logger.info(f"🖼️  Processing Multimodal Input ({len(images)} image(s) + Text)")
                 
-                image_embeds = self._encode_image(image_data)
+                if image_embeds is None:
+                    image_embeds = self._encode_images(images)
                 
                 if image_embeds is not None:
                     rkllm_input.input_type = RKLLMInputType.RKLLM_INPUT_MULTIMODAL
-                    
-                    # Keep references to prevent GC
-                    self._current_prompt_bytes = input_prompt.encode('utf-8')
-                    self._current_image_embeds = image_embeds # Keep numpy array alive
+                    session.keepalive.append(image_embeds)  # Keep numpy array alive
                     
                     # Setup Multimodal Input Struct
                     mm_input = RKLLMMultiModalInput()
-                    mm_input.prompt = self._current_prompt_bytes
-                    mm_input.image_embed = self._current_image_embeds.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
-                    
-                    # Assuming 1536 dim for Qwen2-VL-2B
-                    # The imgenc output was [196, 1536]
-                    mm_input.n_image_tokens = self._current_image_embeds.size // 1536
-                    mm_input.n_image = 1
-                    mm_input.image_width = 392
-                    mm_input.image_height = 392
+                    mm_input.prompt = prompt_bytes
+                    mm_input.image_embed = image_embeds.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
                     
-                    # IMPORTANT: Qwen2-VL requires specific image token count in context
-                    # The C++ demo uses rknn_app_ctx.model_image_token which is 196
-                    # We are hardcoding 196 here based on the model
+                    # All images share one buffer of n_image x n_image_tokens x embed_dim
+                    profile = self.vision_profile
+                    mm_input.n_image_tokens = profile.image_tokens
+                    mm_input.n_image = len(images)
+                    mm_input.image_width = profile.image_width
+                    mm_input.image_height = profile.image_height
                     
                     rkllm_input.input_data.multimodal_input = mm_input
                     logger.info(f"✅ Multimodal input prepared: {mm_input.n_image_tokens} tokens")
-                    logger.info(f"📊 Image Embeddings: Shape={self._current_image_embeds.shape}, Mean={self._current_image_embeds.mean():.4f}, Std={self._current_image_embeds.std():.4f}")
-                    logger.info(f"📝 Prompt sent to RKLLM: {input_prompt!r}")
+                    logger.info(f"📊 Image Embeddings: Shape={image_embeds.shape}, Mean={image_embeds.mean():.4f}, Std={image_embeds.std():.4f}")
+                    logger.info(f"📝 Prompt sent to RKLLM: {prompt!r}")
                 else:
                     logger.warning("⚠️  Image encoding failed, falling back to text-only")
                     rkllm_input.input_type = RKLLMInputType.RKLLM_INPUT_PROMPT
-                    self._current_prompt_bytes = input_prompt.encode('utf-8')
-                    rkllm_input.input_data.prompt_input = self._current_prompt_bytes
+                    rkllm_input.input_data.prompt_input = prompt_bytes
+            elif kv_plan.input_ids is not None:
+                suffix_ids = kv_plan.input_ids
+                token_array = (ctypes.c_int32 * len(suffix_ids))(*suffix_ids)
+                session.keepalive.append(token_array)
+                rkllm_input.input_type = RKLLMInputType.RKLLM_INPUT_TOKEN
+                rkllm_input.input_data.token_input.input_ids = token_array
+                rkllm_input.input_data.token_input.n_tokens = len(suffix_ids)
             else:
                 rkllm_input.input_type = RKLLMInputType.RKLLM_INPUT_PROMPT
-                self._current_prompt_bytes = input_prompt.encode('utf-8')
-                rkllm_input.input_data.prompt_input = self._current_prompt_bytes
+                rkllm_input.input_data.prompt_input = prompt_bytes
             
             # Handle Thinking Mode Override
-            from config.settings import inference_config
-            default_thinking = inference_config['model_defaults'].get('enable_thinking', False)
-            
+            rkllm_input.enable_thinking = thinking
             if enable_thinking is not None:
-                # Override with request parameter
-                rkllm_input.enable_thinking = enable_thinking
                 logger.info(f"🧠 Thinking Mode Override: {enable_thinking}")
-            else:
-                # Use global config
-                rkllm_input.enable_thinking = default_thinking
-                if default_thinking:
-                    logger.info("🧠 Thinking mode ENABLED (Global Config)")
+            elif default_thinking:
+                logger.info("🧠 Thinking mode ENABLED (Global Config)")
             
             # Create infer params
             infer_params = RKLLMInferParam()
             infer_params.mode = RKLLMInferMode.RKLLM_INFER_GENERATE
             infer_params.lora_params = None
-            infer_params.keep_history = 0  # Don't keep history
+            # Keep the KV cache after the run when the prefix index tracks it
+            infer_params.keep_history = kv_plan.keep_history
             
             # Setup binary prompt cache if provided
-            prompt_cache = None
-            self._current_cache_path_bytes = None # Keep ref
-            
             if binary_cache_path:
                 prompt_cache = RKLLMPromptCacheParam()
                 prompt_cache.save_prompt_cache = 1 if save_binary_cache else 0
-                self._current_cache_path_bytes = binary_cache_path.encode('utf-8')
-                prompt_cache.prompt_cache_path = self._current_cache_path_bytes
+                cache_path_bytes = binary_cache_path.encode('utf-8')
+                prompt_cache.prompt_cache_path = cache_path_bytes
+                session.keepalive.extend([prompt_cache, cache_path_bytes])
                 
                 infer_params.prompt_cache_params = ctypes.cast(
                     ctypes.pointer(prompt_cache),
@@ -785,7 +963,6 @@ class RKLLMModel:
                 infer_params.prompt_cache_params = None
             
             # Run inference - use async if configured
-            from config.settings import inference_config
             is_async_mode = inference_config['model_defaults'].get('is_async', False)
             
             if is_async_mode:
@@ -807,28 +984,25 @@ class RKLLMModel:
                 self.handle, 
                 ctypes.byref(rkllm_input), 
                 ctypes.byref(infer_params), 
-                None
+                ctypes.c_void_p(session.session_id)
             )
             
             if ret != 0:
                 raise RuntimeError(f"rkllm_run(_async) failed with code: {ret}")
             
-            # If async mode, wait for completion
+            # If async mode, block on the completion event set by the callback
+            # (RKLLM_RUN_FINISH / RKLLM_RUN_ERROR) - no rkllm_is_running polling
             if is_async_mode:
-                import time
-                rkllm_is_running = self.lib.rkllm_is_running
-                rkllm_is_running.argtypes = [RKLLM_Handle_t]
-                rkllm_is_running.restype = ctypes.c_int
-                
                 logger.info("⏳ Waiting for async inference to complete...")
-                # Give it a moment to start
-                time.sleep(0.01)  # 10ms initial delay
-                # NOTE: rkllm_is_running returns 1 while running, 0 when done
-                poll_count = 0
-                while rkllm_is_running(self.handle) == 1:  # 1 = still running
-                    time.sleep(0.001)  # Poll every 1ms
-                    poll_count += 1
-                logger.info(f"✅ Async inference complete (polled {poll_count} times)")
+                session.wait()
+                logger.info(f"✅ Async inference complete (session {session.session_id})")
+            
+            # Make sure an in-flight abort has landed before the slot is reused
+            if session.stopped and session.abort_fn:
+                session.aborted.wait(timeout=5.0)
+            
+            if session.error:
+                raise RuntimeError(session.error)
             
             # Log binary cache result
             if binary_cache_path and save_binary_cache:
@@ -839,20 +1013,22 @@ class RKLLMModel:
                     logger.warning(f"⚠️  Binary cache not created at {binary_cache_path}")
             
             # Return generated text and perf stats
-            logger.info(f"📦 generated_text list has {len(self.generated_text)} items: {self.generated_text[:5]}")
-            result = ''.join(self.generated_text)
+            logger.info(f"📦 Session {session.session_id} produced {session.generated_tokens} tokens: {session.tokens[:5]}")
+            result = session.text
             logger.info(f"Generated {len(result)} characters: {repr(result[:100])}")
             
-            # Update NPU context for next run
-            # The new context is the full prompt + what was just generated
-            self.npu_context = prompt + result
+            # Record the resident KV sequence and conversation state
+            self._kv_planner().finish(kv_plan, session, prompt)
             
             # Return tuple: (text, perf_stats)
-            return result, self.perf_stats
+            return result, session.perf_stats
             
         except Exception as e:
             logger.error(f"Generation failed: {e}", exc_info=True)
+            self._kv_planner().fail(kv_plan, session)
             raise
+        finally:
+            self.sessions.unregister(session)
     
     async def generate_async(
         self,
@@ -867,34 +1043,69 @@ class RKLLMModel:
         binary_cache_path: Optional[str] = None,
         save_binary_cache: bool = False,
         stop: Optional[List[str]] = None,
-        image_data: Optional[bytes] = None  # New parameter for image data
+        images: Optional[List[ImageInput]] = None,  # Encoded bytes or prepared pixels
+        conversation_id: Optional[str] = None,
+        auto_prefix: Optional[str] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        on_wait: Optional[Callable[[dict], None]] = None,
+        deadline: Optional[float] = None,
+        timing: Optional[RequestTiming] = None
     ) -> tuple[str, Optional[dict]]:
         """
-        Async wrapper for generate() with batch slot queueing
+        Async wrapper for generate() behind the request queue
+        
+        The request is queued on the BatchScheduler, which admits it once the
+        handle is free and clamps max_new_tokens to the remaining KV
+        capacity. Runs on the handle are serialized; the blocking runtime
+        call runs on the scheduler's slot thread.
         
-        Phase 4.2: Multi-batch inference with automatic queuing.
-        Limits concurrent requests to n_batch (configurable, default 3 for RK3588).
-        Requests beyond n_batch are automatically queued and processed as slots free.
+        Cancelling the awaiting task (e.g. the HTTP client went away) stops
+        the session: a queued request leaves the queue, a running one is
+        aborted so its slot frees up within one token interval.
         
-        Args: Same as generate()
+        Args: Same as generate(), plus
+            tenant: Fair-queuing key (API key or user)
+            priority: Scheduling class - "interactive", "batch" or "background"
+            on_wait: Receives queue position updates while waiting for a slot
+            deadline: time.monotonic() by which the request must get a slot
+            timing: Receives the queue, image encode, prefill and decode times
         
         Returns: Same as generate() - (Generated text, performance stats dict)
         """
-        # Ensure semaphore is initialized (should be done in load(), but safety check)
-        if self._batch_semaphore is None:
-            raise RuntimeError("Model not loaded. Call load() first to initialize batch semaphore.")
+        if self.scheduler is None:
+            raise RuntimeError("Model not loaded. Call load() first to initialize batch scheduler.")
+        
+        # Exact prompt length for the scheduler's context check (estimate without tokenizer)
+        prompt_tokens = None
+        if self.tokenizer_service.available:
+            prompt_tokens = await self.tokenizer_service.count_async(prompt)
+        
+        # Encode the image before queuing: the vision encoder runs while other
+        # requests decode, and the LLM slot is only taken once embeddings exist
+        image_embeds = None
+        if images:
+            start = time.monotonic()
+            image_embeds = await self.encode_images_async(images)
+            if timing is not None:
+                timing.image_encode_ms += (time.monotonic() - start) * 1000
+            if image_embeds is not None and prompt_tokens is not None:
+                prompt_tokens += len(images) * self.vision_profile.image_tokens
+        
+        session = GenerationSession(
+            prompt=prompt,
+            max_tokens=max_new_tokens,
+            callback=callback,
+            stop=stop,
+            prompt_tokens=prompt_tokens,
+            tenant=tenant,
+            priority=priority,
+            deadline=deadline
+        )
         
-        # Acquire batch slot (auto-queues if all slots busy)
-        async with self._batch_semaphore:
-            # Log queue depth if waiting
-            waiting = self._batch_size - self._batch_semaphore._value
-            if waiting > 0:
-                logger.info(f"📊 Batch slots: {waiting}/{self._batch_size} active")
-            
-            # Run synchronous generate in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,  # Use default executor
+        try:
+            result = await self.scheduler.submit(
+                session,
                 lambda: self.generate(
                     prompt=prompt,
                     max_new_tokens=max_new_tokens,
@@ -907,18 +1118,31 @@ class RKLLMModel:
                     binary_cache_path=binary_cache_path,
                     save_binary_cache=save_binary_cache,
                     stop=stop,
-                    image_data=image_data
-                )
+                    images=images,
+                    conversation_id=conversation_id,
+                    auto_prefix=auto_prefix,
+                    session=session,
+                    image_embeds=image_embeds
+                ),
+                on_wait=on_wait
             )
+            record_generation(self.model_name, session, result[1])
+            if timing is not None:
+                timing.record_session(session, result[1])
             return result
+        except asyncio.CancelledError:
+            logger.warning(f"🚫 Generation cancelled by caller (session {session.session_id or 'queued'})")
+            session.request_stop("cancelled")
+            raise
     
     def _get_embeddings_sync(
         self,
         text: str,
         inference_config: dict,
         pooling_strategy: str = "last",
-        normalize: bool = True
-    ) -> tuple[list[float], dict]:
+        normalize: bool = True,
+        session: Optional[GenerationSession] = None
+    ) -> tuple[np.ndarray, dict]:
         """
         Synchronous embedding extraction (called via thread pool from get_embeddings).
         
@@ -930,77 +1154,35 @@ class RKLLMModel:
             inference_config: Configuration dict (not heavily used for embeddings)
             pooling_strategy: Pooling method - "mean", "cls", or "last" (default)
             normalize: Whether to L2-normalize the embedding (default True)
+            session: Pre-built session (set by get_embeddings after slot admission)
             
         Returns:
             (embedding_vector, stats_dict) where:
-                - embedding_vector is a list of floats (normalized)
+                - embedding_vector is a float32 numpy array (normalized)
                 - stats_dict contains tokens_processed, time_ms, embedding_dim
         """
         if not self.handle:
             raise RuntimeError("Model not loaded")
         
         import time
-        import math
         
         logger.info(f"🔍 Generating embeddings for text: {text[:100]}...")
         start_time = time.time()
         
-        # Storage for hidden states (local to this call, not shared)
-        hidden_states_result = {"all_states": None, "dim": 0, "num_tokens": 0}
-        
-        def embedding_callback(result_ptr, userdata, state):
-            """Callback for embedding extraction"""
-            if not result_ptr:
-                return 0
-            
-            result = result_ptr.contents
-            
-            if state == LLMCallState.RKLLM_RUN_FINISH:
-                logger.info("✅ Embedding extraction finished")
-                # Extract hidden states
-                if result.last_hidden_layer.hidden_states:
-                    embd_size = result.last_hidden_layer.embd_size
-                    num_tokens = result.last_hidden_layer.num_tokens
-                    
-                    logger.info(f"📊 Hidden layer: {num_tokens} tokens × {embd_size} dimensions")
-                    
-                    # Copy all token hidden states for flexible pooling
-                    # Total size is num_tokens * embd_size
-                    if num_tokens > 0:
-                        total = num_tokens * embd_size
-                        hidden_states_result["all_states"] = [
-                            result.last_hidden_layer.hidden_states[i]
-                            for i in range(total)
-                        ]
-                        hidden_states_result["dim"] = embd_size
-                        hidden_states_result["num_tokens"] = num_tokens
-                else:
-                    logger.warning("⚠️  No hidden states in result")
-            
-            elif state == LLMCallState.RKLLM_RUN_ERROR:
-                logger.error("❌ Error during embedding extraction")
-            
-            return 0
-        
-        # Register callback with a unique key for this invocation
-        callback_type = ctypes.CFUNCTYPE(
-            ctypes.c_int,
-            ctypes.POINTER(RKLLMResult),
-            ctypes.c_void_p,
-            ctypes.c_int
-        )
-        callback_c = callback_type(embedding_callback)
-        cb_key = id(callback_c)
-        with self._callback_lock:
-            self._callback_storage[cb_key] = callback_c
+        # Hidden states are routed to this session by the shared callback
+        if session is None:
+            session = GenerationSession(prompt=text, max_tokens=1)
+        session.pooling_strategy = pooling_strategy
+        self.sessions.register(session)
         
         try:
             # Set up input
+            text_bytes = text.encode('utf-8')
             rkllm_input = RKLLMInput()
             rkllm_input.role = b"user"
             rkllm_input.enable_thinking = False
             rkllm_input.input_type = RKLLMInputType.RKLLM_INPUT_PROMPT
-            rkllm_input.input_data.prompt_input = text.encode('utf-8')
+            rkllm_input.input_data.prompt_input = text_bytes
             
             # Set up inference parameters for embedding mode
             infer_params = RKLLMInferParam()
@@ -1008,6 +1190,9 @@ class RKLLMModel:
             infer_params.lora_params = None
             infer_params.prompt_cache_params = None
             infer_params.keep_history = 0  # Don't keep history for embeddings
+            self.prefix_index.invalidate(session.slot)
+            if self.conversation_cache is not None:
+                self.conversation_cache.invalidate_resident()
             
             # ALWAYS use sync mode for embeddings (async can cause crashes with embedding models)
             logger.debug("🔒 Using rkllm_run (sync) for embeddings")
@@ -1027,49 +1212,33 @@ class RKLLMModel:
                 self.handle,
                 ctypes.byref(rkllm_input),
                 ctypes.byref(infer_params),
-                None
+                ctypes.c_void_p(session.session_id)
             )
             
             if ret != 0:
                 raise RuntimeError(f"rkllm_run failed with code {ret}")
             
             # Check if we got hidden states
-            if hidden_states_result["all_states"] is None:
+            if session.hidden_states is None:
                 raise RuntimeError("Failed to extract hidden states")
             
-            # Apply pooling strategy
-            all_states = hidden_states_result["all_states"]
-            embd_size = hidden_states_result["dim"]
-            num_tokens = hidden_states_result["num_tokens"]
-            
-            if pooling_strategy == "mean":
-                # Average across all token positions
-                embedding = [0.0] * embd_size
-                for t in range(num_tokens):
-                    offset = t * embd_size
-                    for i in range(embd_size):
-                        embedding[i] += all_states[offset + i]
-                embedding = [x / num_tokens for x in embedding]
-            elif pooling_strategy == "cls":
-                # First token (CLS token)
-                embedding = all_states[:embd_size]
-            else:
-                # "last" (default) - last token
-                offset = (num_tokens - 1) * embd_size
-                embedding = all_states[offset:offset + embd_size]
+            logger.info(f"📊 Hidden layer: {session.num_tokens} tokens × {session.embd_size} dimensions")
+            
+            # Pooling already happened in the callback (see embedding_pooling)
+            embedding = session.hidden_states
+            embd_size = session.embd_size
+            num_tokens = session.num_tokens
             
             # L2-normalize to unit vector (configurable)
             if normalize:
-                norm = math.sqrt(sum(x * x for x in embedding))
-                if norm > 0:
-                    embedding = [x / norm for x in embedding]
+                embedding = l2_normalize(embedding)
             
             elapsed_ms = (time.time() - start_time) * 1000
             
             stats = {
-                "tokens_processed": hidden_states_result["num_tokens"],
+                "tokens_processed": num_tokens,
                 "time_ms": elapsed_ms,
-                "embedding_dim": hidden_states_result["dim"]
+                "embedding_dim": embd_size
             }
             
             logger.info(f"✅ Generated {len(embedding)}-dim embedding in {elapsed_ms:.1f}ms (pooling={pooling_strategy})")
@@ -1080,49 +1249,323 @@ class RKLLMModel:
             logger.error(f"Error generating embeddings: {e}")
             raise
         finally:
-            with self._callback_lock:
-                self._callback_storage.pop(cb_key, None)
+            self.sessions.unregister(session)
+    
+    def _get_embeddings_batch_sync(
+        self,
+        texts: List[str],
+        inference_config: dict,
+        pooling_strategy: str,
+        normalize: bool,
+        session: GenerationSession
+    ) -> List[tuple[np.ndarray, dict]]:
+        """
+        Run several embedding extractions back-to-back inside one batch slot.
+        
+        The slot is acquired once for the whole list; each text is a separate
+        rkllm_run, sharing the same session object.
+        """
+        results = []
+        for text in texts:
+            if session.stopped:
+                raise RuntimeError("Embedding batch cancelled")
+            session.hidden_states = None
+            session.prompt = text
+            results.append(self._get_embeddings_sync(
+                text=text,
+                inference_config=inference_config,
+                pooling_strategy=pooling_strategy,
+                normalize=normalize,
+                session=session
+            ))
+        return results
+    
+    async def get_embeddings_batch(
+        self,
+        texts: List[str],
+        inference_config: dict,
+        pooling_strategy: str = "last",
+        normalize: bool = True,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> tuple[List[np.ndarray], List[dict]]:
+        """
+        Embed a list of texts with one slot acquisition.
+        
+        Results are served from the embedding cache where possible. The
+        remaining texts are deduplicated and run back-to-back in a single
+        scheduler slot; their results are added to the cache.
+        
+        Args:
+            texts: Input texts, in request order
+            inference_config: Configuration dict (not heavily used for embeddings)
+            pooling_strategy: Pooling method - "mean", "cls", or "last" (default)
+            normalize: Whether to L2-normalize the embeddings (default True)
+            tenant: Fair-queuing key (API key or user)
+            priority: Scheduling class, e.g. "batch" for bulk indexing
+            deadline: time.monotonic() by which the batch must get a slot
+            
+        Returns:
+            (embeddings, stats) lists aligned with ``texts``; a cached result
+            has ``time_ms`` 0 and ``cached`` True in its stats
+        """
+        if self.scheduler is None:
+            raise RuntimeError("Model not loaded. Call load() first to initialize batch scheduler.")
+        
+        keys = [
+            self.embedding_cache.make_key(self.model_name, pooling_strategy, normalize, text)
+            for text in texts
+        ]
+        results: dict = {}
+        misses: dict = {}  # key -> text, first occurrence order
+        for key, text in zip(keys, texts):
+            if key in results or key in misses:
+                continue
+            cached = self.embedding_cache.get(key)
+            if cached is not None:
+                embedding, tokens = cached
+                results[key] = (embedding, {
+                    "tokens_processed": tokens,
+                    "time_ms": 0.0,
+                    "embedding_dim": len(embedding),
+                    "cached": True
+                })
+            else:
+                misses[key] = text
+        
+        if misses:
+            # Cached results are free; only batches that reach the NPU are timed
+            with observe_duration(EMBEDDING, self.model_name):
+                miss_texts = list(misses.values())
+                logger.info(f"🔍 Embedding batch: {len(texts)} input(s), {len(miss_texts)} to compute, "
+                            f"{len(results)} cached")
+                # Admission checks the longest input against the slot's context
+                session = GenerationSession(prompt=max(miss_texts, key=len), max_tokens=1,
+                                            tenant=tenant, priority=priority, deadline=deadline)
+                try:
+                    computed = await self.scheduler.submit(
+                        session,
+                        lambda: self._get_embeddings_batch_sync(
+                            texts=miss_texts,
+                            inference_config=inference_config,
+                            pooling_strategy=pooling_strategy,
+                            normalize=normalize,
+                            session=session
+                        )
+                    )
+                except asyncio.CancelledError:
+                    # Remaining texts are skipped once the current rkllm_run returns
+                    session.request_stop("cancelled")
+                    raise
+                for key, (embedding, stats) in zip(misses, computed):
+                    self.embedding_cache.put(key, embedding, stats.get("tokens_processed", 0))
+                    results[key] = (embedding, stats)
+        
+        embeddings = [results[key][0] for key in keys]
+        stats = [results[key][1] for key in keys]
+        return embeddings, stats
     
     async def get_embeddings(
         self,
         text: str,
         inference_config: dict,
         pooling_strategy: str = "last",
-        normalize: bool = True
-    ) -> tuple[list[float], dict]:
+        normalize: bool = True,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> tuple[np.ndarray, dict]:
         """
-        Async wrapper for _get_embeddings_sync() with batch slot queueing.
+        Embed a single text (see get_embeddings_batch()).
         
-        Uses the same batch semaphore as generate_async() to prevent concurrent
-        embedding requests from interfering with each other or with generation.
-        The synchronous rkllm_run call is offloaded to a thread pool executor.
+        Uses the same BatchScheduler as generate_async() so embedding runs
+        occupy a slot like any other request and never collide with generation.
+        The synchronous rkllm_run call runs on the scheduler's slot threads.
         
         Args:
             text: Input text to embed
             inference_config: Configuration dict (not heavily used for embeddings)
             pooling_strategy: Pooling method - "mean", "cls", or "last" (default)
             normalize: Whether to L2-normalize the embedding (default True)
+            tenant: Fair-queuing key (API key or user)
+            priority: Scheduling class - "interactive", "batch" or "background"
+            deadline: time.monotonic() by which the request must get a slot
             
         Returns:
             (embedding_vector, stats_dict) where:
-                - embedding_vector is a list of floats (normalized)
+                - embedding_vector is a float32 numpy array (normalized)
                 - stats_dict contains tokens_processed, time_ms, embedding_dim
         """
-        if self._batch_semaphore is None:
-            raise RuntimeError("Model not loaded. Call load() first to initialize batch semaphore.")
+        embeddings, stats = await self.get_embeddings_batch(
+            [text],
+            inference_config=inference_config,
+            pooling_strategy=pooling_strategy,
+            normalize=normalize,
+            tenant=tenant,
+            priority=priority,
+            deadline=deadline
+        )
+        return embeddings[0], stats[0]
+    
+    def _rerank_logits_sync(
+        self,
+        prompts: List[str],
+        yes_id: int,
+        no_id: int,
+        session: GenerationSession
+    ) -> tuple[List[float], int]:
+        """
+        Score judge prompts back-to-back with RKLLM_INFER_GET_LOGITS.
+        
+        The prompts share the query part, so after the first pair the prefix
+        index keeps it in the KV cache and only the document part is prefilled.
+        
+        Returns:
+            (P(yes) per prompt, tokens prefilled)
+        """
+        if not self.handle:
+            raise RuntimeError("Model not loaded")
+        
+        rkllm_run = self.lib.rkllm_run
+        rkllm_run.argtypes = [
+            RKLLM_Handle_t,
+            ctypes.POINTER(RKLLMInput),
+            ctypes.POINTER(RKLLMInferParam),
+            ctypes.c_void_p
+        ]
+        rkllm_run.restype = ctypes.c_int
         
-        async with self._batch_semaphore:
-            loop = asyncio.get_running_loop()
-            result = await loop.run_in_executor(
-                None,
-                lambda: self._get_embeddings_sync(
-                    text=text,
-                    inference_config=inference_config,
-                    pooling_strategy=pooling_strategy,
-                    normalize=normalize
+        if self.conversation_cache is not None:
+            self.conversation_cache.invalidate_resident()
+        
+        scores = []
+        prefilled = 0
+        kv_planner = self._kv_planner()
+        self.sessions.register(session)
+        try:
+            for prompt in prompts:
+                if session.stopped:
+                    raise RuntimeError("Rerank cancelled")
+                session.logits = None
+                
+                prompt_ids, plan = kv_planner.plan_reuse(prompt, session)
+                if prompt_ids is None:
+                    prompt_ids = self.tokenizer_service.encode(prompt)
+                # The judge prompt is already ChatML: always send tokens, so
+                # the runtime chat template cannot wrap it a second time
+                suffix_ids = prompt_ids[plan.reuse:] if plan is not None else prompt_ids
+                token_array = (ctypes.c_int32 * len(suffix_ids))(*suffix_ids)
+                rkllm_input = RKLLMInput()
+                rkllm_input.role = b"user"
+                rkllm_input.enable_thinking = False
+                rkllm_input.input_type = RKLLMInputType.RKLLM_INPUT_TOKEN
+                rkllm_input.input_data.token_input.input_ids = token_array
+                rkllm_input.input_data.token_input.n_tokens = len(suffix_ids)
+                prefilled += len(suffix_ids)
+                
+                infer_params = RKLLMInferParam()
+                infer_params.mode = RKLLMInferMode.RKLLM_INFER_GET_LOGITS
+                infer_params.lora_params = None
+                infer_params.prompt_cache_params = None
+                infer_params.keep_history = 1 if plan is not None else 0
+                
+                ret = rkllm_run(
+                    self.handle,
+                    ctypes.byref(rkllm_input),
+                    ctypes.byref(infer_params),
+                    ctypes.c_void_p(session.session_id)
                 )
+                if ret != 0:
+                    raise RuntimeError(f"rkllm_run failed with code {ret}")
+                if session.error:
+                    raise RuntimeError(session.error)
+                if session.logits is None:
+                    raise RuntimeError("Failed to extract logits")
+                
+                # Nothing was sampled: the KV cache holds exactly the prompt
+                if plan is not None:
+                    self.prefix_index.insert(prompt_ids, session.slot)
+                scores.append(yes_probability(session.logits, yes_id, no_id))
+            return scores, prefilled
+        except Exception:
+            self.prefix_index.invalidate(session.slot)
+            raise
+        finally:
+            self.sessions.unregister(session)
+    
+    async def rerank(
+        self,
+        query: str,
+        documents: List[str],
+        inference_config: dict,
+        mode: str = "auto",
+        instruction: Optional[str] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> tuple[List[float], dict]:
+        """
+        Score (query, document) pairs as one job on the batch scheduler.
+        
+        Args:
+            query: Search query
+            documents: Candidate documents
+            inference_config: Configuration dict (embedding pooling settings)
+            mode: "logits" (yes/no probe), "embedding" (cosine over cached
+                embeddings) or "auto" (logits when a tokenizer is available)
+            instruction: Task description for the yes/no probe
+            tenant: Fair-queuing key (API key or user)
+            priority: Scheduling class - "interactive", "batch" or "background"
+            deadline: time.monotonic() by which the request must get a slot
+            
+        Returns:
+            (scores aligned with documents, stats_dict)
+        """
+        if self.scheduler is None:
+            raise RuntimeError("Model not loaded. Call load() first to initialize batch scheduler.")
+        
+        import time
+        start_time = time.time()
+        
+        if mode == "auto":
+            mode = "logits" if self.tokenizer is not None else "embedding"
+        
+        if mode == "embedding":
+            emb_config = inference_config.get("embedding_model", {})
+            embeddings, stats = await self.get_embeddings_batch(
+                [query] + list(documents),
+                inference_config=inference_config,
+                pooling_strategy=emb_config.get("pooling_strategy", "last"),
+                normalize=emb_config.get("normalize", True),
+                tenant=tenant,
+                priority=priority,
+                deadline=deadline
             )
-            return result
+            scores = cosine_scores(embeddings[0], np.stack(embeddings[1:])).tolist()
+            tokens = sum(s.get("tokens_processed", 0) for s in stats)
+        elif mode == "logits":
+            if self.tokenizer is None:
+                raise ValueError("mode='logits' needs the model's tokenizer; use mode='embedding'")
+            yes_id, no_id = judge_token_ids(self.tokenizer)
+            _, prompts = build_judge_prompts(query, documents, instruction)
+            # Admission checks the longest pair against the slot's context
+            session = GenerationSession(prompt=max(prompts, key=len), max_tokens=1,
+                                        tenant=tenant, priority=priority, deadline=deadline)
+            try:
+                scores, tokens = await self.scheduler.submit(
+                    session,
+                    lambda: self._rerank_logits_sync(prompts, yes_id, no_id, session)
+                )
+            except asyncio.CancelledError:
+                session.request_stop("cancelled")
+                raise
+        else:
+            raise ValueError(f"Unknown rerank mode '{mode}'")
+        
+        elapsed_ms = (time.time() - start_time) * 1000
+        logger.info(f"✅ Reranked {len(documents)} document(s) in {elapsed_ms:.1f}ms (mode={mode})")
+        return scores, {"mode": mode, "tokens_processed": tokens, "time_ms": elapsed_ms}
     
     def unload(self):
         """Unload model and free NPU resources
@@ -1139,6 +1582,12 @@ class RKLLMModel:
                 # Set a flag to prevent new inference calls
                 self._unloading = True
                 
+                # Stop running sessions and wait for the slot threads to leave
+                # rkllm_run before the handle goes away
+                if self.scheduler is not None:
+                    self.scheduler.shutdown()
+                    self.scheduler = None
+                
                 rkllm_destroy = self.lib.rkllm_destroy
                 rkllm_destroy.argtypes = [RKLLM_Handle_t]
                 rkllm_destroy.restype = ctypes.c_int
@@ -1151,6 +1600,16 @@ class RKLLMModel:
                 else:
                     logger.warning(f"rkllm_destroy returned: {ret}")
                 
+                self.tokenizer_service.shutdown()
+                if self.image_encoder is not None:
+                    self.image_encoder.stop()
+                    self.image_encoder = None
+                if self._image_executor is not None:
+                    self._image_executor.shutdown(wait=False)
+                    self._image_executor = None
+                self.prefix_index.invalidate()
+                self.cache_manager.flush_stats()
+                
                 # Clean up callback
                 with self._callback_lock:
                     if id(self) in self._callback_storage:
@@ -5,6 +5,8 @@ Handles RKLLM runtime integration and inference
 import ctypes
 import os
 import logging
+import threading
+import time
 from typing import Optional, Callable, List
 from pathlib import Path
 
@@ -128,3 +130,102 @@ class RKLLMModel:
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
         self.unload()
+
+
+class MockRKLLMRuntime:
+    """
+    Stand-in for librkllmrt used by tests and benchmarks.
+    
+    Models an RKLLM handle with ``n_batch`` decode slots advancing in
+    lockstep: every ``step_time`` seconds the runtime emits one token to each
+    active session, so aggregate throughput grows with the number of occupied
+    slots like batched NPU decode does. Tokens are delivered through the same
+    GenerationSession hooks the real C callback uses.
+    """
+    
+    def __init__(self, n_batch: int = 1, step_time: float = 0.01, prefill_time: float = 0.0):
+        """
+        Args:
+            n_batch: Number of concurrent decode slots
+            step_time: Seconds per decode step (shared by all active slots)
+            prefill_time: Seconds spent on prefill before a session joins decode
+        """
+        self.n_batch = n_batch
+        self.step_time = step_time
+        self.prefill_time = prefill_time
+        
+        self._lock = threading.Lock()
+        self._active = {}  # session_id -> [session, remaining_tokens]
+        self._stepper = None
+        
+        # Observability for tests
+        self.max_concurrency = 0
+        self.steps = 0
+    
+    def run(self, session, output_tokens: Optional[int] = None):
+        """
+        Blocking equivalent of rkllm_run for one session.
+        
+        Args:
+            session: GenerationSession receiving the tokens
+            output_tokens: Tokens to emit before EOS (default: session.max_tokens)
+        """
+        self.run_async(session, output_tokens)
+        session.wait()
+        # A stopped session releases the waiter early, but like rkllm_run we
+        # only return once the runtime has dropped the session from its slot
+        while True:
+            with self._lock:
+                if session.session_id not in self._active:
+                    break
+            time.sleep(self.step_time / 4)
+        return session.text, session.perf_stats
+    
+    def run_async(self, session, output_tokens: Optional[int] = None):
+        """Equivalent of rkllm_run_async: start decoding and return immediately"""
+        if self.prefill_time:
+            time.sleep(self.prefill_time)
+        
+        remaining = output_tokens if output_tokens is not None else session.max_tokens
+        with self._lock:
+            if len(self._active) >= self.n_batch:
+                raise RuntimeError("MockRKLLMRuntime: all batch slots busy")
+            self._active[session.session_id] = [session, remaining]
+            self.max_concurrency = max(self.max_concurrency, len(self._active))
+            if self._stepper is None or not self._stepper.is_alive():
+                self._stepper = threading.Thread(target=self._step_loop, daemon=True)
+                self._stepper.start()
+    
+    def is_running(self) -> bool:
+        """Equivalent of rkllm_is_running"""
+        with self._lock:
+            return bool(self._active)
+    
+    def _step_loop(self):
+        """Advance every active slot by one token per step"""
+        while True:
+            time.sleep(self.step_time)
+            with self._lock:
+                if not self._active:
+                    self._stepper = None
+                    return
+                self.steps += 1
+                entries = list(self._active.items())
+            
+            for session_id, entry in entries:
+                session, remaining = entry
+                finished = remaining <= 0
+                if not finished:
+                    code = session.on_token(f" tok{session.generated_tokens}", session.generated_tokens)
+                    entry[1] -= 1
+                    finished = code == 1 or entry[1] <= 0
+                if finished:
+                    with self._lock:
+                        self._active.pop(session_id, None)
+                    session.on_finish({
+                        'prefill_time_ms': self.prefill_time * 1000,
+                        'prefill_tokens': session.prompt_tokens,
+                        'generate_time_ms': session.generated_tokens * self.step_time * 1000,
+                        'generate_tokens': session.generated_tokens,
+                        'memory_usage_mb': 0.0
+                    })
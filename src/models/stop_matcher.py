@@ -0,0 +1,110 @@
+"""
+Incremental stop-sequence matcher.
+
+An Aho-Corasick automaton over the characters of all stop sequences. Each
+generated token is fed once; every character advances the automaton in O(1)
+amortized time, so the cost per token is proportional to the token length and
+independent of how much text has been generated.
+
+The automaton state also tells us how much trailing output could still turn
+into a stop sequence (the depth of the current node). Exactly that many
+characters are held back from the stream, so a stop string is never partially
+emitted to the client and can be trimmed cleanly when it matches.
+"""
+from collections import deque
+from typing import List, Optional, Tuple
+
+
+class _Node:
+    __slots__ = ("children", "fail", "depth", "out")
+
+    def __init__(self, depth: int):
+        self.children = {}
+        self.fail = None
+        self.depth = depth
+        # Length of the longest stop sequence ending at this node (0 = none)
+        self.out = 0
+
+
+class StopSequenceMatcher:
+    """Streams text through while watching for any of the stop sequences"""
+
+    def __init__(self, stop_sequences: List[str]):
+        """
+        Args:
+            stop_sequences: Strings that end generation (empty strings ignored)
+        """
+        self.stop_sequences = [s for s in stop_sequences if s]
+        self._root = _Node(0)
+        self._build()
+        self._state = self._root
+        self._held = ""
+        self.matched: Optional[str] = None
+
+    def _build(self):
+        for seq in self.stop_sequences:
+            node = self._root
+            for ch in seq:
+                nxt = node.children.get(ch)
+                if nxt is None:
+                    nxt = _Node(node.depth + 1)
+                    node.children[ch] = nxt
+                node = nxt
+            node.out = max(node.out, len(seq))
+
+        # BFS to compute failure links and propagate outputs along them
+        queue = deque()
+        for child in self._root.children.values():
+            child.fail = self._root
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in node.children.items():
+                fail = node.fail
+                while fail is not None and ch not in fail.children:
+                    fail = fail.fail
+                child.fail = fail.children[ch] if fail is not None else self._root
+                child.out = max(child.out, child.fail.out)
+                queue.append(child)
+
+    def _step(self, ch: str) -> _Node:
+        node = self._state
+        while node is not self._root and ch not in node.children:
+            node = node.fail
+        return node.children.get(ch, self._root)
+
+    def feed(self, text: str) -> Tuple[str, bool]:
+        """
+        Feed one generated piece of text.
+
+        Returns:
+            (emit, matched): text that is now safe to stream, and whether a
+            stop sequence completed. On a match ``emit`` is everything before
+            the stop sequence and the matcher ignores further input.
+        """
+        if self.matched is not None or not self.stop_sequences:
+            return ("" if self.matched is not None else text), self.matched is not None
+
+        held = self._held + text
+        base = len(self._held)
+        for i, ch in enumerate(text):
+            self._state = self._step(ch)
+            if self._state.out:
+                end = base + i + 1
+                start = end - self._state.out
+                self.matched = held[start:end]
+                self._held = ""
+                return held[:start], True
+
+        # Keep back the suffix that is still a prefix of some stop sequence
+        keep = self._state.depth
+        if keep:
+            self._held = held[-keep:]
+            return held[:-keep], False
+        self._held = ""
+        return held, False
+
+    def flush(self) -> str:
+        """Release held-back text at the end of generation (no match)"""
+        held, self._held = self._held, ""
+        return held
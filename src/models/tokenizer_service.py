@@ -0,0 +1,170 @@
+"""
+Tokenizer service for token accounting, context checks and /v1/tokenize.
+
+Wraps the HF tokenizer shipped next to the .rkllm file. Encodings are cached
+per segment: prompts are split at special tokens (e.g. <|im_start|>), which
+the tokenizer always treats as atomic, so the tokens of a prompt are the
+concatenation of the tokens of its segments. A multi-turn chat then only
+encodes the messages that are new since the previous turn. Tokenizers whose
+segments do not concatenate cleanly (SentencePiece with a dummy prefix space)
+fall back to caching whole prompts.
+
+Without a tokenizer, counts fall back to the character estimate used by the
+scheduler. Async variants run on a small thread pool so tokenizing long
+prompts never blocks the event loop.
+"""
+import asyncio
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .generation_session import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Used to verify that segment-wise encoding matches whole-prompt encoding
+_SELF_CHECK_TEXT = "Hello world.\n{special}user\nWhat is 2+2?{special}\n{special}assistant\n"
+
+
+class TokenizerService:
+    """Cached, thread-pooled access to a HF tokenizer"""
+
+    def __init__(self, tokenizer=None, cache_size: int = 1024, max_workers: int = 2):
+        """
+        Args:
+            tokenizer: HF tokenizer (None = estimates only)
+            cache_size: Maximum cached segment encodings
+            max_workers: Threads for the async variants
+        """
+        self.tokenizer = tokenizer
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+
+        # Counters for reporting
+        self.hits = 0
+        self.misses = 0
+
+        self._splitter = self._build_splitter() if tokenizer is not None else None
+
+    @property
+    def available(self) -> bool:
+        return self.tokenizer is not None
+
+    # ------------------------------------------------------------------
+    # Sync API
+    # ------------------------------------------------------------------
+
+    def encode(self, text: str) -> List[int]:
+        """Token IDs of ``text`` (no BOS/EOS added)"""
+        if self.tokenizer is None:
+            raise RuntimeError("No tokenizer available for this model")
+        if self._splitter is None:
+            return list(self._encode_cached(text))
+        ids: List[int] = []
+        for segment in self._splitter.split(text):
+            if segment:
+                ids.extend(self._encode_cached(segment))
+        return ids
+
+    def decode(self, ids: List[int]) -> str:
+        if self.tokenizer is None:
+            raise RuntimeError("No tokenizer available for this model")
+        return self.tokenizer.decode(ids)
+
+    def count(self, text: str) -> int:
+        """Exact token count, or the character estimate without a tokenizer"""
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.encode(text))
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+    # ------------------------------------------------------------------
+    # Async API (thread pool)
+    # ------------------------------------------------------------------
+
+    async def encode_async(self, text: str) -> List[int]:
+        return await self._run(self.encode, text)
+
+    async def decode_async(self, ids: List[int]) -> str:
+        return await self._run(self.decode, ids)
+
+    async def count_async(self, text: str) -> int:
+        if self.tokenizer is None:
+            return self.count(text)
+        return await self._run(self.count, text)
+
+    async def count_many_async(self, texts: List[str]) -> List[int]:
+        """Counts for several texts in one trip to the thread pool"""
+        if self.tokenizer is None:
+            return self.count_many(texts)
+        return await self._run(self.count_many, texts)
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="tokenizer")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "available": self.available,
+                "segment_cache": self._splitter is not None,
+                "cached_segments": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _encode_cached(self, text: str) -> tuple:
+        with self._lock:
+            ids = self._cache.get(text)
+            if ids is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return ids
+            self.misses += 1
+        ids = tuple(self.tokenizer.encode(text, add_special_tokens=False))
+        with self._lock:
+            self._cache[text] = ids
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+    def _build_splitter(self) -> Optional[re.Pattern]:
+        """Regex splitting text around special tokens, if that is lossless"""
+        specials = [t for t in getattr(self.tokenizer, "all_special_tokens", []) or [] if t]
+        if not specials:
+            return None
+        splitter = re.compile("(" + "|".join(re.escape(t) for t in sorted(specials, key=len, reverse=True)) + ")")
+
+        sample = _SELF_CHECK_TEXT.format(special=max(specials, key=len))
+        try:
+            whole = list(self.tokenizer.encode(sample, add_special_tokens=False))
+            pieces = [i for seg in splitter.split(sample) if seg
+                      for i in self.tokenizer.encode(seg, add_special_tokens=False)]
+        except Exception as e:
+            logger.debug(f"Tokenizer self-check failed: {e}")
+            return None
+        if whole != pieces:
+            logger.info("ℹ️  Tokenizer segments do not concatenate cleanly, caching whole prompts only")
+            return None
+        return splitter
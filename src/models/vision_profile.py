@@ -0,0 +1,102 @@
+"""
+Vision geometry of multimodal RKLLM models.
+
+RKLLMMultiModalInput needs the embedding layout of the vision encoder
+(tokens per image, hidden size, input resolution), and RKLLMParam needs
+the special tokens that frame image embeddings in the prompt. These
+differ per model family, so they are described by a VisionProfile,
+resolved from the model path in load() and overridable through the
+``vision_encoder.profile`` config section.
+"""
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class VisionProfile:
+    """Embedding layout and prompt tokens of one vision-language model family"""
+    name: str
+    embed_dim: int                   # LLM hidden size each image token is projected to
+    image_tokens: int                # Tokens per image produced by the encoder
+    image_width: int = 392
+    image_height: int = 392
+    img_start: str = "<|vision_start|>"
+    img_end: str = "<|vision_end|>"
+    img_content: str = "<|image_pad|>"
+    image_tag: str = "<image>"       # Placeholder for one image in the prompt text
+    max_images: int = 4              # Images accepted per request
+
+    @property
+    def image_size(self) -> int:
+        """Square input size for preprocessing"""
+        return max(self.image_width, self.image_height)
+
+    @property
+    def floats_per_image(self) -> int:
+        return self.embed_dim * self.image_tokens
+
+    def pack(self, embeddings: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Concatenate per-image embeddings into one contiguous float32 buffer.
+
+        Raises:
+            ValueError: An embedding does not have image_tokens x embed_dim values
+        """
+        if not embeddings:
+            raise ValueError("No image embeddings to pack")
+        for i, emb in enumerate(embeddings):
+            if emb.size != self.floats_per_image:
+                raise ValueError(
+                    f"Image {i} has {emb.size} embedding values, expected "
+                    f"{self.image_tokens} tokens x {self.embed_dim} ({self.floats_per_image}) "
+                    f"for vision profile '{self.name}'"
+                )
+        return np.ascontiguousarray(
+            np.concatenate([np.asarray(emb, dtype=np.float32).ravel() for emb in embeddings])
+        )
+
+
+# Matched against the lower-cased model path, most specific first
+VISION_PROFILES: List[tuple] = [
+    ("qwen2.5-vl-7b", VisionProfile(name="qwen2.5-vl-7b", embed_dim=3584, image_tokens=196)),
+    ("qwen2.5-vl", VisionProfile(name="qwen2.5-vl-3b", embed_dim=2048, image_tokens=196)),
+    ("qwen2-vl", VisionProfile(name="qwen2-vl-2b", embed_dim=1536, image_tokens=196)),
+]
+
+# Vision models that match no entry above (the previous hardcoded geometry)
+DEFAULT_VISION_PROFILE = VISION_PROFILES[-1][1]
+
+
+def is_vision_model(model_path: str) -> bool:
+    path = model_path.lower()
+    return "vl" in path or "vision" in path
+
+
+def resolve_vision_profile(model_path: str, overrides: Optional[Dict[str, Any]] = None) -> Optional[VisionProfile]:
+    """
+    Vision profile for a model, or None for text-only models.
+
+    Args:
+        model_path: Path to the .rkllm file
+        overrides: Profile fields to replace (``vision_encoder.profile``); a
+            "name" naming a built-in profile selects it as the base
+    """
+    overrides = dict(overrides or {})
+    path = model_path.lower()
+    base = None
+    if overrides.get("name"):
+        base = next((p for key, p in VISION_PROFILES if p.name == overrides["name"] or key == overrides["name"]), None)
+    if base is None:
+        base = next((p for key, p in VISION_PROFILES if key in path), None)
+    if base is None:
+        if not is_vision_model(model_path) and not overrides:
+            return None
+        base = DEFAULT_VISION_PROFILE
+
+    known = {f.name for f in fields(VisionProfile)}
+    unknown = set(overrides) - known
+    if unknown:
+        raise ValueError(f"Unknown vision profile fields: {sorted(unknown)}")
+    return replace(base, **overrides)
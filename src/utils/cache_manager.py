@@ -3,23 +3,88 @@ Binary Prompt Cache Manager for RKLLM Models
 
 Handles REAL RKLLM binary prompt caching for performance optimization.
 Binary caches save NPU computation state for 50-70% TTFT reduction.
+
+Besides named caches created via the API, caches are created automatically
+for repeated prompt prefixes (e.g. a shared system prompt). Those are
+content-addressed: the cache name is a hash of the model name and the
+formatted prefix, so matching requests find them without naming them.
+
+All cache metadata is kept in an in-memory index that is built once at
+startup and updated on create/delete, so listing never touches the disk.
+Hit counts are written back to the JSON sidecars at most every
+stats_flush_interval_s seconds, after evictions and on unload, so LRU / LFU
+order survives a restart.
+Byte budgets per model and in total are enforced by evicting the least
+recently used (or least frequently used) caches.
 """
 import os
 import json
 import time
-from typing import Optional, Dict, Any, List
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 
+# Name prefix of content-addressed caches created automatically
+AUTO_CACHE_PREFIX = "auto-"
+
+# Caches never removed by budget eviction
+PROTECTED_CACHES = {"system"}
+
+
+@dataclass
+class CacheEntry:
+    """Index entry for one binary cache file"""
+    model_name: str
+    cache_name: str
+    path: str
+    size_bytes: int
+    created_at: float
+    modified_at: float
+    prompt_length: int = 0
+    source: str = "unknown"
+    ttft_ms: float = 0.0
+    hits: int = 0
+    last_used: float = 0.0
+    
+    def to_info(self) -> Dict[str, Any]:
+        return {
+            "cache_name": self.cache_name,
+            "model_name": self.model_name,
+            "path": self.path,
+            "size_mb": self.size_bytes / (1024 * 1024),
+            "created_at": self.created_at,
+            "modified_at": self.modified_at,
+            "prompt_length": self.prompt_length,
+            "source": self.source,
+            "hits": self.hits,
+            "last_used": self.last_used
+        }
+
 
 class PromptCacheManager:
     """Manages RKLLM binary prompt caches (NPU state caching)"""
     
-    def __init__(self, cache_base_dir: str = "cache"):
+    def __init__(
+        self,
+        cache_base_dir: str = "cache",
+        max_bytes_per_model: int = 0,
+        max_bytes_total: int = 0,
+        eviction_policy: str = "lru",
+        stats_flush_interval_s: float = 30.0
+    ):
         """
         Initialize cache manager
         
         Args:
             cache_base_dir: Base directory for all caches (default: "cache", relative to project root)
+            max_bytes_per_model: Byte budget for one model's caches (0 = unlimited)
+            max_bytes_total: Byte budget across all models (0 = unlimited)
+            eviction_policy: "lru" (oldest last use) or "lfu" (fewest hits) first
+            stats_flush_interval_s: Minimum seconds between writing hit counts
+                back to the sidecars (0 = on every hit)
         """
         # Find project root (parent of src directory)
         if Path(cache_base_dir).is_absolute():
@@ -30,6 +95,34 @@ class PromptCacheManager:
             self.cache_base_dir = project_root / cache_base_dir
         
         self.cache_base_dir.mkdir(exist_ok=True)
+        
+        # Size budgets (configured from inference_config at model load)
+        self.max_bytes_per_model = max_bytes_per_model
+        self.max_bytes_total = max_bytes_total
+        self.eviction_policy = eviction_policy
+        self.evictions = 0
+        
+        # Hit statistics not yet written to the sidecars
+        self.stats_flush_interval_s = stats_flush_interval_s
+        self._dirty_stats = set()
+        self._stats_flushed_at = time.monotonic()
+        
+        # Automatic prefix caching (configured from inference_config at model load)
+        self.auto_cache_enabled = True
+        self.auto_cache_min_sightings = 3
+        self.auto_cache_min_chars = 256
+        self.auto_cache_max_tracked = 1024
+        self._prefix_sightings: "OrderedDict[str, int]" = OrderedDict()
+        self._auto_pending = set()
+        self._auto_lock = threading.Lock()
+        self.auto_cache_hits = 0
+        self.auto_cache_misses = 0
+        self.auto_caches_created = 0
+        
+        # In-memory index: model_name -> cache_name -> CacheEntry
+        self._index: Dict[str, Dict[str, CacheEntry]] = {}
+        self._index_lock = threading.RLock()
+        self._load_index()
     
     def _get_model_cache_dir(self, model_name: str) -> Path:
         """Get cache directory for a specific model"""
@@ -51,6 +144,59 @@ class PromptCacheManager:
         cache_dir = self._get_model_cache_dir(model_name)
         return str(cache_dir / f"{cache_name}.rkllm_cache")
     
+    def _load_index(self):
+        """Scan the cache directory once and build the in-memory index"""
+        with self._index_lock:
+            self._index.clear()
+            for model_dir in self.cache_base_dir.iterdir():
+                if not model_dir.is_dir():
+                    continue
+                for cache_file in model_dir.glob("*.rkllm_cache"):
+                    self._index_file(model_dir.name, cache_file.stem)
+    
+    def _index_file(self, model_name: str, cache_name: str) -> Optional[CacheEntry]:
+        """Stat a cache file, read its sidecar and (re)index it"""
+        path = self.get_cache_path(model_name, cache_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        
+        # Try to load metadata if it exists
+        metadata_path = path.replace('.rkllm_cache', '.json')
+        metadata = {}
+        if os.path.exists(metadata_path):
+            try:
+                with open(metadata_path, 'r') as f:
+                    metadata = json.load(f)
+            except:
+                pass
+        
+        entry = CacheEntry(
+            model_name=model_name,
+            cache_name=cache_name,
+            path=path,
+            size_bytes=stat.st_size,
+            created_at=metadata.get("created_at", stat.st_ctime),
+            modified_at=stat.st_mtime,
+            prompt_length=metadata.get("prompt_length", 0),
+            source=metadata.get("source", "unknown"),
+            ttft_ms=metadata.get("ttft_ms", 0.0),
+            hits=metadata.get("hits", 0),
+            last_used=metadata.get("last_used", stat.st_mtime)
+        )
+        with self._index_lock:
+            self._index.setdefault(model_name, {})[cache_name] = entry
+        return entry
+    
+    def _get_entry(self, model_name: str, cache_name: str) -> Optional[CacheEntry]:
+        with self._index_lock:
+            entry = self._index.get(model_name, {}).get(cache_name)
+        if entry is None:
+            # Written by the runtime but not registered yet
+            entry = self._index_file(model_name, cache_name)
+        return entry
+    
     def cache_exists(self, model_name: str, cache_name: str) -> bool:
         """
         Check if a binary cache file exists
@@ -62,6 +208,9 @@ class PromptCacheManager:
         Returns:
             True if cache exists, False otherwise
         """
+        with self._index_lock:
+            if cache_name in self._index.get(model_name, {}):
+                return True
         path = self.get_cache_path(model_name, cache_name)
         return os.path.exists(path)
     
@@ -76,32 +225,27 @@ class PromptCacheManager:
         Returns:
             Dictionary with size_mb, created_at, modified_at, or None if doesn't exist
         """
-        path = self.get_cache_path(model_name, cache_name)
-        if not os.path.exists(path):
-            return None
-        
-        stat = os.stat(path)
-        
-        # Try to load metadata if it exists
-        metadata_path = path.replace('.rkllm_cache', '.json')
-        metadata = {}
-        if os.path.exists(metadata_path):
-            try:
-                with open(metadata_path, 'r') as f:
-                    metadata = json.load(f)
-            except:
-                pass
+        entry = self._get_entry(model_name, cache_name)
+        return entry.to_info() if entry else None
+    
+    def record_hit(self, model_name: str, cache_name: str):
+        """
+        Record that a cache was used (feeds LRU / LFU eviction)
         
-        return {
-            "cache_name": cache_name,
-            "model_name": model_name,
-            "path": path,
-            "size_mb": stat.st_size / (1024 * 1024),
-            "created_at": stat.st_ctime,
-            "modified_at": stat.st_mtime,
-            "prompt_length": metadata.get("prompt_length", 0),
-            "source": metadata.get("source", "unknown")
-        }
+        Args:
+            model_name: Friendly model name
+            cache_name: Cache identifier
+        """
+        entry = self._get_entry(model_name, cache_name)
+        if entry is None:
+            return
+        with self._index_lock:
+            entry.hits += 1
+            entry.last_used = time.time()
+            self._dirty_stats.add((model_name, cache_name))
+            due = time.monotonic() - self._stats_flushed_at >= self.stats_flush_interval_s
+        if due:
+            self.flush_stats()
     
     def save_metadata(
         self, 
@@ -112,7 +256,7 @@ class PromptCacheManager:
         ttft_ms: float = 0.0
     ):
         """
-        Save metadata for a binary cache
+        Save metadata for a binary cache and register it in the index
         
         Args:
             model_name: Friendly model name
@@ -124,17 +268,59 @@ class PromptCacheManager:
         cache_dir = self._get_model_cache_dir(model_name)
         metadata_path = cache_dir / f"{cache_name}.json"
         
+        now = time.time()
         metadata = {
             "cache_name": cache_name,
             "model_name": model_name,
-            "created_at": time.time(),
+            "created_at": now,
             "prompt_length": prompt_length,
             "source": source,
-            "ttft_ms": ttft_ms
+            "ttft_ms": ttft_ms,
+            "hits": 0,
+            "last_used": now
         }
         
         with open(metadata_path, 'w') as f:
             json.dump(metadata, f, indent=2)
+        
+        if self._index_file(model_name, cache_name) is not None:
+            self.enforce_budget(protect=(model_name, cache_name))
+    
+    def flush_stats(self):
+        """Write hit counts and last-use times back to the JSON sidecars"""
+        with self._index_lock:
+            dirty, self._dirty_stats = self._dirty_stats, set()
+            self._stats_flushed_at = time.monotonic()
+            entries = [
+                self._index[model_name][cache_name] for model_name, cache_name in dirty
+                if cache_name in self._index.get(model_name, {})
+            ]
+        for entry in entries:
+            metadata_path = entry.path.replace('.rkllm_cache', '.json')
+            metadata = {}
+            if os.path.exists(metadata_path):
+                try:
+                    with open(metadata_path, 'r') as f:
+                        metadata = json.load(f)
+                except:
+                    pass
+            if metadata.get("hits") == entry.hits and metadata.get("last_used") == entry.last_used:
+                continue
+            metadata.update({
+                "cache_name": entry.cache_name,
+                "model_name": entry.model_name,
+                "created_at": entry.created_at,
+                "prompt_length": entry.prompt_length,
+                "source": entry.source,
+                "ttft_ms": entry.ttft_ms,
+                "hits": entry.hits,
+                "last_used": entry.last_used
+            })
+            try:
+                with open(metadata_path, 'w') as f:
+                    json.dump(metadata, f, indent=2)
+            except OSError:
+                pass
     
     def delete_cache(self, model_name: str, cache_name: str) -> bool:
         """
@@ -150,6 +336,9 @@ class PromptCacheManager:
         path = self.get_cache_path(model_name, cache_name)
         metadata_path = path.replace('.rkllm_cache', '.json')
         
+        with self._index_lock:
+            self._index.get(model_name, {}).pop(cache_name, None)
+        
         deleted = False
         if os.path.exists(path):
             os.remove(path)
@@ -172,14 +361,8 @@ class PromptCacheManager:
         Returns:
             List of dictionaries with cache information
         """
-        cache_dir = self._get_model_cache_dir(model_name)
-        caches = []
-        
-        for cache_file in cache_dir.glob("*.rkllm_cache"):
-            cache_name = cache_file.stem
-            info = self.get_cache_info(model_name, cache_name)
-            if info:
-                caches.append(info)
+        with self._index_lock:
+            caches = [entry.to_info() for entry in self._index.get(model_name, {}).values()]
         
         # Sort by creation time, newest first
         caches.sort(key=lambda x: x.get('created_at', 0), reverse=True)
@@ -194,18 +377,207 @@ class PromptCacheManager:
         """
         all_caches = {}
         
-        if not self.cache_base_dir.exists():
-            return all_caches
+        with self._index_lock:
+            model_names = list(self._index.keys())
         
-        for model_dir in self.cache_base_dir.iterdir():
-            if model_dir.is_dir():
-                model_name = model_dir.name
-                caches = self.list_caches(model_name)
-                if caches:
-                    all_caches[model_name] = caches
+        for model_name in model_names:
+            caches = self.list_caches(model_name)
+            if caches:
+                all_caches[model_name] = caches
         
         return all_caches
     
+    def usage(self) -> Dict[str, Any]:
+        """
+        Bytes used per model and in total, with the configured budgets
+        
+        Returns:
+            Dictionary with per-model bytes, total bytes, budgets and evictions
+        """
+        with self._index_lock:
+            per_model = {
+                model_name: sum(e.size_bytes for e in caches.values())
+                for model_name, caches in self._index.items()
+            }
+        return {
+            "models": per_model,
+            "total_bytes": sum(per_model.values()),
+            "max_bytes_per_model": self.max_bytes_per_model,
+            "max_bytes_total": self.max_bytes_total,
+            "eviction_policy": self.eviction_policy,
+            "evictions": self.evictions
+        }
+    
+    def enforce_budget(self, protect: Optional[Tuple[str, str]] = None) -> List[str]:
+        """
+        Evict caches until the per-model and total byte budgets are met
+        
+        Args:
+            protect: (model_name, cache_name) that must survive, e.g. the cache
+                that was just created
+            
+        Returns:
+            Names of evicted caches as "model/cache"
+        """
+        if self.eviction_policy == "lfu":
+            order = lambda e: (e.hits, e.last_used)
+        else:
+            order = lambda e: e.last_used
+        
+        with self._index_lock:
+            pending = set(self._auto_pending)
+            candidates = sorted(
+                (e for caches in self._index.values() for e in caches.values()
+                 if e.cache_name not in PROTECTED_CACHES
+                 and e.cache_name not in pending
+                 and (e.model_name, e.cache_name) != protect),
+                key=order
+            )
+            model_bytes = {
+                model_name: sum(e.size_bytes for e in caches.values())
+                for model_name, caches in self._index.items()
+            }
+        
+        total_bytes = sum(model_bytes.values())
+        evicted = []
+        for entry in candidates:
+            over_model = self.max_bytes_per_model and model_bytes[entry.model_name] > self.max_bytes_per_model
+            over_total = self.max_bytes_total and total_bytes > self.max_bytes_total
+            if not over_model and not over_total:
+                continue
+            self.delete_cache(entry.model_name, entry.cache_name)
+            model_bytes[entry.model_name] -= entry.size_bytes
+            total_bytes -= entry.size_bytes
+            self.evictions += 1
+            evicted.append(f"{entry.model_name}/{entry.cache_name}")
+        
+        if evicted:
+            print(f"[CACHE] Evicted {len(evicted)} cache(s) over budget: {', '.join(evicted)}")
+            # Eviction order depends on the surviving caches' stats
+            self.flush_stats()
+        return evicted
+    
+    def prefix_cache_name(self, model_name: str, prefix: str) -> str:
+        """
+        Content-addressed cache name for a prompt prefix
+        
+        Args:
+            model_name: Friendly model name
+            prefix: Formatted prompt prefix (e.g. system message)
+            
+        Returns:
+            Cache identifier of the form auto-<hash>
+        """
+        digest = hashlib.sha256(f"{model_name}\0{prefix}".encode('utf-8')).hexdigest()
+        return f"{AUTO_CACHE_PREFIX}{digest[:16]}"
+    
+    def lookup_prefix(self, model_name: str, prefix: str) -> Optional[str]:
+        """
+        Find the automatic cache for a prompt prefix
+        
+        Counts a hit or a miss, and on a miss records one more sighting of
+        the prefix towards automatic creation.
+        
+        Args:
+            model_name: Friendly model name
+            prefix: Formatted prompt prefix
+            
+        Returns:
+            Path to the binary cache, or None if it does not exist (yet)
+        """
+        if not self.auto_cache_enabled or len(prefix) < self.auto_cache_min_chars:
+            return None
+        
+        cache_name = self.prefix_cache_name(model_name, prefix)
+        with self._auto_lock:
+            if cache_name not in self._auto_pending and self.cache_exists(model_name, cache_name):
+                self.auto_cache_hits += 1
+                self.record_hit(model_name, cache_name)
+                return self.get_cache_path(model_name, cache_name)
+            
+            self.auto_cache_misses += 1
+            key = f"{model_name}/{cache_name}"
+            self._prefix_sightings[key] = self._prefix_sightings.get(key, 0) + 1
+            self._prefix_sightings.move_to_end(key)
+            while len(self._prefix_sightings) > self.auto_cache_max_tracked:
+                self._prefix_sightings.popitem(last=False)
+        return None
+    
+    def claim_auto_cache(self, model_name: str, prefix: str) -> Optional[Tuple[str, str]]:
+        """
+        Reserve creation of the automatic cache for a prefix
+        
+        Returns the reservation only once the prefix has been seen
+        auto_cache_min_sightings times and no cache exists or is being built.
+        
+        Args:
+            model_name: Friendly model name
+            prefix: Formatted prompt prefix
+            
+        Returns:
+            (cache_name, cache_path) to create, or None
+        """
+        if not self.auto_cache_enabled or len(prefix) < self.auto_cache_min_chars:
+            return None
+        
+        cache_name = self.prefix_cache_name(model_name, prefix)
+        key = f"{model_name}/{cache_name}"
+        with self._auto_lock:
+            if self._prefix_sightings.get(key, 0) < self.auto_cache_min_sightings:
+                return None
+            if cache_name in self._auto_pending or self.cache_exists(model_name, cache_name):
+                return None
+            self._auto_pending.add(cache_name)
+        return cache_name, self.get_cache_path(model_name, cache_name)
+    
+    def complete_auto_cache(
+        self,
+        model_name: str,
+        cache_name: str,
+        prefix: str,
+        success: bool,
+        ttft_ms: float = 0.0
+    ):
+        """
+        Finish a reservation made by claim_auto_cache
+        
+        Args:
+            model_name: Friendly model name
+            cache_name: Reserved cache identifier
+            prefix: Formatted prompt prefix that was cached
+            success: Whether the binary cache file was written
+            ttft_ms: Prefill time of the cached prefix
+        """
+        if success and self.cache_exists(model_name, cache_name):
+            self.save_metadata(model_name, cache_name, len(prefix), source="auto", ttft_ms=ttft_ms)
+            self.auto_caches_created += 1
+        else:
+            self.delete_cache(model_name, cache_name)
+        with self._auto_lock:
+            self._auto_pending.discard(cache_name)
+            self._prefix_sightings.pop(f"{model_name}/{cache_name}", None)
+    
+    def auto_cache_stats(self) -> Dict[str, Any]:
+        """
+        Counters for automatic prefix caching
+        
+        Returns:
+            Dictionary with hits, misses, created, pending and tracked prefixes
+        """
+        with self._auto_lock:
+            lookups = self.auto_cache_hits + self.auto_cache_misses
+            return {
+                "enabled": self.auto_cache_enabled,
+                "hits": self.auto_cache_hits,
+                "misses": self.auto_cache_misses,
+                "hit_rate": self.auto_cache_hits / lookups if lookups else 0.0,
+                "created": self.auto_caches_created,
+                "pending": len(self._auto_pending),
+                "tracked_prefixes": len(self._prefix_sightings),
+                "min_sightings": self.auto_cache_min_sightings,
+                "min_prefix_chars": self.auto_cache_min_chars
+            }
+    
     def ensure_model_cache_dir(self, model_name: str) -> Path:
         """
         Ensure cache directory exists for a model
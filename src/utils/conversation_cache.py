@@ -0,0 +1,355 @@
+"""
+Per-conversation NPU state snapshots for RKLLM models
+
+Only one conversation's KV state is resident on the NPU at a time. When
+several users take turns, each turn of a displaced conversation would pay a
+full prefill. This manager keeps a binary prompt cache (RKLLMPromptCacheParam
+snapshot) per conversation ID, so a returning conversation restores its state
+instead of recomputing it.
+
+Snapshots live in two tiers, each with a byte budget and LRU order:
+  - RAM tier: a tmpfs directory (e.g. /dev/shm), fastest to restore
+  - Disk tier: cache/<model>/sessions managed by PromptCacheManager
+Least recently used snapshots are demoted from RAM to disk, then deleted from
+disk when the disk budget is exceeded. Each snapshot has a JSON sidecar with
+its conversation and prefix, so snapshots survive a server restart.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .cache_manager import PromptCacheManager
+
+# Actions returned by ConversationCacheManager.plan()
+RESIDENT = "resident"   # KV already holds this conversation, nothing to load
+RESTORE = "restore"     # Load the conversation's snapshot before prefill
+SNAPSHOT = "snapshot"   # Full prefill, saving a fresh snapshot
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class ConversationSnapshot:
+    """A saved NPU state for one conversation"""
+    conversation_id: str
+    path: str
+    tier: str              # "ram" or "disk"
+    size_bytes: int
+    prefix_chars: int      # Length of the prompt the snapshot was taken from
+    prefix_digest: str     # sha256 of that prompt
+    created_at: float
+    last_used: float
+    restores: int = 0
+
+
+@dataclass
+class ConversationPlan:
+    """What generate() should do for one conversation turn"""
+    model_name: str
+    conversation_id: str
+    action: str
+    cache_path: Optional[str] = None
+
+    @property
+    def save(self) -> bool:
+        return self.action == SNAPSHOT
+
+
+class ConversationCacheManager:
+    """LRU-managed binary prompt cache snapshots keyed by conversation ID"""
+
+    def __init__(
+        self,
+        cache_manager: PromptCacheManager,
+        ram_dir: Optional[str] = "/dev/shm/rkllm-sessions",
+        ram_budget_bytes: int = 512 * 1024 * 1024,
+        disk_budget_bytes: int = 2048 * 1024 * 1024,
+        refresh_ratio: float = 0.5
+    ):
+        """
+        Args:
+            cache_manager: Owner of the on-disk cache directory
+            ram_dir: tmpfs directory for the RAM tier (None disables the tier)
+            ram_budget_bytes: Maximum bytes of snapshots kept in the RAM tier
+            disk_budget_bytes: Maximum bytes of snapshots kept on disk
+            refresh_ratio: Re-snapshot once the snapshot covers less than this
+                fraction of the conversation's prompt
+        """
+        self.cache_manager = cache_manager
+        self.ram_dir = Path(ram_dir) if ram_dir else None
+        self.ram_budget_bytes = ram_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.refresh_ratio = refresh_ratio
+
+        self._snapshots: Dict[str, "OrderedDict[str, ConversationSnapshot]"] = {}
+        self._resident: Optional[tuple] = None  # (model_name, conversation_id)
+        self._lock = threading.Lock()
+
+        # Counters for reporting
+        self.restores = 0
+        self.snapshots = 0
+        self.demotions = 0
+        self.evictions = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def plan(
+        self,
+        model_name: str,
+        conversation_id: str,
+        prompt: str,
+        kv_resident: bool = False
+    ) -> ConversationPlan:
+        """
+        Decide how to serve one turn of a conversation.
+
+        Args:
+            model_name: Friendly model name
+            conversation_id: Client-supplied conversation key
+            prompt: Full formatted prompt of this turn
+            kv_resident: Whether the live KV cache is still tracked (prefix cache)
+        """
+        with self._lock:
+            if kv_resident and self._resident == (model_name, conversation_id):
+                return ConversationPlan(model_name, conversation_id, RESIDENT)
+
+            snapshots = self._model_snapshots(model_name)
+            snap = snapshots.get(conversation_id)
+            if snap is not None and os.path.exists(snap.path) and self._covers(snap, prompt):
+                snap.last_used = time.time()
+                snap.restores += 1
+                snapshots.move_to_end(conversation_id)
+                self._write_metadata(snap)
+                self.restores += 1
+                return ConversationPlan(model_name, conversation_id, RESTORE, snap.path)
+
+            return ConversationPlan(
+                model_name, conversation_id, SNAPSHOT, self._snapshot_path(model_name, conversation_id)
+            )
+
+    def commit(self, plan: ConversationPlan, prompt: str):
+        """Record a finished turn: the conversation now owns the NPU KV state"""
+        with self._lock:
+            self._resident = (plan.model_name, plan.conversation_id)
+            if plan.action != SNAPSHOT or not os.path.exists(plan.cache_path):
+                return
+
+            snapshots = self._model_snapshots(plan.model_name)
+            old = snapshots.pop(plan.conversation_id, None)
+            if old is not None and old.path != plan.cache_path:
+                self._remove_file(old.path)
+
+            now = time.time()
+            snap = ConversationSnapshot(
+                conversation_id=plan.conversation_id,
+                path=plan.cache_path,
+                tier="ram" if self._in_ram_tier(plan.cache_path) else "disk",
+                size_bytes=os.path.getsize(plan.cache_path),
+                prefix_chars=len(prompt),
+                prefix_digest=_digest(prompt),
+                created_at=now,
+                last_used=now
+            )
+            snapshots[plan.conversation_id] = snap
+            self._write_metadata(snap)
+            self.snapshots += 1
+            self._enforce_budgets(plan.model_name)
+
+    def discard(self, plan: ConversationPlan):
+        """Forget a failed turn; a half-written snapshot is removed"""
+        with self._lock:
+            self._resident = None
+            if plan.action == SNAPSHOT:
+                # The run may have overwritten an older snapshot at this path
+                snapshots = self._model_snapshots(plan.model_name)
+                snap = snapshots.get(plan.conversation_id)
+                if snap is not None and snap.path == plan.cache_path:
+                    del snapshots[plan.conversation_id]
+                self._remove_file(plan.cache_path)
+
+    def invalidate_resident(self):
+        """The NPU KV cache was replaced by a request outside any conversation"""
+        with self._lock:
+            self._resident = None
+
+    def drop(self, model_name: str, conversation_id: str) -> bool:
+        """Delete a conversation's snapshot"""
+        with self._lock:
+            snap = self._model_snapshots(model_name).pop(conversation_id, None)
+            if snap is None:
+                return False
+            self._remove_file(snap.path)
+            if self._resident == (model_name, conversation_id):
+                self._resident = None
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            all_snaps = [s for snaps in self._snapshots.values() for s in snaps.values()]
+            return {
+                "conversations": len(all_snaps),
+                "ram_bytes": sum(s.size_bytes for s in all_snaps if s.tier == "ram"),
+                "disk_bytes": sum(s.size_bytes for s in all_snaps if s.tier == "disk"),
+                "ram_budget_bytes": self.ram_budget_bytes if self.ram_dir else 0,
+                "disk_budget_bytes": self.disk_budget_bytes,
+                "restores": self.restores,
+                "snapshots": self.snapshots,
+                "demotions": self.demotions,
+                "evictions": self.evictions,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _model_snapshots(self, model_name: str) -> "OrderedDict[str, ConversationSnapshot]":
+        snapshots = self._snapshots.get(model_name)
+        if snapshots is None:
+            snapshots = OrderedDict()
+            self._snapshots[model_name] = snapshots
+            self._load_snapshots(model_name, snapshots)
+        return snapshots
+
+    def _load_snapshots(self, model_name: str, snapshots: "OrderedDict[str, ConversationSnapshot]"):
+        """Re-index snapshots left by a previous server run from their sidecars"""
+        found = []
+        for tier, directory in (("ram", self._ram_dir(model_name)), ("disk", self._disk_dir(model_name))):
+            if directory is None:
+                continue
+            for cache_file in directory.glob("*.rkllm_cache"):
+                try:
+                    with open(self._metadata_path(str(cache_file)), 'r') as f:
+                        metadata = json.load(f)
+                    found.append(ConversationSnapshot(
+                        conversation_id=metadata['conversation_id'],
+                        path=str(cache_file),
+                        tier=tier,
+                        size_bytes=cache_file.stat().st_size,
+                        prefix_chars=metadata['prefix_chars'],
+                        prefix_digest=metadata['prefix_digest'],
+                        created_at=metadata.get('created_at', 0.0),
+                        last_used=metadata.get('last_used', 0.0),
+                        restores=metadata.get('restores', 0)
+                    ))
+                except (OSError, ValueError, KeyError, TypeError):
+                    # No usable sidecar: the snapshot cannot be matched to a prompt
+                    self._remove_file(str(cache_file))
+            for metadata_file in directory.glob("*.json"):
+                if not metadata_file.with_suffix(".rkllm_cache").exists():
+                    self._remove_file(str(metadata_file))
+
+        for snap in sorted(found, key=lambda s: s.last_used):
+            old = snapshots.pop(snap.conversation_id, None)
+            if old is not None:
+                self._remove_file(old.path)
+            snapshots[snap.conversation_id] = snap
+        self._enforce_budgets(model_name)
+
+    def _covers(self, snap: ConversationSnapshot, prompt: str) -> bool:
+        """Snapshot is a prefix of the prompt and still covers enough of it"""
+        if len(prompt) < snap.prefix_chars:
+            return False
+        if _digest(prompt[:snap.prefix_chars]) != snap.prefix_digest:
+            return False
+        return snap.prefix_chars >= self.refresh_ratio * len(prompt)
+
+    def _ram_dir(self, model_name: str) -> Optional[Path]:
+        if self.ram_dir is None or self.ram_budget_bytes <= 0:
+            return None
+        directory = self.ram_dir / model_name
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            return None
+        return directory
+
+    def _disk_dir(self, model_name: str) -> Path:
+        directory = self.cache_manager.ensure_model_cache_dir(model_name) / "sessions"
+        directory.mkdir(exist_ok=True)
+        return directory
+
+    def _in_ram_tier(self, path: str) -> bool:
+        return self.ram_dir is not None and Path(path).is_relative_to(self.ram_dir)
+
+    def _snapshot_path(self, model_name: str, conversation_id: str) -> str:
+        directory = self._ram_dir(model_name) or self._disk_dir(model_name)
+        return str(directory / f"{_digest(conversation_id)[:16]}.rkllm_cache")
+
+    def _enforce_budgets(self, model_name: str):
+        """Demote LRU snapshots from RAM to disk, then evict LRU from disk"""
+        snapshots = self._model_snapshots(model_name)
+
+        ram_used = sum(s.size_bytes for s in snapshots.values() if s.tier == "ram")
+        for snap in list(snapshots.values()):
+            if ram_used <= self.ram_budget_bytes:
+                break
+            if snap.tier != "ram":
+                continue
+            target = self._disk_dir(model_name) / Path(snap.path).name
+            try:
+                shutil.move(snap.path, target)
+                self._remove_metadata(snap.path)
+                snap.path, snap.tier = str(target), "disk"
+                self._write_metadata(snap)
+                self.demotions += 1
+            except OSError:
+                self._remove_file(snap.path)
+                del snapshots[snap.conversation_id]
+                self.evictions += 1
+            ram_used -= snap.size_bytes
+
+        disk_used = sum(s.size_bytes for s in snapshots.values() if s.tier == "disk")
+        for snap in list(snapshots.values()):
+            if disk_used <= self.disk_budget_bytes:
+                break
+            if snap.tier != "disk":
+                continue
+            self._remove_file(snap.path)
+            del snapshots[snap.conversation_id]
+            self.evictions += 1
+            disk_used -= snap.size_bytes
+
+    @staticmethod
+    def _metadata_path(path: str) -> str:
+        return path.replace('.rkllm_cache', '.json')
+
+    def _write_metadata(self, snap: ConversationSnapshot):
+        metadata = {
+            "conversation_id": snap.conversation_id,
+            "prefix_chars": snap.prefix_chars,
+            "prefix_digest": snap.prefix_digest,
+            "created_at": snap.created_at,
+            "last_used": snap.last_used,
+            "restores": snap.restores,
+        }
+        try:
+            with open(self._metadata_path(snap.path), 'w') as f:
+                json.dump(metadata, f, indent=2)
+        except OSError:
+            pass
+
+    def _remove_metadata(self, path: str):
+        if path.endswith('.rkllm_cache'):
+            try:
+                os.remove(self._metadata_path(path))
+            except OSError:
+                pass
+
+    def _remove_file(self, path: str):
+        """Remove a snapshot (or orphaned sidecar) and its sidecar"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self._remove_metadata(path)
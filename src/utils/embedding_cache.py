@@ -0,0 +1,93 @@
+"""
+Bounded LRU cache of embedding results
+
+RAG ingest re-embeds the same chunks over and over. Vectors are keyed by
+(model, pooling strategy, normalize flag, sha256 of the text) and kept in
+least-recently-used order under a byte budget, so repeated inputs skip the
+NPU entirely.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# Rough per-entry cost of the key, the tuple and the OrderedDict node
+_ENTRY_OVERHEAD_BYTES = 256
+
+EmbeddingKey = Tuple[str, str, bool, str]
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of float32 embedding vectors with a memory budget"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Memory budget for cached vectors (0 disables the cache)
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[EmbeddingKey, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Counters for reporting
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, pooling_strategy: str, normalize: bool, text: str) -> EmbeddingKey:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return (model_name or "", pooling_strategy, bool(normalize), digest)
+
+    def get(self, key: EmbeddingKey) -> Optional[Tuple[np.ndarray, int]]:
+        """Return (embedding, tokens_processed) or None; the array is read-only"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: EmbeddingKey, embedding: np.ndarray, tokens_processed: int = 0):
+        """Store a vector, evicting least recently used entries over budget"""
+        if self.max_bytes <= 0:
+            return
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        size = embedding.nbytes + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0].nbytes + _ENTRY_OVERHEAD_BYTES
+            self._entries[key] = (embedding, tokens_processed)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes + _ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,233 @@
+"""
+LRU cache of vision-encoder outputs
+
+Visual-QA clients ask about the same pictures again and again, and each
+image costs a full vision-encoder pass (~1 s on the NPU). Embeddings are
+keyed by (vision model ID, sha256 of the decoded pixels), so the same
+picture re-sent with different metadata or container still hits, while
+a different encoder never reuses another model's vectors.
+
+Two tiers, each with a byte budget and LRU order:
+  - RAM: float32 arrays in an OrderedDict
+  - Disk (optional): one .npy file per image, memory-mapped on load, so a
+    restart or a RAM eviction does not cost another encoder pass
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .image_fetcher import ImageInput, PreparedImage
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry cost of the key, the tuple and the OrderedDict node
+_ENTRY_OVERHEAD_BYTES = 256
+
+ImageKey = Tuple[str, str]
+
+
+def pixel_digest(image: ImageInput) -> str:
+    """
+    sha256 of the decoded RGB pixels and image size.
+
+    Prepared images already carry their digest. Encoded bytes fall back to
+    hashing the bytes themselves when Pillow is not installed or the data
+    does not decode (the encoder will then reject it anyway).
+    """
+    if isinstance(image, PreparedImage):
+        return image.digest
+    image_data = image
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_data)) as image:
+            image = image.convert("RGB")
+            h = hashlib.sha256(f"{image.width}x{image.height}:".encode())
+            h.update(image.tobytes())
+            return h.hexdigest()
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.debug(f"Could not decode image for hashing: {e}")
+    return "raw-" + hashlib.sha256(image_data).hexdigest()
+
+
+class ImageEmbeddingCache:
+    """Thread-safe LRU of image embeddings with RAM and optional disk budgets"""
+
+    def __init__(
+        self,
+        max_bytes: int = 128 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024
+    ):
+        """
+        Args:
+            max_bytes: RAM budget for cached embeddings (0 disables the RAM tier)
+            disk_dir: Directory for the .npy disk tier (None disables it)
+            disk_max_bytes: Disk budget for the .npy files
+        """
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir: Optional[Path] = None
+        self._entries: "OrderedDict[ImageKey, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._disk: "OrderedDict[ImageKey, int]" = OrderedDict()  # key -> file size
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        # Counters for reporting
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_dir:
+            self.set_disk_dir(disk_dir)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self.disk_dir is not None
+
+    @staticmethod
+    def make_key(model_id: str, image: ImageInput) -> ImageKey:
+        # The model ID doubles as a file-name prefix in the disk tier
+        model_id = "".join(c if c.isalnum() or c in "-." else "_" for c in model_id or "")
+        return (model_id, pixel_digest(image))
+
+    def set_disk_dir(self, disk_dir: str):
+        """Attach a disk tier, indexing files left by earlier runs (oldest first)"""
+        path = Path(disk_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        files = sorted(path.glob("*.npy"), key=lambda p: p.stat().st_mtime)
+        with self._lock:
+            self.disk_dir = path
+            self._disk.clear()
+            self._disk_bytes = 0
+            for f in files:
+                model_id, sep, digest = f.stem.rpartition("__")
+                if not sep:
+                    continue
+                size = f.stat().st_size
+                self._disk[(model_id, digest)] = size
+                self._disk_bytes += size
+            self._trim_disk()
+
+    def get(self, key: ImageKey) -> Optional[np.ndarray]:
+        """Cached embedding (read-only) or None"""
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            if key not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+            path = self._path(key)
+
+        try:
+            embedding = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Dropping unreadable image embedding {path.name}: {e}")
+            with self._lock:
+                self._drop_disk(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._put_ram(key, embedding)
+        return embedding
+
+    def put(self, key: ImageKey, embedding: np.ndarray):
+        """Store an embedding in RAM and, if configured, on disk"""
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        with self._lock:
+            self._put_ram(key, embedding)
+            if self.disk_dir is None or embedding.nbytes > self.disk_max_bytes or key in self._disk:
+                return
+            path = self._path(key)
+
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, embedding)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"⚠️  Failed to write image embedding to disk: {e}")
+            return
+        with self._lock:
+            size = path.stat().st_size
+            self._disk[key] = size
+            self._disk_bytes += size
+            self._trim_disk()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for key in list(self._disk):
+                self._drop_disk(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir is not None else 0,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals (caller holds self._lock)
+    # ------------------------------------------------------------------
+
+    def _path(self, key: ImageKey) -> Path:
+        return self.disk_dir / f"{key[0]}__{key[1]}.npy"
+
+    def _put_ram(self, key: ImageKey, embedding: np.ndarray):
+        size = embedding.nbytes + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes + _ENTRY_OVERHEAD_BYTES
+        self._entries[key] = embedding
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes + _ENTRY_OVERHEAD_BYTES
+            self.evictions += 1
+
+    def _trim_disk(self):
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            self._drop_disk(next(iter(self._disk)))
+            self.evictions += 1
+
+    def _drop_disk(self, key: ImageKey):
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
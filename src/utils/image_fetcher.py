@@ -0,0 +1,241 @@
+"""
+Async image loading for multimodal chat requests
+
+Images arrive as data: URLs or http(s) URLs inside chat messages. Fetching
+them with a blocking client inside the request handler stalls the event
+loop, and with it every SSE stream in flight, for the whole download.
+
+ImageFetcher downloads over one shared httpx.AsyncClient (pooled
+keep-alive connections), enforces a byte limit while streaming the body,
+fetches all images of a message concurrently, and decodes/letterboxes
+them to the vision encoder's input size on a small thread pool. Prepared
+images carry their pixel hash, so the embedding cache does not decode
+them again.
+
+Pillow is optional here: without it images are passed on as encoded
+bytes and the encoder decodes them itself.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Grey used by the vision demos to pad non-square images
+PAD_VALUE = 127
+
+
+class ImageFetchError(ValueError):
+    """An image URL could not be loaded (bad URL, too large, HTTP error)"""
+
+
+@dataclass
+class PreparedImage:
+    """Decoded RGB pixels at the encoder's input size (uint8, HWC)"""
+    pixels: np.ndarray
+    digest: str              # sha256 of the pixels and their shape
+
+    @classmethod
+    def from_pixels(cls, pixels: np.ndarray) -> "PreparedImage":
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        h = hashlib.sha256("x".join(map(str, pixels.shape)).encode() + b":")
+        h.update(pixels.tobytes())
+        return cls(pixels=pixels, digest=h.hexdigest())
+
+
+ImageInput = Union[bytes, PreparedImage]
+
+
+def letterbox(image_data: bytes, size: int) -> np.ndarray:
+    """Decode, pad to a square with grey and resize to size x size RGB (uint8, HWC)"""
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image = image.convert("RGB")
+    except Exception as e:
+        raise ImageFetchError(f"Cannot decode image: {e}")
+    side = max(image.size)
+    canvas = Image.new("RGB", (side, side), (PAD_VALUE,) * 3)
+    canvas.paste(image, ((side - image.width) // 2, (side - image.height) // 2))
+    canvas = canvas.resize((size, size), Image.BILINEAR)
+    return np.asarray(canvas, dtype=np.uint8)
+
+
+def decode_data_url(url: str, max_bytes: int) -> bytes:
+    """Bytes of a base64 ``data:image/...`` URL"""
+    header, sep, encoded = url.partition(",")
+    if not sep or ";base64" not in header:
+        raise ImageFetchError("Only base64 data URLs are supported for images")
+    if len(encoded) * 3 // 4 > max_bytes:
+        raise ImageFetchError(f"Image exceeds {max_bytes // (1024 * 1024)} MB limit")
+    try:
+        return base64.b64decode(encoded, validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise ImageFetchError(f"Invalid base64 image: {e}")
+
+
+def image_urls(content: Any) -> List[str]:
+    """URLs of the image_url parts of a message content (dicts or schema objects)"""
+    if not isinstance(content, list):
+        return []
+    urls = []
+    for part in content:
+        if isinstance(part, dict):
+            if part.get('type') == 'image_url':
+                urls.append((part.get('image_url') or {}).get('url', ''))
+        elif getattr(part, 'type', None) == 'image_url' and part.image_url is not None:
+            urls.append(part.image_url.url)
+    return [url for url in urls if url]
+
+
+def last_user_image_urls(messages: list) -> List[str]:
+    """Image URLs of the last user message - the images sent to the vision encoder"""
+    for msg in reversed(messages):
+        role = msg.role if hasattr(msg, 'role') else msg.get('role', 'user')
+        if role == 'user':
+            return image_urls(msg.content if hasattr(msg, 'content') else msg.get('content', ''))
+    return []
+
+
+class ImageFetcher:
+    """Pooled async downloads plus off-loop decode/resize"""
+
+    def __init__(
+        self,
+        max_bytes: int = 20 * 1024 * 1024,
+        timeout: float = 10.0,
+        max_connections: int = 8,
+        image_size: Optional[int] = None,
+        max_workers: int = 2,
+        client: Any = None
+    ):
+        """
+        Args:
+            max_bytes: Largest accepted image (encoded)
+            timeout: Seconds per download (connect and read)
+            max_connections: Pool size of the shared HTTP client
+            image_size: Default input size to letterbox to (None = keep encoded bytes)
+            max_workers: Threads for decoding/resizing
+            client: httpx.AsyncClient to use instead of creating one
+        """
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.image_size = image_size
+        self._max_workers = max_workers
+        self._client = client
+        self._owns_client = client is None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Counters for reporting
+        self.fetched = 0
+        self.bytes_fetched = 0
+        self.failures = 0
+
+    async def load(self, messages: list, image_size: Optional[int] = None) -> List[ImageInput]:
+        """
+        Images of the last user message, fetched and prepared concurrently.
+
+        Args:
+            messages: Chat messages
+            image_size: Letterbox size for this model (default self.image_size)
+
+        Raises:
+            ImageFetchError: An image could not be downloaded or decoded
+        """
+        urls = last_user_image_urls(messages)
+        if not urls:
+            return []
+        return list(await asyncio.gather(*(self.load_url(url, image_size) for url in urls)))
+
+    async def load_url(self, url: str, image_size: Optional[int] = None) -> ImageInput:
+        data = await self.fetch(url)
+        return await self.prepare(data, image_size)
+
+    async def fetch(self, url: str) -> bytes:
+        """Encoded bytes of a data: or http(s) URL"""
+        if url.startswith('data:'):
+            return decode_data_url(url, self.max_bytes)
+        if not url.startswith(('http://', 'https://')):
+            raise ImageFetchError(f"Unsupported image URL scheme: {url[:32]}")
+        try:
+            data = await self._download(url)
+        except ImageFetchError:
+            self.failures += 1
+            raise
+        except Exception as e:
+            self.failures += 1
+            raise ImageFetchError(f"Failed to download image: {e}")
+        self.fetched += 1
+        self.bytes_fetched += len(data)
+        return data
+
+    async def prepare(self, data: bytes, image_size: Optional[int] = None) -> ImageInput:
+        """Letterboxed pixels when Pillow and an image size are available, else the bytes"""
+        image_size = image_size or self.image_size
+        if not image_size or not _pillow_available():
+            return data
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="image-prep")
+        loop = asyncio.get_running_loop()
+        pixels = await loop.run_in_executor(self._executor, letterbox, data, image_size)
+        return PreparedImage.from_pixels(pixels)
+
+    async def _download(self, url: str) -> bytes:
+        client = self._get_client()
+        async with client.stream("GET", url) as resp:
+            if resp.status_code >= 400:
+                raise ImageFetchError(f"Image download failed with HTTP {resp.status_code}")
+            length = resp.headers.get("content-length")
+            if length is not None and length.isdigit() and int(length) > self.max_bytes:
+                raise ImageFetchError(f"Image exceeds {self.max_bytes // (1024 * 1024)} MB limit")
+            chunks, size = [], 0
+            async for chunk in resp.aiter_bytes():
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ImageFetchError(f"Image exceeds {self.max_bytes // (1024 * 1024)} MB limit")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "fetched": self.fetched,
+            "bytes_fetched": self.bytes_fetched,
+            "failures": self.failures,
+        }
+
+
+def _pillow_available() -> bool:
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return False
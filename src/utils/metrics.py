@@ -0,0 +1,303 @@
+"""
+Prometheus metrics for the inference server
+
+A small dependency-free registry that renders the Prometheus text format
+(version 0.0.4) for GET /metrics. Request-path metrics are observed where
+the work happens (generate_async, embeddings, image encoding); cache and
+scheduler counters are mirrored from their own stats at scrape time.
+
+Every series carries a ``model`` label and, for request metrics, an
+``endpoint`` label ("openai", "ollama", ...) taken from the context
+variable set per HTTP request by the metrics middleware. Work started
+outside a request (automatic cache builds) is labelled "internal".
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# API surface of the request being served, set by the HTTP middleware
+current_endpoint: contextvars.ContextVar = contextvars.ContextVar("metrics_endpoint", default="internal")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+INTER_TOKEN_BUCKETS = (0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 4, 6, 8, 10, 15, 20, 30, 50, 100)
+
+
+def endpoint_for_path(path: str) -> str:
+    """Metrics endpoint label of an HTTP path"""
+    if path.startswith("/api/"):
+        return "ollama"
+    if path.startswith("/v1/"):
+        return "openai"
+    return "other"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base for labelled metric families"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic total"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Mirror a total kept elsewhere (e.g. a cache's hit counter)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        self.set_total(value, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket distribution"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts incl. +Inf, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{self._labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Ordered collection of metric families"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+_REQUEST_LABELS = ("model", "endpoint")
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "rkllm_http_requests_total", "HTTP requests by API surface and status code", ("endpoint", "status"))
+QUEUE_WAIT = REGISTRY.histogram(
+    "rkllm_queue_wait_seconds", "Time from submission to getting an NPU batch slot", _REQUEST_LABELS)
+PREFILL = REGISTRY.histogram(
+    "rkllm_prefill_seconds", "Prompt prefill time reported by the runtime", _REQUEST_LABELS)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "rkllm_time_to_first_token_seconds", "Time from submission to the first generated token", _REQUEST_LABELS)
+INTER_TOKEN_LATENCY = REGISTRY.histogram(
+    "rkllm_inter_token_latency_seconds", "Mean time between generated tokens of a request",
+    _REQUEST_LABELS, INTER_TOKEN_BUCKETS)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "rkllm_generation_tokens_per_second", "Decode speed of a request reported by the runtime",
+    _REQUEST_LABELS, TOKENS_PER_SECOND_BUCKETS)
+GENERATED_TOKENS = REGISTRY.counter(
+    "rkllm_generated_tokens_total", "Tokens generated", _REQUEST_LABELS)
+IMAGE_ENCODE = REGISTRY.histogram(
+    "rkllm_image_encode_seconds", "Vision encoder time per request (cache hits included)", _REQUEST_LABELS)
+EMBEDDING = REGISTRY.histogram(
+    "rkllm_embedding_seconds", "Latency of an embedding batch, queue wait included", _REQUEST_LABELS)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "rkllm_cache_lookups_total", "Cache lookups by cache and result (hit or miss)", ("model", "cache", "result"))
+NPU_MEMORY = REGISTRY.gauge(
+    "rkllm_npu_memory_mb", "NPU memory usage reported by the runtime after the last run", ("model",))
+QUEUE_DEPTH = REGISTRY.gauge(
+    "rkllm_queue_depth", "Requests waiting for a batch slot", ("model",))
+ACTIVE_SLOTS = REGISTRY.gauge(
+    "rkllm_active_slots", "Batch slots currently running a request", ("model",))
+REJECTED = REGISTRY.counter(
+    "rkllm_rejected_requests_total", "Requests refused by admission control or expired in the queue",
+    ("model", "reason"))
+
+
+def record_generation(model: str, session, perf_stats: Optional[dict] = None):
+    """
+    Observe the stage latencies of a finished generation.
+
+    Args:
+        model: Model name label
+        session: GenerationSession with queued_at / started_at / token timestamps
+        perf_stats: Runtime perf stats (prefill/generate time, memory)
+    """
+    labels = {"model": model or "", "endpoint": current_endpoint.get()}
+    if session.queued_at is not None and session.started_at is not None:
+        QUEUE_WAIT.observe(session.started_at - session.queued_at, **labels)
+    if session.queued_at is not None and session.first_token_at is not None:
+        TIME_TO_FIRST_TOKEN.observe(session.first_token_at - session.queued_at, **labels)
+    n = session.generated_tokens
+    if n > 1 and session.first_token_at is not None and session.last_token_at is not None:
+        INTER_TOKEN_LATENCY.observe((session.last_token_at - session.first_token_at) / (n - 1), **labels)
+    if n:
+        GENERATED_TOKENS.inc(n, **labels)
+    if perf_stats:
+        PREFILL.observe(perf_stats.get("prefill_time_ms", 0.0) / 1000, **labels)
+        generate_ms = perf_stats.get("generate_time_ms", 0.0)
+        if generate_ms > 0 and perf_stats.get("generate_tokens", 0) > 0:
+            TOKENS_PER_SECOND.observe(perf_stats["generate_tokens"] / (generate_ms / 1000), **labels)
+        if perf_stats.get("memory_usage_mb"):
+            NPU_MEMORY.set(perf_stats["memory_usage_mb"], model=model or "")
+
+
+@contextmanager
+def observe_duration(histogram: Histogram, model: str):
+    """Observe the elapsed seconds of a block into a request histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, model=model or "", endpoint=current_endpoint.get())
+
+
+def collect_model_stats(model):
+    """
+    Mirror cache and scheduler counters of a loaded model into the registry.
+
+    Called at scrape time: those components already keep their own totals,
+    so copying them here keeps the request path free of metric calls.
+
+    Args:
+        model: Loaded RKLLMModel (only its stats() providers are used)
+    """
+    name = getattr(model, "model_name", None) or ""
+
+    def lookups(cache: str, hits: int, misses: int):
+        CACHE_LOOKUPS.set_total(hits, model=name, cache=cache, result="hit")
+        CACHE_LOOKUPS.set_total(misses, model=name, cache=cache, result="miss")
+
+    if getattr(model, "embedding_cache", None) is not None:
+        s = model.embedding_cache.stats()
+        lookups("embedding", s["hits"], s["misses"])
+    if getattr(model, "image_cache", None) is not None:
+        s = model.image_cache.stats()
+        lookups("image", s["hits"] + s["disk_hits"], s["misses"])
+    if getattr(model, "tokenizer_service", None) is not None:
+        s = model.tokenizer_service.stats()
+        lookups("tokenizer", s["hits"], s["misses"])
+    if getattr(model, "prefix_index", None) is not None:
+        s = model.prefix_index.stats()
+        lookups("kv_prefix", s["hits"], s["lookups"] - s["hits"])
+    if getattr(model, "cache_manager", None) is not None:
+        s = model.cache_manager.auto_cache_stats()
+        lookups("prompt", s["hits"], s["misses"])
+
+    scheduler = getattr(model, "scheduler", None)
+    if scheduler is not None:
+        QUEUE_DEPTH.set(scheduler.pending_count, model=name)
+        ACTIVE_SLOTS.set(scheduler.active_count, model=name)
+        REJECTED.set_total(scheduler.rejected, model=name, reason="admission")
+        REJECTED.set_total(scheduler.expired, model=name, reason="expired")
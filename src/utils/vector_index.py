@@ -0,0 +1,546 @@
+"""
+Local vector index for retrieval over embeddings from the loaded model
+
+Collections live under a data directory, one folder each:
+  meta.json     - dimension, metric, index type, embedding model, row count
+  vectors.f32   - raw float32 rows, memory-mapped and grown by doubling
+  records.json  - per-row id / text / metadata (null for deleted rows)
+  records.log   - [row, record] lines appended since records.json was written
+  ivf.npz       - IVF centroids and row assignments (large collections)
+
+Small collections are searched exhaustively with one matrix-vector product.
+Past a size threshold an IVF index (k-means coarse quantizer) restricts the
+search to the rows of the nprobe closest lists. Scores are inner products;
+for the "cosine" metric vectors are L2-normalized on insert.
+
+Ingest appends new and deleted records to records.log, so an add costs I/O
+proportional to its own rows; records.json is only rewritten when the log
+outgrows it or rows are renumbered by compaction.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("cosine", "ip")
+INDEX_TYPES = ("auto", "flat", "ivf")
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+_MIN_CAPACITY = 1024
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLES_PER_LIST = 256
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = _KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd's k-means with squared L2 distance, vectorized over all points.
+
+    Returns (k, dim) float32 centroids. Empty clusters keep their previous
+    centroid.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].astype(np.float32)
+    x_sq = np.einsum("ij,ij->i", x, x)
+    for _ in range(iterations):
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2
+        dist = x_sq[:, None] - 2.0 * (x @ centroids.T) + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        labels = np.argmin(dist, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class VectorCollection:
+    """One named collection of vectors with payloads, persisted on disk"""
+
+    def __init__(
+        self,
+        path: Path,
+        dim: int,
+        metric: str = "cosine",
+        index_type: str = "auto",
+        model_name: Optional[str] = None,
+        ivf_threshold: int = 20000,
+        nprobe: int = 8
+    ):
+        """
+        Args:
+            path: Collection directory (created if missing)
+            dim: Vector dimension
+            metric: "cosine" or "ip" (inner product)
+            index_type: "flat", "ivf", or "auto" (IVF from ivf_threshold rows)
+            model_name: Embedding model that produced the vectors
+            ivf_threshold: Live row count at which "auto" switches to IVF
+            nprobe: Default number of IVF lists searched per query
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}' (expected one of {', '.join(METRICS)})")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+        if dim <= 0:
+            raise ValueError("Vector dimension must be positive")
+
+        self.path = Path(path)
+        self.name = self.path.name
+        self.dim = dim
+        self.metric = metric
+        self.index_type = index_type
+        self.model_name = model_name
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.created_at = int(time.time())
+
+        self._count = 0  # Rows used in vectors.f32, including deleted ones
+        self._records: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._vectors: Optional[np.memmap] = None
+
+        # Record changes not yet on disk, and lines in records.log
+        self._pending_log: List[list] = []
+        self._log_entries = 0
+        self._rewrite_records = True
+
+        # IVF state
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_rows = 0
+        self._lists: Optional[List[np.ndarray]] = None  # Rebuilt lazily from assignments
+
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    @property
+    def _vectors_file(self) -> Path:
+        return self.path / "vectors.f32"
+
+    @classmethod
+    def create(cls, path: Path, **kwargs) -> "VectorCollection":
+        collection = cls(path, **kwargs)
+        collection.path.mkdir(parents=True, exist_ok=True)
+        collection._map_vectors(_MIN_CAPACITY)
+        collection._save()
+        return collection
+
+    @classmethod
+    def open(cls, path: Path) -> "VectorCollection":
+        path = Path(path)
+        with open(path / "meta.json", "r") as f:
+            meta = json.load(f)
+        collection = cls(
+            path,
+            dim=meta["dim"],
+            metric=meta["metric"],
+            index_type=meta.get("index_type", "auto"),
+            model_name=meta.get("model"),
+            ivf_threshold=meta.get("ivf_threshold", 20000),
+            nprobe=meta.get("nprobe", 8)
+        )
+        collection.created_at = meta.get("created_at", collection.created_at)
+        collection._count = meta["count"]
+
+        with open(path / "records.json", "r") as f:
+            collection._records = json.load(f)
+        collection._replay_log()
+        collection._records = collection._records[:collection._count]
+        collection._rewrite_records = False
+        collection._alive = np.array([r is not None for r in collection._records], dtype=bool)
+        collection._rows = {r["id"]: row for row, r in enumerate(collection._records) if r is not None}
+
+        capacity = os.path.getsize(collection._vectors_file) // (4 * collection.dim)
+        collection._map_vectors(max(capacity, _MIN_CAPACITY))
+
+        ivf_file = path / "ivf.npz"
+        if ivf_file.exists():
+            data = np.load(ivf_file)
+            collection._centroids = data["centroids"]
+            collection._assignments = data["assignments"][:collection._count]
+            collection._trained_rows = int(data["trained_rows"])
+        return collection
+
+    def _map_vectors(self, capacity: int):
+        """(Re)map vectors.f32 with room for ``capacity`` rows"""
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_file, "ab") as f:
+            if f.tell() < capacity * self.dim * 4:
+                f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(self._vectors_file, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _ensure_capacity(self, rows: int):
+        capacity = self._vectors.shape[0]
+        if rows > capacity:
+            self._map_vectors(max(rows, capacity * 2))
+
+    def _replay_log(self):
+        """Apply records.log on top of records.json"""
+        log_file = self.path / "records.log"
+        if not log_file.exists():
+            return
+        with open(log_file, "r") as f:
+            for line in f:
+                try:
+                    row, record = json.loads(line)
+                except ValueError:
+                    # Torn final line from an interrupted append
+                    break
+                if row < len(self._records):
+                    self._records[row] = record
+                else:
+                    self._records.append(record)
+                self._log_entries += 1
+
+    def _save_records(self):
+        """Append pending record changes, or rewrite records.json when due"""
+        log_file = self.path / "records.log"
+        if self._rewrite_records or self._log_entries + len(self._pending_log) > max(_MIN_CAPACITY, self._count):
+            self._write_json("records.json", self._records)
+            log_file.unlink(missing_ok=True)
+            self._log_entries = 0
+            self._rewrite_records = False
+        elif self._pending_log:
+            with open(log_file, "a") as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in self._pending_log))
+            self._log_entries += len(self._pending_log)
+        self._pending_log = []
+
+    def _save(self):
+        """Flush vectors, persist record changes and rewrite the metadata atomically"""
+        self._vectors.flush()
+        self._save_records()
+        meta = {
+            "name": self.name,
+            "dim": self.dim,
+            "metric": self.metric,
+            "index_type": self.index_type,
+            "model": self.model_name,
+            "count": self._count,
+            "ivf_threshold": self.ivf_threshold,
+            "nprobe": self.nprobe,
+            "created_at": self.created_at,
+        }
+        self._write_json("meta.json", meta)
+        if self._centroids is not None:
+            tmp = self.path / "ivf.tmp.npz"
+            np.savez(tmp, centroids=self._centroids, assignments=self._assignments,
+                     trained_rows=np.int64(self._trained_rows))
+            os.replace(tmp, self.path / "ivf.npz")
+        else:
+            (self.path / "ivf.npz").unlink(missing_ok=True)
+
+    def _write_json(self, filename: str, data: Any):
+        tmp = self.path / f"{filename}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path / filename)
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+
+    # ------------------------------------------------------------------
+    # Mutation
+    # ------------------------------------------------------------------
+
+    def add(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        texts: Optional[Sequence[Optional[str]]] = None,
+        metadata: Optional[Sequence[Optional[Dict[str, Any]]]] = None
+    ) -> int:
+        """
+        Insert or replace rows. An existing id is deleted and re-added.
+
+        Returns:
+            Number of rows written
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got shape {vectors.shape}")
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate ids in one add() call")
+        if self.metric == "cosine":
+            vectors = _normalize_rows(vectors)
+        texts = texts or [None] * len(ids)
+        metadata = metadata or [None] * len(ids)
+
+        with self._lock:
+            for doc_id in ids:
+                self._delete_row(doc_id)
+
+            start, end = self._count, self._count + len(ids)
+            self._ensure_capacity(end)
+            self._vectors[start:end] = vectors
+            records = [
+                {"id": doc_id, "text": text, "metadata": meta}
+                for doc_id, text, meta in zip(ids, texts, metadata)
+            ]
+            self._records.extend(records)
+            self._pending_log.extend([start + i, record] for i, record in enumerate(records))
+            self._rows.update((doc_id, start + i) for i, doc_id in enumerate(ids))
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._count = end
+
+            if self._centroids is not None:
+                self._assignments = np.concatenate([self._assignments, self._assign(vectors)])
+                self._lists = None
+            self._maybe_train()
+            self._save()
+            return len(ids)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """Remove rows by id; returns how many existed"""
+        with self._lock:
+            deleted = sum(1 for doc_id in ids if self._delete_row(doc_id))
+            if deleted:
+                if self._count - self.size > max(_MIN_CAPACITY, self._count // 2):
+                    self._compact()
+                self._save()
+            return deleted
+
+    def _delete_row(self, doc_id: str) -> bool:
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return False
+        self._records[row] = None
+        self._alive[row] = False
+        self._pending_log.append([row, None])
+        return True
+
+    def _compact(self):
+        """Drop deleted rows from vectors.f32 and renumber the rest"""
+        keep = np.flatnonzero(self._alive)
+        live = np.array(self._vectors[keep])
+        self._vectors[:len(keep)] = live
+        self._records = [self._records[row] for row in keep]
+        self._rows = {r["id"]: row for row, r in enumerate(self._records)}
+        self._alive = np.ones(len(keep), dtype=bool)
+        if self._centroids is not None:
+            self._assignments = self._assignments[keep]
+            self._lists = None
+        self._count = len(keep)
+        self._rewrite_records = True  # Row numbers changed
+        logger.info(f"🧹 Compacted vector collection '{self.name}' to {self._count} rows")
+
+    # ------------------------------------------------------------------
+    # IVF
+    # ------------------------------------------------------------------
+
+    def _use_ivf(self) -> bool:
+        if self.index_type == "ivf":
+            return self.size > 0
+        return self.index_type == "auto" and self.size >= self.ivf_threshold
+
+    def _maybe_train(self):
+        """Train IVF centroids when first needed and again once the data doubles"""
+        if not self._use_ivf():
+            return
+        if self._centroids is not None and self.size < 2 * self._trained_rows:
+            return
+        rows = np.flatnonzero(self._alive)
+        nlist = int(min(max(16, np.sqrt(len(rows))), 4096, len(rows)))
+        sample = rows
+        max_samples = nlist * _KMEANS_SAMPLES_PER_LIST
+        if len(sample) > max_samples:
+            sample = np.sort(np.random.default_rng(0).choice(rows, size=max_samples, replace=False))
+
+        start = time.time()
+        self._centroids = kmeans(np.asarray(self._vectors[sample]), nlist)
+        self._trained_rows = len(rows)
+        self._assignments = np.zeros(self._count, dtype=np.int32)
+        # Assign in chunks to bound the temporary distance matrix
+        for chunk in range(0, self._count, 8192):
+            self._assignments[chunk:chunk + 8192] = self._assign(np.asarray(self._vectors[chunk:min(chunk + 8192, self._count)]))
+        self._lists = None
+        logger.info(f"📐 Trained IVF for '{self.name}': {nlist} lists over {len(rows)} rows "
+                    f"in {(time.time() - start) * 1000:.0f}ms")
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        c = self._centroids
+        dist = -2.0 * (vectors @ c.T) + np.einsum("ij,ij->i", c, c)[None, :]
+        return np.argmin(dist, axis=1).astype(np.int32)
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            bounds = np.searchsorted(self._assignments[order], np.arange(len(self._centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._lists
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(self, query: np.ndarray, top_k: int = 10, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k rows by inner product (cosine for normalized collections).
+
+        Returns:
+            Hits, best first: {"id", "score", "text", "metadata"}
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Expected a query of dimension {self.dim}, got {query.shape[0]}")
+        if self.metric == "cosine":
+            query = _normalize_rows(query)
+
+        with self._lock:
+            if self.size == 0 or top_k <= 0:
+                return []
+            if self._centroids is not None and self._use_ivf():
+                probe = min(nprobe or self.nprobe, len(self._centroids))
+                lists = self._inverted_lists()
+                nearest = _top_k(self._centroids @ query, probe)
+                candidates = np.concatenate([lists[i] for i in nearest])
+                candidates = candidates[self._alive[candidates]]
+                scores = self._vectors[candidates] @ query
+            elif self.size == self._count:
+                # No deleted rows: score the mapped matrix without a gather
+                candidates = np.arange(self._count)
+                scores = self._vectors[:self._count] @ query
+            else:
+                candidates = np.flatnonzero(self._alive)
+                scores = self._vectors[candidates] @ query
+            if len(candidates) == 0:
+                return []
+            best = _top_k(scores, top_k)
+
+            hits = []
+            for i in best:
+                record = self._records[candidates[i]]
+                hits.append({
+                    "id": record["id"],
+                    "score": float(scores[i]),
+                    "text": record["text"],
+                    "metadata": record["metadata"],
+                })
+            return hits
+
+    # ------------------------------------------------------------------
+    # Info
+    # ------------------------------------------------------------------
+
+    @property
+    def size(self) -> int:
+        """Live (non-deleted) rows"""
+        return len(self._rows)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "dim": self.dim,
+                "metric": self.metric,
+                "index_type": self.index_type,
+                "active_index": "ivf" if self._centroids is not None and self._use_ivf() else "flat",
+                "nlist": len(self._centroids) if self._centroids is not None else 0,
+                "model": self.model_name,
+                "count": self.size,
+                "size_mb": round(self._count * self.dim * 4 / (1024 * 1024), 2),
+                "created_at": self.created_at,
+            }
+
+
+class VectorStore:
+    """Named collections under one data directory, opened lazily"""
+
+    def __init__(self, data_dir: str, ivf_threshold: int = 20000, nprobe: int = 8):
+        self.data_dir = Path(data_dir)
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._collections: Dict[str, VectorCollection] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        if not _NAME_RE.match(name) or name in (".", ".."):
+            raise ValueError(f"Invalid collection name '{name}' (use letters, digits, '_', '-', '.')")
+        return self.data_dir / name
+
+    def get(self, name: str) -> Optional[VectorCollection]:
+        path = self._path(name)
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None and (path / "meta.json").exists():
+                collection = VectorCollection.open(path)
+                self._collections[name] = collection
+            return collection
+
+    def get_or_create(
+        self,
+        name: str,
+        dim: int,
+        metric: str = "cosine",
+        index_type: str = "auto",
+        model_name: Optional[str] = None
+    ) -> VectorCollection:
+        collection = self.get(name)
+        if collection is not None:
+            return collection
+        path = self._path(name)
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = VectorCollection.create(
+                    path,
+                    dim=dim,
+                    metric=metric,
+                    index_type=index_type,
+                    model_name=model_name,
+                    ivf_threshold=self.ivf_threshold,
+                    nprobe=self.nprobe
+                )
+                self._collections[name] = collection
+                logger.info(f"🗂️  Created vector collection '{name}' (dim={dim}, metric={metric})")
+            return collection
+
+    def drop(self, name: str) -> bool:
+        path = self._path(name)
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection.close()
+            if not path.exists():
+                return collection is not None
+            shutil.rmtree(path)
+            return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not self.data_dir.exists():
+            return []
+        names = sorted(p.name for p in self.data_dir.iterdir() if (p / "meta.json").exists())
+        return [self.get(name).info() for name in names]
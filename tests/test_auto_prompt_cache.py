@@ -0,0 +1,104 @@
+"""
+Tests for content-addressed automatic prompt caching.
+
+Tests cover:
+- Stable, model-scoped cache names derived from the prefix
+- Sighting threshold before a cache is claimed for creation
+- Hit / miss counters and transparent lookup after creation
+- Failed creation cleanup
+"""
+import sys
+import os
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.cache_manager import PromptCacheManager, AUTO_CACHE_PREFIX
+
+MODEL = "qwen3-0.6b"
+PREFIX = "<|im_start|>system\n" + "You are a helpful assistant. " * 20 + "<|im_end|>\n"
+
+
+@pytest.fixture
+def cache_mgr(tmp_path):
+    mgr = PromptCacheManager(str(tmp_path / "cache"))
+    mgr.auto_cache_min_sightings = 3
+    mgr.auto_cache_min_chars = 16
+    return mgr
+
+
+def _write_cache(mgr, cache_name, size=1024):
+    with open(mgr.get_cache_path(MODEL, cache_name), "wb") as f:
+        f.write(b"\0" * size)
+
+
+class TestAutoPromptCache:
+    """Test automatic prefix cache lifecycle."""
+
+    def test_name_is_content_addressed(self, cache_mgr):
+        name = cache_mgr.prefix_cache_name(MODEL, PREFIX)
+        assert name.startswith(AUTO_CACHE_PREFIX)
+        assert name == cache_mgr.prefix_cache_name(MODEL, PREFIX)
+        assert name != cache_mgr.prefix_cache_name("other-model", PREFIX)
+        assert name != cache_mgr.prefix_cache_name(MODEL, PREFIX + " ")
+
+    def test_claim_requires_min_sightings(self, cache_mgr):
+        for _ in range(2):
+            assert cache_mgr.lookup_prefix(MODEL, PREFIX) is None
+            assert cache_mgr.claim_auto_cache(MODEL, PREFIX) is None
+        cache_mgr.lookup_prefix(MODEL, PREFIX)
+        claim = cache_mgr.claim_auto_cache(MODEL, PREFIX)
+        assert claim is not None
+        assert claim[0] == cache_mgr.prefix_cache_name(MODEL, PREFIX)
+        # Only one creator at a time
+        assert cache_mgr.claim_auto_cache(MODEL, PREFIX) is None
+
+    def test_created_cache_is_found_transparently(self, cache_mgr):
+        for _ in range(3):
+            cache_mgr.lookup_prefix(MODEL, PREFIX)
+        cache_name, cache_path = cache_mgr.claim_auto_cache(MODEL, PREFIX)
+        _write_cache(cache_mgr, cache_name)
+        cache_mgr.complete_auto_cache(MODEL, cache_name, PREFIX, success=True, ttft_ms=42.0)
+
+        assert cache_mgr.lookup_prefix(MODEL, PREFIX) == cache_path
+        info = cache_mgr.get_cache_info(MODEL, cache_name)
+        assert info["source"] == "auto"
+        assert info["prompt_length"] == len(PREFIX)
+
+        stats = cache_mgr.auto_cache_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 3
+        assert stats["created"] == 1
+        assert stats["pending"] == 0
+
+    def test_pending_cache_is_not_used(self, cache_mgr):
+        for _ in range(3):
+            cache_mgr.lookup_prefix(MODEL, PREFIX)
+        cache_name, _ = cache_mgr.claim_auto_cache(MODEL, PREFIX)
+        _write_cache(cache_mgr, cache_name)  # Runtime still writing
+        assert cache_mgr.lookup_prefix(MODEL, PREFIX) is None
+
+    def test_failed_creation_cleans_up(self, cache_mgr):
+        for _ in range(3):
+            cache_mgr.lookup_prefix(MODEL, PREFIX)
+        cache_name, _ = cache_mgr.claim_auto_cache(MODEL, PREFIX)
+        _write_cache(cache_mgr, cache_name)
+        cache_mgr.complete_auto_cache(MODEL, cache_name, PREFIX, success=False)
+        assert not cache_mgr.cache_exists(MODEL, cache_name)
+        assert cache_mgr.auto_cache_stats()["pending"] == 0
+        # Sightings start over after a failure
+        assert cache_mgr.claim_auto_cache(MODEL, PREFIX) is None
+
+    def test_short_prefix_ignored(self, cache_mgr):
+        cache_mgr.auto_cache_min_chars = 10_000
+        for _ in range(5):
+            assert cache_mgr.lookup_prefix(MODEL, PREFIX) is None
+        assert cache_mgr.claim_auto_cache(MODEL, PREFIX) is None
+        assert cache_mgr.auto_cache_stats()["misses"] == 0
+
+    def test_disabled(self, cache_mgr):
+        cache_mgr.auto_cache_enabled = False
+        for _ in range(5):
+            cache_mgr.lookup_prefix(MODEL, PREFIX)
+        assert cache_mgr.claim_auto_cache(MODEL, PREFIX) is None
@@ -0,0 +1,374 @@
+"""
+Tests for the continuous batching scheduler.
+
+The scheduler is driven through MockRKLLMRuntime, which stands in for
+librkllmrt and decodes all active slots in lockstep.
+
+Tests cover:
+- Admission of queued requests into freed slots
+- Slot occupancy never exceeding n_batch
+- Per-slot KV accounting against max_context_len
+- No token interleaving between concurrent sessions
+- Aggregate throughput scaling with the slot count
+- Priority classes, tenant caps and queue position updates
+- Admission control: queue depth, deadlines and retry hints
+"""
+import asyncio
+import sys
+import os
+import threading
+import time
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.batch_scheduler import (
+    BatchScheduler, ContextLengthError, QueueFullError, DeadlineExceededError
+)
+from models.fair_queue import FairQueue
+from models.generation_session import GenerationSession, SessionRegistry
+from models.rkllm_model_mock import MockRKLLMRuntime
+
+
+async def _run_requests(n_slots, n_requests, tokens, step_time=0.005, max_context_len=4096):
+    runtime = MockRKLLMRuntime(n_batch=n_slots, step_time=step_time)
+    scheduler = BatchScheduler(n_slots=n_slots, max_context_len=max_context_len)
+    registry = SessionRegistry()
+    sessions = []
+
+    async def one():
+        session = GenerationSession(prompt="hello world", max_tokens=tokens)
+        registry.register(session)
+        sessions.append(session)
+        return await scheduler.submit(session, lambda: runtime.run(session))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    scheduler.shutdown()
+    return runtime, scheduler, sessions, results, elapsed
+
+
+class TestBatchScheduler:
+    """Test slot admission and accounting."""
+
+    def test_rejects_zero_slots(self):
+        with pytest.raises(ValueError):
+            BatchScheduler(n_slots=0, max_context_len=512)
+
+    def test_all_requests_complete(self):
+        runtime, scheduler, sessions, results, _ = asyncio.run(_run_requests(2, 5, tokens=4))
+        assert len(results) == 5
+        assert all(s.generated_tokens == 4 for s in sessions)
+        assert scheduler.completed == 5
+        assert scheduler.generated_tokens == 20
+        assert scheduler.active_count == 0
+        assert scheduler.pending_count == 0
+
+    def test_concurrency_bounded_by_slots(self):
+        runtime, _, _, _, _ = asyncio.run(_run_requests(3, 9, tokens=5))
+        assert runtime.max_concurrency == 3
+
+    def test_tokens_do_not_interleave(self):
+        _, _, sessions, _, _ = asyncio.run(_run_requests(3, 6, tokens=6))
+        for session in sessions:
+            assert session.text == "".join(f" tok{i}" for i in range(6))
+
+    def test_clamps_max_tokens_to_context(self):
+        _, _, sessions, _, _ = asyncio.run(
+            _run_requests(1, 1, tokens=100, max_context_len=10)
+        )
+        # "hello world" is estimated at 2 prompt tokens
+        assert sessions[0].max_tokens == 8
+        assert sessions[0].generated_tokens == 8
+
+    def test_rejects_prompt_larger_than_context(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=4)
+            session = GenerationSession(prompt="x" * 100)
+            with pytest.raises(ContextLengthError):
+                await scheduler.submit(session, lambda: None)
+        asyncio.run(run())
+
+    def test_exact_prompt_tokens_override_estimate(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=50)
+            # 400 chars estimate to 100 tokens, but the tokenizer counted 10
+            session = GenerationSession(prompt="x" * 400, max_tokens=5, prompt_tokens=10)
+            await scheduler.submit(session, lambda: None)
+            scheduler.shutdown()
+        asyncio.run(run())
+
+    def test_slot_kv_usage_tracks_session(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100)
+            seen = []
+
+            def job():
+                session.on_token("a")
+                session.on_token("b")
+                seen.append(scheduler.stats()["kv_used"][0])
+
+            session = GenerationSession(prompt="x" * 40, max_tokens=10)
+            await scheduler.submit(session, job)
+            assert scheduler.stats()["kv_used"] == [0]
+            return seen
+        assert asyncio.run(run()) == [12]
+
+    def test_freed_slot_admits_next_request(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100)
+            order = []
+
+            async def one(name):
+                session = GenerationSession(prompt="p")
+                await scheduler.submit(session, lambda: order.append(name))
+            await asyncio.gather(one("a"), one("b"), one("c"))
+            return order
+        assert asyncio.run(run()) == ["a", "b", "c"]
+
+    def test_cancel_while_queued_leaves_queue(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100)
+            gate = threading.Event()
+
+            first = asyncio.create_task(
+                scheduler.submit(GenerationSession(prompt="p"), gate.wait)
+            )
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(
+                scheduler.submit(GenerationSession(prompt="p"), lambda: None)
+            )
+            await asyncio.sleep(0.01)
+            assert scheduler.pending_count == 1
+            queued.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+            assert scheduler.pending_count == 0
+            gate.set()
+            await first
+            scheduler.shutdown()
+        asyncio.run(run())
+
+    def test_shutdown_stops_running_sessions_and_joins(self):
+        async def run():
+            runtime = MockRKLLMRuntime(n_batch=1, step_time=0.005)
+            scheduler = BatchScheduler(n_slots=1, max_context_len=4096)
+            running = GenerationSession(prompt="p", max_tokens=10000)
+            queued = GenerationSession(prompt="p", max_tokens=10)
+            first = asyncio.create_task(scheduler.submit(running, lambda: runtime.run(running)))
+            second = asyncio.create_task(scheduler.submit(queued, lambda: runtime.run(queued)))
+            await asyncio.sleep(0.05)
+            scheduler.shutdown()
+            # The runtime call has returned by the time shutdown() does
+            assert running.stopped
+            assert not runtime.is_running()
+            with pytest.raises(asyncio.CancelledError):
+                await second
+            await first
+            return running
+        session = asyncio.run(run())
+        assert session.generated_tokens < 10000
+
+    def test_throughput_scales_with_slots(self):
+        _, _, _, _, single = asyncio.run(_run_requests(1, 6, tokens=10, step_time=0.01))
+        _, _, _, _, batched = asyncio.run(_run_requests(3, 6, tokens=10, step_time=0.01))
+        # 3 slots decode three streams per step: expect close to 3x, require 2x
+        assert batched * 2 < single
+
+
+class TestSchedulingPolicy:
+    """Test priorities, tenant caps and queue reporting."""
+
+    def test_interactive_overtakes_queued_batch(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100)
+            gate = threading.Event()
+            order = []
+
+            first = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p"), gate.wait))
+            await asyncio.sleep(0.01)
+            batch = [
+                asyncio.create_task(scheduler.submit(
+                    GenerationSession(prompt="p", tenant="nightly", priority="batch"),
+                    lambda i=i: order.append(f"batch{i}")
+                ))
+                for i in range(3)
+            ]
+            await asyncio.sleep(0.01)
+            chat = asyncio.create_task(scheduler.submit(
+                GenerationSession(prompt="p", tenant="alice"), lambda: order.append("chat")
+            ))
+            await asyncio.sleep(0.01)
+            gate.set()
+            await asyncio.gather(first, chat, *batch)
+            scheduler.shutdown()
+            return order
+        assert asyncio.run(run())[0] == "chat"
+
+    def test_tenant_cap_leaves_slot_for_others(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=2, max_context_len=100,
+                                       queue=FairQueue(tenant_caps={"bulk": 1}))
+            gate = threading.Event()
+            running = []
+
+            def job(name):
+                running.append(name)
+                gate.wait()
+
+            tasks = [asyncio.create_task(scheduler.submit(
+                GenerationSession(prompt="p", tenant="bulk"), lambda i=i: job(f"bulk{i}")
+            )) for i in range(3)]
+            await asyncio.sleep(0.05)
+            # Second slot stays free for other tenants
+            assert scheduler.active_count == 1
+            tasks.append(asyncio.create_task(scheduler.submit(
+                GenerationSession(prompt="p", tenant="alice"), lambda: job("alice")
+            )))
+            await asyncio.sleep(0.05)
+            assert sorted(running) == ["alice", "bulk0"]
+            gate.set()
+            await asyncio.gather(*tasks)
+            scheduler.shutdown()
+        asyncio.run(run())
+
+    def test_runtime_policy_switch(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=1000)
+            gate = threading.Event()
+            order = []
+            first = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p"), gate.wait))
+            await asyncio.sleep(0.01)
+            tasks = [
+                asyncio.create_task(scheduler.submit(
+                    GenerationSession(prompt="p", max_tokens=tokens), lambda t=tokens: order.append(t)
+                ))
+                for tokens in (400, 200, 10)
+            ]
+            await asyncio.sleep(0.01)
+            scheduler.set_policy("sjf")
+            assert scheduler.stats()["policy"] == "sjf"
+            gate.set()
+            await asyncio.gather(first, *tasks)
+            scheduler.shutdown()
+            return order
+        assert asyncio.run(run()) == [10, 200, 400]
+
+    def test_waiters_receive_queue_position(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100)
+            gate = threading.Event()
+            updates = []
+
+            first = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p"), gate.wait))
+            await asyncio.sleep(0.01)
+            second = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p"), lambda: None))
+            third = asyncio.create_task(scheduler.submit(
+                GenerationSession(prompt="p"), lambda: None, on_wait=updates.append
+            ))
+            await asyncio.sleep(0.01)
+            assert [u["position"] for u in updates] == [2]
+            snapshot = scheduler.queue_snapshot()
+            assert [entry["position"] for entry in snapshot] == [1, 2]
+            gate.set()
+            await asyncio.gather(first, second, third)
+            scheduler.shutdown()
+            return updates
+        updates = asyncio.run(run())
+        assert [u["position"] for u in updates] == [2, 1]
+        assert all(u["estimated_wait_s"] >= 0 for u in updates)
+
+
+class TestAdmissionControl:
+    """Test queue limits, deadlines and back-pressure hints."""
+
+    def test_rejects_beyond_max_queue_depth(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100, max_queue_depth=1)
+            gate = threading.Event()
+            first = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p"), gate.wait))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p"), lambda: None))
+            await asyncio.sleep(0.01)
+            with pytest.raises(QueueFullError) as excinfo:
+                await scheduler.submit(GenerationSession(prompt="p"), lambda: None)
+            assert excinfo.value.retry_after >= 1
+            assert scheduler.stats()["rejected"] == 1
+            gate.set()
+            await asyncio.gather(first, queued)
+            scheduler.shutdown()
+        asyncio.run(run())
+
+    def test_deadline_expires_while_queued(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100)
+            gate = threading.Event()
+            ran = []
+            first = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p"), gate.wait))
+            await asyncio.sleep(0.01)
+            session = GenerationSession(prompt="p", deadline=time.monotonic() + 0.05)
+            start = time.monotonic()
+            with pytest.raises(DeadlineExceededError):
+                await scheduler.submit(session, lambda: ran.append(True))
+            # Failed by its timer, not when the slot eventually freed up
+            assert time.monotonic() - start < 0.5
+            assert scheduler.pending_count == 0
+            gate.set()
+            await first
+            scheduler.shutdown()
+            return ran
+        assert asyncio.run(run()) == []
+
+    def test_past_deadline_is_refused(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=100)
+            with pytest.raises(DeadlineExceededError):
+                await scheduler.submit(GenerationSession(prompt="p", deadline=time.monotonic() - 1), lambda: None)
+            scheduler.shutdown()
+        asyncio.run(run())
+
+    def test_retry_after_from_rate_and_queued_tokens(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=1000)
+            scheduler.tokens_per_second = 10.0
+            gate = threading.Event()
+            first = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p", max_tokens=50), gate.wait))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p", max_tokens=100), lambda: None))
+            await asyncio.sleep(0.01)
+            # 50 owed to the running session + 100 queued at 10 tok/s
+            assert scheduler.retry_after() == pytest.approx(15.0)
+            with pytest.raises(QueueFullError) as excinfo:
+                scheduler.check_admission(deadline=time.monotonic() + 5)
+            assert excinfo.value.retry_after == 15
+            gate.set()
+            await asyncio.gather(first, queued)
+            scheduler.shutdown()
+        asyncio.run(run())
+
+    def test_queued_batch_jobs_do_not_refuse_interactive(self):
+        async def run():
+            scheduler = BatchScheduler(n_slots=1, max_context_len=1000, max_queue_depth=1)
+            scheduler.tokens_per_second = 10.0
+            gate = threading.Event()
+            first = asyncio.create_task(scheduler.submit(GenerationSession(prompt="p", max_tokens=10), gate.wait))
+            await asyncio.sleep(0.01)
+            batch = asyncio.create_task(scheduler.submit(
+                GenerationSession(prompt="p", max_tokens=500, priority="batch"), lambda: None
+            ))
+            await asyncio.sleep(0.01)
+            # Only the 10 tokens owed to the running session are ahead of it
+            assert scheduler.retry_after("interactive") == pytest.approx(1.0)
+            scheduler.check_admission(deadline=time.monotonic() + 5, priority="interactive")
+            with pytest.raises(QueueFullError):
+                scheduler.check_admission(priority="background")
+            gate.set()
+            await asyncio.gather(first, batch)
+            scheduler.shutdown()
+        asyncio.run(run())
+
+    def test_measures_generation_rate(self):
+        runtime, scheduler, _, _, _ = asyncio.run(_run_requests(1, 2, tokens=5, step_time=0.01))
+        assert 0 < scheduler.tokens_per_second < 200
@@ -0,0 +1,145 @@
+"""
+Tests for the PromptCacheManager index and size budgets.
+
+Tests cover:
+- Index built once at startup and kept current on create/delete
+- Listing served from memory (no sidecar re-reads)
+- Hit statistics written back to the sidecars
+- Per-model and global byte budgets with LRU / LFU eviction
+- Protected caches survive eviction
+"""
+import json
+import sys
+import os
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.cache_manager import PromptCacheManager
+
+MB = 1024 * 1024
+
+
+def _create(mgr, model_name, cache_name, size=MB):
+    with open(mgr.get_cache_path(model_name, cache_name), "wb") as f:
+        f.write(b"\0" * size)
+    mgr.save_metadata(model_name, cache_name, prompt_length=10)
+
+
+class TestCacheIndex:
+    """Test the in-memory index."""
+
+    def test_index_loaded_at_startup(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path))
+        _create(mgr, "m", "a")
+        reloaded = PromptCacheManager(str(tmp_path))
+        caches = reloaded.list_caches("m")
+        assert [c["cache_name"] for c in caches] == ["a"]
+        assert caches[0]["size_mb"] == pytest.approx(1.0)
+        assert caches[0]["source"] == "api"
+
+    def test_listing_does_not_reread_sidecars(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path))
+        _create(mgr, "m", "a")
+        # Corrupt the sidecar; the index keeps serving its copy
+        with open(tmp_path / "m" / "a.json", "w") as f:
+            f.write("{broken")
+        assert mgr.list_caches("m")[0]["prompt_length"] == 10
+
+    def test_delete_updates_index(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path))
+        _create(mgr, "m", "a")
+        assert mgr.delete_cache("m", "a")
+        assert mgr.list_caches("m") == []
+        assert not mgr.cache_exists("m", "a")
+
+    def test_runtime_written_file_is_found(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path))
+        with open(mgr.get_cache_path("m", "fresh"), "wb") as f:
+            f.write(b"\0" * 10)
+        assert mgr.cache_exists("m", "fresh")
+        assert mgr.get_cache_info("m", "fresh")["cache_name"] == "fresh"
+
+    def test_hits_are_flushed_to_sidecar(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path))
+        _create(mgr, "m", "a")
+        mgr.record_hit("m", "a")
+        mgr.record_hit("m", "a")
+        mgr.flush_stats()
+        with open(tmp_path / "m" / "a.json") as f:
+            assert json.load(f)["hits"] == 2
+        assert PromptCacheManager(str(tmp_path)).get_cache_info("m", "a")["hits"] == 2
+
+    def test_hits_survive_restart_without_explicit_flush(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path), stats_flush_interval_s=0)
+        _create(mgr, "m", "a")
+        mgr.record_hit("m", "a")
+        mgr.record_hit("m", "a")
+        mgr.record_hit("m", "a")
+        assert PromptCacheManager(str(tmp_path)).get_cache_info("m", "a")["hits"] == 3
+
+    def test_hit_writes_are_debounced(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path), stats_flush_interval_s=3600)
+        _create(mgr, "m", "a")
+        mgr.record_hit("m", "a")
+        with open(tmp_path / "m" / "a.json") as f:
+            assert json.load(f)["hits"] == 0
+        mgr.flush_stats()
+        with open(tmp_path / "m" / "a.json") as f:
+            assert json.load(f)["hits"] == 1
+
+
+class TestCacheBudgets:
+    """Test byte budgets and eviction order."""
+
+    def test_per_model_budget_evicts_lru(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path), max_bytes_per_model=2 * MB)
+        _create(mgr, "m", "a")
+        _create(mgr, "m", "b")
+        mgr.record_hit("m", "a")  # "b" is now least recently used
+        _create(mgr, "m", "c")
+        names = {c["cache_name"] for c in mgr.list_caches("m")}
+        assert names == {"a", "c"}
+        assert not os.path.exists(mgr.get_cache_path("m", "b"))
+        assert mgr.usage()["evictions"] == 1
+
+    def test_lfu_policy_evicts_fewest_hits(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path), max_bytes_per_model=2 * MB, eviction_policy="lfu")
+        _create(mgr, "m", "a")
+        _create(mgr, "m", "b")
+        mgr.record_hit("m", "a")
+        mgr.record_hit("m", "a")
+        mgr.record_hit("m", "b")
+        _create(mgr, "m", "c")
+        assert {c["cache_name"] for c in mgr.list_caches("m")} == {"a", "c"}
+
+    def test_eviction_persists_survivor_stats(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path), max_bytes_per_model=2 * MB, eviction_policy="lfu")
+        _create(mgr, "m", "a")
+        _create(mgr, "m", "b")
+        mgr.record_hit("m", "a")
+        mgr.record_hit("m", "a")
+        _create(mgr, "m", "c")
+        assert PromptCacheManager(str(tmp_path)).get_cache_info("m", "a")["hits"] == 2
+
+    def test_global_budget_spans_models(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path), max_bytes_total=2 * MB)
+        _create(mgr, "m1", "a")
+        _create(mgr, "m2", "b")
+        _create(mgr, "m2", "c")
+        usage = mgr.usage()
+        assert usage["total_bytes"] <= 2 * MB
+        assert mgr.list_caches("m1") == []
+
+    def test_system_cache_is_protected(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path), max_bytes_per_model=MB)
+        _create(mgr, "m", "system")
+        _create(mgr, "m", "a")
+        assert {c["cache_name"] for c in mgr.list_caches("m")} == {"system", "a"}
+
+    def test_unlimited_by_default(self, tmp_path):
+        mgr = PromptCacheManager(str(tmp_path))
+        for name in "abcd":
+            _create(mgr, "m", name)
+        assert len(mgr.list_caches("m")) == 4
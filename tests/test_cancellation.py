@@ -0,0 +1,111 @@
+"""
+Tests for client-disconnect cancellation.
+
+Tests cover:
+- run_until_disconnect returning results and raising 499 on disconnect
+- Cancellation of the wrapped generation task
+- Stopping a running session frees its batch slot for the next request
+"""
+import asyncio
+import sys
+import os
+import time
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fastapi import HTTPException
+
+from api.cancellation import CLIENT_CLOSED_REQUEST, cancel_task, run_until_disconnect
+from models.batch_scheduler import BatchScheduler
+from models.generation_session import GenerationSession, SessionRegistry
+from models.rkllm_model_mock import MockRKLLMRuntime
+
+
+class FakeRequest:
+    """Minimal stand-in for starlette's Request.is_disconnected()"""
+
+    def __init__(self, disconnect_after: float = None):
+        self._deadline = None if disconnect_after is None else time.monotonic() + disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+
+class TestRunUntilDisconnect:
+    """Test the route-side disconnect watch."""
+
+    def test_returns_result_while_connected(self):
+        async def work():
+            await asyncio.sleep(0.02)
+            return "done"
+        result = asyncio.run(run_until_disconnect(FakeRequest(), work(), poll_interval=0.01))
+        assert result == "done"
+
+    def test_disconnect_cancels_generation(self):
+        cancelled = []
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            with pytest.raises(HTTPException) as exc:
+                await run_until_disconnect(FakeRequest(disconnect_after=0.02), work(), poll_interval=0.01)
+            return exc.value.status_code
+        assert asyncio.run(run()) == CLIENT_CLOSED_REQUEST
+        assert cancelled == [True]
+
+    def test_cancel_task_ignores_finished_task(self):
+        async def run():
+            task = asyncio.ensure_future(asyncio.sleep(0))
+            await task
+            await cancel_task(task)
+            await cancel_task(None)
+        asyncio.run(run())
+
+
+class TestSlotRelease:
+    """Test that a stopped session gives its slot back promptly."""
+
+    def test_stopped_session_frees_slot_for_queued_request(self):
+        step_time = 0.01
+
+        async def run():
+            runtime = MockRKLLMRuntime(n_batch=1, step_time=step_time)
+            scheduler = BatchScheduler(n_slots=1, max_context_len=4096)
+            registry = SessionRegistry()
+
+            async def generate(session):
+                # Mirrors RKLLMModel.generate_async's cancellation handling
+                registry.register(session)
+                try:
+                    return await scheduler.submit(session, lambda: runtime.run(session))
+                except asyncio.CancelledError:
+                    session.request_stop("cancelled")
+                    raise
+
+            abandoned = GenerationSession(prompt="p", max_tokens=10_000)
+            waiting = GenerationSession(prompt="p", max_tokens=3)
+            first = asyncio.create_task(generate(abandoned))
+            await asyncio.sleep(step_time * 3)
+            second = asyncio.create_task(generate(waiting))
+            await asyncio.sleep(0)
+
+            start = time.perf_counter()
+            await cancel_task(first)
+            await second
+            elapsed = time.perf_counter() - start
+            scheduler.shutdown()
+            return abandoned, waiting, elapsed
+
+        abandoned, waiting, elapsed = asyncio.run(run())
+        assert abandoned.finish_reason == "cancelled"
+        assert abandoned.generated_tokens < 100
+        assert waiting.generated_tokens == 3
+        # Slot hand-over within a couple of decode steps, then 3 tokens
+        assert elapsed < step_time * 20
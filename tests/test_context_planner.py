@@ -0,0 +1,105 @@
+"""
+Tests for context-window planning.
+
+Tests cover:
+- Chats that fit are left alone
+- System prompt and latest message are always kept
+- Cuts land on user turns and stay stable as the chat grows (hysteresis)
+- Digest of dropped turns respects its token budget
+"""
+import sys
+import os
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.context_planner import ContextPlanner, build_digest
+
+
+def _chat(turns, system=True):
+    """Alternating user/assistant roles, optionally led by a system message"""
+    roles = (["system"] if system else []) + ["user" if i % 2 == 0 else "assistant" for i in range(turns)]
+    return roles
+
+
+class TestContextPlanner:
+    """Test which messages are kept."""
+
+    def test_fitting_chat_is_untouched(self):
+        planner = ContextPlanner(context_size=1000, reserve_tokens=0)
+        plan = planner.plan(_chat(4), [50] * 5, max_tokens=100)
+        assert plan.keep == [0, 1, 2, 3, 4]
+        assert not plan.truncated
+        assert plan.fits
+
+    def test_keeps_system_and_latest_message(self):
+        planner = ContextPlanner(context_size=1000, reserve_tokens=0)
+        roles = _chat(21)
+        plan = planner.plan(roles, [100] + [60] * 21, max_tokens=200)
+        assert plan.truncated
+        assert plan.keep[0] == 0
+        assert plan.keep[-1] == 21
+        assert roles[plan.keep[1]] == "user"
+        assert plan.prompt_tokens <= plan.budget
+        assert plan.dropped == list(range(1, plan.keep[1]))
+
+    def test_cut_is_stable_while_chat_grows(self):
+        def cuts(block_fraction):
+            planner = ContextPlanner(context_size=1000, reserve_tokens=0, block_fraction=block_fraction)
+            result = []
+            for turns in range(15, 41, 2):
+                plan = planner.plan(_chat(turns), [100] + [60] * turns, max_tokens=200)
+                assert plan.fits
+                result.append(plan.keep[1])
+            return result
+
+        def moves(seq):
+            return sum(1 for a, b in zip(seq, seq[1:]) if a != b)
+
+        # One-message blocks move the cut on every turn, coarse blocks rarely
+        fine, coarse = cuts(0.01), cuts(0.5)
+        assert moves(fine) == len(fine) - 1
+        assert moves(coarse) <= len(coarse) // 3
+        assert coarse == sorted(coarse)
+
+    def test_compact_reserves_digest_budget(self):
+        roles = _chat(21)
+        counts = [100] + [60] * 21
+        dropped = ContextPlanner(1000, strategy="drop", reserve_tokens=0).plan(roles, counts, 200)
+        compact = ContextPlanner(1000, strategy="compact", digest_tokens=150, reserve_tokens=0).plan(roles, counts, 200)
+        assert compact.digest_tokens == 150
+        assert len(compact.dropped) > len(dropped.dropped)
+        assert compact.prompt_tokens + compact.digest_tokens <= compact.budget
+
+    def test_oversized_latest_message(self):
+        planner = ContextPlanner(context_size=500, reserve_tokens=0)
+        plan = planner.plan(["system", "user", "assistant", "user"], [50, 50, 50, 900], max_tokens=100)
+        assert plan.keep == [0, 3]
+        assert not plan.fits
+
+    def test_invalid_strategy(self):
+        with pytest.raises(ValueError):
+            ContextPlanner(1000, strategy="summarize")
+
+
+class TestDigest:
+    """Test the extractive digest."""
+
+    def test_digest_fits_budget_and_prefers_recent_turns(self):
+        turns = [("user", f"question {i} " + "word " * 100) for i in range(10)]
+        count = lambda text: len(text) // 4
+        digest = build_digest(turns, 200, count)
+        assert count(digest) <= 200
+        assert "question 9" in digest
+        assert "question 0" not in digest
+        assert "10 earlier messages" in digest
+
+    def test_digest_is_deterministic(self):
+        turns = [("user", "hi"), ("assistant", "hello\n\nthere")]
+        count = lambda text: len(text) // 4
+        assert build_digest(turns, 100, count) == build_digest(list(turns), 100, count)
+        assert "- assistant: hello there" in build_digest(turns, 100, count)
+
+    def test_no_room_for_digest(self):
+        assert build_digest([("user", "hi")], 1, lambda text: len(text)) is None
@@ -0,0 +1,160 @@
+"""
+Tests for per-conversation NPU state snapshots.
+
+Tests cover:
+- Snapshot / restore / resident decisions per conversation
+- Prefix validation and snapshot refresh
+- RAM tier demotion and disk tier eviction under byte budgets
+- Cleanup of failed turns
+- Re-indexing snapshots after a restart
+"""
+import sys
+import os
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.cache_manager import PromptCacheManager
+from utils.conversation_cache import ConversationCacheManager, RESIDENT, RESTORE, SNAPSHOT
+
+MODEL = "qwen3-0.6b"
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return ConversationCacheManager(
+        PromptCacheManager(str(tmp_path / "cache")),
+        ram_dir=str(tmp_path / "shm"),
+        ram_budget_bytes=250,
+        disk_budget_bytes=250,
+    )
+
+
+def _run_turn(manager, conversation_id, prompt, size=100, kv_resident=False):
+    """Simulate generate(): the runtime writes the snapshot when asked to save"""
+    plan = manager.plan(MODEL, conversation_id, prompt, kv_resident=kv_resident)
+    if plan.save:
+        with open(plan.cache_path, "wb") as f:
+            f.write(b"\0" * size)
+    manager.commit(plan, prompt)
+    return plan
+
+
+class TestConversationPlans:
+    """Test per-turn decisions."""
+
+    def test_first_turn_snapshots(self, manager):
+        plan = _run_turn(manager, "alice", "system user-1")
+        assert plan.action == SNAPSHOT
+        assert plan.save
+        assert os.path.exists(plan.cache_path)
+
+    def test_returning_conversation_restores(self, manager):
+        first = _run_turn(manager, "alice", "system user-1")
+        _run_turn(manager, "bob", "system other")
+        plan = manager.plan(MODEL, "alice", "system user-1 reply user-2")
+        assert plan.action == RESTORE
+        assert plan.cache_path == first.cache_path
+        assert not plan.save
+
+    def test_resident_conversation_needs_nothing(self, manager):
+        _run_turn(manager, "alice", "system user-1")
+        plan = manager.plan(MODEL, "alice", "system user-1 more", kv_resident=True)
+        assert plan.action == RESIDENT
+        assert plan.cache_path is None
+
+    def test_other_request_clears_residency(self, manager):
+        _run_turn(manager, "alice", "system user-1")
+        manager.invalidate_resident()
+        plan = manager.plan(MODEL, "alice", "system user-1 more", kv_resident=True)
+        assert plan.action == RESTORE
+
+    def test_edited_history_takes_new_snapshot(self, manager):
+        _run_turn(manager, "alice", "system user-1")
+        _run_turn(manager, "bob", "system other")
+        plan = manager.plan(MODEL, "alice", "system EDITED reply")
+        assert plan.action == SNAPSHOT
+
+    def test_stale_snapshot_is_refreshed(self, manager):
+        _run_turn(manager, "alice", "abcd")
+        _run_turn(manager, "bob", "other")
+        plan = manager.plan(MODEL, "alice", "abcd" + "x" * 20)
+        assert plan.action == SNAPSHOT
+
+
+class TestConversationBudgets:
+    """Test tiered LRU eviction."""
+
+    def test_lru_demoted_from_ram_to_disk(self, manager, tmp_path):
+        _run_turn(manager, "a", "prompt a")
+        _run_turn(manager, "b", "prompt b")
+        _run_turn(manager, "c", "prompt c")
+        stats = manager.stats()
+        assert stats["ram_bytes"] <= 250
+        assert stats["disk_bytes"] == 100
+        assert stats["demotions"] == 1
+        # The oldest conversation still restores, now from disk
+        plan = manager.plan(MODEL, "a", "prompt a again")
+        assert plan.action == RESTORE
+        assert str(tmp_path / "cache") in plan.cache_path
+
+    def test_lru_evicted_from_disk(self, manager):
+        for name in "abcdef":
+            _run_turn(manager, name, f"prompt {name}")
+        stats = manager.stats()
+        assert stats["conversations"] == 4
+        assert stats["evictions"] == 2
+        assert manager.plan(MODEL, "a", "prompt a").action == SNAPSHOT
+
+    def test_restore_refreshes_lru_position(self, manager):
+        _run_turn(manager, "a", "prompt a")
+        _run_turn(manager, "b", "prompt b")
+        manager.plan(MODEL, "a", "prompt a 2")
+        _run_turn(manager, "c", "prompt c")
+        # "b" was least recently used, so it is the one demoted
+        assert manager.plan(MODEL, "a", "prompt a 3").cache_path.startswith(str(manager.ram_dir))
+
+    def test_discard_removes_partial_snapshot(self, manager):
+        plan = manager.plan(MODEL, "alice", "system user-1")
+        with open(plan.cache_path, "wb") as f:
+            f.write(b"partial")
+        manager.discard(plan)
+        assert not os.path.exists(plan.cache_path)
+        assert manager.stats()["conversations"] == 0
+
+
+class TestConversationRestart:
+    """Test re-indexing snapshots left by a previous server run."""
+
+    def _restart(self, manager, tmp_path):
+        return ConversationCacheManager(
+            PromptCacheManager(str(tmp_path / "cache")),
+            ram_dir=str(tmp_path / "shm"),
+            ram_budget_bytes=manager.ram_budget_bytes,
+            disk_budget_bytes=manager.disk_budget_bytes,
+        )
+
+    def test_snapshots_survive_restart(self, manager, tmp_path):
+        first = _run_turn(manager, "alice", "system user-1")
+        _run_turn(manager, "bob", "system other")
+        _run_turn(manager, "carol", "system third")
+
+        restarted = self._restart(manager, tmp_path)
+        plan = restarted.plan(MODEL, "alice", "system user-1 reply user-2")
+        assert plan.action == RESTORE
+        assert plan.cache_path.endswith(os.path.basename(first.cache_path))
+        assert restarted.plan(MODEL, "bob", "system other more").action == RESTORE
+        assert restarted.stats()["conversations"] == 3
+
+    def test_restart_keeps_prefix_validation(self, manager, tmp_path):
+        _run_turn(manager, "alice", "system user-1")
+        restarted = self._restart(manager, tmp_path)
+        assert restarted.plan(MODEL, "alice", "system EDITED").action == SNAPSHOT
+
+    def test_snapshot_without_sidecar_is_removed(self, manager, tmp_path):
+        plan = _run_turn(manager, "alice", "system user-1")
+        os.remove(plan.cache_path.replace(".rkllm_cache", ".json"))
+        restarted = self._restart(manager, tmp_path)
+        assert restarted.plan(MODEL, "alice", "system user-1 more").action == SNAPSHOT
+        assert not os.path.exists(plan.cache_path)
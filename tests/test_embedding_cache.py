@@ -0,0 +1,81 @@
+"""
+Tests for the bounded embedding result cache.
+
+Tests cover:
+- Keys separate model, pooling strategy and normalization
+- Hit / miss counters
+- LRU eviction under the byte budget
+- Cached vectors are read-only
+"""
+import sys
+import os
+import numpy as np
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.embedding_cache import EmbeddingCache
+
+
+def _vec(value, dim=256):
+    return np.full(dim, value, dtype=np.float32)
+
+
+class TestEmbeddingCache:
+    """Test LRU embedding caching."""
+
+    def test_key_includes_model_and_pooling(self):
+        key = EmbeddingCache.make_key("m", "last", True, "hello")
+        assert key == EmbeddingCache.make_key("m", "last", True, "hello")
+        assert key != EmbeddingCache.make_key("other", "last", True, "hello")
+        assert key != EmbeddingCache.make_key("m", "mean", True, "hello")
+        assert key != EmbeddingCache.make_key("m", "last", False, "hello")
+        assert key != EmbeddingCache.make_key("m", "last", True, "hello!")
+
+    def test_put_then_get(self):
+        cache = EmbeddingCache()
+        key = EmbeddingCache.make_key("m", "last", True, "hello")
+        assert cache.get(key) is None
+        cache.put(key, _vec(0.5), tokens_processed=3)
+        embedding, tokens = cache.get(key)
+        assert embedding.dtype == np.float32
+        assert embedding[0] == pytest.approx(0.5)
+        assert tokens == 3
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_cached_vector_is_read_only(self):
+        cache = EmbeddingCache()
+        key = EmbeddingCache.make_key("m", "last", True, "hello")
+        source = _vec(1.0)
+        cache.put(key, source)
+        source[0] = 9.0  # The caller's array is not aliased
+        embedding, _ = cache.get(key)
+        assert embedding[0] == 1.0
+        with pytest.raises(ValueError):
+            embedding[0] = 2.0
+
+    def test_lru_eviction_under_budget(self):
+        entry_bytes = _vec(0).nbytes + 256
+        cache = EmbeddingCache(max_bytes=2 * entry_bytes)
+        keys = [EmbeddingCache.make_key("m", "last", True, str(i)) for i in range(3)]
+        cache.put(keys[0], _vec(0))
+        cache.put(keys[1], _vec(1))
+        cache.get(keys[0])  # keys[1] is now least recently used
+        cache.put(keys[2], _vec(2))
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[2]) is not None
+        stats = cache.stats()
+        assert stats["entries"] == 2
+        assert stats["bytes"] <= cache.max_bytes
+        assert stats["evictions"] == 1
+
+    def test_zero_budget_disables(self):
+        cache = EmbeddingCache(max_bytes=0)
+        key = EmbeddingCache.make_key("m", "last", True, "hello")
+        cache.put(key, _vec(1.0))
+        assert cache.get(key) is None
+        assert cache.stats()["entries"] == 0
@@ -7,42 +7,31 @@ Tests cover:
 - Adapter functions (OpenAI and Ollama embedding format conversion)
 - Schema validation
 """
+import ctypes
 import math
 import sys
 import os
+import numpy as np
 import pytest
 
 # Add src to path to match the project's import style
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+from models.embedding_pooling import hidden_state_view, pool_hidden_states, l2_normalize
+
 
 # ============================================================================
 # Pooling Strategy Tests
 # ============================================================================
 
 def _pool_embeddings(all_states, embd_size, num_tokens, strategy):
-    """Replicate the pooling logic from rkllm_model.py get_embeddings()."""
-    if strategy == "mean":
-        embedding = [0.0] * embd_size
-        for t in range(num_tokens):
-            offset = t * embd_size
-            for i in range(embd_size):
-                embedding[i] += all_states[offset + i]
-        embedding = [x / num_tokens for x in embedding]
-    elif strategy == "cls":
-        embedding = all_states[:embd_size]
-    else:
-        offset = (num_tokens - 1) * embd_size
-        embedding = all_states[offset:offset + embd_size]
-    return embedding
+    """Pool a flat hidden-state buffer the way the RKLLM callback does."""
+    states = np.asarray(all_states, dtype=np.float32).reshape(num_tokens, embd_size)
+    return pool_hidden_states(states, strategy).tolist()
 
 
 def _l2_normalize(embedding):
-    """Replicate the normalization logic from rkllm_model.py get_embeddings()."""
-    norm = math.sqrt(sum(x * x for x in embedding))
-    if norm > 0:
-        embedding = [x / norm for x in embedding]
-    return embedding
+    return l2_normalize(np.asarray(embedding, dtype=np.float32)).tolist()
 
 
 class TestPoolingStrategies:
@@ -81,6 +70,32 @@ class TestPoolingStrategies:
         result = _pool_embeddings(self.ALL_STATES, self.EMBD_SIZE, self.NUM_TOKENS, "unknown")
         assert result == [9.0, 10.0, 11.0, 12.0]
 
+    def test_pooled_vector_is_owned_float32(self):
+        states = np.arange(12, dtype=np.float32).reshape(3, 4)
+        for strategy in ["mean", "cls", "last"]:
+            result = pool_hidden_states(states, strategy)
+            assert result.dtype == np.float32
+            assert result.shape == (4,)
+            assert not np.shares_memory(result, states)
+
+
+class TestHiddenStateView:
+    """Test zero-copy access to the runtime's hidden-state buffer."""
+
+    def test_view_aliases_c_buffer(self):
+        buf = (ctypes.c_float * 6)(1.0, 2.0, 3.0, 4.0, 5.0, 6.0)
+        view = hidden_state_view(ctypes.cast(buf, ctypes.POINTER(ctypes.c_float)), 2, 3)
+        assert view.shape == (2, 3)
+        assert view.dtype == np.float32
+        buf[4] = 50.0
+        assert view[1, 1] == 50.0
+
+    def test_pool_from_view(self):
+        buf = (ctypes.c_float * 6)(1.0, 2.0, 3.0, 4.0, 5.0, 6.0)
+        view = hidden_state_view(ctypes.cast(buf, ctypes.POINTER(ctypes.c_float)), 2, 3)
+        assert pool_hidden_states(view, "mean").tolist() == [2.5, 3.5, 4.5]
+        assert pool_hidden_states(view, "last").tolist() == [4.0, 5.0, 6.0]
+
 
 class TestL2Normalization:
     """Test L2 normalization of embeddings."""
@@ -155,6 +170,14 @@ class TestOpenAIEmbeddingAdapters:
         assert result.usage.prompt_tokens == 8
         assert result.usage.total_tokens == 8
 
+    def test_numpy_embedding_serialized_as_list(self):
+        from api.adapters import internal_to_openai_embedding
+        from models.inference_types import InferenceResponse
+
+        vec = np.array([0.5, 0.25], dtype=np.float32)
+        result = internal_to_openai_embedding([InferenceResponse(embedding=vec)], "test-model")
+        assert result.data[0].embedding == [0.5, 0.25]
+
 
 class TestOllamaEmbeddingAdapters:
     """Test Ollama embedding format conversion."""
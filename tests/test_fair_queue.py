@@ -0,0 +1,154 @@
+"""
+Tests for priority classes and per-tenant fair queuing.
+
+Tests cover:
+- Strict ordering between priority classes
+- Fair interleaving of a flooding tenant with a newcomer
+- Weights and per-tenant caps
+- Projected dispatch order
+- Shortest-job-first with learned output lengths and aging
+"""
+import sys
+import os
+import time
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.fair_queue import FairQueue
+
+
+def _drain(queue, active=None):
+    order = []
+    while True:
+        entry = queue.pop(active)
+        if entry is None:
+            return order
+        order.append(entry.item)
+
+
+class TestFairQueue:
+    """Test dispatch order."""
+
+    def test_interactive_before_batch_before_background(self):
+        queue = FairQueue()
+        queue.push("cache", priority="background")
+        queue.push("nightly", priority="batch")
+        queue.push("chat", priority="interactive")
+        assert _drain(queue) == ["chat", "nightly", "cache"]
+
+    def test_newcomer_is_not_stuck_behind_flood(self):
+        queue = FairQueue()
+        for i in range(10):
+            queue.push(f"bulk{i}", tenant="bulk", cost=100)
+        queue.push("chat", tenant="alice", cost=100)
+        order = _drain(queue)
+        assert order.index("chat") <= 1
+
+    def test_tenants_alternate(self):
+        queue = FairQueue()
+        for i in range(3):
+            queue.push(f"a{i}", tenant="a", cost=10)
+        for i in range(3):
+            queue.push(f"b{i}", tenant="b", cost=10)
+        assert _drain(queue) == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+    def test_weights_share_tokens(self):
+        queue = FairQueue(weights={"heavy": 2.0})
+        for i in range(4):
+            queue.push(f"h{i}", tenant="heavy", cost=10)
+            queue.push(f"l{i}", tenant="light", cost=10)
+        first_six = _drain(queue)[:6]
+        assert sum(item.startswith("h") for item in first_six) == 4
+
+    def test_fifo_within_tenant(self):
+        queue = FairQueue()
+        for i in range(5):
+            queue.push(i, tenant="t")
+        assert _drain(queue) == [0, 1, 2, 3, 4]
+
+    def test_tenant_cap_skips_capped_tenant(self):
+        queue = FairQueue(tenant_caps={"jobs": 1})
+        queue.push("job", tenant="jobs", priority="interactive")
+        queue.push("chat", tenant="alice", priority="batch")
+        assert queue.pop({"jobs": 1}).item == "chat"
+        assert queue.pop({"jobs": 1}) is None
+        assert queue.pop({}).item == "job"
+
+    def test_remove(self):
+        queue = FairQueue()
+        queue.push("a")
+        assert queue.remove("a")
+        assert not queue.remove("a")
+        assert len(queue) == 0
+
+    def test_unknown_priority(self):
+        with pytest.raises(ValueError):
+            FairQueue().push("a", priority="urgent")
+
+    def test_ordered_projects_caps(self):
+        queue = FairQueue(tenant_max_active=1)
+        queue.push("a0", tenant="a")
+        queue.push("a1", tenant="a")
+        queue.push("b0", tenant="b")
+        assert [e.item for e in queue.ordered()] == ["a0", "b0", "a1"]
+        assert len(queue) == 3
+
+
+class TestQueuePolicies:
+    """Test fifo and shortest-job-first ordering."""
+
+    def test_fifo_ignores_tenant_tags(self):
+        queue = FairQueue(policy="fifo")
+        for i in range(3):
+            queue.push(f"a{i}", tenant="a", cost=10)
+        queue.push("b0", tenant="b", cost=10)
+        assert _drain(queue) == ["a0", "a1", "a2", "b0"]
+
+    def test_sjf_orders_by_max_tokens(self):
+        queue = FairQueue(policy="sjf")
+        queue.push("long", max_tokens=500)
+        queue.push("short", max_tokens=20)
+        queue.push("medium", max_tokens=100)
+        assert _drain(queue) == ["short", "medium", "long"]
+
+    def test_sjf_uses_learned_output_length(self):
+        queue = FairQueue(policy="sjf")
+        for _ in range(5):
+            queue.record_output("chat", 30)
+            queue.record_output("summarizer", 400)
+        queue.push("summary", tenant="summarizer", max_tokens=512)
+        queue.push("reply", tenant="chat", max_tokens=512)
+        assert queue.predicted_output("chat", 512) == pytest.approx(30)
+        assert queue.predicted_output("chat", 10) == 10
+        assert _drain(queue) == ["reply", "summary"]
+
+    def test_sjf_counts_prompt_at_prefill_ratio(self):
+        queue = FairQueue(policy="sjf", prefill_cost_ratio=0.1)
+        queue.push("long-prompt", prompt_tokens=2000, max_tokens=50)
+        queue.push("short-prompt", prompt_tokens=100, max_tokens=200)
+        assert _drain(queue) == ["short-prompt", "long-prompt"]
+
+    def test_sjf_aging_prevents_starvation(self):
+        queue = FairQueue(policy="sjf", aging_tokens_per_s=1000)
+        old = queue.push("long", max_tokens=500)
+        old.enqueued_at = time.monotonic() - 1.0  # Waited a second: 1000 tokens of credit
+        queue.push("short", max_tokens=20)
+        assert _drain(queue) == ["long", "short"]
+
+    def test_priority_still_wins_under_sjf(self):
+        queue = FairQueue(policy="sjf")
+        queue.push("batch-short", priority="batch", max_tokens=1)
+        queue.push("chat-long", max_tokens=1000)
+        assert _drain(queue) == ["chat-long", "batch-short"]
+
+    def test_switch_policy_reorders_waiting_entries(self):
+        queue = FairQueue(policy="fifo")
+        queue.push("long", max_tokens=500)
+        queue.push("short", max_tokens=20)
+        assert [e.item for e in queue.ordered()] == ["long", "short"]
+        queue.set_policy("sjf")
+        assert [e.item for e in queue.ordered()] == ["short", "long"]
+        with pytest.raises(ValueError):
+            queue.set_policy("lifo")
@@ -0,0 +1,122 @@
+"""
+Tests for per-request generation state.
+
+Tests cover:
+- SessionRegistry userdata key allocation and lookup
+- Token buffers, max_tokens and callbacks owned by each session
+- Isolation between concurrently registered sessions
+- Completion event set from FINISH / ERROR / pause
+"""
+import sys
+import os
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.generation_session import GenerationSession, SessionRegistry, DEFAULT_STOP_SEQUENCES
+
+
+class TestSessionRegistry:
+    """Test userdata routing through the registry."""
+
+    def test_keys_are_unique_and_non_zero(self):
+        registry = SessionRegistry()
+        a, b = GenerationSession(), GenerationSession()
+        key_a = registry.register(a)
+        key_b = registry.register(b)
+        assert key_a != key_b
+        assert key_a > 0 and key_b > 0
+
+    def test_lookup_by_userdata(self):
+        registry = SessionRegistry()
+        session = GenerationSession()
+        key = registry.register(session)
+        assert registry.get(key) is session
+
+    def test_null_userdata_resolves_to_nothing(self):
+        registry = SessionRegistry()
+        registry.register(GenerationSession())
+        assert registry.get(None) is None
+        assert registry.get(0) is None
+
+    def test_unregister(self):
+        registry = SessionRegistry()
+        session = GenerationSession()
+        key = registry.register(session)
+        registry.unregister(session)
+        assert registry.get(key) is None
+        assert len(registry) == 0
+
+
+class TestGenerationSession:
+    """Test state owned by a single session."""
+
+    def test_defaults(self):
+        session = GenerationSession(max_tokens=-1)
+        assert session.max_tokens == 512
+        assert session.stop_sequences == DEFAULT_STOP_SEQUENCES
+
+    def test_tokens_and_callback(self):
+        streamed = []
+        session = GenerationSession(callback=streamed.append)
+        assert session.on_token("Hello", 1) == 0
+        assert session.on_token(" world", 2) == 0
+        assert session.text == "Hello world"
+        assert session.token_ids == [1, 2]
+        assert streamed == ["Hello", " world"]
+
+    def test_max_tokens_pauses_runtime(self):
+        session = GenerationSession(max_tokens=2)
+        session.on_token("a")
+        session.on_token("b")
+        assert session.on_token("c") == 1
+        assert session.text == "ab"
+        assert session.finish_reason == "length"
+
+    def test_finish_records_perf_stats(self):
+        session = GenerationSession()
+        session.on_finish({"generate_tokens": 3})
+        assert session.perf_stats == {"generate_tokens": 3}
+        assert session.finish_reason == "stop"
+
+    def test_error(self):
+        session = GenerationSession()
+        session.on_error("boom")
+        assert session.error == "boom"
+        assert session.done.is_set()
+
+    def test_sessions_do_not_interleave(self):
+        registry = SessionRegistry()
+        a, b = GenerationSession(), GenerationSession()
+        key_a, key_b = registry.register(a), registry.register(b)
+        for i in range(3):
+            registry.get(key_a).on_token(f"a{i}")
+            registry.get(key_b).on_token(f"b{i}")
+        assert a.text == "a0a1a2"
+        assert b.text == "b0b1b2"
+
+
+class TestCompletionEvent:
+    """Test event-driven completion signalling."""
+
+    def test_not_done_while_generating(self):
+        session = GenerationSession()
+        session.on_token("a")
+        assert not session.wait(timeout=0)
+
+    def test_finish_sets_event(self):
+        session = GenerationSession()
+        session.on_finish(None)
+        assert session.wait(timeout=0)
+
+    def test_pause_sets_event(self):
+        session = GenerationSession(max_tokens=1)
+        session.on_token("a")
+        session.on_token("b")
+        assert session.wait(timeout=0)
+
+    def test_wait_wakes_on_finish_from_other_thread(self):
+        import threading
+        session = GenerationSession()
+        threading.Timer(0.01, session.on_finish, args=(None,)).start()
+        assert session.wait(timeout=1.0)
@@ -0,0 +1,95 @@
+"""
+Tests for the image embedding cache.
+
+Tests cover:
+- Keys separate vision models and images
+- RAM tier hit / miss counters and LRU eviction
+- Disk tier: memory-mapped hits, reload after restart, byte budget
+"""
+import sys
+import os
+import numpy as np
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.image_cache import ImageEmbeddingCache
+
+
+def _emb(value, n=1024):
+    return np.full(n, value, dtype=np.float32)
+
+
+class TestImageEmbeddingCache:
+
+    def test_key_includes_model_and_image(self):
+        key = ImageEmbeddingCache.make_key("vision-a", b"image-1")
+        assert key == ImageEmbeddingCache.make_key("vision-a", b"image-1")
+        assert key != ImageEmbeddingCache.make_key("vision-b", b"image-1")
+        assert key != ImageEmbeddingCache.make_key("vision-a", b"image-2")
+
+    def test_model_id_is_file_name_safe(self):
+        model_id, _ = ImageEmbeddingCache.make_key("../qwen vl/encoder", b"x")
+        assert "/" not in model_id and " " not in model_id
+
+    def test_put_then_get(self):
+        cache = ImageEmbeddingCache()
+        key = ImageEmbeddingCache.make_key("m", b"photo")
+        assert cache.get(key) is None
+        cache.put(key, _emb(0.25))
+        embedding = cache.get(key)
+        assert embedding.dtype == np.float32
+        assert embedding[0] == pytest.approx(0.25)
+        assert not embedding.flags.writeable
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == pytest.approx(0.5)
+
+    def test_lru_eviction_under_budget(self):
+        one = _emb(0).nbytes
+        cache = ImageEmbeddingCache(max_bytes=int(one * 2.5))
+        keys = [ImageEmbeddingCache.make_key("m", bytes([i])) for i in range(3)]
+        cache.put(keys[0], _emb(0))
+        cache.put(keys[1], _emb(1))
+        cache.get(keys[0])  # keys[1] becomes least recently used
+        cache.put(keys[2], _emb(2))
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_disk_tier_serves_after_ram_eviction(self, tmp_path):
+        one = _emb(0).nbytes
+        cache = ImageEmbeddingCache(max_bytes=int(one * 1.5), disk_dir=str(tmp_path))
+        a = ImageEmbeddingCache.make_key("m", b"a")
+        b = ImageEmbeddingCache.make_key("m", b"b")
+        cache.put(a, _emb(1))
+        cache.put(b, _emb(2))  # Evicts a from RAM, both stay on disk
+        embedding = cache.get(a)
+        assert isinstance(embedding, np.memmap)
+        assert embedding[0] == pytest.approx(1)
+        assert cache.stats()["disk_hits"] == 1
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        key = ImageEmbeddingCache.make_key("vision-392px", b"photo")
+        ImageEmbeddingCache(disk_dir=str(tmp_path)).put(key, _emb(3))
+        reopened = ImageEmbeddingCache(disk_dir=str(tmp_path))
+        assert reopened.stats()["disk_entries"] == 1
+        assert reopened.get(key)[0] == pytest.approx(3)
+
+    def test_disk_budget_deletes_oldest(self, tmp_path):
+        one = _emb(0).nbytes
+        cache = ImageEmbeddingCache(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=int(one * 2.5))
+        keys = [ImageEmbeddingCache.make_key("m", bytes([i])) for i in range(3)]
+        for i, key in enumerate(keys):
+            cache.put(key, _emb(i))
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[2])[0] == pytest.approx(2)
+        assert len(list(tmp_path.glob("*.npy"))) == 2
+
+    def test_clear_removes_files(self, tmp_path):
+        cache = ImageEmbeddingCache(disk_dir=str(tmp_path))
+        cache.put(ImageEmbeddingCache.make_key("m", b"a"), _emb(1))
+        cache.clear()
+        assert cache.stats()["entries"] == 0
+        assert not list(tmp_path.glob("*.npy"))
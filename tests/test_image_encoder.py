@@ -0,0 +1,147 @@
+"""
+Tests for the persistent image-encoder worker.
+
+Tests cover:
+- The encoder is loaded once and reused across images
+- Restart and retry after the worker process dies or hangs
+- Encoder errors reported without a restart
+- Failed starts and health reporting
+- Vision model / imgenc discovery
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.image_encoder import (
+    ImageEncoderError,
+    ImageEncoderWorker,
+    create_image_encoder,
+    find_imgenc,
+    find_vision_model,
+)
+
+
+class FakeEncoder:
+    """Stands in for RKNNLiteImageEncoder inside the worker process"""
+
+    def __init__(self, model_path, dim=4):
+        self.dim = dim
+
+    def encode(self, image_data):
+        if image_data == b"bad":
+            raise ValueError("cannot decode image")
+        if image_data == b"crash":
+            os._exit(1)
+        if image_data == b"hang":
+            time.sleep(60)
+        # Report the worker pid so tests can tell whether it was restarted
+        return np.array([len(image_data), os.getpid()] + [0.0] * (self.dim - 2), dtype=np.float32)
+
+
+def failing_factory(model_path):
+    raise RuntimeError("no NPU")
+
+
+@pytest.fixture
+def worker():
+    w = ImageEncoderWorker("vision.rknn", factory=FakeEncoder, options={"dim": 4},
+                           timeout=2.0, health_interval=0)
+    w.start()
+    yield w
+    w.stop()
+
+
+class TestImageEncoderWorker:
+
+    def test_reuses_one_process(self, worker):
+        first = worker.encode(b"abc")
+        second = worker.encode(b"abcdef")
+        assert first.dtype == np.float32 and first.shape == (4,)
+        assert first[0] == 3 and second[0] == 6
+        assert first[1] == second[1]  # Same worker pid
+        assert worker.health()["starts"] == 1
+        assert worker.health()["encoded"] == 2
+
+    def test_encoder_error_does_not_restart(self, worker):
+        with pytest.raises(ValueError, match="cannot decode"):
+            worker.encode(b"bad")
+        assert worker.health()["restarts"] == 0
+        assert worker.encode(b"ok")[0] == 2
+
+    def test_restart_after_worker_dies(self, worker):
+        pid = worker.encode(b"x")[1]
+        worker._process.kill()
+        worker._process.join()
+        assert not worker.ping()
+        result = worker.encode(b"xy")
+        assert result[0] == 2 and result[1] != pid
+        assert worker.health()["restarts"] == 1
+
+    def test_crash_mid_request_is_retried_once(self, worker):
+        with pytest.raises(ImageEncoderError):
+            worker.encode(b"crash")  # Crashes again on the retry
+        assert worker.health()["restarts"] == 1
+        assert worker.encode(b"abc")[0] == 3  # Next request starts a fresh worker
+        assert worker.health()["restarts"] == 2
+
+    def test_timeout_kills_hung_worker(self):
+        w = ImageEncoderWorker("vision.rknn", factory=FakeEncoder, timeout=0.5, health_interval=0)
+        try:
+            w.start()
+            with pytest.raises(ImageEncoderError, match="No reply"):
+                w.encode(b"hang")
+            assert w.encode(b"ok")[0] == 2
+        finally:
+            w.stop()
+
+    def test_ping_and_health(self, worker):
+        assert worker.ping()
+        health = worker.health()
+        assert health["alive"] and health["pid"] is not None
+        assert health["backend"] == "FakeEncoder"
+        worker.stop()
+        assert not worker.ping()
+        assert not worker.health()["alive"]
+
+    def test_failed_start_enters_cooldown(self):
+        w = ImageEncoderWorker("vision.rknn", factory=failing_factory, max_restarts=1,
+                               restart_cooldown=60, health_interval=0)
+        try:
+            with pytest.raises(ImageEncoderError, match="no NPU"):
+                w.start()
+            with pytest.raises(ImageEncoderError, match="failed starts"):
+                w.encode(b"x")
+            assert w.health()["starts"] == 1  # No further spawn during the cooldown
+        finally:
+            w.stop()
+
+
+class TestDiscovery:
+
+    def test_finds_vision_model_and_imgenc(self, tmp_path):
+        (tmp_path / "qwen2-vl.rkllm").write_bytes(b"")
+        (tmp_path / "qwen2_vl_vision_rk3588.rknn").write_bytes(b"")
+        demo = tmp_path / "demo_Linux_aarch64"
+        demo.mkdir()
+        (demo / "imgenc").write_bytes(b"")
+        assert find_vision_model(str(tmp_path)).endswith("qwen2_vl_vision_rk3588.rknn")
+        assert find_imgenc(str(tmp_path)) == str(demo / "imgenc")
+
+    def test_text_only_model_has_no_encoder(self, tmp_path):
+        (tmp_path / "qwen3.rkllm").write_bytes(b"")
+        assert find_vision_model(str(tmp_path)) is None
+        assert create_image_encoder(str(tmp_path / "qwen3.rkllm"), {}) is None
+
+    def test_imgenc_fallback(self, tmp_path):
+        (tmp_path / "vl.rkllm").write_bytes(b"")
+        (tmp_path / "vl_vision.rknn").write_bytes(b"")
+        (tmp_path / "imgenc").write_bytes(b"")
+        encoder = create_image_encoder(str(tmp_path / "vl.rkllm"), {"backend": "imgenc"})
+        assert encoder.health()["backend"] == "imgenc"
+        assert os.access(encoder.imgenc_path, os.X_OK)
@@ -0,0 +1,139 @@
+"""
+Tests for async image loading.
+
+Tests cover:
+- Image URLs of the last user message (dicts and schema objects)
+- base64 data URLs and the size limit
+- Streamed downloads: size limit, HTTP errors, concurrent fetches
+- Prepared images carry a stable pixel digest
+"""
+import asyncio
+import base64
+import sys
+import os
+import numpy as np
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.image_fetcher import ImageFetcher, ImageFetchError, PreparedImage, image_urls
+from utils.image_cache import ImageEmbeddingCache
+from api.schemas import ChatMessage
+
+
+class _FakeResponse:
+    def __init__(self, body, status_code=200, headers=None, delay=0.0):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.delay = delay
+        self.client = None
+
+    async def __aenter__(self):
+        self.client.active += 1
+        self.client.max_active = max(self.client.max_active, self.client.active)
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.client.active -= 1
+        return False
+
+    async def aiter_bytes(self):
+        for i in range(0, len(self.body), 4):
+            yield self.body[i:i + 4]
+
+
+class _FakeClient:
+    """Minimal stand-in for httpx.AsyncClient.stream()"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.active = 0
+        self.max_active = 0
+
+    def stream(self, method, url):
+        response = self.responses[url]
+        response.client = self
+        return response
+
+
+def _data_url(data: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(data).decode()
+
+
+class TestImageUrls:
+
+    def test_dict_and_schema_parts(self):
+        content = [{"type": "text", "text": "what is this?"},
+                   {"type": "image_url", "image_url": {"url": "http://x/a.jpg"}}]
+        assert image_urls(content) == ["http://x/a.jpg"]
+        msg = ChatMessage(role="user", content=content)
+        assert image_urls(msg.content) == ["http://x/a.jpg"]
+        assert image_urls("plain text") == []
+
+    def test_only_last_user_message(self):
+        fetcher = ImageFetcher()
+        messages = [
+            {"role": "user", "content": [{"type": "image_url", "image_url": {"url": _data_url(b"old")}}]},
+            {"role": "assistant", "content": "A cat."},
+            {"role": "user", "content": "And now?"},
+        ]
+        assert asyncio.run(fetcher.load(messages)) == []
+
+
+class TestImageFetcher:
+
+    def test_data_url(self):
+        fetcher = ImageFetcher()
+        assert asyncio.run(fetcher.fetch(_data_url(b"\x89PNG..."))) == b"\x89PNG..."
+
+    def test_data_url_size_limit(self):
+        fetcher = ImageFetcher(max_bytes=16)
+        with pytest.raises(ImageFetchError, match="limit"):
+            asyncio.run(fetcher.fetch(_data_url(b"x" * 64)))
+
+    def test_download_streams_body(self):
+        client = _FakeClient({"http://img/a": _FakeResponse(b"0123456789")})
+        fetcher = ImageFetcher(client=client)
+        assert asyncio.run(fetcher.fetch("http://img/a")) == b"0123456789"
+        assert fetcher.stats()["bytes_fetched"] == 10
+
+    def test_download_size_limit(self):
+        client = _FakeClient({
+            "http://img/declared": _FakeResponse(b"", headers={"content-length": "1000"}),
+            "http://img/streamed": _FakeResponse(b"x" * 100),
+        })
+        fetcher = ImageFetcher(max_bytes=50, client=client)
+        for url in ("http://img/declared", "http://img/streamed"):
+            with pytest.raises(ImageFetchError, match="limit"):
+                asyncio.run(fetcher.fetch(url))
+        assert fetcher.stats()["failures"] == 2
+
+    def test_http_error_and_bad_scheme(self):
+        client = _FakeClient({"http://img/missing": _FakeResponse(b"", status_code=404)})
+        fetcher = ImageFetcher(client=client)
+        with pytest.raises(ImageFetchError, match="404"):
+            asyncio.run(fetcher.fetch("http://img/missing"))
+        with pytest.raises(ImageFetchError, match="scheme"):
+            asyncio.run(fetcher.fetch("file:///etc/passwd"))
+
+    def test_images_fetched_concurrently(self):
+        urls = [f"http://img/{i}" for i in range(3)]
+        client = _FakeClient({url: _FakeResponse(url.encode(), delay=0.05) for url in urls})
+        fetcher = ImageFetcher(client=client)
+        messages = [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": u}} for u in urls]}]
+        images = asyncio.run(fetcher.load(messages))
+        assert images == [u.encode() for u in urls]
+        assert client.max_active == 3
+
+
+class TestPreparedImage:
+
+    def test_digest_depends_on_pixels(self):
+        a = PreparedImage.from_pixels(np.zeros((4, 4, 3), dtype=np.uint8))
+        b = PreparedImage.from_pixels(np.zeros((4, 4, 3), dtype=np.uint8))
+        c = PreparedImage.from_pixels(np.ones((4, 4, 3), dtype=np.uint8))
+        assert a.digest == b.digest != c.digest
+        assert ImageEmbeddingCache.make_key("m", a) == ImageEmbeddingCache.make_key("m", b)
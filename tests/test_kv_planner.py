@@ -0,0 +1,194 @@
+"""
+Tests for per-run KV cache planning.
+
+Tests cover:
+- Resident prefix reuse with token input between runs
+- Conversation snapshots keeping their KV history, so the next turn is resident
+- Restores of displaced conversations
+- Binary caches and untracked runs resetting the KV cache
+"""
+import re
+import sys
+import os
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.generation_session import GenerationSession
+from models.kv_planner import KVPlanner
+from models.prefix_cache import TokenPrefixIndex
+from models.rkllm_model_mock import MockRKLLMRuntime
+from models.tokenizer_service import TokenizerService
+from utils.cache_manager import PromptCacheManager
+from utils.conversation_cache import ConversationCacheManager, RESIDENT, RESTORE, SNAPSHOT
+
+MODEL = "qwen3-0.6b"
+SPECIALS = ["<|im_start|>", "<|im_end|>"]
+SYSTEM = "<|im_start|>system\nBe brief.<|im_end|>\n"
+
+
+class _WordTokenizer:
+    """Special tokens are atomic, other text splits into words and whitespace"""
+
+    all_special_tokens = SPECIALS
+
+    def __init__(self):
+        self.vocab = {t: i for i, t in enumerate(SPECIALS)}
+
+    def encode(self, text, add_special_tokens=False):
+        ids = []
+        for part in re.split("(" + "|".join(re.escape(t) for t in SPECIALS) + ")", text):
+            if part in SPECIALS:
+                ids.append(self.vocab[part])
+            elif part:
+                ids.extend(self.vocab.setdefault(p, len(self.vocab)) for p in re.findall(r"\s+|\S+", part))
+        return ids
+
+
+def _chat(*turns):
+    prompt = SYSTEM
+    for user, reply in turns:
+        prompt += f"<|im_start|>user\n{user}<|im_end|>\n<|im_start|>assistant\n"
+        if reply is not None:
+            prompt += f"{reply}<|im_end|>\n"
+    return prompt
+
+
+class _Harness:
+    """generate() around MockRKLLMRuntime: plan, run, finish"""
+
+    def __init__(self, tmp_path, token_input=True):
+        self.clears = []
+        self.loaded = []
+        self.runtime = MockRKLLMRuntime(n_batch=1, step_time=0.001)
+        self.prefix_index = TokenPrefixIndex()
+        self.conversations = ConversationCacheManager(
+            PromptCacheManager(str(tmp_path / "cache")),
+            ram_dir=str(tmp_path / "shm"),
+        )
+        self.planner = KVPlanner(
+            self.prefix_index,
+            TokenizerService(_WordTokenizer()),
+            clear_kv=self._clear_kv,
+            max_context_len=4096,
+            token_input=token_input,
+            conversation_cache=self.conversations,
+            model_name=MODEL,
+        )
+
+    def _clear_kv(self, start_pos=None, end_pos=None):
+        self.clears.append((start_pos, end_pos))
+        return True
+
+    def generate(self, prompt, conversation_id=None):
+        session = GenerationSession(prompt=prompt, max_tokens=4)
+        kv = self.planner.plan(prompt, session, conversation_id=conversation_id)
+        if kv.binary_cache_path:
+            if kv.save_binary_cache:
+                # The runtime writes the snapshot after prefill
+                with open(kv.binary_cache_path, "wb") as f:
+                    f.write(b"\0" * 64)
+            else:
+                self.loaded.append(kv.binary_cache_path)
+        self.runtime.run(session)
+        self.planner.finish(kv, session, prompt)
+        return kv
+
+
+@pytest.fixture
+def harness(tmp_path):
+    return _Harness(tmp_path)
+
+
+class TestPrefixReuse:
+    """Test resident KV reuse without conversations."""
+
+    def test_first_run_prefills_everything(self, harness):
+        kv = harness.generate(_chat(("Hi", None)))
+        assert kv.prefix.reuse == 0
+        assert kv.input_ids == kv.prompt_ids
+        assert kv.keep_history == 1
+        assert harness.clears == [(None, None)]
+
+    def test_follow_up_prefills_only_the_suffix(self, harness):
+        first = harness.generate(_chat(("Hi", None)))
+        kv = harness.generate(_chat(("Hi", "Hello"), ("Bye", None)))
+        assert kv.prefix.reuse >= len(first.prompt_ids)
+        assert kv.input_ids == kv.prompt_ids[kv.prefix.reuse:]
+        assert harness.clears[-1] == (kv.prefix.trim_from, 4096)
+
+    def test_text_input_is_not_tracked(self, tmp_path):
+        harness = _Harness(tmp_path, token_input=False)
+        kv = harness.generate(_chat(("Hi", None)))
+        assert kv.input_ids is None
+        assert kv.keep_history == 0
+        assert harness.prefix_index.resident_length(0) == 0
+
+
+class TestConversationTurns:
+    """Test conversation snapshots on top of the prefix index."""
+
+    def test_second_turn_is_resident(self, harness):
+        first = harness.generate(_chat(("Hi", None)), conversation_id="alice")
+        assert first.conversation.action == SNAPSHOT
+        assert first.keep_history == 1
+        assert harness.prefix_index.resident_length(0) > len(first.prompt_ids)
+
+        kv = harness.generate(_chat(("Hi", "Hello"), ("Bye", None)), conversation_id="alice")
+        assert kv.conversation.action == RESIDENT
+        assert kv.binary_cache_path is None
+        assert kv.prefix.reuse >= len(first.prompt_ids)
+        assert kv.input_ids == kv.prompt_ids[kv.prefix.reuse:]
+        assert harness.loaded == []
+
+    def test_displaced_conversation_restores_then_stays_resident(self, harness):
+        first = harness.generate(_chat(("Hi", None)), conversation_id="alice")
+        harness.generate(_chat(("Other", None)), conversation_id="bob")
+
+        restored = harness.generate(_chat(("Hi", "Hello"), ("Bye", None)), conversation_id="alice")
+        assert restored.conversation.action == RESTORE
+        assert restored.keep_history == 1
+        assert harness.loaded == [first.binary_cache_path]
+
+        kv = harness.generate(
+            _chat(("Hi", "Hello"), ("Bye", "Ciao"), ("Again", None)), conversation_id="alice"
+        )
+        assert kv.conversation.action == RESIDENT
+        assert kv.prefix.reuse >= len(restored.prompt_ids)
+        assert harness.loaded == [first.binary_cache_path]
+
+    def test_request_outside_conversation_ends_residency(self, harness):
+        harness.generate(_chat(("Hi", None)), conversation_id="alice")
+        harness.generate(_chat(("Unrelated", None)))
+        kv = harness.generate(_chat(("Hi", "Hello"), ("Bye", None)), conversation_id="alice")
+        assert kv.conversation.action == RESTORE
+
+    def test_snapshot_resets_kv_cache(self, harness):
+        harness.generate(_chat(("Other", None)))
+        harness.clears.clear()
+        harness.generate(_chat(("Hi", None)), conversation_id="alice")
+        assert harness.clears == [(None, None)]
+
+
+class TestFailures:
+    """Test cleanup after failed or aborted runs."""
+
+    def test_fail_forgets_kv_and_snapshot(self, harness):
+        prompt = _chat(("Hi", None))
+        session = GenerationSession(prompt=prompt, max_tokens=4)
+        kv = harness.planner.plan(prompt, session, conversation_id="alice")
+        with open(kv.binary_cache_path, "wb") as f:
+            f.write(b"\0" * 64)
+        harness.planner.fail(kv, session)
+        assert harness.prefix_index.resident_length(0) == 0
+        assert not os.path.exists(kv.binary_cache_path)
+
+    def test_abort_during_prefill_invalidates(self, harness):
+        harness.generate(_chat(("Hi", None)))
+        prompt = _chat(("Hi", "Hello"), ("Bye", None))
+        session = GenerationSession(prompt=prompt, max_tokens=4)
+        kv = harness.planner.plan(prompt, session)
+        session.stopped = True
+        harness.planner.finish(kv, session, prompt)
+        assert harness.prefix_index.resident_length(0) == 0
@@ -0,0 +1,115 @@
+"""
+Tests for the Prometheus metrics registry.
+
+Tests cover:
+- Text exposition format and label escaping
+- Cumulative histogram buckets
+- Stage timestamps recorded through the scheduler
+- Scrape-time mirroring of cache and scheduler counters
+"""
+import asyncio
+import sys
+import os
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.batch_scheduler import BatchScheduler
+from models.generation_session import GenerationSession
+from models.rkllm_model_mock import MockRKLLMRuntime
+from utils.embedding_cache import EmbeddingCache
+from utils.metrics import (
+    CACHE_LOOKUPS, GENERATED_TOKENS, INTER_TOKEN_LATENCY, QUEUE_DEPTH, QUEUE_WAIT, TIME_TO_FIRST_TOKEN,
+    MetricsRegistry, collect_model_stats, current_endpoint, endpoint_for_path, record_generation
+)
+
+
+class TestRegistry:
+
+    def test_counter_and_gauge_render(self):
+        registry = MetricsRegistry()
+        requests = registry.counter("t_requests_total", "Requests", ("endpoint",))
+        depth = registry.gauge("t_depth", "Depth")
+        requests.inc(endpoint="openai")
+        requests.inc(2, endpoint='we"ird\n')
+        depth.set(3)
+        text = registry.render()
+        assert "# TYPE t_requests_total counter" in text
+        assert 't_requests_total{endpoint="openai"} 1' in text
+        assert 't_requests_total{endpoint="we\\"ird\\n"} 2' in text
+        assert "# TYPE t_depth gauge\nt_depth 3\n" in text
+        assert text.endswith("\n")
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        latency = registry.histogram("t_latency_seconds", "Latency", ("model",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value, model="m")
+        text = registry.render()
+        assert 't_latency_seconds_bucket{model="m",le="0.1"} 2' in text
+        assert 't_latency_seconds_bucket{model="m",le="1"} 3' in text
+        assert 't_latency_seconds_bucket{model="m",le="+Inf"} 4' in text
+        assert 't_latency_seconds_sum{model="m"} 3.65' in text
+        assert 't_latency_seconds_count{model="m"} 4' in text
+
+    def test_label_mismatch_and_duplicates_rejected(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("t_total", "Total", ("model",))
+        with pytest.raises(ValueError, match="expects labels"):
+            counter.inc(endpoint="openai")
+        with pytest.raises(ValueError, match="already registered"):
+            registry.gauge("t_total", "Again")
+
+    def test_endpoint_for_path(self):
+        assert endpoint_for_path("/api/chat") == "ollama"
+        assert endpoint_for_path("/v1/chat/completions") == "openai"
+        assert endpoint_for_path("/") == "other"
+
+
+class TestRecordGeneration:
+
+    def test_stage_latencies_from_scheduler(self):
+        async def run():
+            runtime = MockRKLLMRuntime(n_batch=1, step_time=0.002)
+            scheduler = BatchScheduler(n_slots=1, max_context_len=4096)
+            session = GenerationSession(prompt="hello", max_tokens=5)
+            token = current_endpoint.set("ollama")
+            try:
+                _, perf = await scheduler.submit(session, lambda: runtime.run(session))
+                record_generation("metrics-test", session, perf)
+            finally:
+                current_endpoint.reset(token)
+                scheduler.shutdown()
+            return session
+
+        session = asyncio.run(run())
+        assert session.queued_at <= session.started_at <= session.first_token_at <= session.last_token_at
+        labels = {"model": "metrics-test", "endpoint": "ollama"}
+        assert QUEUE_WAIT.count(**labels) == 1
+        assert TIME_TO_FIRST_TOKEN.count(**labels) == 1
+        assert INTER_TOKEN_LATENCY.count(**labels) == 1
+        assert GENERATED_TOKENS.value(**labels) == session.generated_tokens
+
+    def test_session_without_tokens(self):
+        session = GenerationSession(prompt="hi", max_tokens=1)
+        record_generation("metrics-empty", session, None)
+        assert QUEUE_WAIT.count(model="metrics-empty", endpoint="internal") == 0
+
+
+class TestCollectModelStats:
+
+    def test_mirrors_cache_and_scheduler_counters(self):
+        class _Model:
+            model_name = "metrics-collect"
+            embedding_cache = EmbeddingCache()
+            scheduler = BatchScheduler(n_slots=2, max_context_len=512)
+
+        model = _Model()
+        model.embedding_cache.get("missing")
+        collect_model_stats(model)
+        collect_model_stats(model)  # Totals are mirrored, not accumulated
+        assert CACHE_LOOKUPS.value(model="metrics-collect", cache="embedding", result="miss") == 1
+        assert CACHE_LOOKUPS.value(model="metrics-collect", cache="embedding", result="hit") == 0
+        assert QUEUE_DEPTH.value(model="metrics-collect") == 0
+        model.scheduler.shutdown()
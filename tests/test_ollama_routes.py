@@ -0,0 +1,157 @@
+"""
+Tests for scheduler errors on the Ollama-compatible routes.
+
+Tests cover:
+- 429 with Retry-After when the scheduler refuses a request
+- 504 when the deadline passes in the queue, 400 for an oversized prompt
+- Tenant, priority and deadline passed through to the model
+- Chat history that overflows the context window trimmed before generation
+"""
+import asyncio
+import sys
+import os
+import types
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fastapi import HTTPException, Response
+
+from src.api import ollama_routes
+from src.api.schemas import OllamaGenerateRequest, OllamaChatRequest, OllamaEmbeddingRequest
+from models.batch_scheduler import ContextLengthError, DeadlineExceededError, QueueFullError
+
+
+class FakeRequest:
+    """Headers, client and is_disconnected() of starlette's Request"""
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+        self.client = None
+
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+class FakeScheduler:
+    def __init__(self, error=None):
+        self.error = error
+
+    def check_admission(self, deadline, priority=None):
+        if self.error is not None:
+            raise self.error
+
+
+class FakeModel:
+    """Loaded model whose generation and embedding calls raise ``error``"""
+
+    model_name = "qwen3-0.6b"
+
+    def __init__(self, error=None, admission_error=None, max_context_len=0):
+        self.error = error
+        self.max_context_len = max_context_len
+        self.scheduler = FakeScheduler(admission_error)
+        self.calls = []
+
+    async def generate_async(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error is not None:
+            raise self.error
+        return "Blue.", {"prefill_tokens": 3, "generate_tokens": 1}
+
+    async def get_embeddings(self, **kwargs):
+        self.calls.append(kwargs)
+        raise self.error
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Make ``model`` the current model of src.main's model manager"""
+    def _serve(model):
+        manager = types.SimpleNamespace(get_current_model=lambda: model)
+        main = types.ModuleType("src.main")
+        main.model_manager = manager
+        monkeypatch.setitem(sys.modules, "src.main", main)
+        return model
+    return _serve
+
+
+def _generate(headers=None):
+    request = OllamaGenerateRequest(model="qwen3-0.6b", prompt="Why is the sky blue?")
+    return asyncio.run(ollama_routes.ollama_generate(request, FakeRequest(headers), Response()))
+
+
+def _chat(messages=None, options=None):
+    messages = messages or [{"role": "user", "content": "Hi"}]
+    request = OllamaChatRequest(model="qwen3-0.6b", messages=messages, options=options)
+    return asyncio.run(ollama_routes.ollama_chat(request, FakeRequest(), Response()))
+
+
+class TestOllamaAdmission:
+    """Test scheduler refusals mapped to HTTP status codes."""
+
+    def test_full_queue_at_admission_is_429(self, serve):
+        serve(FakeModel(admission_error=QueueFullError("Queue is full", retry_after=3)))
+        with pytest.raises(HTTPException) as exc:
+            _generate()
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "3"
+
+    def test_full_queue_while_queued_is_429(self, serve):
+        serve(FakeModel(error=QueueFullError("Queue is full", retry_after=2)))
+        with pytest.raises(HTTPException) as exc:
+            _chat()
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "2"
+
+    def test_deadline_exceeded_is_504(self, serve):
+        serve(FakeModel(error=DeadlineExceededError("Deadline exceeded")))
+        with pytest.raises(HTTPException) as exc:
+            _generate()
+        assert exc.value.status_code == 504
+        assert "Retry-After" in exc.value.headers
+
+    def test_context_length_is_400(self, serve):
+        serve(FakeModel(error=ContextLengthError("Prompt too long")))
+        with pytest.raises(HTTPException) as exc:
+            _chat()
+        assert exc.value.status_code == 400
+
+    def test_embeddings_queue_full_is_429(self, serve):
+        serve(FakeModel(error=QueueFullError("Queue is full")))
+        request = OllamaEmbeddingRequest(model="qwen3-0.6b", prompt="The quick brown fox")
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(ollama_routes.ollama_embeddings(request, FakeRequest()))
+        assert exc.value.status_code == 429
+
+    def test_scheduling_inputs_come_from_headers(self, serve):
+        model = serve(FakeModel())
+        _generate({"authorization": "Bearer secret", "x-priority": "batch", "x-request-timeout": "5"})
+        call = model.calls[0]
+        assert call["tenant"].startswith("key-")
+        assert call["priority"] == "batch"
+        assert call["deadline"] is not None
+
+
+class TestOllamaContextWindow:
+    """Test chat history trimming on /api/chat."""
+
+    def test_chat_that_fits_is_sent_whole(self, serve):
+        model = serve(FakeModel(max_context_len=4096))
+        _chat([{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}])
+        assert model.calls[0]["prompt"] == "System: Be brief.\nUser: Hi\nAssistant:"
+
+    def test_overflowing_history_is_trimmed(self, serve):
+        model = serve(FakeModel(max_context_len=400))
+        messages = [{"role": "system", "content": "Be brief."}]
+        for i in range(40):
+            role = "user" if i % 2 == 0 else "assistant"
+            messages.append({"role": role, "content": f"turn {i} " + "word " * 20})
+        _chat(messages, options={"num_predict": 64})
+        prompt = model.calls[0]["prompt"]
+        assert prompt.startswith("System: Be brief.\n")
+        assert "turn 0 " not in prompt
+        assert "turn 39 " in prompt
+        assert "- user: turn" in prompt
+        assert prompt.endswith("Assistant:")
@@ -0,0 +1,115 @@
+"""
+Tests for the token-level prefix index.
+
+Tests cover:
+- Longest common prefix against the resident sequence
+- Edge splitting for branching sequences
+- Per-slot isolation and invalidation
+- Reuse planning (always prefill at least one token)
+- Token input only when the runtime chat template is cleared
+"""
+import sys
+import os
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.prefix_cache import NO_CHAT_TEMPLATE, TokenPrefixIndex, token_input_allowed
+
+
+class TestTokenPrefixIndex:
+    """Test prefix matching over token IDs."""
+
+    def test_empty_index_matches_nothing(self):
+        index = TokenPrefixIndex()
+        assert index.match([1, 2, 3]) == 0
+
+    def test_continuation_matches_whole_resident(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4])
+        assert index.match([1, 2, 3, 4, 5, 6]) == 4
+
+    def test_edit_matches_up_to_divergence(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4, 5])
+        assert index.match([1, 2, 9, 4, 5]) == 2
+
+    def test_shorter_prompt_matches_its_length(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4, 5])
+        assert index.match([1, 2, 3]) == 3
+
+    def test_insert_replaces_resident_sequence(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4])
+        index.insert([1, 2, 7, 8])
+        assert index.match([1, 2, 3, 4]) == 2
+        assert index.match([1, 2, 7, 8, 9]) == 4
+        assert index.resident_tokens() == [1, 2, 7, 8]
+
+    def test_slots_are_isolated(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4], slot=0)
+        index.insert([1, 2, 5, 6], slot=1)
+        assert index.match([1, 2, 3, 4], slot=0) == 4
+        assert index.match([1, 2, 3, 4], slot=1) == 2
+        assert index.match([1, 2, 5, 6], slot=1) == 4
+
+    def test_invalidate_slot_keeps_others(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3], slot=0)
+        index.insert([1, 2, 4], slot=1)
+        index.invalidate(0)
+        assert index.match([1, 2, 3], slot=0) == 0
+        assert index.match([1, 2, 4], slot=1) == 3
+        index.invalidate()
+        assert index.resident_length(1) == 0
+
+    def test_truncate(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4, 5])
+        index.truncate(2)
+        assert index.resident_length() == 2
+        assert index.match([1, 2, 3]) == 2
+
+
+class TestPrefixPlan:
+    """Test reuse planning for the runtime."""
+
+    def test_plan_reuses_shared_prefix(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4, 5, 6])
+        plan = index.plan([1, 2, 3, 9, 9])
+        assert plan.reuse == 3
+        assert plan.trim_from == 3
+        assert plan.resident == 6
+
+    def test_regenerate_prefills_last_prompt_token(self):
+        index = TokenPrefixIndex()
+        index.insert([1, 2, 3, 4, 5, 6])
+        plan = index.plan([1, 2, 3, 4])
+        assert plan.reuse == 3
+
+    def test_plan_counters(self):
+        index = TokenPrefixIndex()
+        index.plan([1, 2])
+        index.insert([1, 2, 3])
+        index.plan([1, 2, 3, 4])
+        stats = index.stats()
+        assert stats["lookups"] == 2
+        assert stats["hits"] == 1
+        assert stats["reused_tokens"] == 3
+
+
+class TestTokenInputAllowed:
+    """Token input must not bypass a runtime chat template or thinking mode."""
+
+    def test_builtin_template_keeps_prompt_input(self):
+        assert not token_input_allowed(None, enable_thinking=False)
+
+    def test_custom_template_keeps_prompt_input(self):
+        assert not token_input_allowed(("sys", "<|user|>", "<|assistant|>"), enable_thinking=False)
+
+    def test_cleared_template(self):
+        assert token_input_allowed(NO_CHAT_TEMPLATE, enable_thinking=False)
+        assert not token_input_allowed(NO_CHAT_TEMPLATE, enable_thinking=True)
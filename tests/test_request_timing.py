@@ -0,0 +1,85 @@
+"""
+Tests for per-request timing breakdowns.
+
+Tests cover:
+- Stage measurement and the Server-Timing header value
+- Queue wait and first-token times taken from a scheduled session
+- Timing surfaced in OpenAI usage and Ollama responses
+"""
+import asyncio
+import sys
+import os
+import time
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.batch_scheduler import BatchScheduler
+from models.generation_session import GenerationSession
+from models.inference_types import InferenceResponse, RequestTiming
+from models.rkllm_model_mock import MockRKLLMRuntime
+
+
+class TestRequestTiming:
+
+    def test_measure_accumulates(self):
+        timing = RequestTiming()
+        with timing.measure('image_fetch_ms'):
+            time.sleep(0.01)
+        with timing.measure('image_fetch_ms'):
+            time.sleep(0.01)
+        assert timing.image_fetch_ms >= 20
+        assert timing.template_ms == 0
+
+    def test_server_timing_skips_empty_stages(self):
+        timing = RequestTiming(template_ms=1.234, prefill_ms=80.0)
+        assert timing.server_timing() == "template;dur=1.23, prefill;dur=80.0"
+        timing.finish()
+        assert timing.server_timing().endswith(f"total;dur={round(timing.total_ms, 2)}")
+
+    def test_to_dict_has_every_stage(self):
+        data = RequestTiming().to_dict()
+        assert "started_at" not in data
+        assert {"queue_wait_ms", "template_ms", "image_fetch_ms", "image_encode_ms", "prefill_ms",
+                "decode_ms", "first_token_ms", "stream_flush_ms"} <= set(data)
+
+    def test_record_session_from_scheduler(self):
+        async def run():
+            runtime = MockRKLLMRuntime(n_batch=1, step_time=0.005)
+            scheduler = BatchScheduler(n_slots=1, max_context_len=4096)
+            first = GenerationSession(prompt="hello", max_tokens=10)
+            second = GenerationSession(prompt="hello", max_tokens=3)
+            timing = RequestTiming()
+            try:
+                # The second request waits for the first to free the only slot
+                results = await asyncio.gather(
+                    scheduler.submit(first, lambda: runtime.run(first)),
+                    scheduler.submit(second, lambda: runtime.run(second)),
+                )
+            finally:
+                scheduler.shutdown()
+            timing.record_session(second, {"prefill_time_ms": 12.0, "generate_time_ms": 30.0})
+            return timing
+
+        timing = asyncio.run(run())
+        assert timing.queue_wait_ms >= 30
+        assert timing.first_token_ms >= timing.queue_wait_ms
+        assert timing.prefill_ms == 12.0 and timing.decode_ms == 30.0
+
+
+class TestTimingInResponses:
+
+    def test_openai_usage(self):
+        from api.adapters import internal_to_openai_chat
+
+        response = InferenceResponse(text="hi", prefill_tokens=3, generate_tokens=1,
+                                     timing=RequestTiming(queue_wait_ms=5.0))
+        result = internal_to_openai_chat(response, "test-model")
+        assert result.usage.timing["queue_wait_ms"] == 5.0
+
+    def test_ollama_generate(self):
+        from api.adapters import internal_to_ollama_generate
+
+        response = InferenceResponse(text="hi", timing=RequestTiming(decode_ms=42.0))
+        assert internal_to_ollama_generate(response, "test-model").timing["decode_ms"] == 42.0
+        assert internal_to_ollama_generate(InferenceResponse(text="hi"), "test-model").timing is None
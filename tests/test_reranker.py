@@ -0,0 +1,87 @@
+"""
+Tests for rerank prompt construction and scoring.
+
+Tests cover:
+- Judge prompts share the query prefix (KV reuse between pairs)
+- Yes/no probability from logits
+- Cosine scores and ranking
+- Rerank schemas
+"""
+import sys
+import os
+import numpy as np
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.reranker import build_judge_prompts, judge_token_ids, yes_probability, cosine_scores, rank
+
+
+class _CharTokenizer:
+    """Maps known words to one token, everything else to one token per character"""
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+
+    def encode(self, text, add_special_tokens=False):
+        return [self.vocab[text]] if text in self.vocab else [ord(c) for c in text]
+
+
+class TestJudgePrompts:
+    """Test prompt construction."""
+
+    def test_prompts_share_query_prefix(self):
+        prefix, prompts = build_judge_prompts("npu cores?", ["doc a", "doc b"])
+        assert len(prompts) == 2
+        assert all(p.startswith(prefix) for p in prompts)
+        assert "npu cores?" in prefix
+        assert "doc a" not in prefix
+        assert prompts[0].endswith("</think>\n\n")
+
+    def test_custom_instruction(self):
+        prefix, _ = build_judge_prompts("q", ["d"], instruction="Find code snippets")
+        assert "<Instruct>: Find code snippets" in prefix
+
+    def test_judge_token_ids(self):
+        assert judge_token_ids(_CharTokenizer({"yes": 5, "no": 7})) == (5, 7)
+        with pytest.raises(ValueError):
+            judge_token_ids(_CharTokenizer({}))
+
+
+class TestScoring:
+    """Test score computation and ordering."""
+
+    def test_yes_probability(self):
+        logits = np.zeros(10, dtype=np.float32)
+        assert yes_probability(logits, 1, 2) == pytest.approx(0.5)
+        logits[1] = 3.0
+        assert yes_probability(logits, 1, 2) == pytest.approx(1 / (1 + np.exp(-3.0)))
+        logits[2] = 50.0
+        assert yes_probability(logits, 1, 2) < 1e-6
+
+    def test_cosine_scores(self):
+        scores = cosine_scores(np.array([1.0, 0.0]), np.array([[2.0, 0.0], [0.0, 3.0], [1.0, 1.0], [0.0, 0.0]]))
+        assert scores == pytest.approx([1.0, 0.0, np.sqrt(0.5), 0.0])
+
+    def test_rank_orders_and_truncates(self):
+        assert rank([0.1, 0.9, 0.5]) == [(1, 0.9), (2, 0.5), (0, 0.1)]
+        assert rank([0.1, 0.9, 0.5], top_n=1) == [(1, 0.9)]
+        assert rank([0.5, 0.5]) == [(0, 0.5), (1, 0.5)]
+
+
+class TestRerankSchemas:
+    """Test rerank request/response schemas."""
+
+    def test_request_defaults(self):
+        from api.schemas import RerankRequest
+        req = RerankRequest(query="q", documents=["a", "b"])
+        assert req.mode == "auto"
+        assert req.top_n is None
+        assert not req.return_documents
+
+    def test_request_requires_documents(self):
+        from pydantic import ValidationError
+        from api.schemas import RerankRequest
+        with pytest.raises(ValidationError):
+            RerankRequest(query="q", documents=[])
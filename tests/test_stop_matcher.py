@@ -0,0 +1,125 @@
+"""
+Tests for incremental stop-sequence matching.
+
+Tests cover:
+- Matches inside a token and across token boundaries
+- Hold-back of partial matches and release when they diverge
+- Multiple and overlapping stop sequences
+- Session integration: trimming, streaming and abort hook
+"""
+import sys
+import os
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.stop_matcher import StopSequenceMatcher
+from models.generation_session import GenerationSession
+
+
+def _stream(matcher, pieces):
+    out = []
+    for piece in pieces:
+        emit, matched = matcher.feed(piece)
+        out.append(emit)
+        if matched:
+            return "".join(out), True
+    out.append(matcher.flush())
+    return "".join(out), False
+
+
+class TestStopSequenceMatcher:
+    """Test the Aho-Corasick matcher."""
+
+    def test_no_stop_sequences_passes_through(self):
+        matcher = StopSequenceMatcher([])
+        assert matcher.feed("abc") == ("abc", False)
+
+    def test_match_within_token(self):
+        text, matched = _stream(StopSequenceMatcher(["STOP"]), ["hello STOP world"])
+        assert matched
+        assert text == "hello "
+
+    def test_match_across_tokens(self):
+        matcher = StopSequenceMatcher(["\nUser:"])
+        text, matched = _stream(matcher, ["Answer", "\n", "Us", "er", ":", " more"])
+        assert matched
+        assert text == "Answer"
+        assert matcher.matched == "\nUser:"
+
+    def test_partial_match_is_held_back(self):
+        matcher = StopSequenceMatcher(["</tool>"])
+        emit, matched = matcher.feed("result </to")
+        assert not matched
+        assert emit == "result "
+
+    def test_diverging_partial_is_released(self):
+        text, matched = _stream(StopSequenceMatcher(["</tool>"]), ["a </to", "p> b"])
+        assert not matched
+        assert text == "a </top> b"
+
+    def test_flush_releases_tail(self):
+        matcher = StopSequenceMatcher(["###"])
+        assert matcher.feed("x ##") == ("x ", False)
+        assert matcher.flush() == "##"
+
+    def test_multiple_sequences(self):
+        text, matched = _stream(StopSequenceMatcher(["END", "<|im_end|>"]), ["foo<|im_", "end|>bar"])
+        assert matched
+        assert text == "foo"
+
+    def test_overlapping_sequences(self):
+        # "abcd" is never completed, but "bc" is: the suffix link must find it
+        text, matched = _stream(StopSequenceMatcher(["abcd", "bc"]), ["xab", "cz"])
+        assert matched
+        assert text == "xa"
+
+    def test_input_ignored_after_match(self):
+        matcher = StopSequenceMatcher(["!"])
+        matcher.feed("hi!")
+        assert matcher.feed("more") == ("", True)
+
+
+class TestSessionStopSequences:
+    """Test stop handling inside GenerationSession."""
+
+    def test_trims_output_and_stream(self):
+        streamed = []
+        session = GenerationSession(stop=["\n\n"], callback=streamed.append)
+        for piece in ["First", " line", "\n", "\n", "Second"]:
+            session.on_token(piece)
+        assert session.text == "First line"
+        assert "".join(streamed) == "First line"
+        assert session.finish_reason == "stop"
+        assert session.matched_stop == "\n\n"
+        assert session.done.is_set()
+
+    def test_pauses_runtime_without_abort_hook(self):
+        session = GenerationSession(stop=["X"])
+        assert session.on_token("aX") == 1
+        assert session.on_token("more") == 1
+        assert session.text == "a"
+
+    def test_abort_hook_called_once(self):
+        aborted = []
+        session = GenerationSession(stop=["X"])
+        session.abort_fn = aborted.append
+        assert session.on_token("aX") == 0
+        assert session.on_token("late") == 0
+        assert aborted == [session]
+        assert session.text == "a"
+
+    def test_held_text_flushed_on_finish(self):
+        streamed = []
+        session = GenerationSession(stop=["<end>"], callback=streamed.append)
+        session.on_token("value <e")
+        assert "".join(streamed) == "value "
+        session.on_finish(None)
+        assert session.text == "value <e"
+        assert "".join(streamed) == "value <e"
+
+    def test_error_after_stop_is_ignored(self):
+        session = GenerationSession(stop=["X"])
+        session.on_token("X")
+        session.on_error()
+        assert session.error is None
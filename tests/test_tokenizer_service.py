@@ -0,0 +1,109 @@
+"""
+Tests for the tokenizer service.
+
+Tests cover:
+- Segment-wise encoding cache split at special tokens
+- Fallback to whole-prompt caching when segments do not concatenate
+- Character estimate without a tokenizer
+- Async variants
+"""
+import asyncio
+import re
+import sys
+import os
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.tokenizer_service import TokenizerService
+from models.generation_session import estimate_tokens
+
+SPECIALS = ["<|im_start|>", "<|im_end|>"]
+
+
+class _WordTokenizer:
+    """Special tokens are atomic, other text splits into words and whitespace"""
+
+    all_special_tokens = SPECIALS
+
+    def __init__(self, prefix_space=False):
+        self.prefix_space = prefix_space  # SentencePiece-style dummy prefix
+        self.vocab = {t: i for i, t in enumerate(SPECIALS)}
+        self.calls = 0
+
+    def _id(self, piece):
+        return self.vocab.setdefault(piece, len(self.vocab))
+
+    def encode(self, text, add_special_tokens=False):
+        self.calls += 1
+        if self.prefix_space:
+            text = " " + text
+        ids = []
+        for part in re.split("(" + "|".join(re.escape(t) for t in SPECIALS) + ")", text):
+            if part in SPECIALS:
+                ids.append(self._id(part))
+            elif part:
+                ids.extend(self._id(p) for p in re.findall(r"\s+|\S+", part))
+        return ids
+
+    def decode(self, ids):
+        inverse = {i: t for t, i in self.vocab.items()}
+        return "".join(inverse[i] for i in ids)
+
+
+CHAT = "<|im_start|>system\nBe brief.<|im_end|>\n<|im_start|>user\nHi there<|im_end|>\n"
+
+
+class TestTokenizerService:
+    """Test cached encoding."""
+
+    def test_segmented_encoding_matches_whole(self):
+        tokenizer = _WordTokenizer()
+        service = TokenizerService(tokenizer)
+        assert service.stats()["segment_cache"]
+        assert service.encode(CHAT) == tokenizer.encode(CHAT)
+        assert service.decode(service.encode(CHAT)) == CHAT
+
+    def test_repeated_prefix_is_not_re_encoded(self):
+        tokenizer = _WordTokenizer()
+        service = TokenizerService(tokenizer)
+        service.encode(CHAT)
+        calls = tokenizer.calls
+        service.encode(CHAT + "<|im_start|>assistant\nHello<|im_end|>\n")
+        # Only the new message content is encoded ("assistant\nHello")
+        assert tokenizer.calls == calls + 1
+        assert service.stats()["hits"] > 0
+
+    def test_prefix_space_tokenizer_caches_whole_prompts(self):
+        tokenizer = _WordTokenizer(prefix_space=True)
+        service = TokenizerService(tokenizer)
+        assert not service.stats()["segment_cache"]
+        assert service.encode(CHAT) == tokenizer.encode(CHAT)
+
+    def test_cache_is_bounded(self):
+        service = TokenizerService(_WordTokenizer(), cache_size=2)
+        for i in range(5):
+            service.encode(f"text {i}")
+        assert service.stats()["cached_segments"] == 2
+
+    def test_estimate_without_tokenizer(self):
+        service = TokenizerService()
+        assert not service.available
+        assert service.count("x" * 40) == estimate_tokens("x" * 40)
+        assert service.count("") == 0
+        with pytest.raises(RuntimeError):
+            service.encode("hello")
+
+    def test_async_variants(self):
+        service = TokenizerService(_WordTokenizer())
+
+        async def run():
+            ids = await service.encode_async(CHAT)
+            counts = await service.count_many_async([CHAT, "hi"])
+            return ids, counts, await service.decode_async(ids)
+
+        ids, counts, text = asyncio.run(run())
+        service.shutdown()
+        assert counts == [len(ids), 1]
+        assert text == CHAT
@@ -0,0 +1,171 @@
+"""
+Tests for the local vector index.
+
+Tests cover:
+- Flat top-k search for cosine and inner product
+- Upsert, delete and compaction
+- Persistence through memory-mapped files and the append-only record log
+- IVF training and recall on clustered data
+"""
+import sys
+import os
+import numpy as np
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.vector_index import VectorStore, VectorCollection, kmeans
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VectorStore(str(tmp_path / "vectors"), ivf_threshold=1000, nprobe=4)
+
+
+def _ids(hits):
+    return [hit["id"] for hit in hits]
+
+
+class TestFlatSearch:
+    """Test exact search and mutation."""
+
+    def test_cosine_ranks_by_angle(self, store):
+        col = store.get_or_create("docs", dim=2)
+        col.add(["x", "y", "xy"], np.array([[10, 0], [0, 1], [1, 1]]), texts=["a", "b", "c"])
+        hits = col.search(np.array([1.0, 0.1]), top_k=2)
+        assert _ids(hits) == ["x", "xy"]
+        assert hits[0]["score"] == pytest.approx(np.cos(np.arctan(0.1)), rel=1e-5)
+        assert hits[0]["text"] == "a"
+
+    def test_inner_product_uses_magnitude(self, store):
+        col = store.get_or_create("docs", dim=2, metric="ip")
+        col.add(["x", "y"], np.array([[10, 0], [0, 1]]))
+        assert col.search(np.array([1.0, 1.0]), top_k=1)[0]["id"] == "x"
+
+    def test_upsert_replaces_document(self, store):
+        col = store.get_or_create("docs", dim=2)
+        col.add(["a"], np.array([[1, 0]]), metadata=[{"v": 1}])
+        col.add(["a"], np.array([[0, 1]]), metadata=[{"v": 2}])
+        assert col.size == 1
+        hit = col.search(np.array([0.0, 1.0]), top_k=5)
+        assert len(hit) == 1
+        assert hit[0]["metadata"] == {"v": 2}
+
+    def test_delete(self, store):
+        col = store.get_or_create("docs", dim=2)
+        col.add(["a", "b"], np.array([[1, 0], [0, 1]]))
+        assert col.delete(["a", "missing"]) == 1
+        assert _ids(col.search(np.array([1.0, 0.0]), top_k=5)) == ["b"]
+
+    def test_dimension_mismatch(self, store):
+        col = store.get_or_create("docs", dim=3)
+        with pytest.raises(ValueError):
+            col.add(["a"], np.ones((1, 2)))
+        with pytest.raises(ValueError):
+            col.search(np.ones(2))
+
+    def test_invalid_name(self, store):
+        with pytest.raises(ValueError):
+            store.get_or_create("../escape", dim=2)
+
+
+class TestPersistence:
+    """Test reopening collections from disk."""
+
+    def test_reopen_after_growth(self, tmp_path):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(3000, 8)).astype(np.float32)  # Grows past the initial capacity
+        store = VectorStore(str(tmp_path), ivf_threshold=10 ** 9)
+        col = store.get_or_create("docs", dim=8, model_name="m")
+        col.add([str(i) for i in range(3000)], vectors)
+        col.delete(["0"])
+        col.close()
+
+        reopened = VectorStore(str(tmp_path)).get("docs")
+        assert reopened.size == 2999
+        assert reopened.model_name == "m"
+        assert reopened.search(vectors[42], top_k=1)[0]["id"] == "42"
+        assert reopened.search(vectors[0], top_k=1)[0]["id"] != "0"
+
+    def test_compaction_keeps_ids(self, store):
+        col = store.get_or_create("docs", dim=4)
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(3000, 4))
+        col.add([str(i) for i in range(3000)], vectors)
+        col.delete([str(i) for i in range(0, 3000, 2)][:1600] + [str(i) for i in range(1, 400, 2)])
+        info = col.info()
+        assert info["count"] == col.size
+        assert col.search(vectors[2999], top_k=1)[0]["id"] == "2999"
+
+    def test_small_adds_append_to_log(self, tmp_path):
+        store = VectorStore(str(tmp_path), ivf_threshold=10 ** 9)
+        col = store.get_or_create("docs", dim=2)
+        snapshot = tmp_path / "docs" / "records.json"
+        size = snapshot.stat().st_size
+        for i in range(20):
+            col.add([f"d{i}"], np.array([[1.0, i]]), texts=[f"text {i}"])
+        col.delete(["d3"])
+        col.add(["d5"], np.array([[0.0, 1.0]]), texts=["replaced"])
+        assert snapshot.stat().st_size == size
+        col.close()
+
+        reopened = VectorStore(str(tmp_path)).get("docs")
+        assert reopened.size == 19
+        assert reopened.search(np.array([0.0, 1.0]), top_k=1)[0]["text"] == "replaced"
+        assert "d3" not in _ids(reopened.search(np.array([1.0, 3.0]), top_k=20))
+
+    def test_log_is_folded_into_snapshot(self, tmp_path):
+        store = VectorStore(str(tmp_path), ivf_threshold=10 ** 9)
+        col = store.get_or_create("docs", dim=2)
+        # Upserts log a deletion and an insert each; the log stays bounded
+        for i in range(1200):
+            col.add([f"d{i % 10}"], np.array([[1.0, i]]), texts=[str(i)])
+        log_file = tmp_path / "docs" / "records.log"
+        assert not log_file.exists() or sum(1 for _ in open(log_file)) <= 1024
+        col.close()
+        reopened = VectorStore(str(tmp_path)).get("docs")
+        assert reopened.size == 10
+        texts = {hit["id"]: hit["text"] for hit in reopened.search(np.array([1.0, 1.0]), top_k=10)}
+        assert texts["d9"] == "1199"
+
+    def test_list_and_drop(self, store):
+        store.get_or_create("a", dim=2)
+        store.get_or_create("b", dim=2)
+        assert [c["name"] for c in store.list()] == ["a", "b"]
+        assert store.drop("a")
+        assert store.get("a") is None
+        assert not store.drop("a")
+
+
+class TestIVF:
+    """Test the approximate index."""
+
+    def test_kmeans_separates_clusters(self):
+        rng = np.random.default_rng(0)
+        centers = np.array([[10, 0], [0, 10], [-10, -10]], dtype=np.float32)
+        points = np.concatenate([c + rng.normal(size=(50, 2)) for c in centers]).astype(np.float32)
+        found = kmeans(points, 3)
+        for c in centers:
+            assert np.min(np.linalg.norm(found - c, axis=1)) < 1.0
+
+    def test_auto_switches_to_ivf_and_keeps_recall(self, store):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(32, 16)) * 10
+        vectors = (centers[rng.integers(0, 32, size=2000)] + rng.normal(size=(2000, 16))).astype(np.float32)
+        col = store.get_or_create("docs", dim=16)
+        col.add([str(i) for i in range(2000)], vectors)
+        assert col.info()["active_index"] == "ivf"
+
+        queries = rng.choice(2000, size=20, replace=False)
+        found = sum(col.search(vectors[q], top_k=1)[0]["id"] == str(q) for q in queries)
+        assert found >= 18
+
+    def test_ivf_persists(self, store, tmp_path):
+        col = store.get_or_create("docs", dim=4, index_type="ivf")
+        vectors = np.random.default_rng(0).normal(size=(200, 4))
+        col.add([str(i) for i in range(200)], vectors)
+        col.close()
+        reopened = VectorCollection.open(tmp_path / "vectors" / "docs")
+        assert reopened.info()["nlist"] == col.info()["nlist"] > 0
+        assert reopened.search(vectors[7], top_k=1, nprobe=1000)[0]["id"] == "7"
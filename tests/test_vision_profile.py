@@ -0,0 +1,63 @@
+"""
+Tests for vision profiles.
+
+Tests cover:
+- Profile detection from the model path
+- Config overrides
+- Packing several images into one embedding buffer
+"""
+import sys
+import os
+import numpy as np
+import pytest
+
+# Add src to path to match the project's import style
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.vision_profile import resolve_vision_profile, DEFAULT_VISION_PROFILE
+
+
+class TestResolveVisionProfile:
+
+    def test_detects_family_from_path(self):
+        assert resolve_vision_profile("/models/qwen2-vl-2b/qwen2-vl-llm_rk3588.rkllm").embed_dim == 1536
+        assert resolve_vision_profile("/models/Qwen2.5-VL-3B/model.rkllm").embed_dim == 2048
+        assert resolve_vision_profile("/models/qwen2.5-vl-7b-w8a8/model.rkllm").embed_dim == 3584
+
+    def test_text_model_has_no_profile(self):
+        assert resolve_vision_profile("/models/qwen3-4b/qwen3.rkllm") is None
+
+    def test_unknown_vision_model_uses_default(self):
+        assert resolve_vision_profile("/models/some-vision-llm/m.rkllm") == DEFAULT_VISION_PROFILE
+
+    def test_overrides(self):
+        profile = resolve_vision_profile("/models/qwen2-vl-2b/m.rkllm", {"image_tokens": 256, "image_width": 448,
+                                                                         "image_height": 448})
+        assert profile.image_tokens == 256
+        assert profile.image_size == 448
+        assert profile.embed_dim == 1536
+
+    def test_override_by_name_on_text_path(self):
+        profile = resolve_vision_profile("/models/custom/m.rkllm", {"name": "qwen2.5-vl"})
+        assert profile.embed_dim == 2048
+
+    def test_unknown_field_rejected(self):
+        with pytest.raises(ValueError, match="Unknown vision profile fields"):
+            resolve_vision_profile("/models/qwen2-vl/m.rkllm", {"tokens": 1})
+
+
+class TestPack:
+
+    def test_packs_images_contiguously(self):
+        profile = resolve_vision_profile("/m/qwen2-vl/m.rkllm", {"embed_dim": 4, "image_tokens": 3})
+        a = np.full((3, 4), 1, dtype=np.float32)
+        b = np.full(12, 2, dtype=np.float32)
+        packed = profile.pack([a, b])
+        assert packed.shape == (24,)
+        assert packed.flags.c_contiguous
+        assert packed[:12].tolist() == [1] * 12 and packed[12:].tolist() == [2] * 12
+
+    def test_rejects_wrong_geometry(self):
+        profile = resolve_vision_profile("/m/qwen2-vl/m.rkllm", {"embed_dim": 4, "image_tokens": 3})
+        with pytest.raises(ValueError, match="expected 3 tokens x 4"):
+            profile.pack([np.zeros(10, dtype=np.float32)])